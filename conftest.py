@@ -17,6 +17,12 @@ Functions:
 - db_insert_24h_empty_parsivel: Inserts 24 hours worth of empty Telegram telegrams into the test database.
 - db_insert_24h_empty_thies: Inserts 24 hours worth of empty Thies telegrams into the test database.
 - db_insert_24h_empty: Inserts 24 hours worth of empty lines into a test database.
+- pytest_addoption: Adds the --benchmark option, which runs the tests marked as benchmark.
+- pytest_configure: Registers the benchmark marker.
+- pytest_collection_modifyitems: Skips the tests marked as benchmark, unless --benchmark is given.
+
+Classes:
+- FakeClock: Deterministic replacement for the monotonic clock, wall clock and sleep used by MinuteScheduler.
 """
 
 import os
@@ -27,7 +33,7 @@ from datetime import datetime, timedelta, timezone
 from pydantic.v1.utils import deep_update
 import pytest
 
-from modules.sqldb import create_db, connect_db
+from modules.sqldb import create_db, connect_db, insert_telegrams
 from modules.util_functions import yaml2dict
 from modules.now_time import NowTime
 from modules.telegram import create_telegram
@@ -115,16 +121,17 @@ def db_insert_24h(db_path, config_dict, telegram_lines):
     """
     # inserts 1440 rows to db
     con, cur = connect_db(dbpath=str(db_path))
+    telegrams = []
     for i in range(data_points_24h):
         new_time = start_dt + timedelta(minutes=i)  # time offset: by 1 minute
-        telegram = create_telegram(config_dict=config_dict,
-                                    telegram_lines=telegram_lines,
-                                    db_row_id=None,
-                                    timestamp=new_time,
-                                    db_cursor=cur,
-                                    telegram_data={},
-                                    logger=logger)
-        telegram.insert2db()
+        telegrams.append(create_telegram(config_dict=config_dict,
+                                         telegram_lines=telegram_lines,
+                                         db_row_id=None,
+                                         timestamp=new_time,
+                                         db_cursor=cur,
+                                         telegram_data={},
+                                         logger=logger))
+    insert_telegrams(cur=cur, telegrams=telegrams, logger=logger)
     con.commit()
     cur.close()
     con.close()
@@ -248,4 +255,97 @@ def db_insert_two_telegrams_parsivel(create_db_parsivel): # pylint: disable=unus
     This function inserts two Parsivel telegrams into the test database.
     :param create_db_parsivel: the function to create the test database
     """
-    db_insert_two_telegrams(db_path_parsivel, config_dict_parsivel, parsivel_lines)
\ No newline at end of file
+    db_insert_two_telegrams(db_path_parsivel, config_dict_parsivel, parsivel_lines)
+
+
+def pytest_addoption(parser):
+    """
+    Adds the --benchmark option, which runs the tests marked as benchmark.
+    :param parser: the pytest command line parser
+    """
+    parser.addoption('--benchmark', action='store_true', default=False,
+                     help='run the benchmarks (tests marked as benchmark), which compare wall clock times')
+
+
+def pytest_configure(config):
+    """
+    Registers the benchmark marker.
+    :param config: the pytest config object
+    """
+    config.addinivalue_line('markers', 'benchmark: compares wall clock times, only runs with --benchmark')
+
+
+def pytest_collection_modifyitems(config, items):
+    """
+    Skips the tests marked as benchmark, unless --benchmark is given: their timings depend on the machine and its
+    load, so they do not run in CI.
+    :param config: the pytest config object
+    :param items: the collected tests
+    """
+    if config.getoption('--benchmark'):
+        return
+    skip_benchmark = pytest.mark.skip(reason='benchmark, run with --benchmark')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip_benchmark)
+
+
+class FakeClock:
+    """
+    Deterministic replacement for the monotonic clock, wall clock and sleep used by MinuteScheduler.
+    Sleeping and working only move the fake time forward, so a day of ticks runs in milliseconds.
+
+    Attributes:
+    - wall: the fake POSIX timestamp in seconds
+    - mono: the fake monotonic clock in seconds
+    - sleeps: list of all the durations that were slept
+    - sleep_hook: optional function called with the fake clock after every sleep
+    """
+
+    def __init__(self, start: datetime = start_dt, sleep_hook=None):
+        """
+        Constructor for FakeClock.
+        :param start: the datetime the wall clock starts at
+        :param sleep_hook: optional function called with the fake clock after every sleep
+        """
+        self.wall = start.timestamp()
+        self.mono = 1000.0
+        self.sleeps = []
+        self.sleep_hook = sleep_hook
+
+    def monotonic(self):
+        """
+        Returns the fake monotonic clock.
+        """
+        return self.mono
+
+    def time(self):
+        """
+        Returns the fake wall clock.
+        """
+        return self.wall
+
+    def work(self, seconds):
+        """
+        Moves both clocks forward, as if the caller was busy.
+        :param seconds: the number of seconds to move forward
+        """
+        self.wall += seconds
+        self.mono += seconds
+
+    def sleep(self, seconds):
+        """
+        Moves both clocks forward and records the duration.
+        :param seconds: the number of seconds to sleep
+        """
+        self.sleeps.append(seconds)
+        self.work(seconds)
+        if self.sleep_hook is not None:
+            self.sleep_hook(self)
+
+    async def async_sleep(self, seconds):
+        """
+        Coroutine version of sleep, for MinuteScheduler.wait_async.
+        :param seconds: the number of seconds to sleep
+        """
+        self.sleep(seconds)
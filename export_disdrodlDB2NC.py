@@ -2,25 +2,55 @@
 Script to export telegram data from the database from a specific date to a netCDF file
 based on the given site config file.
 
+With --start and --end (and one or more -c site config files) every day of the range is exported,
+the days of all sensors are divided over a pool of worker processes (--workers). A worker loads each config
+and opens each database once, and reuses them for all the days it exports.
+
 Functions:
 - get_arguments: Parses the arguments for exporting to netCDF.
+- read_rows: Reads the rows of a sensor between two timestamps from the database or its partition files.
+- read_records: Decodes the rows into a structured array, one record per minute.
+- read_telegram_objs: Parses the rows into Telegram objects, one per minute.
+- load_config: Loads the combined config dictionary and the logger of a site config file.
+- get_full_version: Returns whether a version name is the full or the light version.
+- export_day: Exports one day of a sensor to a netCDF file.
+- init_worker: Initializes a worker process of the range export.
+- export_task: Exports one day of one sensor in a worker process, reusing its config and database connection.
+- export_range: Exports every day of a range for one or more sensors, in a pool of worker processes.
 - main: The main function for exporting a netCDF file.
 """
 
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from logging import Logger
+from typing import Dict, Iterable, List, Tuple, Union
 from argparse import ArgumentParser
 from datetime import datetime, date, timedelta, timezone
 from pathlib import Path
+import numpy
 from pydantic.v1.utils import deep_update
 from modules.util_functions import yaml2dict, get_general_config_dict, create_dir, create_logger
-from modules.telegram import create_telegram
+from modules.registry import get_sensor_entry
+from modules.telegram import create_telegram, Telegram, RECORD_FIELDS
+from modules.quality import QUALITY_MISSING
 from modules.netCDF import NetCDF
-from modules.sqldb import query_db_rows_gen, connect_db
+from modules.sqldb import day_range
+from modules.partitions import query_partitions_gen
+from modules.db_reader import DBReader
 
 
 date_today = date.today()
 date_yest = date_today - timedelta(days=1)
 
+# the combined config dictionary and logger per site config file, loaded once per process
+_configs: Dict[str, Tuple[Dict, Logger]] = {}
+# the open read-only database connection per database path of a worker process
+_readers: Dict[str, DBReader] = {}
+# the version and per_object setting of the days exported by a worker process, see init_worker
+_worker_settings: Dict = {}
+
 def get_arguments():
     """
     Parses the arguments for exporting to netCDF.
@@ -35,7 +65,9 @@ def get_arguments():
         '-c',
         '--config',
         required=True,
-        help='Path to site config file. ie. -c configs_netcdf/config_PAR_007_CABAUW.yml')
+        nargs='+',
+        help='Path to site config file. ie. -c configs_netcdf/config_PAR_007_CABAUW.yml, '
+             'several files export the same days of several sensors')
     parser.add_argument(
         '-d',
         '--date',
@@ -46,18 +78,140 @@ def get_arguments():
         '--version',
         default='full',
         help="Bool for what version netCDF to export, a full or light version. Format: 'full' or 'light'")
+    parser.add_argument(
+        '--per-object',
+        action='store_true',
+        help='Parse every telegram into a Telegram object instead of decoding the day at once, for compatibility')
+    parser.add_argument(
+        '--start',
+        default=None,
+        help='First date of a range of days to export, instead of --date. Format: YYYY-mm-dd')
+    parser.add_argument(
+        '--end',
+        default=None,
+        help='Last date (included) of the range of days to export, default the --start date. Format: YYYY-mm-dd')
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=os.cpu_count(),
+        help='Number of worker processes exporting the days of a range, 1 exports them in this process')
 
     return parser.parse_args()
 
-def main(args):
+def read_rows(db_path, partitioning, start_ts, end_ts, sensor_id, logger,  # pylint: disable=too-many-arguments
+              reader: Union[DBReader, None] = None):
     """
-    The main function for exporting a netCDF file.
-    :param args: a tuple with a path to a config file, a date, and a version
+    Reads the rows of a sensor with start_ts <= timestamp < end_ts, ordered by timestamp.
+    Without partitioning the database is opened read-only and read in batches of tuples (see DBReader),
+    otherwise the partition files overlapping the range are attached read-only (see query_partitions_gen).
+    :param db_path: the path of the database without partitions
+    :param partitioning: none, daily, monthly or yearly
+    :param start_ts: the first timestamp (seconds since epoch) to include
+    :param end_ts: the timestamp (seconds since epoch) to stop at, excluded
+    :param sensor_id: the sensor_id (sensor name) to get the rows of
+    :param logger: the logger object to log the queries
+    :param reader: an open DBReader of the database to use and keep open, instead of opening and closing one
+    :return: generator of (id, timestamp, telegram, spectrum, parsed, quality_flag) tuples, with None for a column
+             that the database does not have (the BLOB columns and quality_flag are enabled by the site config)
     """
-    date_dt = datetime.strptime(args.date, '%Y-%m-%d')
-    wd = Path(__file__).parent
+    if partitioning != 'none':
+        for row in query_partitions_gen(db_path, start_ts=start_ts, end_ts=end_ts, partitioning=partitioning,
+                                        sensor_id=sensor_id, logger=logger):
+            yield (row['id'], row['timestamp'], row['telegram'], row.get('spectrum'), row.get('parsed'),
+                   row.get('quality_flag'))
+        return
+    own_reader = reader is None
+    if own_reader:
+        reader = DBReader(dbpath=db_path)
+    try:
+        for batch in reader.range_batches(start_ts, end_ts, sensor_id=sensor_id, logger=logger):
+            # the positions of the columns, the BLOB and quality_flag columns only exist when the site config
+            # enables them
+            columns = [reader.columns.index(name) if name in reader.columns else None
+                       for name in ('id', 'timestamp', 'telegram', 'spectrum', 'parsed', 'quality_flag')]
+            for row in batch:
+                yield tuple(None if column is None else row[column] for column in columns)
+    finally:
+        if own_reader:
+            reader.close()
+
+def read_records(rows: Iterable[Tuple], config_dict: Dict, logger: Logger) -> Tuple[numpy.ndarray, int]:
+    """
+    Decodes the rows into a structured array with one record per row, with the decoder of the
+    sensor type (see registry.py, telegram.decode_telegrams for the Parsivel and Thies). A row without data
+    (e.g. an empty read) is a record with fill values that is flagged as missing.
+    Of a minute stored more than once (in a database from before the unique index) the first record
+    that is not flagged as missing is kept, or the first record if they all are.
+    :param rows: the rows of read_rows, ordered by timestamp
+    :param config_dict: the combined config dictionary
+    :param logger: the logger object
+    :return: the structured array, and the number of records that were left out because their minute was a duplicate
+    """
+    decoder = get_sensor_entry(config_dict['global_attrs']['sensor_type']).decoder
+    records = decoder(config_dict, rows, logger)
+    # a stable sort on the minute that puts the records flagged as missing after the others of their minute
+    missing = (records['quality_flag'] & QUALITY_MISSING) != 0
+    records = records[numpy.lexsort((missing, records['timestamp'] // 60))]
+    minutes = records['timestamp'] // 60
+    first = numpy.ones(len(records), dtype=bool)
+    first[1:] = minutes[1:] != minutes[:-1]
+    return records[first], int(len(records) - first.sum())
+
+def read_telegram_objs(rows: Iterable[Tuple], config_dict: Dict, logger: Logger) -> Tuple[List[Telegram], int]:
+    """
+    Parses every row into a Telegram object, one per minute. A row without data (e.g. an empty read) is kept
+    as a Telegram object without data, unless its minute is stored again with data.
+    This is how the rows were exported before decode_telegrams, it is kept for compatibility (--per-object).
+    :param rows: the rows of read_rows, ordered by timestamp
+    :param config_dict: the combined config dictionary
+    :param logger: the logger object
+    :return: the list of Telegram objects, and the number of rows that were left out because their minute was a duplicate
+    """
+    telegram_objs = []
+    duplicates = 0
+    for row_id, timestamp, telegram_str, spectrum, parsed, *_ in rows:
+        ts_dt = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+        # a minute stored more than once (in a database from before the unique index) is exported once,
+        # a row with data replaces an earlier row of the minute without data
+        duplicate = telegram_objs and telegram_objs[-1].timestamp.replace(second=0, microsecond=0) == \
+            ts_dt.replace(second=0, microsecond=0)
+        if duplicate and telegram_objs[-1].DATA_FIELD in telegram_objs[-1].telegram_data:
+            duplicates += 1
+            continue
 
-    config_dict_site = yaml2dict(path=wd / args.config)
+        telegram_instance = create_telegram(
+                config_dict=config_dict,
+                telegram_lines=telegram_str,
+                db_row_id=row_id,
+                timestamp=ts_dt,
+                db_cursor=None,
+                telegram_data={},
+                logger=logger,
+                spectrum_blob=spectrum,
+                parsed_blob=parsed)
+
+        # rows stored with their parsed fields are not parsed again, older rows are parsed from the text
+        telegram_instance.parse_telegram_row()
+
+        if not duplicate:
+            telegram_objs.append(telegram_instance)
+        elif telegram_instance.DATA_FIELD in telegram_instance.telegram_data:
+            telegram_objs[-1] = telegram_instance
+            duplicates += 1
+        else:
+            duplicates += 1
+    return telegram_objs, duplicates
+
+def load_config(config: str, wd: Path) -> Tuple[Dict, Logger]:
+    """
+    Loads the site config file, combined with the general config file of its sensor type, and creates its logger.
+    :param config: the path of the site config file, relative to wd
+    :param wd: the directory of the script
+    :return: the combined config dictionary and the logger object
+    """
+    config_dict_site = yaml2dict(path=wd / config)
 
     # Get the sensor type from the site specific config file
     sensor_type = config_dict_site['global_attrs']['sensor_type']
@@ -74,22 +228,40 @@ def main(args):
         sys.exit(1)
 
     # Combine the site specific config file and the sensor type specific config file into one
-    config_dict = deep_update(config_dict_general, config_dict_site)
+    return deep_update(config_dict_general, config_dict_site), logger
 
+def get_full_version(version: str, logger: Logger) -> bool:
+    """
+    Returns whether a version name is the full or the light version, and exits if it is neither.
+    :param version: the version name, 'full' or 'light'
+    :param logger: the logger object
+    :return: True for the full version, False for the light version
+    """
     # Create a boolean from the version name to indicate a full or light version
-    if args.version == 'full':
-        full_version = True
-    elif args.version == 'light':
-        full_version = False
-    else:
-        logger.error(msg=f"Version {args.version} is not recognized.")
-        sys.exit(1)
-
+    if version == 'full':
+        return True
+    if version == 'light':
+        return False
+    logger.error(msg=f"Version {version} is not recognized.")
+    sys.exit(1)
+
+def export_day(config_dict: Dict, date_dt: datetime, full_version: bool,  # pylint: disable=too-many-arguments
+               per_object: bool, logger: Logger, reader: Union[DBReader, None] = None) -> bool:
+    """
+    Exports one day of the sensor of a config to a netCDF file.
+    :param config_dict: the combined config dictionary
+    :param date_dt: the date to export
+    :param full_version: whether to export the full or the light version
+    :param per_object: whether to parse every telegram into a Telegram object instead of decoding the day at once
+    :param logger: the logger object
+    :param reader: an open DBReader of the database to reuse, see read_rows
+    :return: True if the netCDF file was written, False if the day has no telegrams with data
+    """
     # Combine the site name, station code and sensor name into the start of the file name
     site_name = config_dict['global_attrs']['site_name']
     st_code = config_dict['station_code']
     sensor_name = config_dict['global_attrs']['sensor_name']
-    fn_start = f"{args.date.replace('-', '')}_{site_name}-{st_code}_{sensor_name}"
+    fn_start = f"{date_dt.strftime('%Y%m%d')}_{site_name}-{st_code}_{sensor_name}"
 
     # Add "_light" to the end of the file name when exporting a light version
     if full_version is False:
@@ -104,35 +276,26 @@ def main(args):
     msg_date = f'Exporting data from {date_dt} to {date_dt.replace(hour=23, minute=59, second=59)}'
     logger.info(msg=msg_date)
 
-    # Query the relevant data rows and create Telegram instances out of those
-    telegram_objs = []
-    cur, con = connect_db(dbpath=str(db_path))
-    for row in query_db_rows_gen(con, date_dt=date_dt, logger=logger):
-        ts_dt = datetime.fromtimestamp(row.get('timestamp'), tz=timezone.utc)
-
-        telegram_instance = create_telegram(
-                config_dict=config_dict,
-                telegram_lines=row.get('telegram'),
-                db_row_id=row.get('id'),
-                timestamp=ts_dt,
-                db_cursor=None,
-                telegram_data={},
-                logger=logger)
-
-        telegram_instance.parse_telegram_row()
-
-        # Append telegram_instance if it has data organized by keys(fields)
-        if (("11" in telegram_instance.telegram_data.keys() and sensor_type == 'Thies Clima') or
-            ("90" in telegram_instance.telegram_data.keys() and sensor_type == 'OTT Hydromet Parsivel2')):
-            telegram_objs.append(telegram_instance)
+    # Query the relevant data rows and decode them into a structured array, or create Telegram instances out of those
+    start_ts, end_ts = day_range(date_dt)
+    rows = read_rows(db_path, config_dict.get('db_partitioning', 'none'), start_ts, end_ts, sensor_name, logger,
+                     reader=reader)
+    if per_object:
+        telegram_objs, duplicates = read_telegram_objs(rows, config_dict, logger)
+        records = None
+    else:
+        records, duplicates = read_records(rows, config_dict, logger)
+        telegram_objs = None
 
-    con.close()
-    cur.close()
+    if duplicates:
+        logger.warning(msg=f'skipped {duplicates} row(s) of minutes that were already exported, '
+                           f'run upgrade_db.py to remove them from the database')
 
-    # Exit the process if there are no Telegram objects
-    if len(telegram_objs) == 0:
+    # No netCDF file for a day without telegrams with data, records without data only have the RECORD_FIELDS
+    if not (any(obj.DATA_FIELD in obj.telegram_data for obj in telegram_objs) if per_object
+            else len(records) and len(records.dtype.names) > len(RECORD_FIELDS)):
         logger.error(msg="netCDF not created because there are no Telegram objects")
-        sys.exit(1)
+        return False
 
     # Directory to put the netCDF file in
     data_dir = Path(config_dict['data_dir']) / date_dt.strftime('%Y%m')
@@ -149,7 +312,8 @@ def main(args):
                 fn_start=fn_start,
                 full_version=full_version,
                 telegram_objs=telegram_objs,
-                date=date_dt)
+                date=date_dt,
+                records=records)
 
     msg_date = f'data_dir is: {nc.data_dir}'
     logger.info(msg=msg_date)
@@ -159,6 +323,125 @@ def main(args):
     nc.write_data_to_netCDF()
 
     nc.compress()
+    return True
+
+def init_worker(full_version: bool, per_object: bool):
+    """
+    Initializes a worker process of the range export: sets the version and per_object setting of its days.
+    A forked worker gets the configs loaded by the main process, but opens its own database connections.
+    :param full_version: whether to export the full or the light version
+    :param per_object: whether to parse every telegram into a Telegram object instead of decoding the day at once
+    """
+    _readers.clear()
+    _worker_settings.update(full_version=full_version, per_object=per_object)
+
+def export_task(task: Tuple[str, str]) -> Tuple[str, str, bool]:
+    """
+    Exports one day of one sensor in a worker process. The config of the sensor is loaded, and its database opened,
+    by the first day the worker exports of that sensor, and reused for its next days.
+    An error of one day is logged, and does not stop the export of the other days.
+    :param task: the path of the site config file and the date (YYYY-mm-dd) to export
+    :return: the path of the site config file, the date and whether the netCDF file was written
+    """
+    config, date_str = task
+    if config not in _configs:
+        _configs[config] = load_config(config, Path(__file__).parent)
+    config_dict, logger = _configs[config]
+    try:
+        reader = None
+        if config_dict.get('db_partitioning', 'none') == 'none':
+            db_path = str(Path(config_dict['data_dir']) / 'disdrodl.db')
+            if db_path not in _readers:
+                _readers[db_path] = DBReader(dbpath=db_path)
+            reader = _readers[db_path]
+        exported = export_day(config_dict, datetime.strptime(date_str, '%Y-%m-%d'),
+                              _worker_settings['full_version'], _worker_settings['per_object'], logger, reader=reader)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.error(msg=f'netCDF of {date_str} not created: {e}')
+        exported = False
+    return config, date_str, exported
+
+def export_range(configs: List[str], start_dt: datetime, end_dt: datetime,  # pylint: disable=too-many-arguments
+                 full_version: bool, per_object: bool, workers: int) -> Tuple[int, int]:
+    """
+    Exports every day from start_dt to end_dt (included) of the sensor of every config. The days are divided over
+    a pool of worker processes, see export_task, and the throughput of the whole range is logged in days per minute.
+    :param configs: the paths of the site config files, relative to the directory of the script
+    :param start_dt: the first date to export
+    :param end_dt: the last date to export
+    :param full_version: whether to export the full or the light version
+    :param per_object: whether to parse every telegram into a Telegram object instead of decoding the day at once
+    :param workers: the number of worker processes, 1 exports the days in this process
+    :return: the number of netCDF files written, and the number of days without a netCDF file
+    """
+    # the configs are loaded before the pool is started, so a bad config stops the export before any day is exported
+    for config in configs:
+        if config not in _configs:
+            _configs[config] = load_config(config, Path(__file__).parent)
+    days = [(start_dt + timedelta(days=day)).strftime('%Y-%m-%d') for day in range((end_dt - start_dt).days + 1)]
+    tasks = [(config, day) for config in configs for day in days]
+    workers = max(1, min(workers or 1, len(tasks)))
+
+    start_time = time.perf_counter()
+    if workers == 1:
+        init_worker(full_version, per_object)
+        results = [export_task(task) for task in tasks]
+        for reader in _readers.values():
+            reader.close()
+        _readers.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(full_version, per_object)) as executor:
+            results = list(executor.map(export_task, tasks))
+    minutes = (time.perf_counter() - start_time) / 60
+
+    exported = sum(result[2] for result in results)
+    for config in configs:
+        failed = [day for result_config, day, result in results if result_config == config and not result]
+        logger = _configs[config][1]
+        logger.info(msg=f'Exported {len(days) - len(failed)} of {len(days)} day(s) from {days[0]} to {days[-1]}')
+        if failed:
+            logger.warning(msg=f'No netCDF created for {len(failed)} day(s): {", ".join(failed)}')
+    msg = (f'Exported {exported} of {len(tasks)} day(s) of {len(configs)} sensor(s) with {workers} worker(s) '
+           f'in {minutes * 60:.1f} s: {len(tasks) / minutes if minutes else 0:.1f} days per minute')
+    print(msg)
+    for config in configs:
+        _configs[config][1].info(msg=msg)
+    return exported, len(tasks) - exported
+
+def main(args):
+    """
+    The main function for exporting a netCDF file, or the netCDF files of a range of days (see export_range).
+    :param args: the arguments, with the path(s) to the config file(s), a date or a start and end date, and a version
+    """
+    configs = args.config
+    # the day is decoded at once into a structured array, unless the Telegram objects are asked for
+    per_object = args.per_object
+
+    # A range of days, or one day of several sensors, is exported by a pool of worker processes
+    if args.start is not None or len(configs) > 1:
+        start = args.start if args.start is not None else args.date
+        start_dt = datetime.strptime(start, '%Y-%m-%d')
+        end_dt = datetime.strptime(args.end if args.end is not None else start, '%Y-%m-%d')
+        for config in configs:
+            if config not in _configs:
+                _configs[config] = load_config(config, Path(__file__).parent)
+        full_version = get_full_version(args.version, _configs[configs[0]][1])
+        _, missing = export_range(configs, start_dt, end_dt, full_version, per_object, args.workers)
+        if missing:
+            sys.exit(1)
+        return
+
+    date_dt = datetime.strptime(args.date, '%Y-%m-%d')
+    wd = Path(__file__).parent
+
+    config_dict, logger = load_config(configs[0], wd)
+
+    full_version = get_full_version(args.version, logger)
+
+    # Exit the process if there are no telegrams with data
+    if not export_day(config_dict, date_dt, full_version, per_object, logger):
+        sys.exit(1)
 
 if __name__ == '__main__':
     main(get_arguments())
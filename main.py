@@ -2,27 +2,58 @@
 This module contains the main loop to log data once every minute.
 
 After setting up the logger and the connection with the database,
-the code enters a permanent while loop where each time the seconds are 0,
-data gets logged to the database.
+the code enters a permanent while loop where a MinuteScheduler wakes up at every whole minute,
+and data gets logged to the database.
+The start sequence of the sensor runs once; a SensorSession re-applies only the settings
+that drifted (e.g. the clock of the Thies) or failed.
+Reading the sensor and writing to the database are decoupled by a TelegramPipeline:
+the loop only queues the telegram, a writer thread parses and commits it,
+so a slow database write never delays the next read.
+
+When more than one site config is given, all sensors are logged concurrently by a single process:
+every sensor is driven through an AsyncSensor on one asyncio event loop,
+so a sensor that times out does not delay the others.
+
+Functions:
+- setup_sensor: Loads the config files, creates the logger and connects to the sensor and database.
+- main: Main function to log data of one sensor once every minute.
+- log_minutes: Runs the minute loop of main.
+- db_columns: Gets the typed columns of the scalar telegram fields if they are enabled in the site config.
+- create_db_writer: Creates the long-lived database writer for a sensor.
+- create_pipeline: Creates and starts the pipeline writing the telegrams to the database(s).
+- log_sensors: Logs data of several sensors concurrently once every minute.
+- log_ticks: Runs the start sequences and the minute loop of log_sensors.
+- main_multi: Main function to log data of several sensors once every minute.
+- get_config_file: Gets the config file(s) from the command line.
 """
+import asyncio
 import sys
 from pathlib import Path
 from time import sleep
 from argparse import ArgumentParser
 from pydantic.v1.utils import deep_update
 
-from modules.sensors import Parsivel, Thies
 from modules.util_functions import yaml2dict, get_general_config_dict, create_logger, create_sensor
-from modules.telegram import ParsivelTelegram, ThiesTelegram, create_telegram
-from modules.now_time import NowTime
-from modules.sqldb import create_db, connect_db
+from modules.telegram import create_telegram
+from modules.scheduler import MinuteScheduler
+from modules.async_sensor import AsyncSensor
+from modules.sqldb import create_db, field_columns
+from modules.db_writer import DBWriter
+from modules.pipeline import TelegramPipeline
+from modules.sensor_session import SensorSession
+
+
+# seconds to wait for a telegram or start sequence of one sensor in multi-sensor mode
+READ_TIMEOUT = 20
+START_SEQUENCE_TIMEOUT = 40
 
 
 ######################## BOILER PLATE ##################
-def main(config_site):
+def setup_sensor(config_site):
     """
-    Main function to log data once every minute
+    Loads the config files, creates the logger and connects to the sensor and database.
     :param config_site: the config file for the site
+    :return: tuple of the combined config dictionary, logger, sensor object and database path
     """
     ### Config files ###
     wd = Path(__file__).parent
@@ -51,26 +82,108 @@ def main(config_site):
     sensor = create_sensor(sensor_type=sensor_type, logger=logger, sensor_id=sensor_id)
 
     sensor.init_serial_connection(port=config_dict['port'], baud=config_dict['baud'], logger=logger)
-    sensor.sensor_start_sequence(config_dict=config_dict, logger=logger, include_in_log=True)
-    sleep(2)
 
     ### DB ###
     db_path = Path(config_dict['data_dir']) / 'disdrodl.db'
-    create_db(dbpath=str(db_path))
+    # partition files are created by the DBWriter when the first telegram of their period is written
+    if config_dict.get('db_partitioning', 'none') == 'none':
+        create_db(dbpath=str(db_path), spectrum_storage=config_dict.get('db_spectrum_storage', 'text'),
+                  columns=db_columns(config_dict), parsed=config_dict.get('db_parsed_column', False),
+                  quality=config_dict.get('db_quality_column', False))
+
+    return config_dict, logger, sensor, db_path
+
+
+def db_columns(config_dict):
+    """
+    Gets the typed columns of the scalar telegram fields, if the site config enables them with db_field_columns.
+    :param config_dict: the combined config dictionary
+    :return: dictionary of the (column name, column type) per field, or None
+    """
+    if not config_dict.get('db_field_columns', False):
+        return None
+    return field_columns(config_dict)
+
+
+def create_db_writer(db_path, config_dict, logger):
+    """
+    Creates the long-lived database writer, with the optional db settings from the site config.
+    :param db_path: the path to the database
+    :param config_dict: the combined config dictionary
+    :param logger: the logger object
+    :return: the DBWriter object
+    """
+    return DBWriter(dbpath=str(db_path), logger=logger,
+                    synchronous=config_dict.get('db_synchronous', 'NORMAL'),
+                    busy_timeout=config_dict.get('db_busy_timeout', 10.0),
+                    spectrum_storage=config_dict.get('db_spectrum_storage', 'text'),
+                    columns=db_columns(config_dict),
+                    partitioning=config_dict.get('db_partitioning', 'none'),
+                    parsed=config_dict.get('db_parsed_column', False),
+                    quality=config_dict.get('db_quality_column', False))
+
+
+def create_pipeline(db_configs, logger):
+    """
+    Creates and starts the pipeline writing the telegrams to the database(s), with the optional queue settings
+    from the site config.
+    :param db_configs: dictionary of the config dictionary per database path
+    :param logger: the logger object
+    :return: the started TelegramPipeline object
+    """
+    config_dict = next(iter(db_configs.values()))
+    pipeline = TelegramPipeline(
+        create_writer=lambda db_path: create_db_writer(db_path, db_configs[db_path], logger),
+        logger=logger,
+        maxsize=config_dict.get('queue_size', 60),
+        overflow=config_dict.get('queue_overflow', 'drop_oldest'),
+        spool=config_dict.get('spool', False),
+        spool_sync_interval=config_dict.get('spool_sync_interval', 60))
+    pipeline.start()
+    return pipeline
+
+
+def main(config_site):
+    """
+    Main function to log data once every minute
+    :param config_site: the config file for the site
+    """
+    config_dict, logger, sensor, db_path = setup_sensor(config_site)
+
+    session = SensorSession(sensor=sensor, config_dict=config_dict, logger=logger)
+    session.start(include_in_log=True)
+    sleep(2)
 
     #########################################################
 
-    while True:
-        now_utc = NowTime()
+    scheduler = MinuteScheduler(logger=logger)
+    pipeline = create_pipeline({db_path: config_dict}, logger)
+
+    try:
+        log_minutes(session, logger, scheduler, pipeline, db_path)
+    finally:
+        # write the telegrams that are still queued
+        pipeline.stop()
+
+
+def log_minutes(session, logger, scheduler, pipeline, db_path):
+    """
+    Runs the minute loop of main: reads the sensor, queues the telegram for the writer thread,
+    and applies the settings of the sensor again that drifted or failed.
+    :param session: the SensorSession object of the sensor
+    :param logger: the logger object
+    :param scheduler: the MinuteScheduler object
+    :param pipeline: the started TelegramPipeline object
+    :param db_path: the path to the database
+    """
+    sensor, config_dict = session.sensor, session.config_dict
 
-        # if the seconds are not 0, sleep for 1 second and then continue
-        if int(now_utc.time_list[2]) != 0:
-            sleep(1)
-            continue
+    while True:
+        # sleep until the next whole minute, resulting in data getting logged once a minute
+        now_utc = scheduler.wait()
 
-        # only log data if the seconds are 0, resulting in data getting logged once a minute
-        con, cur = connect_db(dbpath=str(db_path))
-        logger.debug(msg=f'writing Telegram to DB on: {now_utc.time_list}, {now_utc.utc}')
+        logger.debug(msg=f'writing Telegram to DB on: {now_utc.time_list}, {now_utc.utc},'
+                         f' jitter: {now_utc.jitter:.3f}s, pipeline: {pipeline.metrics()}')
 
         # Read telegram from the sensor
         telegram_lines = sensor.read(logger=logger)
@@ -85,43 +198,138 @@ def main(config_site):
                                    telegram_lines=telegram_lines,
                                    db_row_id=None,
                                    timestamp=now_utc.utc,
-                                   db_cursor=cur,
+                                   db_cursor=None,
                                    telegram_data={},
                                    logger=logger)
 
         if telegram is None:
             logger.error(msg=f"telegram is None on: {now_utc.time_list}, {now_utc.utc}")
         else:
-            telegram.capture_prefixes_and_data()
-            telegram.prep_telegram_data4db()
-            telegram.insert2db()
-            con.commit()
+            session.update(telegram)
+            pipeline.put(db_path, telegram)
+
+        # only the settings that drifted or failed, instead of the full start sequence
+        session.reconcile()
+
+
+async def log_sensors(async_sensors, scheduler, logger, read_timeout=READ_TIMEOUT,
+                      start_sequence_timeout=START_SEQUENCE_TIMEOUT):
+    """
+    Logs data of several sensors concurrently once every minute.
+    At every tick all sensors are read at the same time, the telegrams are queued for the writer thread,
+    and settings that drifted or failed are applied again in the background, so they never delay the next tick.
+    :param async_sensors: list of AsyncSensor objects
+    :param scheduler: the MinuteScheduler object
+    :param logger: the logger of the process
+    :param read_timeout: seconds to wait for the telegram of one sensor
+    :param start_sequence_timeout: seconds to wait for the start sequence of one sensor
+    """
+    # one writer thread, with one long-lived connection per database shared by the sensors writing to it
+    db_configs = {}
+    for async_sensor in async_sensors:
+        db_configs.setdefault(async_sensor.db_path, async_sensor.config_dict)
+    pipeline = create_pipeline(db_configs, logger)
+
+    try:
+        await log_ticks(async_sensors, scheduler, logger, pipeline, read_timeout, start_sequence_timeout)
+    finally:
+        pipeline.stop()
+
+
+async def log_ticks(async_sensors, scheduler, logger, pipeline,  # pylint: disable=too-many-arguments
+                    read_timeout, start_sequence_timeout):
+    """
+    Runs the start sequences and the minute loop of log_sensors.
+    :param async_sensors: list of AsyncSensor objects
+    :param scheduler: the MinuteScheduler object
+    :param logger: the logger of the process
+    :param pipeline: the started TelegramPipeline object
+    :param read_timeout: seconds to wait for the telegram of one sensor
+    :param start_sequence_timeout: seconds to wait for the start sequence of one sensor
+    """
+    await asyncio.gather(*(async_sensor.start_sequence(timeout=start_sequence_timeout, include_in_log=True)
+                           for async_sensor in async_sensors))
+
+    while True:
+        now_utc = await scheduler.wait_async()
+
+        # read all sensors at the same time, a sensor that times out returns None
+        all_telegram_lines = await asyncio.gather(*(async_sensor.read(timeout=read_timeout)
+                                                    for async_sensor in async_sensors))
+
+        for async_sensor, telegram_lines in zip(async_sensors, all_telegram_lines):
+            if not telegram_lines:
+                async_sensor.logger.error(msg=f"sensor_lines is EMPTY on: {now_utc.time_list}, {now_utc.utc}")
+                telegram_lines = []
+
+            telegram = create_telegram(config_dict=async_sensor.config_dict,
+                                       telegram_lines=telegram_lines,
+                                       db_row_id=None,
+                                       timestamp=now_utc.utc,
+                                       db_cursor=None,
+                                       telegram_data={},
+                                       logger=async_sensor.logger)
+
+            if telegram is None:
+                async_sensor.logger.error(msg=f"telegram is None on: {now_utc.time_list}, {now_utc.utc}")
+            else:
+                async_sensor.session.update(telegram)
+                # the writer thread commits the telegrams of this tick together, one transaction per database
+                pipeline.put(async_sensor.db_path, telegram)
+
+        logger.debug(msg=f'queued telegrams of: {now_utc.utc}, pipeline: {pipeline.metrics()}')
+
+        for async_sensor in async_sensors:
+            busy = async_sensor.background is not None and not async_sensor.background.done()
+            if async_sensor.session.pending() and not busy:
+                async_sensor.run_in_background(async_sensor.reconcile(timeout=start_sequence_timeout))
+
+
+def main_multi(config_sites):
+    """
+    Main function to log data of several sensors once every minute, in a single process.
+    :param config_sites: list of the config files for the sites
+    """
+    async_sensors = []
+    for config_site in config_sites:
+        config_dict, sensor_logger, sensor, _ = setup_sensor(config_site)
+        async_sensors.append(AsyncSensor(sensor=sensor, config_dict=config_dict, logger=sensor_logger))
 
-        cur.close()
-        con.close()
+    sensor_names = ', '.join(async_sensor.name for async_sensor in async_sensors)
+    logger = create_logger(log_dir=Path(async_sensors[0].config_dict['log_dir']),
+                           script_name='disdrodl_multi',
+                           sensor_name=sensor_names)
 
-        sensor.sensor_start_sequence(config_dict=config_dict, logger=logger, include_in_log=False)
+    scheduler = MinuteScheduler(logger=logger)
 
-        # sleep for 2 seconds to guarantee you don't log the same data twice
-        # this causes issues with a computation time of 58 seconds
-        sleep(2)
+    try:
+        asyncio.run(log_sensors(async_sensors, scheduler, logger))
+    finally:
+        for async_sensor in async_sensors:
+            async_sensor.close()
 
 
 def get_config_file():
     """
-    Function that gets th config file from the command line
-    :return: the config file's name
+    Function that gets the config file(s) from the command line
+    :return: list of the config files' names
     """
     parser = ArgumentParser(
-        description="Ruisdael: OTT Disdrometer data logger. Run: python main.py -c config_*.yml")
+        description="Ruisdael: OTT Disdrometer data logger. Run: python main.py -c config_*.yml [config_*.yml ...]")
     parser.add_argument(
         '-c',
         '--config',
         required=True,
-        help='Path to site config file. ie. -c configs_netcdf/config_PAR_008_GV.yml')
+        nargs='+',
+        help='Path to site config file(s), more than one logs all sensors in a single process.'
+             ' ie. -c configs_netcdf/config_PAR_008_GV.yml configs_netcdf/config_THIES_006_GV.yml')
     args = parser.parse_args()
     return args.config
 
 
 if __name__ == '__main__':
-    main(get_config_file())
+    config_files = get_config_file()
+    if len(config_files) == 1:
+        main(config_files[0])
+    else:
+        main_multi(config_files)
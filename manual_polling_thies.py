@@ -1,13 +1,12 @@
 """
 Manual polling of telegrams for Thies sensors
 """
-from time import sleep
 from pathlib import Path
 
 from modules.sensors import Thies # pylint: disable=import-error
-from modules.sqldb import create_db, connect_db # pylint: disable=import-error
+from modules.sqldb import create_db, connect_db, insert_rows # pylint: disable=import-error
 from modules.util_functions import yaml2dict, create_logger # pylint: disable=import-error
-from modules.now_time import NowTime # pylint: disable=import-error
+from modules.scheduler import MinuteScheduler # pylint: disable=import-error
 
 if __name__ == '__main__':
 
@@ -31,32 +30,25 @@ if __name__ == '__main__':
     thies.init_serial_connection(thies_port, thies_baud, logger)
     thies.sensor_start_sequence(config_dict=config_dict, logger=logger)
 
-    while True:
-        now_time = NowTime()
+    scheduler = MinuteScheduler(logger=logger)
 
-        if int(now_time.time_list[2]) != 0:
-            print(now_time.time_list)
-            sleep(1)
-            continue
+    while True:
+        now_time = scheduler.wait()
+        print(now_time.time_list)
 
         con, cur = connect_db(dbpath=str(db_path))
 
         output = thies.read(logger)
 
-        insert = 'INSERT INTO disdrodl(timestamp, datetime, sensor_id, telegram) VALUES'
-
         timestamp_str = now_time.utc.isoformat()
         ts = now_time.utc.timestamp()
         sensor = config_dict['global_attrs']['sensor_name']
 
         # Insert telegram into db
-        insert_str = f"{insert} ({ts}, '{timestamp_str}', '{sensor}', '{output}');"
-
-        cur.execute(insert_str)
+        insert_rows(cur=cur, rows=[(ts, timestamp_str, sensor, output)])
 
         con.commit()
         cur.close()
         con.close()
 
         print(output)
-        sleep(2)
@@ -0,0 +1,119 @@
+"""
+This module contains a wrapper that makes the blocking serial communication of a Sensor usable from asyncio.
+
+pyserial has no asyncio transport, so every sensor gets its own single worker thread in which all of its
+serial calls are executed. The event loop only awaits the results with a timeout, so a sensor that does
+not answer (or runs a slow start sequence) never delays the other sensors on the same event loop.
+
+Classes:
+- AsyncSensor: Runs the serial calls of one Sensor in a dedicated thread, with a timeout on every call.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from logging import Logger
+from pathlib import Path
+from typing import Dict
+
+from modules.sensors import Sensor
+from modules.sensor_session import SensorSession
+
+
+class AsyncSensor:
+    """
+    Class wrapping a Sensor, so it can be driven from an asyncio event loop.
+
+    Attributes:
+    - sensor: the wrapped Sensor object
+    - config_dict: the combined general and site specific config dictionary of the sensor
+    - logger: the logger of the sensor
+    - name: the sensor name from the config dictionary
+    - db_path: the path of the database the telegrams of the sensor are written to
+    - session: the SensorSession keeping track of the applied settings of the sensor
+    - executor: the single worker thread executing the serial calls of the sensor
+    - background: the last task that was started with run_in_background
+
+    Functions:
+    - call: runs a blocking function in the worker thread of the sensor, with a timeout
+    - read: reads a telegram from the sensor
+    - start_sequence: runs the start sequence of the sensor
+    - reconcile: applies the settings of the sensor again that drifted or failed
+    - run_in_background: starts a coroutine as a task without waiting for it
+    - close: stops the worker thread and closes the serial connection
+    """
+
+    def __init__(self, sensor: Sensor, config_dict: Dict, logger: Logger):
+        """
+        Constructor for AsyncSensor.
+        :param sensor: the Sensor object with an initialized serial connection
+        :param config_dict: the combined general and site specific config dictionary of the sensor
+        :param logger: the logger of the sensor
+        """
+        self.sensor = sensor
+        self.config_dict = config_dict
+        self.logger = logger
+        self.name = config_dict['global_attrs']['sensor_name']
+        self.db_path = Path(config_dict['data_dir']) / 'disdrodl.db'
+        self.session = SensorSession(sensor=sensor, config_dict=config_dict, logger=logger)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'serial-{self.name}')
+        self.background = None
+
+    async def call(self, func, timeout: float, **kwargs):
+        """
+        Runs a blocking function in the worker thread of the sensor.
+        On a timeout the event loop stops waiting for the result; calls that are still queued behind
+        a blocking call are cancelled, so they do not pile up in the worker thread.
+        :param func: the blocking function to run
+        :param timeout: seconds to wait for the result
+        :param kwargs: keyword arguments for the function
+        :return: the result of the function, or None on a timeout or error
+        """
+        future = asyncio.get_running_loop().run_in_executor(self.executor, partial(func, **kwargs))
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            self.logger.error(msg=f'{self.name}: {func.__name__} timed out after {timeout} s')
+        except Exception as e:  # pylint: disable=broad-except
+            self.logger.error(msg=f'{self.name}: {func.__name__} failed: {e}')
+        return None
+
+    async def read(self, timeout: float):
+        """
+        Reads a telegram from the sensor.
+        :param timeout: seconds to wait for the telegram
+        :return: the telegram as returned by Sensor.read, or None on a timeout or error
+        """
+        return await self.call(self.sensor.read, timeout=timeout, logger=self.logger)
+
+    async def start_sequence(self, timeout: float, include_in_log: bool):
+        """
+        Runs the start sequence of the sensor.
+        :param timeout: seconds to wait for the start sequence to finish
+        :param include_in_log: whether the start sequence should be included in the log
+        """
+        await self.call(self.session.start, timeout=timeout, include_in_log=include_in_log)
+
+    async def reconcile(self, timeout: float):
+        """
+        Applies the settings of the sensor again that drifted or failed.
+        :param timeout: seconds to wait for the settings to be applied
+        """
+        await self.call(self.session.reconcile, timeout=timeout)
+
+    def run_in_background(self, coroutine):
+        """
+        Starts a coroutine as a task without waiting for it.
+        A reference to the task is kept, so it is not garbage collected before it is finished.
+        :param coroutine: the coroutine to run
+        :return: the task
+        """
+        self.background = asyncio.ensure_future(coroutine)
+        return self.background
+
+    def close(self):
+        """
+        Stops the worker thread and closes the serial connection.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.sensor.close_serial_connection()
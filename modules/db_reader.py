@@ -0,0 +1,132 @@
+"""
+This module contains the read-only connection the export reads the rows of a range with, in batches.
+
+Classes:
+- DBReader: Read-only connection used by the export to read rows in batches, as tuples or NumPy record arrays.
+"""
+
+from typing import Iterator, List, Sequence, Tuple, Union
+import numpy
+from modules.sqldb import connect_db_readonly, range_query, MMAP_SIZE
+
+# rows fetched from SQLite at a time by DBReader
+FETCH_SIZE = 1440
+# NumPy dtype of a column in a record array, by its SQLite type; INTEGER columns can be NULL, which becomes NaN
+NUMPY_TYPES = {'REAL': numpy.float64, 'INTEGER': numpy.float64}
+
+
+class DBReader:
+    """
+    Class holding one read-only connection to the database (see connect_db_readonly), used by the export to read
+    the rows of a range in batches of fetch_size rows (fetchmany), as tuples or as NumPy record arrays.
+    The column names are read once per query instead of once per row (as dict_factory does),
+    so the rows of years of telegrams are read without building a dictionary per row.
+
+    Attributes:
+    - dbpath: the path to the database as a string
+    - fetch_size: the number of rows fetched at a time
+    - mmap_size: bytes of the file to memory-map
+    - con: the connection object, None when closed
+    - columns: the column names of the rows of the last query
+
+    Functions:
+    - connect: opens the read-only connection
+    - batches: runs a query and generates its rows in batches
+    - range_batches: generates the rows between two timestamps in batches, ordered by timestamp
+    - rows: generates the rows between two timestamps as tuples, ordered by timestamp
+    - close: closes the connection
+    """
+
+    def __init__(self, dbpath, fetch_size: int = FETCH_SIZE, mmap_size: int = MMAP_SIZE, timeout: float = 5.0):
+        """
+        Constructor for DBReader, the connection is opened right away.
+        :param dbpath: the path to the database
+        :param fetch_size: the number of rows fetched at a time
+        :param mmap_size: bytes of the file to memory-map, 0 to read with normal I/O
+        :param timeout: seconds to wait for a lock held by another connection
+        :raises sqlite3.OperationalError: if the database does not exist
+        """
+        self.dbpath = str(dbpath)
+        self.fetch_size = fetch_size
+        self.mmap_size = mmap_size
+        self.timeout = timeout
+        self.con = None
+        self.columns = []
+        self.connect()
+
+    def connect(self):
+        """
+        Opens the read-only connection, closing the previous connection if there is one.
+        """
+        self.close()
+        self.con = connect_db_readonly(self.dbpath, timeout=self.timeout, mmap_size=self.mmap_size)
+
+    def batches(self, query: str, params: Sequence = (),
+                records: bool = False) -> Iterator[Union[List[Tuple], numpy.recarray]]:
+        """
+        Runs a query and generates its rows in batches of at most fetch_size rows.
+        :param query: the query
+        :param params: the values bound to the ? placeholders of the query
+        :param records: whether to generate NumPy record arrays instead of lists of tuples, with a float64 field for
+                        the REAL and INTEGER columns (NULL is NaN), an int64 id, and an object field for the others
+        :return: generator of lists of row tuples, or of record arrays with a field per column
+        """
+        cur = self.con.execute(query, params)
+        self.columns = [column[0] for column in cur.description]
+        dtype = self.__dtype() if records else None
+        try:
+            while True:
+                batch = cur.fetchmany(self.fetch_size)
+                if not batch:
+                    break
+                yield numpy.rec.array(numpy.array(batch, dtype=dtype)) if records else batch
+        finally:
+            cur.close()
+
+    def range_batches(self, start_ts, end_ts, sensor_id=None,
+                      records: bool = False, logger=None) -> Iterator[Union[List[Tuple], numpy.recarray]]:
+        """
+        Generates the rows with start_ts <= timestamp < end_ts in batches, ordered by timestamp,
+        using the (sensor_id, timestamp) index if a sensor_id is given, see query_range_gen.
+        :param start_ts: the first timestamp (seconds since epoch) to include
+        :param end_ts: the timestamp (seconds since epoch) to stop at, excluded
+        :param sensor_id: optional sensor_id (sensor name) to get the rows of
+        :param records: whether to generate NumPy record arrays instead of lists of tuples
+        :param logger: optional logger object to log the query
+        :return: generator of lists of row tuples, or of record arrays
+        """
+        query_str = range_query(sensor_id)
+        params = (start_ts, end_ts) if sensor_id is None else (sensor_id, start_ts, end_ts)
+        if logger is not None:
+            logger.debug(msg=f'{query_str} {params}')
+        yield from self.batches(query_str, params, records=records)
+
+    def rows(self, start_ts, end_ts, sensor_id=None, logger=None) -> Iterator[Tuple]:
+        """
+        Generates the rows with start_ts <= timestamp < end_ts as tuples of the columns, ordered by timestamp,
+        fetched in batches.
+        :param start_ts: the first timestamp (seconds since epoch) to include
+        :param end_ts: the timestamp (seconds since epoch) to stop at, excluded
+        :param sensor_id: optional sensor_id (sensor name) to get the rows of
+        :param logger: optional logger object to log the query
+        :return: generator of row tuples
+        """
+        for batch in self.range_batches(start_ts, end_ts, sensor_id=sensor_id, logger=logger):
+            yield from batch
+
+    def close(self):
+        """
+        Closes the connection.
+        """
+        if self.con is not None:
+            self.con.close()
+        self.con = None
+
+    def __dtype(self) -> numpy.dtype:
+        """
+        Returns the NumPy dtype of the rows of the last query, by the types of the columns of the disdrodl table.
+        :return: the structured dtype
+        """
+        types = {column[1]: column[2].upper() for column in self.con.execute("PRAGMA table_info(disdrodl)")}
+        return numpy.dtype([(name, numpy.int64 if name == 'id' else NUMPY_TYPES.get(types.get(name), object))
+                            for name in self.columns])
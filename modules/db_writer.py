@@ -0,0 +1,296 @@
+"""
+This module contains the long-lived connection the ingest loop writes telegrams with, into the database
+or into its partition files (see modules/partitions.py), and the spooled rows it replays (see modules/spool.py),
+together with their position in the spool.
+
+Classes:
+- DBWriter: Long-lived WAL mode connection used by the ingest loop to write telegrams.
+"""
+
+import sqlite3
+from logging import Logger
+from typing import Callable, Dict, List, Tuple, Union
+from datetime import datetime, timezone
+from pathlib import Path
+from modules.sqldb import connect_db, create_db, database_id, insert_rows, insert_telegrams, SPECTRUM_STORAGE
+from modules.partitions import partition_path, seal_partition, PARTITION_FORMATS
+
+
+class DBWriter:
+    """
+    Class holding one long-lived connection to the database, used by the ingest loop to write telegrams.
+    The connection uses WAL journaling, so the export script can read while the logger writes,
+    and a busy timeout, so a short lock held by another connection is waited for instead of failing.
+    When writing fails because of an I/O error, the connection is opened again and the write is retried.
+    With partitioning, every telegram is written into the partition file of its timestamp (see partition_path),
+    which is created when needed; the previous partition is sealed (see seal_partition) once a newer one is opened.
+
+    Attributes:
+    - dbpath: the path to the database as a string
+    - partitioning: none, daily, monthly or yearly
+    - path: the path of the database (partition) file that is currently open
+    - logger: optional logger to report failed writes
+    - synchronous: the value of PRAGMA synchronous (OFF, NORMAL, FULL or EXTRA)
+    - busy_timeout: seconds to wait for a lock held by another connection
+    - max_retries: number of times a failed write is retried
+    - spectrum_storage: how the spectrum field is stored: text, blob or zlib
+    - columns: dictionary of the (column name, column type) per field to fill, None to only store the text
+    - parsed: whether the parsed telegram fields are stored in the parsed column
+    - quality: whether the quality flag of the telegrams is stored in the quality_flag column
+    - con: the connection object, None when closed
+    - cur: the cursor object, None when closed
+    - reconnect_count: number of times the connection was opened again after an error
+
+    Functions:
+    - connect: opens the connection and applies the pragmas
+    - write: inserts telegrams and commits them in one transaction
+    - db_row: prepares a telegram as a row of the disdrodl table of this writer
+    - write_rows: inserts rows read from a spool, skipping the rows that were committed before
+    - spool_position: returns the position of the last record of a spool committed to the open database file
+    - database_id: returns the random id of the database file, which the spool of the database is tied to
+    - close: closes the connection
+    """
+
+    SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+    def __init__(self, dbpath: str, logger: Union[Logger, None] = None,  # pylint: disable=too-many-arguments
+                 synchronous: str = 'NORMAL', busy_timeout: float = 10.0, max_retries: int = 3,
+                 spectrum_storage: str = 'text', columns: Union[Dict[str, Tuple[str, str]], None] = None,
+                 partitioning: str = 'none', parsed: bool = False, quality: bool = False):
+        """
+        Constructor for DBWriter, the connection is opened right away, without partitioning.
+        :param dbpath: the path to the database as a string
+        :param logger: optional logger to report failed writes
+        :param synchronous: the value of PRAGMA synchronous, NORMAL is safe in WAL mode
+                            (a power loss can only lose the last commits, never corrupt the database)
+        :param busy_timeout: seconds to wait for a lock held by another connection
+        :param max_retries: number of times a failed write is retried
+        :param spectrum_storage: how the spectrum field is stored: text, blob or zlib,
+                                 the spectrum column should exist for blob and zlib (see create_db)
+        :param columns: dictionary of the (column name, column type) per field to fill, see field_columns,
+                        the columns should exist (see create_db)
+        :param partitioning: none, daily, monthly or yearly, the partition files are created when needed
+        :param parsed: whether to store the parsed telegram fields (see pack_fields), the parsed column should exist
+        :param quality: whether to store the quality flag of the telegrams, the quality_flag column should exist
+        """
+        if synchronous.upper() not in self.SYNCHRONOUS_LEVELS:
+            raise ValueError(f'synchronous should be one of {self.SYNCHRONOUS_LEVELS}, not {synchronous}')
+        if spectrum_storage not in SPECTRUM_STORAGE:
+            raise ValueError(f'spectrum_storage should be one of {SPECTRUM_STORAGE}, not {spectrum_storage}')
+        if partitioning not in PARTITION_FORMATS:
+            raise ValueError(f'partitioning should be one of {tuple(PARTITION_FORMATS)}, not {partitioning}')
+        self.dbpath = str(dbpath)
+        self.partitioning = partitioning
+        self.path = self.dbpath if partitioning == 'none' else None
+        self.logger = logger
+        self.synchronous = synchronous.upper()
+        self.busy_timeout = busy_timeout
+        self.max_retries = max_retries
+        self.spectrum_storage = spectrum_storage
+        self.columns = columns
+        self.parsed = parsed
+        self.quality = quality
+        self.con = None
+        self.cur = None
+        self.reconnect_count = 0
+        if self.path is not None:
+            self.connect()
+
+    def connect(self):
+        """
+        Opens the connection and applies the pragmas, closing the previous connection if there is one.
+        """
+        self.close()
+        self.con, self.cur = connect_db(dbpath=self.path, timeout=self.busy_timeout)
+        self.cur.execute("PRAGMA journal_mode=WAL")
+        self.cur.execute(f"PRAGMA synchronous={self.synchronous}")
+        self.cur.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+
+    def write(self, telegrams: List) -> bool:
+        """
+        Inserts the telegrams and commits them in one transaction (one per partition file).
+        If the database is locked for longer than the busy timeout the write is retried,
+        on any other database error the connection is opened again before retrying.
+        :param telegrams: list of Telegram objects to insert
+        :return: True if the telegrams were committed, False if all attempts failed
+        """
+        partitions = self.__partitions(telegrams, [telegram.timestamp for telegram in telegrams])
+        # write every partition, also when writing one of them fails
+        return all([self.__write(path, lambda partition=partition: self.__insert_telegrams(partition))
+                    for path, partition in partitions.items()])
+
+    def db_row(self, telegram) -> Tuple:
+        """
+        Prepares a telegram as a row of the disdrodl table of this writer, with its spectrum storage and columns.
+        :param telegram: the Telegram object
+        :return: the row tuple, see Telegram.db_row
+        """
+        return telegram.db_row(spectrum_storage=self.spectrum_storage, columns=self.columns, parsed=self.parsed,
+                               quality=self.quality)
+
+    def write_rows(self, records: List[Tuple[Tuple[int, int], Tuple]], spool: str) -> bool:
+        """
+        Inserts rows read from a spool (see modules/spool.py) and commits them in one transaction per partition file,
+        with the same retries as write. The position of the last inserted record is stored in the spool_position
+        table in the same transaction, and records at or before the stored position are skipped,
+        so replaying the same records again never inserts them twice.
+        :param records: list of (position in the spool, row) tuples, in the order of their position
+        :param spool: the name of the spool
+        :return: True if the rows were committed, False if all attempts failed
+        """
+        timestamps = [datetime.fromtimestamp(row[0], tz=timezone.utc) for _, row in records]
+        partitions = self.__partitions(records, timestamps)
+        return all([self.__write(path, lambda partition=partition: self.__insert_records(partition, spool))
+                    for path, partition in partitions.items()])
+
+    def spool_position(self, spool: str) -> Tuple[int, int]:
+        """
+        Returns the position of the last record of a spool committed to the open database file.
+        :param spool: the name of the spool
+        :return: the (segment, offset) position, (0, 0) if no record was committed
+        """
+        self.cur.execute("CREATE TABLE IF NOT EXISTS spool_position "
+                         "(spool TEXT PRIMARY KEY, segment INTEGER, offset INTEGER)")
+        row = self.cur.execute("SELECT segment, offset FROM spool_position WHERE spool = ?", (spool,)).fetchone()
+        return tuple(row) if row is not None else (0, 0)
+
+    def database_id(self) -> Union[str, None]:
+        """
+        Returns the random id of the database file (see create_database_id), which the spool is tied to.
+        With partitioning there is no single file: every record is written into the partition of its timestamp,
+        whichever file that is, so the spool is not tied to a file.
+        :return: the id, None with partitioning or if it cannot be read (e.g. the file is corrupt)
+        """
+        if self.partitioning != 'none':
+            return None
+        try:
+            if self.con is None:
+                self.connect()
+            return database_id(self.cur)
+        except sqlite3.Error:
+            return None
+
+    def __partitions(self, items: List, timestamps: List[datetime]) -> Dict[str, List]:
+        """
+        Groups items by the database (partition) file of their timestamp.
+        :param items: list of telegrams or records
+        :param timestamps: the timestamp of every item
+        :return: dictionary of the items per path, in the order of the items
+        """
+        if self.partitioning == 'none':
+            return {self.dbpath: items}
+        partitions = {}
+        for item, timestamp in zip(items, timestamps):
+            partitions.setdefault(str(partition_path(self.dbpath, timestamp, self.partitioning)), []).append(item)
+        return partitions
+
+    def __insert_telegrams(self, telegrams: List):
+        """
+        Inserts the telegrams of one database file.
+        :param telegrams: list of Telegram objects
+        """
+        insert_telegrams(cur=self.cur, telegrams=telegrams, logger=self.logger,
+                         spectrum_storage=self.spectrum_storage, columns=self.columns, parsed=self.parsed,
+                         quality=self.quality)
+
+    def __insert_records(self, records: List[Tuple[Tuple[int, int], Tuple]], spool: str):
+        """
+        Inserts the spooled rows that were not committed before, and stores the position of the last one.
+        :param records: list of (position in the spool, row) tuples of one database file
+        :param spool: the name of the spool
+        """
+        committed = self.spool_position(spool)
+        rows = [row for position, row in records if position > committed]
+        if not rows:
+            return
+        inserted = insert_rows(cur=self.cur, rows=rows, spectrum=self.spectrum_storage != 'text',
+                               columns=[column for column, _ in (self.columns or {}).values()], parsed=self.parsed,
+                               quality=self.quality)
+        self.cur.execute("INSERT OR REPLACE INTO spool_position(spool, segment, offset) VALUES (?, ?, ?)",
+                         (spool,) + tuple(records[-1][0]))
+        if self.logger is not None:
+            period = rows[0][1] if len(rows) == 1 else f'{rows[0][1]} - {rows[-1][1]}'
+            self.logger.info(msg=f'inserting to DB from spool {spool}: {period}')
+            self.logger.debug(msg=f'inserted {inserted} spooled telegram(s), skipped {len(records) - len(rows)}, '
+                                  f'ignored {len(rows) - inserted} of minutes that were already in the database')
+
+    def __write(self, path: str, insert: Callable[[], None]) -> bool:
+        """
+        Inserts into one database file and commits, with the retries described in write.
+        :param path: the path of the database (partition) file
+        :param insert: function inserting the rows with self.cur
+        :return: True if the rows were committed, False if all attempts failed
+        """
+        for attempt in range(1, self.max_retries + 2):
+            try:
+                if path != self.path:
+                    self.__open_partition(path)
+                if self.con is None:
+                    self.connect()
+                insert()
+                self.con.commit()
+                return True
+            except sqlite3.DatabaseError as e:
+                if self.logger is not None:
+                    self.logger.error(msg=f'writing to {path} failed (attempt {attempt}): {e}')
+                self.__recover(error=e)
+        return False
+
+    def __open_partition(self, path: str):
+        """
+        Opens a partition file, creating it if it does not exist yet, and seals the previous partition if it is older.
+        Writing into a sealed partition (e.g. a late telegram) removes its checksum, it is sealed again later.
+        :param path: the path of the partition file
+        """
+        previous = self.path
+        self.close()
+        self.path = path
+        create_db(dbpath=path, spectrum_storage=self.spectrum_storage, columns=self.columns, parsed=self.parsed,
+                  quality=self.quality)
+        checksum = Path(f'{path}.sha256')
+        if checksum.exists():
+            checksum.unlink()
+            if self.logger is not None:
+                self.logger.warning(msg=f'writing to sealed partition {path}, its checksum is removed')
+        self.connect()
+        if previous is not None and Path(previous).name < Path(path).name:
+            try:
+                seal_partition(previous)
+            except sqlite3.Error as e:  # e.g. locked by a reader, it stays a WAL database without checksum
+                if self.logger is not None:
+                    self.logger.warning(msg=f'sealing partition {previous} failed: {e}')
+            else:
+                if self.logger is not None:
+                    self.logger.info(msg=f'sealed partition {previous}')
+
+    def close(self):
+        """
+        Closes the connection, errors while closing a broken connection are ignored.
+        """
+        if self.con is not None:
+            try:
+                self.cur.close()
+                self.con.close()
+            except sqlite3.Error:
+                pass
+        self.con = None
+        self.cur = None
+
+    def __recover(self, error: sqlite3.DatabaseError):
+        """
+        Rolls back the failed transaction, and opens the connection again unless the database was only locked.
+        :param error: the error raised while writing
+        """
+        if 'locked' in str(error) or 'busy' in str(error):
+            try:
+                self.con.rollback()
+                return
+            except sqlite3.Error:
+                pass
+        try:
+            self.connect()
+            self.reconnect_count += 1
+        except sqlite3.Error as e:
+            self.close()
+            if self.logger is not None:
+                self.logger.error(msg=f'reconnecting to {self.path} failed: {e}')
@@ -0,0 +1,160 @@
+"""
+This module contains a reader for telegrams framed by known bytes, with an overall deadline.
+
+readlines() on a serial connection only returns once the port timeout passes without new data,
+so every telegram costs at least one timeout of idle waiting. The FramedReader instead stops reading
+as soon as the end byte of the telegram (ETX) arrives, and gives up when the deadline passes,
+in which case the frame is marked as incomplete. Bytes before the start byte (STX for the Thies) are skipped.
+Fragments are read straight into one preallocated buffer, so a telegram spread over several OS reads
+is reassembled without concatenating (copying) the fragments.
+
+Classes:
+- Frame: Represents one telegram read from the sensor, with the timing of every stage.
+- FramedReader: Reads frames from a serial connection until the end byte or the deadline.
+
+Functions:
+- split_lines: Splits a frame in lines the way readlines() does.
+"""
+
+import time
+from typing import Callable, Dict, List, Union
+
+import serial
+
+
+STX = b'\x02'
+ETX = b'\x03'
+
+
+class Frame:
+    """
+    Class representing one telegram read from the sensor.
+
+    Attributes:
+    - data: the bytes of the telegram, from the start byte up to and including the end byte
+    - complete: whether the end byte was received before the deadline (and the telegram fitted in the buffer)
+    - timings: seconds spent in every stage of the read:
+        request (writing the request), first_byte (waiting for the sensor to answer),
+        transfer (first byte until the end byte or the deadline) and total
+    """
+
+    def __init__(self, data: bytes, complete: bool, timings: Dict[str, float]):
+        """
+        Constructor for Frame.
+        :param data: the bytes of the telegram
+        :param complete: whether the end byte was received before the deadline
+        :param timings: seconds spent in every stage of the read
+        """
+        self.data = data
+        self.complete = complete
+        self.timings = timings
+
+
+class FramedReader:
+    """
+    Class reading frames from a serial connection until the end byte or the deadline.
+
+    Attributes:
+    - serial_connection: the serial connection to read from
+    - start: the byte starting a frame, None if a frame starts with the first byte received
+    - end: the byte ending a frame
+    - deadline: seconds a whole read (request, answer and transfer) may take
+    - max_size: the size of the buffer, the longest frame that can be read
+    - monotonic: function returning the monotonic clock in seconds
+
+    Functions:
+    - read_frame: optionally writes a request, and reads a frame
+    """
+
+    def __init__(self, serial_connection: serial.Serial,  # pylint: disable=too-many-arguments
+                 start: Union[bytes, None] = None, end: bytes = ETX, deadline: float = 10.0,
+                 max_size: int = 8192, monotonic: Callable[[], float] = time.monotonic):
+        """
+        Constructor for FramedReader.
+        :param serial_connection: the serial connection to read from
+        :param start: the byte starting a frame, None if a frame starts with the first byte received
+        :param end: the byte ending a frame
+        :param deadline: seconds a whole read may take
+        :param max_size: the size of the buffer, the longest frame that can be read
+        :param monotonic: function returning the monotonic clock in seconds
+        """
+        self.serial_connection = serial_connection
+        self.start = start
+        self.end = end
+        self.deadline = deadline
+        self.max_size = max_size
+        self.monotonic = monotonic
+
+    def read_frame(self, request: Union[bytes, None] = None) -> Frame:
+        """
+        Optionally writes a request, and reads until the end byte or the deadline.
+        Every read asks for the bytes that are already waiting (at least one), so a read returns as soon as
+        data arrives, and the port timeout is lowered to the time left, so the deadline is never overrun.
+        :param request: the bytes to write before reading, None to only read
+        :return: the Frame, with complete set to False if the deadline passed before the end byte
+        """
+        start = self.monotonic()
+        if request is not None:
+            self.serial_connection.write(request)
+        requested = self.monotonic()
+
+        port_timeout = self.serial_connection.timeout
+        buffer = bytearray(self.max_size)
+        view = memoryview(buffer)
+        length = 0  # number of bytes in the buffer
+        frame_start = 0 if self.start is None else -1
+        frame_end = -1
+        first_byte = None
+        try:
+            while frame_end < 0 and length < self.max_size:
+                remaining = start + self.deadline - self.monotonic()
+                if remaining <= 0:
+                    break
+                if port_timeout is None or remaining < port_timeout:
+                    self.serial_connection.timeout = remaining
+                size = min(max(1, self.serial_connection.in_waiting), self.max_size - length)
+                received = self.serial_connection.readinto(view[length:length + size])
+                if not received:
+                    continue
+                if first_byte is None:
+                    first_byte = self.monotonic()
+                # only search the new bytes (and the bytes before them a marker could start in)
+                search_from = length
+                length += received
+                if frame_start < 0:
+                    frame_start = buffer.find(self.start, max(0, search_from - len(self.start) + 1), length)
+                    if frame_start < 0:
+                        continue
+                    search_from = frame_start + len(self.start)
+                frame_end = buffer.find(self.end, max(frame_start, search_from - len(self.end) + 1), length)
+        finally:
+            if self.serial_connection.timeout != port_timeout:
+                self.serial_connection.timeout = port_timeout
+
+        done = self.monotonic()
+        complete = frame_end >= 0
+        if complete:
+            data = view[frame_start:frame_end + len(self.end)]
+        elif frame_start >= 0:
+            data = view[frame_start:length]
+        else:
+            data = view[0:0]
+        timings = {'request': requested - start,
+                   'first_byte': (first_byte if first_byte is not None else done) - requested,
+                   'transfer': done - first_byte if first_byte is not None else 0.0,
+                   'total': done - start}
+        return Frame(data=data.tobytes(), complete=complete, timings=timings)
+
+
+def split_lines(data: bytes) -> List[bytes]:
+    """
+    Splits a frame in lines the way readlines() does: every line keeps its b'\\n',
+    and the bytes after the last b'\\n' (e.g. the ETX of the Parsivel) form the last line.
+    :param data: the bytes of the frame
+    :return: list of lines
+    """
+    lines = [line + b'\n' for line in data.split(b'\n')]
+    lines[-1] = lines[-1][:-1]
+    if len(lines[-1]) == 0:
+        lines.pop()
+    return lines
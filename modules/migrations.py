@@ -0,0 +1,608 @@
+"""
+This module contains the schema migrations of disdrodl.db, run by upgrade_db.py.
+
+Every migration has a version number and is recorded in the schema_version table once it is applied,
+so a database is only upgraded by the migrations it misses, in the order of their versions.
+A migration first changes the schema (e.g. adds a column) in one short transaction, and can then migrate the data:
+the rows are rewritten in batches of at most batch_size rows, one short transaction per batch, in the order of
+their id. The id of the last migrated row is stored in the schema_migration table in the same transaction as the
+batch, so an interrupted migration resumes after the last committed batch. Between the transactions the logger
+can write, so a migration can run on the database of a running logger without blocking it for minutes.
+The exceptions are the migrations that build an index over all rows in one transaction (BLOCKING): the logger
+cannot write until the index is built, which is logged as a warning with the number of rows beforehand.
+They can be skipped, and applied by a later run when the logger is stopped.
+
+Classes:
+- Migration: One numbered step of the schema, optionally migrating the data in batches.
+- RenameSensorId: Renames the parsivel_id column of old databases to sensor_id.
+- RangeIndex: Creates the (sensor_id, timestamp) index.
+- SpectrumBlob: Moves the spectrum field of existing rows from the telegram string into the spectrum BLOB column.
+- FieldColumns: Fills the typed columns of the scalar telegram fields of existing rows.
+- UniqueMinutes: Removes the duplicate rows of a sensor and minute, and makes the (sensor_id, timestamp) index unique.
+- ParsedColumn: Stores the parsed telegram fields of existing rows in the parsed BLOB column.
+- QualityFlag: Stores the quality flag of existing rows in the quality_flag column.
+
+Functions:
+- column_exists: Checks if a column exists in the disdrodl table.
+- telegram_fields: Splits a telegram string from the database into a dictionary of the field values.
+- create_version_tables: Creates the schema_version and schema_migration tables if they do not exist yet.
+- applied_versions: Returns the versions of the migrations applied to a database.
+- pending_migrations: Returns the migrations that are enabled by the config and not applied yet.
+- migrate: Applies the pending migrations to a database.
+- record_version: Records a migration as applied in the schema_version table.
+"""
+
+import sqlite3
+import time
+from datetime import datetime, timezone
+from logging import Logger
+from typing import Dict, List, Sequence, Tuple, Union
+
+from modules.sqldb import connect_db, create_range_index, create_unique_index, add_spectrum_column, field_columns, \
+    add_field_columns, field_value, add_parsed_column, add_quality_column
+from modules.quality import QUALITY_MISSING
+from modules.telegram import create_telegram, decode_telegrams
+
+
+def column_exists(cur, column_name: str) -> bool:
+    """
+    Function to check if a column exists in the disdrodl table
+    :param cur: the database cursor
+    :param column_name: the name of the column to check
+    :return: True if the column exists, False otherwise
+    """
+    # This query gets info about the table including the column names
+    cur.execute("PRAGMA table_info(disdrodl)")
+    columns = cur.fetchall()
+    for column in columns:
+        if column[1] == column_name:
+            return True
+    return False
+
+
+def telegram_fields(telegram_str: str) -> Dict[str, str]:
+    """
+    Splits a telegram string from the database (see Telegram.prep_telegram_data4db) into a dictionary,
+    without parsing the values, so the string can be joined again without changes.
+    Empty values are stored as 'None' and are kept as 'None'.
+    :param telegram_str: the telegram string, e.g. '01:0000.000; 02:0000.00; ...'
+    :return: dictionary of the value string per field, e.g. {'01': '0000.000', '02': '0000.00', ...}
+    """
+    fields = {}
+    if not telegram_str:
+        return fields
+    for keyval in telegram_str.split('; '):
+        # split at the first ':' only, e.g. the sensor time 20:10:13:21
+        field, _, value = keyval.partition(':')
+        fields[field] = value
+    return fields
+
+
+class Migration:
+    """
+    Class representing one numbered step of the schema of disdrodl.db.
+    Subclasses change the schema in migrate_schema, and can migrate the existing rows in migrate_rows.
+
+    Attributes:
+    - VERSION: the number of the migration, migrations are applied in the order of their number
+    - NAME: short description that is logged and stored in the schema_version table
+    - DATA: whether the migration migrates the existing rows in batches
+    - COLUMNS: the columns of the disdrodl table read for every batch
+- BLOCKING: whether the migration builds an index over all rows in one transaction, blocking the logger
+
+    Functions:
+    - enabled: whether the migration applies to the database of a config
+    - migrate_schema: changes the schema
+    - batch_query: returns the query of the next batch of rows
+    - migrate_rows: migrates one batch of rows
+    - finalize: changes the schema after the last batch
+    """
+
+    VERSION = 0
+    NAME = ''
+    DATA = False
+    COLUMNS = ('id',)
+    BLOCKING = False
+
+    def enabled(self, config_dict: Dict) -> bool:  # pylint: disable=unused-argument
+        """
+        Method telling whether the migration applies to the database of a config,
+        a migration that is not enabled is not recorded, so it is applied once the config enables it.
+        :param config_dict: the combined config dictionary
+        :return: True by default
+        """
+        return True
+
+    def migrate_schema(self, cur: sqlite3.Cursor, config_dict: Dict):
+        """
+        Method changing the schema, it should not fail when the change was already made.
+        :param cur: the database cursor, inside a transaction
+        :param config_dict: the combined config dictionary
+        """
+
+    def batch_query(self) -> str:
+        """
+        Method returning the query of the next batch of rows, with placeholders for the id of the last migrated row
+        and the size of the batch. The rows are read in the order of their id, so the primary key is used.
+        :return: the query string
+        """
+        return f"SELECT {', '.join(self.COLUMNS)} FROM disdrodl WHERE id > ? ORDER BY id LIMIT ?"
+
+    def migrate_rows(self, cur: sqlite3.Cursor, rows: List[Tuple], config_dict: Dict,  # pylint: disable=unused-argument
+                     logger: Logger) -> int:
+        """
+        Method migrating one batch of rows.
+        :param cur: the database cursor, inside the transaction of the batch
+        :param rows: the rows of the batch, as tuples of COLUMNS
+        :param config_dict: the combined config dictionary
+        :param logger: the logger object
+        :return: the number of rows that were changed
+        """
+        return 0
+
+    def finalize(self, cur: sqlite3.Cursor, config_dict: Dict):
+        """
+        Method changing the schema after the last batch of rows, in the transaction that records the version,
+        e.g. a constraint that only holds once all rows are migrated.
+        :param cur: the database cursor, inside a transaction
+        :param config_dict: the combined config dictionary
+        """
+
+
+class RenameSensorId(Migration):
+    """
+    Class renaming the parsivel_id column of databases of the first version of disdroDL to sensor_id.
+    """
+
+    VERSION = 1
+    NAME = 'rename parsivel_id to sensor_id'
+
+    def migrate_schema(self, cur: sqlite3.Cursor, config_dict: Dict):
+        """
+        Renames the column, if it exists.
+        :param cur: the database cursor, inside a transaction
+        :param config_dict: the combined config dictionary
+        """
+        if column_exists(cur, 'parsivel_id'):
+            cur.execute("ALTER TABLE disdrodl RENAME COLUMN parsivel_id TO sensor_id")
+
+
+class RangeIndex(Migration):
+    """
+    Class creating the (sensor_id, timestamp) index used by the range queries of the export.
+    The index is built from the existing rows in one transaction, which takes seconds for millions of rows
+    (minutes on an SD card), so the migration is BLOCKING.
+    It is not unique when the database has duplicate rows, until they are removed by UniqueMinutes.
+    """
+
+    VERSION = 2
+    NAME = 'index on (sensor_id, timestamp)'
+    BLOCKING = True
+
+    def migrate_schema(self, cur: sqlite3.Cursor, config_dict: Dict):
+        """
+        Creates the index, if neither it nor the unique index exists yet.
+        :param cur: the database cursor, inside a transaction
+        :param config_dict: the combined config dictionary
+        """
+        create_range_index(cur)
+
+
+class SpectrumBlob(Migration):
+    """
+    Class adding the spectrum BLOB column, and moving the spectrum field of the existing rows
+    from the telegram string into it, when the config stores the spectrum as blob or zlib.
+    Rows whose spectrum cannot be packed keep it in the telegram string, which the export reads as before.
+    """
+
+    VERSION = 3
+    NAME = 'spectrum BLOB column'
+    DATA = True
+    COLUMNS = ('id', 'timestamp', 'telegram')
+
+    def enabled(self, config_dict: Dict) -> bool:
+        """
+        Applies when db_spectrum_storage in the config is blob or zlib.
+        :param config_dict: the combined config dictionary
+        :return: whether the spectrum is not stored as text
+        """
+        return config_dict.get('db_spectrum_storage', 'text') != 'text'
+
+    def migrate_schema(self, cur: sqlite3.Cursor, config_dict: Dict):
+        """
+        Adds the spectrum column, if it does not exist yet.
+        :param cur: the database cursor, inside a transaction
+        :param config_dict: the combined config dictionary
+        """
+        add_spectrum_column(cur)
+
+    def batch_query(self) -> str:
+        """
+        Returns the query of the next batch of rows without a spectrum BLOB.
+        :return: the query string
+        """
+        return "SELECT id, timestamp, telegram FROM disdrodl WHERE id > ? AND spectrum IS NULL ORDER BY id LIMIT ?"
+
+    def migrate_rows(self, cur: sqlite3.Cursor, rows: List[Tuple], config_dict: Dict, logger: Logger) -> int:
+        """
+        Packs the spectrum of every row into the spectrum column, and removes it from the telegram string.
+        :param cur: the database cursor, inside the transaction of the batch
+        :param rows: the (id, timestamp, telegram) rows of the batch
+        :param config_dict: the combined config dictionary
+        :param logger: the logger object
+        :return: the number of rows that were changed
+        """
+        updates = []
+        for row_id, timestamp, telegram_str in rows:
+            telegram = create_telegram(config_dict=config_dict, telegram_lines=telegram_str,
+                                       timestamp=datetime.fromtimestamp(timestamp, tz=timezone.utc),
+                                       db_cursor=None, logger=logger, db_row_id=row_id,
+                                       telegram_data=telegram_fields(telegram_str))
+            if telegram is None or telegram.telegram_data.get(telegram.SPECTRUM_FIELD) in (None, 'None'):
+                continue
+            blob = telegram.spectrum2blob(compress=config_dict['db_spectrum_storage'] == 'zlib')
+            if blob is None:
+                continue
+            telegram.prep_telegram_data4db(exclude=(telegram.SPECTRUM_FIELD,))
+            updates.append((telegram.telegram_data_str, blob, row_id))
+        cur.executemany("UPDATE disdrodl SET telegram = ?, spectrum = ? WHERE id = ?", updates)
+        return len(updates)
+
+
+class FieldColumns(Migration):
+    """
+    Class adding the typed columns of the scalar telegram fields, and filling them for the existing rows,
+    when the config enables db_field_columns.
+    """
+
+    VERSION = 4
+    NAME = 'typed field columns'
+    DATA = True
+    COLUMNS = ('id', 'telegram')
+
+    def enabled(self, config_dict: Dict) -> bool:
+        """
+        Applies when db_field_columns in the config is true.
+        :param config_dict: the combined config dictionary
+        :return: whether the typed columns are enabled
+        """
+        return bool(config_dict.get('db_field_columns', False))
+
+    def migrate_schema(self, cur: sqlite3.Cursor, config_dict: Dict):
+        """
+        Adds the columns that do not exist yet.
+        :param cur: the database cursor, inside a transaction
+        :param config_dict: the combined config dictionary
+        """
+        add_field_columns(cur, field_columns(config_dict))
+
+    def migrate_rows(self, cur: sqlite3.Cursor, rows: List[Tuple], config_dict: Dict, logger: Logger) -> int:
+        """
+        Converts the values of the scalar fields in the telegram string of every row to the types of their columns.
+        :param cur: the database cursor, inside the transaction of the batch
+        :param rows: the (id, telegram) rows of the batch
+        :param config_dict: the combined config dictionary
+        :param logger: the logger object
+        :return: the number of rows that were changed
+        """
+        columns = field_columns(config_dict)
+        assignments = ', '.join(f'{column} = ?' for column, _ in columns.values())
+        updates = []
+        for row_id, telegram_str in rows:
+            fields = telegram_fields(telegram_str)
+            values = tuple(field_value(None if fields.get(field) == 'None' else fields.get(field), column_type)
+                           for field, (_, column_type) in columns.items())
+            updates.append(values + (row_id,))
+        cur.executemany(f"UPDATE disdrodl SET {assignments} WHERE id = ?", updates)
+        return len(updates)
+
+
+class UniqueMinutes(Migration):
+    """
+    Class removing the rows of a sensor and timestamp that were stored more than once (e.g. by a restart),
+    and making the (sensor_id, timestamp) index unique once they are removed, see sqldb.create_unique_index.
+    This is the only place the unique index is built on a table with rows, in the last transaction,
+    so the migration is BLOCKING. The duplicates are found with the index of RangeIndex.
+    Of the rows of a timestamp, the first one with a telegram is kept, or the first one if all are empty.
+    """
+
+    VERSION = 5
+    NAME = 'unique (sensor_id, timestamp)'
+    DATA = True
+    BLOCKING = True
+
+    def migrate_rows(self, cur: sqlite3.Cursor, rows: List[Tuple], config_dict: Dict, logger: Logger) -> int:
+        """
+        Deletes the rows of the batch for which a better row of the same sensor and timestamp exists,
+        the other rows are found with the (sensor_id, timestamp) index.
+        :param cur: the database cursor, inside the transaction of the batch
+        :param rows: the (id,) rows of the batch
+        :param config_dict: the combined config dictionary
+        :param logger: the logger object
+        :return: the number of rows that were deleted
+        """
+        cur.execute("""
+                    DELETE FROM disdrodl WHERE id >= ? AND id <= ? AND EXISTS (
+                        SELECT 1 FROM disdrodl AS twin
+                        WHERE twin.sensor_id = disdrodl.sensor_id AND twin.timestamp = disdrodl.timestamp
+                        AND twin.id != disdrodl.id
+                        AND (COALESCE(twin.telegram, '') != '', -twin.id) >
+                            (COALESCE(disdrodl.telegram, '') != '', -disdrodl.id)
+                    )
+                    """, (rows[0][0], rows[-1][0]))
+        if cur.rowcount:
+            logger.warning(msg=f'deleted {cur.rowcount} duplicate row(s) between id {rows[0][0]} and {rows[-1][0]}')
+        return cur.rowcount
+
+    def finalize(self, cur: sqlite3.Cursor, config_dict: Dict):
+        """
+        Replaces the (sensor_id, timestamp) index by the unique index.
+        :param cur: the database cursor, inside a transaction
+        :param config_dict: the combined config dictionary
+        :raises sqlite3.IntegrityError: if a duplicate row was stored after the batches, the migration is run again
+        """
+        if not create_unique_index(cur):
+            raise sqlite3.IntegrityError('duplicate (sensor_id, timestamp) rows were stored during the migration')
+
+
+class ParsedColumn(Migration):
+    """
+    Class adding the parsed BLOB column, and storing the parsed telegram fields of the existing rows in it,
+    when the config enables db_parsed_column, so the export no longer parses their telegram strings.
+    """
+
+    VERSION = 6
+    NAME = 'parsed BLOB column'
+    DATA = True
+
+    def enabled(self, config_dict: Dict) -> bool:
+        """
+        Applies when db_parsed_column in the config is true.
+        :param config_dict: the combined config dictionary
+        :return: whether the parsed column is enabled
+        """
+        return bool(config_dict.get('db_parsed_column', False))
+
+    def migrate_schema(self, cur: sqlite3.Cursor, config_dict: Dict):
+        """
+        Adds the parsed column, if it does not exist yet.
+        :param cur: the database cursor, inside a transaction
+        :param config_dict: the combined config dictionary
+        """
+        add_parsed_column(cur)
+
+    def batch_query(self) -> str:
+        """
+        Returns the query of the next batch of rows without a parsed BLOB.
+        :return: the query string
+        """
+        return "SELECT id, timestamp, telegram FROM disdrodl WHERE id > ? AND parsed IS NULL ORDER BY id LIMIT ?"
+
+    def migrate_rows(self, cur: sqlite3.Cursor, rows: List[Tuple], config_dict: Dict, logger: Logger) -> int:
+        """
+        Parses the telegram string of every row (with the spectrum from the spectrum column, if the row has one),
+        and stores the parsed fields in the parsed column.
+        :param cur: the database cursor, inside the transaction of the batch
+        :param rows: the (id, timestamp, telegram) rows of the batch
+        :param config_dict: the combined config dictionary
+        :param logger: the logger object
+        :return: the number of rows that were changed
+        """
+        spectra = {}
+        if column_exists(cur, 'spectrum'):
+            spectra = dict(cur.execute("SELECT id, spectrum FROM disdrodl WHERE id >= ? AND id <= ?",
+                                       (rows[0][0], rows[-1][0])).fetchall())
+        updates = []
+        for row_id, timestamp, telegram_str in rows:
+            telegram = create_telegram(config_dict=config_dict, telegram_lines=telegram_str,
+                                       timestamp=datetime.fromtimestamp(timestamp, tz=timezone.utc),
+                                       db_cursor=None, logger=logger, db_row_id=row_id,
+                                       telegram_data=telegram_fields(telegram_str), spectrum_blob=spectra.get(row_id))
+            if telegram is None:
+                continue
+            # the spectrum stays in the spectrum column
+            blob = telegram.parsed2blob(exclude=(telegram.SPECTRUM_FIELD,) if spectra.get(row_id) is not None else ())
+            if blob is not None:
+                updates.append((blob, row_id))
+        cur.executemany("UPDATE disdrodl SET parsed = ? WHERE id = ?", updates)
+        return len(updates)
+
+
+class QualityFlag(Migration):
+    """
+    Class adding the quality_flag column, and storing the quality flag of the existing rows in it,
+    when the config enables db_quality_column. The rows of a batch are checked at once (see telegram.decode_telegrams),
+    a row without data is missing.
+    """
+
+    VERSION = 7
+    NAME = 'quality_flag column'
+    DATA = True
+
+    def enabled(self, config_dict: Dict) -> bool:
+        """
+        Applies when db_quality_column in the config is true.
+        :param config_dict: the combined config dictionary
+        :return: whether the quality_flag column is enabled
+        """
+        return bool(config_dict.get('db_quality_column', False))
+
+    def migrate_schema(self, cur: sqlite3.Cursor, config_dict: Dict):
+        """
+        Adds the quality_flag column, if it does not exist yet.
+        :param cur: the database cursor, inside a transaction
+        :param config_dict: the combined config dictionary
+        """
+        add_quality_column(cur)
+
+    def batch_query(self) -> str:
+        """
+        Returns the query of the next batch of rows without a quality flag.
+        :return: the query string
+        """
+        return "SELECT id, timestamp, telegram FROM disdrodl WHERE id > ? AND quality_flag IS NULL ORDER BY id LIMIT ?"
+
+    def migrate_rows(self, cur: sqlite3.Cursor, rows: List[Tuple], config_dict: Dict, logger: Logger) -> int:
+        """
+        Decodes the telegrams of the batch (with the spectrum and parsed BLOB of the rows that have them),
+        and stores their quality flag in the quality_flag column.
+        :param cur: the database cursor, inside the transaction of the batch
+        :param rows: the (id, timestamp, telegram) rows of the batch
+        :param config_dict: the combined config dictionary
+        :param logger: the logger object
+        :return: the number of rows that were changed
+        """
+        blobs = {column: dict(cur.execute(f"SELECT id, {column} FROM disdrodl WHERE id >= ? AND id <= ?",
+                                          (rows[0][0], rows[-1][0])).fetchall())
+                 if column_exists(cur, column) else {} for column in ('spectrum', 'parsed')}
+        records = decode_telegrams(config_dict, [(row_id, timestamp, telegram_str, blobs['spectrum'].get(row_id),
+                                                  blobs['parsed'].get(row_id))
+                                                 for row_id, timestamp, telegram_str in rows], logger)
+        flags = dict(zip(records['id'].tolist(), records['quality_flag'].tolist()))
+        updates = [(flags.get(row_id, QUALITY_MISSING), row_id) for row_id, _, _ in rows]
+        cur.executemany("UPDATE disdrodl SET quality_flag = ? WHERE id = ?", updates)
+        return len(updates)
+
+
+MIGRATIONS = (RenameSensorId(), RangeIndex(), SpectrumBlob(), FieldColumns(), UniqueMinutes(), ParsedColumn(),
+              QualityFlag())
+
+
+def create_version_tables(cur: sqlite3.Cursor):
+    """
+    This function creates the schema_version table, with one row per applied migration,
+    and the schema_migration table, with the id of the last migrated row of the data migrations in progress.
+    :param cur: the database cursor
+    """
+    cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version
+                (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT,
+                    applied TEXT
+                )
+                """)
+    cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migration
+                (
+                    version INTEGER PRIMARY KEY,
+                    last_id INTEGER,
+                    rows INTEGER
+                )
+                """)
+
+
+def applied_versions(cur: sqlite3.Cursor) -> List[int]:
+    """
+    This function returns the versions of the migrations applied to a database.
+    :param cur: the database cursor
+    :return: sorted list of versions
+    """
+    return [row[0] for row in cur.execute("SELECT version FROM schema_version ORDER BY version").fetchall()]
+
+
+def pending_migrations(cur: sqlite3.Cursor, config_dict: Dict,
+                       migrations: Sequence[Migration] = MIGRATIONS) -> List[Migration]:
+    """
+    This function returns the migrations that are enabled by the config and not applied yet, in order of version.
+    :param cur: the database cursor
+    :param config_dict: the combined config dictionary
+    :param migrations: the migrations to choose from
+    :return: list of Migration objects
+    """
+    applied = set(applied_versions(cur))
+    return [migration for migration in sorted(migrations, key=lambda m: m.VERSION)
+            if migration.VERSION not in applied and migration.enabled(config_dict)]
+
+
+def migrate(dbpath, config_dict: Dict, logger: Logger,  # pylint: disable=too-many-arguments
+            batch_size: int = 1000, pause: float = 0.1, busy_timeout: float = 10.0,
+            max_batches: Union[int, None] = None, migrations: Sequence[Migration] = MIGRATIONS,
+            skip: Sequence[int] = ()) -> bool:
+    """
+    This function applies the pending migrations to a database, see the module docstring.
+    Every transaction is started with BEGIN IMMEDIATE, waiting at most busy_timeout for the logger to finish
+    writing, and holds the write lock for one batch only, except for the index of a BLOCKING migration.
+    :param dbpath: the path to the database
+    :param config_dict: the combined config dictionary
+    :param logger: the logger object to report the progress
+    :param batch_size: the maximum number of rows migrated in one transaction
+    :param pause: seconds to wait between two batches, so the logger gets the write lock
+    :param busy_timeout: seconds to wait for the write lock
+    :param max_batches: optional number of batches to stop after, the next call resumes the migration
+    :param migrations: the migrations to apply
+    :param skip: the versions of the migrations not to apply in this run, e.g. the BLOCKING ones while the logger
+                 is running, they are not recorded and are applied by a later run
+    :return: True if all migrations were applied, False if it stopped after max_batches or skipped a migration
+    """
+    con, cur = connect_db(dbpath=str(dbpath), timeout=busy_timeout)
+    con.isolation_level = None  # the transactions are started and committed explicitly
+    batches = 0
+    try:
+        create_version_tables(cur)
+        skipped = False
+        for migration in pending_migrations(cur, config_dict, migrations):
+            if migration.VERSION in skip:
+                logger.info(msg=f'{dbpath}: skipped migration {migration.VERSION} ({migration.NAME})')
+                skipped = True
+                continue
+            if migration.BLOCKING:
+                rows = cur.execute("SELECT COUNT(*) FROM disdrodl").fetchone()[0]
+                logger.warning(msg=f'{dbpath}: migration {migration.VERSION} ({migration.NAME}) builds an index over '
+                                   f'{rows} rows in one transaction, the logger cannot write until it is built')
+            cur.execute("BEGIN IMMEDIATE")
+            migration.migrate_schema(cur, config_dict)
+            if not migration.DATA:
+                record_version(cur, migration)
+            cur.execute("COMMIT")
+            if not migration.DATA:
+                logger.info(msg=f'{dbpath}: applied migration {migration.VERSION} ({migration.NAME})')
+                continue
+
+            row = cur.execute("SELECT last_id, rows FROM schema_migration WHERE version = ?",
+                              (migration.VERSION,)).fetchone()
+            last_id, migrated = row if row is not None else (0, 0)
+            total = migrated + cur.execute("SELECT COUNT(*) FROM disdrodl WHERE id > ?", (last_id,)).fetchone()[0]
+            if row is not None:
+                logger.info(msg=f'{dbpath}: resuming migration {migration.VERSION} ({migration.NAME}) '
+                                f'after row {last_id}')
+            while True:
+                if max_batches is not None and batches >= max_batches:
+                    logger.info(msg=f'{dbpath}: stopped migration {migration.VERSION} after {batches} batches')
+                    return False
+                cur.execute("BEGIN IMMEDIATE")
+                rows = cur.execute(migration.batch_query(), (last_id, batch_size)).fetchall()
+                if not rows:
+                    migration.finalize(cur, config_dict)
+                    record_version(cur, migration)
+                    cur.execute("DELETE FROM schema_migration WHERE version = ?", (migration.VERSION,))
+                    cur.execute("COMMIT")
+                    logger.info(msg=f'{dbpath}: applied migration {migration.VERSION} ({migration.NAME}), '
+                                    f'{migrated} rows migrated')
+                    break
+                changed = migration.migrate_rows(cur, rows, config_dict, logger)
+                last_id = rows[-1][0]
+                migrated += len(rows)
+                cur.execute("INSERT OR REPLACE INTO schema_migration(version, last_id, rows) VALUES (?, ?, ?)",
+                            (migration.VERSION, last_id, migrated))
+                cur.execute("COMMIT")
+                batches += 1
+                logger.info(msg=f'{dbpath}: migration {migration.VERSION} ({migration.NAME}): '
+                                f'{migrated}/{max(total, migrated)} rows ({changed} changed in this batch)')
+                time.sleep(pause)
+        return not skipped
+    finally:
+        if con.in_transaction:
+            cur.execute("ROLLBACK")
+        cur.close()
+        con.close()
+
+
+def record_version(cur: sqlite3.Cursor, migration: Migration):
+    """
+    This function records a migration as applied in the schema_version table.
+    :param cur: the database cursor, inside a transaction
+    :param migration: the applied Migration object
+    """
+    cur.execute("INSERT OR REPLACE INTO schema_version(version, name, applied) VALUES (?, ?, ?)",
+                (migration.VERSION, migration.NAME, datetime.now(timezone.utc).isoformat()))
@@ -9,7 +9,7 @@ Functions:
 
 import os
 import subprocess
-from datetime import datetime
+from datetime import datetime, timezone
 from venv import logger
 from logging import Logger
 from pathlib import Path
@@ -17,6 +17,9 @@ from typing import List, Dict, Union
 import numpy
 from cftime import date2num
 from netCDF4 import Dataset  # pylint: disable=no-name-in-module
+from modules.schema import compile_schema
+from modules.quality import QUALITY_FLAGS
+from modules.telegram import telegrams2records
 
 
 class NetCDF:
@@ -26,10 +29,12 @@ class NetCDF:
     Attributes:
     - logger: logger object for logging info related to the netCDF object
     - config_dict: a combined site specific and sensor type specific config file
+    - schema: the compiled schema of the telegram fields of config_dict, see schema.compile_schema
     - data_dir: directory for the netCDF file
     - fn_start: file name for the netCDF file
     - full_version: bool to indicate whether this netCDF is a full or light version
     - telegram_objs: list with all telegram objects
+    - records: structured array of the telegrams (see telegram.decode_telegrams), written instead of telegram_objs
     - date_dt: the date from when the data is
     - path_netCDF: full path for the netCDF file
     - path_netCDF_temp: additional temporary path for the netCDF file
@@ -39,6 +44,9 @@ class NetCDF:
     - write_data_to_netCDF: chooses the right function to write data to the netCDF file
     - write_data_to_netCDF_thies: writes data from ThiesTelegram objects to the netCDF file
     - write_data_to_netCDF_parsivel: writes data from ParsivelTelegram objects to the netCDF file
+    - write_records_to_netCDF: writes the structured array of the telegrams to the netCDF file
+    - __write_quality_flag: writes the quality flag of the telegrams to the quality_flag variable
+    - __telegram_records: converts the telegram objects into a structured array
     - compress: compresses the netCDF file
     - __set_netCDF_path: sets the path of the netCDF based on fn_start
     - __netcdf_populate_s4_var: populates netCDF S4 vars
@@ -50,17 +58,19 @@ class NetCDF:
 
     def __init__(self, logger: Logger, config_dict: Dict, data_dir: Path, fn_start: str, full_version,
                  # pylint: disable=redefined-outer-name
-                 telegram_objs: List[Dict],
-                 date: datetime) -> None:
+                 telegram_objs: Union[List[Dict], None],
+                 date: datetime, records: Union[numpy.ndarray, None] = None) -> None:
         """
         Constructor for NetCDF.
         """
         self.logger = logger
         self.config_dict = config_dict
+        self.schema = compile_schema(config_dict['telegram_fields'], config_dict.get('dimensions'))
         self.data_dir = data_dir
         self.fn_start = fn_start
         self.date_dt = date
         self.telegram_objs = telegram_objs
+        self.records = records
         self.full_version = full_version
         logger.debug(msg="NetCDF class is initialized")
 
@@ -79,13 +89,24 @@ class NetCDF:
     def write_data_to_netCDF(self):
         """
         This function choices the right function to write data to the netCDF file.
-        It uses the name of the telegram objects in self.telegram_objs to determine which function to use.
+        It uses the name of the telegram objects in self.telegram_objs to determine which function to use,
+        or writes self.records if the telegrams were decoded into a structured array.
+        The telegram objects of another sensor type (see registry.py), or with a telegram object without data
+        (e.g. an empty read), are converted into a structured array.
         """
+        if self.records is not None:
+            self.write_records_to_netCDF()
+            return
         telegram_instance = type(self.telegram_objs[0]).__name__
         write = {
             'ThiesTelegram': self.write_data_to_netCDF_thies,
             'ParsivelTelegram': self.write_data_to_netCDF_parsivel
         }
+        if telegram_instance not in write or \
+                any(obj.DATA_FIELD not in obj.telegram_data for obj in self.telegram_objs):
+            self.records = self.__telegram_records(log_errors=True)
+            self.write_records_to_netCDF()
+            return
         write[telegram_instance]()
 
     def write_data_to_netCDF_thies(self):
@@ -108,22 +129,20 @@ class NetCDF:
         netCDF_var_datetime = netCDF_rootgrp.variables['datetime']
         self.__netcdf_populate_s4_var(netCDF_var_=netCDF_var_datetime, var_key_='timestamp')
 
+        # NetCDF var: quality_flag
+        self.__write_quality_flag(nc_rootgrp=netCDF_rootgrp)
+
         # --- NetCDF variables in telegram_data ---
+        nc_fields = self.schema.nc_fields[self.full_version is True]
         for key in self.telegram_objs[0].telegram_data.keys():  # pylint: disable=too-many-nested-blocks
 
             # checks if key is not in the telegram fields or if the value from the telegram should not be added
             # to the netcdf (either should never be added or a light netcdf has been requested), if that is the
             # case go onto next key
-            if key not in self.config_dict['telegram_fields'].keys() or \
-                    ((self.full_version is True and
-                      self.config_dict['telegram_fields'][key].get('include_in_nc') == 'never') or
-                     (self.full_version is False and
-                      self.config_dict['telegram_fields'][key].get('include_in_nc') != 'always')):
+            if key not in nc_fields:
                 continue
 
-            field_dict = self.config_dict['telegram_fields'][key]
-            standard_name = field_dict['var_attrs']['standard_name']
-            netCDF_var = netCDF_rootgrp.variables[standard_name]
+            netCDF_var = netCDF_rootgrp.variables[nc_fields[key].variable]
 
             # import pdb; pdb.set_trace()
             # message for the debugger
@@ -199,22 +218,20 @@ class NetCDF:
         netCDF_var_datetime = netCDF_rootgrp.variables['datetime']
         self.__netcdf_populate_s4_var(netCDF_var_=netCDF_var_datetime, var_key_='timestamp')
 
+        # NetCDF var: quality_flag
+        self.__write_quality_flag(nc_rootgrp=netCDF_rootgrp)
+
         # --- NetCDF variables in telegram_data ---
+        nc_fields = self.schema.nc_fields[self.full_version is True]
         for key in self.telegram_objs[0].telegram_data.keys():  # pylint: disable=too-many-nested-blocks
 
             # checks if key is not in the telegram fields or if the value from the telegram should not be added
             # to the netcdf (either should never be added or a light netcdf has been requested), if that is the
             # case go onto next key
-            if not (key in self.config_dict['telegram_fields'].keys()) or \
-                    ((self.full_version is True and
-                      self.config_dict['telegram_fields'][key].get('include_in_nc') == 'never') or
-                     (self.full_version is False and
-                      self.config_dict['telegram_fields'][key].get('include_in_nc') != 'always')):
+            if key not in nc_fields:
                 continue
 
-            field_dict = self.config_dict['telegram_fields'][key]
-            standard_name = field_dict['var_attrs']['standard_name']
-            netCDF_var = netCDF_rootgrp.variables[standard_name]
+            netCDF_var = netCDF_rootgrp.variables[nc_fields[key].variable]
 
             # import pdb; pdb.set_trace()
             # message for the debugger
@@ -256,8 +273,9 @@ class NetCDF:
                             error_f93 = numpy.full(shape=(32, 32), fill_value='-99', dtype='<U3')
                             all_f93_items_val.append(error_f93)
                         else:
-                            # if list was of appropriate size reshapes it into a 32x32 matrix
-                            reshaped_f93 = numpy.array(telegram_obj.telegram_data[key]).reshape(32, 32)
+                            # if list was of appropriate size reshapes it into a 32x32 matrix,
+                            # a spectrum decoded into uint16 (see telegram.decode_spectrum) is reshaped without a copy
+                            reshaped_f93 = numpy.asarray(telegram_obj.telegram_data[key]).reshape(32, 32)
                             all_f93_items_val.append(reshaped_f93)
                             self.logger.debug(msg=f'F93 values from DB item {telegram_obj.db_row_id}'
                                                   f' from {telegram_obj.timestamp} successfully reshaped')
@@ -267,6 +285,76 @@ class NetCDF:
         netCDF_rootgrp.close()
         self.logger.info(msg='class NetCDF executed write_data_to_netCDF()')
 
+    def write_records_to_netCDF(self):
+        """
+        This function writes self.records, the structured array of the telegrams (see telegram.decode_telegrams),
+        to the netCDF file. Every variable in the telegram data is written with one assignment of its column,
+        except the S4 variables, which can only be assigned one element at a time.
+        """
+        netCDF_rootgrp = Dataset(self.path_netCDF, "a", format="NETCDF4")
+
+        # --- NetCDF variables NOT in telegram_data ---
+        timestamps = [datetime.fromtimestamp(timestamp, tz=timezone.utc) for timestamp in self.records['timestamp']]
+        netCDF_var_time = netCDF_rootgrp.variables['time']
+        netCDF_var_time[:] = date2num(timestamps, units=netCDF_var_time.units, calendar=netCDF_var_time.calendar)
+        netCDF_var_datetime = netCDF_rootgrp.variables['datetime']
+        for i, timestamp in enumerate(timestamps):
+            netCDF_var_datetime[i] = timestamp.isoformat()
+        self.__write_quality_flag(nc_rootgrp=netCDF_rootgrp)
+
+        # --- NetCDF variables in telegram_data ---
+        nc_fields = self.schema.nc_fields[self.full_version is True]
+        for key in self.records.dtype.names:
+            if key not in nc_fields:
+                continue
+            netCDF_var = netCDF_rootgrp.variables[nc_fields[key].variable]
+            column = self.records[key]
+            if netCDF_var.dtype == str:  # S4
+                for i, value in enumerate(column):
+                    netCDF_var[i] = value
+            # a field with a dimension that is not in the config is a column of strings, and not written
+            elif column.dtype != object and netCDF_var.ndim == column.ndim:
+                netCDF_var[:] = column
+
+        netCDF_rootgrp.close()
+        self.logger.info(msg='class NetCDF executed write_records_to_netCDF()')
+
+    def __write_quality_flag(self, nc_rootgrp):
+        """
+        This function writes the quality flag of every telegram (see quality.py) to the quality_flag variable,
+        if the config defines it. The flags of self.records are written as they are, the telegram data of
+        self.telegram_objs is checked at once, with the same checks (see telegram.telegrams2records).
+        :param nc_rootgrp: the root group of the netCDF file
+        """
+        if 'quality_flag' not in nc_rootgrp.variables:
+            return
+        records = self.records
+        if records is None:
+            records = self.__telegram_records()
+        flags = records['quality_flag']
+        nc_rootgrp.variables['quality_flag'][:] = flags
+        flagged = int(numpy.count_nonzero(flags))
+        if flagged:
+            self.logger.info(msg=f'{flagged} of {len(flags)} telegram(s) have a quality flag')
+
+    def __telegram_records(self, log_errors: bool = False):
+        """
+        This function converts the telegram data of self.telegram_objs into a structured array
+        (see telegram.telegrams2records). A telegram object without data is a record with fill values,
+        flagged with its quality flag, e.g. missing and truncated for a Thies telegram without all its values.
+        :param log_errors: whether to log the fields with the wrong number of values
+        :return: the structured array, with a record per telegram object
+        """
+        has_data = [obj.DATA_FIELD in obj.telegram_data for obj in self.telegram_objs]
+        return telegrams2records(self.config_dict,
+                                 [telegram_obj.db_row_id or 0 for telegram_obj in self.telegram_objs],
+                                 [telegram_obj.timestamp.timestamp() for telegram_obj in self.telegram_objs],
+                                 [telegram_obj.telegram_data if data else {}
+                                  for telegram_obj, data in zip(self.telegram_objs, has_data)],
+                                 self.logger if log_errors else None,
+                                 empty_flags=[None if data else telegram_obj.quality_flag()
+                                              for telegram_obj, data in zip(self.telegram_objs, has_data)])
+
     def compress(self):
         """
         This function compresses the netCDF file.
@@ -381,6 +469,10 @@ class NetCDF:
             for var_attr in one_var_dict['var_attrs']:
                 variable.__setattr__(var_attr,
                                      one_var_dict['var_attrs'][var_attr])  # pylint: disable=unnecessary-dunder-call
+            if key == 'quality_flag':
+                # CF flag attributes, from the bits of the quality flag in quality.py
+                variable.setncattr('flag_masks', numpy.array(list(QUALITY_FLAGS.values()), dtype=one_var_dict['dtype']))
+                variable.setncattr('flag_meanings', ' '.join(QUALITY_FLAGS))
             if key == 'time':
                 _start_dt = self.date_dt.replace(hour=0, minute=0, second=0).strftime("%Y-%m-%d %H:%M:%S")
                 variable.__setattr__('units',
@@ -16,11 +16,12 @@ class NowTime:
     - date_strings: Sets the string fields of the class to the respective string representations of the current time.
     """
 
-    def __init__(self):
+    def __init__(self, utc: datetime = None):
         """
         Constructor for NowTime.
+        :param utc: optional timezone aware datetime to represent instead of the current time
         """
-        self.utc = datetime.now(timezone.utc)
+        self.utc = datetime.now(timezone.utc) if utc is None else utc
         self.time_list = (self.utc.strftime("%H:%M:%S")).split(":")  # used to be: now_hour_min_secs
         # now_hour_min_secs = now_hour_min_secs.split(":")
         self.__date_strings()
@@ -0,0 +1,132 @@
+"""
+This module contains functionalities to split the database in one file per period, the partition files,
+e.g. disdrodl_202401.db next to disdrodl.db for monthly partitions (see the db_partitioning key of the site config).
+
+Functions:
+- partition_path: Returns the path of the partition file a timestamp is stored in.
+- partition_paths: Returns the existing partition files overlapping a range of timestamps.
+- query_partitions_gen: Queries the rows between two timestamps from the partition files overlapping the range.
+- seal_partition: Turns a partition file into one immutable file and writes its checksum.
+"""
+
+import hashlib
+import sqlite3
+from typing import List
+from datetime import datetime, timezone
+from pathlib import Path
+from modules.sqldb import connect_db, dict_factory
+
+# the database can be split in one file per period, e.g. disdrodl_202401.db for monthly partitions
+PARTITION_FORMATS = {'none': None, 'daily': '%Y%m%d', 'monthly': '%Y%m', 'yearly': '%Y'}
+# SQLite can attach at most 10 databases to one connection by default
+MAX_ATTACHED = 10
+
+
+def partition_path(dbpath, timestamp: datetime, partitioning: str) -> Path:
+    """
+    This function returns the path of the partition file a timestamp is stored in,
+    e.g. disdrodl_202401.db next to disdrodl.db for monthly partitions.
+    :param dbpath: the path of the database without partitions, e.g. /data/disdroDL/disdrodl.db
+    :param timestamp: the (UTC) time of the telegram
+    :param partitioning: none, daily, monthly or yearly
+    :return: the path of the partition file, dbpath itself if partitioning is none
+    """
+    dbpath = Path(dbpath)
+    if PARTITION_FORMATS[partitioning] is None:
+        return dbpath
+    suffix = timestamp.astimezone(timezone.utc).strftime(PARTITION_FORMATS[partitioning])
+    return dbpath.with_name(f'{dbpath.stem}_{suffix}{dbpath.suffix}')
+
+
+def partition_paths(dbpath, start_ts, end_ts, partitioning: str) -> List[Path]:
+    """
+    This function returns the existing partition files overlapping start_ts <= timestamp < end_ts, oldest first.
+    :param dbpath: the path of the database without partitions
+    :param start_ts: the first timestamp (seconds since epoch) of the range
+    :param end_ts: the timestamp (seconds since epoch) the range stops at, excluded
+    :param partitioning: none, daily, monthly or yearly
+    :return: list of paths
+    """
+    fmt = PARTITION_FORMATS[partitioning]
+    if fmt is None:
+        return [Path(dbpath)] if Path(dbpath).exists() else []
+    first = datetime.fromtimestamp(start_ts, tz=timezone.utc).strftime(fmt)
+    last = datetime.fromtimestamp(max(start_ts, end_ts - 1e-3), tz=timezone.utc).strftime(fmt)
+    dbpath = Path(dbpath)
+    paths = []
+    for path in sorted(dbpath.parent.glob(f'{dbpath.stem}_*{dbpath.suffix}')):
+        suffix = path.stem[len(dbpath.stem) + 1:]
+        if len(suffix) == len(first) and suffix.isdigit() and first <= suffix <= last:
+            paths.append(path)
+    return paths
+
+
+def query_partitions_gen(dbpath, start_ts, end_ts, partitioning: str,  # pylint: disable=too-many-arguments,too-many-locals
+                         sensor_id=None, logger=None):
+    """
+    This function queries the rows with start_ts <= timestamp < end_ts, ordered by timestamp, from the partition files
+    overlapping the range. The partitions are attached read-only to one connection, at most MAX_ATTACHED at a time,
+    and queried with one UNION ALL query per batch. Columns missing in older partitions are returned as None.
+    :param dbpath: the path of the database without partitions
+    :param start_ts: the first timestamp (seconds since epoch) to include
+    :param end_ts: the timestamp (seconds since epoch) to stop at, excluded
+    :param partitioning: none, daily, monthly or yearly
+    :param sensor_id: optional sensor_id (sensor name) to get the rows of
+    :param logger: optional logger object to log the queries
+    :return: the rows as dictionaries
+    """
+    paths = partition_paths(dbpath, start_ts, end_ts, partitioning)
+    con = sqlite3.connect('file::memory:', uri=True)
+    con.row_factory = dict_factory
+    where = "timestamp >= ? AND timestamp < ?" if sensor_id is None else \
+        "sensor_id = ? AND timestamp >= ? AND timestamp < ?"
+    params = (start_ts, end_ts) if sensor_id is None else (sensor_id, start_ts, end_ts)
+    try:
+        # the columns of all partitions, so every row has the same keys
+        table_columns = []
+        for path in paths:
+            con.execute("ATTACH DATABASE ? AS p0", (f'{path.resolve().as_uri()}?mode=ro',))
+            table_columns.append([column['name'] for column in
+                                  con.execute("PRAGMA p0.table_info(disdrodl)").fetchall()])
+            con.execute("DETACH DATABASE p0")
+        names = list(dict.fromkeys(name for columns in table_columns for name in columns))
+
+        for i in range(0, len(paths), MAX_ATTACHED):
+            batch = paths[i:i + MAX_ATTACHED]
+            for j, path in enumerate(batch):
+                con.execute(f"ATTACH DATABASE ? AS p{j}", (f'{path.resolve().as_uri()}?mode=ro',))
+            selects = []
+            for j, columns in enumerate(table_columns[i:i + MAX_ATTACHED]):
+                select_list = ', '.join(name if name in columns else f'NULL AS {name}' for name in names)
+                selects.append(f"SELECT {select_list} FROM p{j}.disdrodl WHERE {where}")
+            query_str = ' UNION ALL '.join(selects) + ' ORDER BY timestamp'
+            if logger is not None:
+                logger.debug(msg=f'querying {", ".join(path.name for path in batch)}: {where} {params}')
+            yield from con.execute(query_str, params * len(batch)).fetchall()
+            for j in range(len(batch)):
+                con.execute(f"DETACH DATABASE p{j}")
+    finally:
+        con.close()
+
+
+def seal_partition(path) -> str:
+    """
+    This function turns a partition file that is no longer written into one immutable file,
+    by moving the WAL into the file and switching off WAL journaling, and writes its SHA-256 checksum
+    next to it (path + '.sha256', in the format of sha256sum), so it can be verified and shipped once.
+    :param path: the path of the partition file
+    :return: the checksum
+    """
+    path = Path(path)
+    con, cur = connect_db(dbpath=str(path))
+    cur.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    cur.execute("PRAGMA journal_mode=DELETE")
+    cur.close()
+    con.close()
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(block)
+    checksum = sha256.hexdigest()
+    Path(f'{path}.sha256').write_text(f'{checksum}  {path.name}\n', encoding='utf-8')
+    return checksum
@@ -0,0 +1,402 @@
+"""
+This module contains the pipeline that decouples reading the sensors from writing to the database.
+
+The acquisition stage (the minute loop in main.py) only reads the telegram and puts the Telegram object
+in a bounded in-memory queue. The persistence stage is a writer thread that takes the telegrams from the queue,
+parses them and commits them in batches, one transaction per database. A slow fsync (e.g. on the SD card
+of a Raspberry Pi) therefore only delays the writer thread, never the next serial read.
+When the queue is full, the overflow policy decides which telegram is lost.
+With the spool enabled, the writer thread first appends the rows to a Spool (see modules/spool.py),
+so telegrams that cannot be written because the database is unavailable are kept on disk
+and replayed in bulk once it is available again, instead of being lost.
+
+Classes:
+- TelegramQueue: Bounded queue of telegrams with an overflow policy and queue depth metrics.
+- TelegramPipeline: Writer thread committing the telegrams from a TelegramQueue in batches.
+"""
+
+import itertools
+import queue
+import threading
+import time
+from logging import Logger
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple, Union
+
+from modules.spool import Spool
+from modules.db_writer import DBWriter
+
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+
+class TelegramQueue:
+    """
+    Class representing a bounded queue of (database path, telegram) items.
+
+    Attributes:
+    - maxsize: the maximum number of telegrams in the queue
+    - overflow: the overflow policy when the queue is full:
+        drop_oldest drops the oldest telegram in the queue, drop_newest drops the telegram being put,
+        block waits up to block_timeout seconds for room and then drops the telegram being put
+    - block_timeout: seconds put waits for room with the block policy
+    - enqueued: number of telegrams put in the queue
+    - dropped: number of telegrams lost because the queue was full
+    - max_depth: the largest number of telegrams that were in the queue at once
+
+    Functions:
+    - put: puts a telegram in the queue, applying the overflow policy when it is full
+    - get_batch: takes up to batch_size telegrams from the queue
+    - depth: returns the number of telegrams in the queue
+    """
+
+    def __init__(self, maxsize: int = 60, overflow: str = 'drop_oldest', block_timeout: float = 5.0):
+        """
+        Constructor for TelegramQueue.
+        :param maxsize: the maximum number of telegrams in the queue
+        :param overflow: the overflow policy, one of drop_oldest, drop_newest or block
+        :param block_timeout: seconds put waits for room with the block policy
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'overflow should be one of {OVERFLOW_POLICIES}, not {overflow}')
+        if maxsize < 1:
+            raise ValueError(f'maxsize should be at least 1, not {maxsize}')
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.enqueued = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def put(self, db_path, telegram) -> bool:
+        """
+        Puts a telegram in the queue, applying the overflow policy when it is full.
+        :param db_path: the path of the database the telegram should be written to
+        :param telegram: the Telegram object
+        :return: True if the telegram was queued, False if it was dropped
+        """
+        item = (db_path, telegram)
+        if self.overflow == 'block':
+            try:
+                self._queue.put(item, timeout=self.block_timeout)
+            except queue.Full:
+                return self.__drop()
+            return self.__count_put()
+
+        with self._lock:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                if self.overflow == 'drop_newest':
+                    return self.__drop()
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+                self._queue.put_nowait(item)
+                self.dropped += 1
+            return self.__count_put()
+
+    def get_batch(self, batch_size: int, timeout: float) -> List[Tuple]:
+        """
+        Takes up to batch_size telegrams from the queue.
+        Waits up to timeout seconds for the first telegram, the others are only taken if they are already queued.
+        :param batch_size: the maximum number of telegrams to take
+        :param timeout: seconds to wait for the first telegram
+        :return: list of (database path, telegram) items, empty if nothing arrived in time
+        """
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def depth(self) -> int:
+        """
+        Returns the number of telegrams in the queue.
+        :return: the queue depth
+        """
+        return self._queue.qsize()
+
+    def __count_put(self) -> bool:
+        """
+        Updates the metrics after a telegram was queued.
+        :return: True
+        """
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    def __drop(self) -> bool:
+        """
+        Updates the metrics after the telegram being put was dropped.
+        :return: False
+        """
+        self.dropped += 1
+        return False
+
+
+class TelegramPipeline:  # pylint: disable=too-many-instance-attributes
+    """
+    Class running the persistence stage: a writer thread committing the queued telegrams in batches.
+    The DBWriter objects are created and closed by the writer thread itself,
+    since an sqlite3 connection can only be used by the thread that created it.
+
+    Attributes:
+    - queue: the TelegramQueue shared with the acquisition stage
+    - create_writer: function creating the DBWriter for a database path
+    - logger: optional logger
+    - batch_size: the maximum number of telegrams committed in one batch
+    - batch_timeout: seconds the writer thread waits for a telegram before checking whether it should stop
+    - written: number of telegrams committed to the database
+    - failed: number of telegrams that could not be written
+    - batches: number of batches written
+    - last_write_duration: seconds the last batch took to write
+    - spool: whether the rows are appended to a spool before they are written to the database
+    - spool_sync_interval: the maximum number of seconds between two fsyncs of a spool
+    - replay_batch_size: the maximum number of spooled rows inserted in one transaction
+    - replay_interval: seconds between two attempts to replay a spool while the database is unavailable
+    - replayed: number of records read back from the spools, and committed or skipped as committed before
+
+    Functions:
+    - start: starts the writer thread
+    - put: hands a telegram to the writer thread
+    - stop: writes the telegrams still in the queue and stops the writer thread
+    - metrics: returns the queue and writer metrics
+    """
+
+    def __init__(self, create_writer: Callable[[str], DBWriter],  # pylint: disable=too-many-arguments
+                 logger: Union[Logger, None] = None, maxsize: int = 60, overflow: str = 'drop_oldest',
+                 batch_size: int = 32, batch_timeout: float = 1.0, spool: bool = False, spool_sync_interval: float = 60.0,
+                 replay_batch_size: int = 5000, replay_interval: float = 30.0):
+        """
+        Constructor for TelegramPipeline.
+        :param create_writer: function creating the DBWriter for a database path
+        :param logger: optional logger
+        :param maxsize: the maximum number of telegrams in the queue
+        :param overflow: the overflow policy of the queue, one of drop_oldest, drop_newest or block
+        :param batch_size: the maximum number of telegrams committed in one batch
+        :param batch_timeout: seconds the writer thread waits for a telegram before checking whether it should stop
+        :param spool: whether the rows are appended to a spool before they are written to the database,
+                      the spool of a database is kept in the spool directory next to it (see Spool)
+        :param spool_sync_interval: the maximum number of seconds between two fsyncs of a spool
+        :param replay_batch_size: the maximum number of spooled rows inserted in one transaction
+        :param replay_interval: seconds between two attempts to replay a spool while the database is unavailable
+        """
+        self.queue = TelegramQueue(maxsize=maxsize, overflow=overflow)
+        self.create_writer = create_writer
+        self.logger = logger
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_write_duration = 0.0
+        self.spool = spool
+        self.spool_sync_interval = spool_sync_interval
+        self.replay_batch_size = replay_batch_size
+        self.replay_interval = replay_interval
+        self.replayed = 0
+        self._spools = {}
+        self._last_replay = 0.0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the writer thread.
+        """
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.__run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def put(self, db_path, telegram) -> bool:
+        """
+        Hands a telegram to the writer thread, never waiting for the database.
+        :param db_path: the path of the database the telegram should be written to
+        :param telegram: the Telegram object
+        :return: True if the telegram was queued, False if it was dropped by the overflow policy
+        """
+        queued = self.queue.put(db_path, telegram)
+        if not queued and self.logger is not None:
+            self.logger.error(msg=f'telegram queue full ({self.queue.maxsize}), '
+                                  f'dropped telegram of {telegram.timestamp.isoformat()}')
+        return queued
+
+    def stop(self, timeout: Union[float, None] = None):
+        """
+        Writes the telegrams still in the queue and stops the writer thread.
+        :param timeout: seconds to wait for the writer thread, None waits until the queue is written
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def metrics(self) -> Dict:
+        """
+        Returns the queue and writer metrics.
+        :return: dictionary with the current queue depth and the counters
+        """
+        return {'depth': self.queue.depth(),
+                'max_depth': self.queue.max_depth,
+                'enqueued': self.queue.enqueued,
+                'dropped': self.queue.dropped,
+                'written': self.written,
+                'failed': self.failed,
+                'batches': self.batches,
+                'last_write_duration': self.last_write_duration,
+                'spool_backlog': sum(spool.backlog() for spool in self._spools.values()),
+                'replayed': self.replayed}
+
+    def __run(self):
+        """
+        Main loop of the writer thread, runs until stop is called and the queue is empty.
+        """
+        db_writers = {}
+        try:
+            while True:
+                batch = self.queue.get_batch(batch_size=self.batch_size, timeout=self.batch_timeout)
+                if batch:
+                    self.__write(batch, db_writers)
+                elif self._stop_event.is_set():
+                    break
+                if time.monotonic() - self._last_replay >= self.replay_interval:
+                    self.__replay_spools(db_writers)
+        finally:
+            for spool in self._spools.values():
+                spool.close()
+            self._spools = {}
+            for db_writer in db_writers.values():
+                db_writer.close()
+
+    def __write(self, batch: List[Tuple], db_writers: Dict):
+        """
+        Writes a batch of telegrams, with one transaction per database.
+        :param batch: list of (database path, telegram) items
+        :param db_writers: dictionary of the DBWriter objects of the writer thread per database path
+        """
+        start = time.monotonic()
+        telegrams_per_db = {}
+        for db_path, telegram in batch:
+            telegrams_per_db.setdefault(db_path, []).append(telegram)
+
+        for db_path, telegrams in telegrams_per_db.items():
+            try:
+                if db_path not in db_writers:
+                    db_writers[db_path] = self.create_writer(db_path)
+                if not self.spool:
+                    success = db_writers[db_path].write(telegrams)
+                else:
+                    success = self.__write_spooled(db_path, db_writers[db_path], telegrams)
+            except Exception as e:  # pylint: disable=broad-except
+                # the writer thread should keep running, whatever goes wrong with one batch
+                success = False
+                if self.logger is not None:
+                    self.logger.error(msg=f'writing telegrams to {db_path} failed: {e}')
+
+            if success:
+                self.written += len(telegrams)
+            else:
+                self.failed += len(telegrams)
+                if self.logger is not None:
+                    self.logger.error(msg=f'{len(telegrams)} telegrams could not be written to {db_path}')
+
+        self.batches += 1
+        self.last_write_duration = time.monotonic() - start
+
+    def __spool(self, db_path, db_writer: DBWriter) -> Spool:
+        """
+        Returns the spool of a database, opening it when it is used for the first time.
+        The spool is tied to the id of the database file, so the segments left for a database that was deleted
+        or replaced are moved aside instead of being replayed into the new one (see Spool).
+        :param db_path: the path of the database
+        :param db_writer: the DBWriter of the database
+        :return: the Spool object
+        """
+        if db_path not in self._spools:
+            spool = Spool(directory=Path(db_path).parent / 'spool', name=Path(db_path).stem,
+                          sync_interval=self.spool_sync_interval, database_id=db_writer.database_id())
+            if spool.set_aside is not None and self.logger is not None:
+                self.logger.warning(msg=f'the spool of {db_path} was written for another database file, '
+                                        f'its segments are not replayed but moved to {spool.set_aside}')
+            self._spools[db_path] = spool
+        return self._spools[db_path]
+
+    def __write_spooled(self, db_path, db_writer: DBWriter, telegrams: List) -> bool:
+        """
+        Appends the telegrams to the spool of the database, and writes them to the database.
+        Without a backlog the appended records are written directly, otherwise the spool is replayed.
+        :param db_path: the path of the database
+        :param db_writer: the DBWriter of the database
+        :param telegrams: list of Telegram objects
+        :return: True if the telegrams were committed, False if they stay in the spool
+        """
+        spool = self.__spool(db_path, db_writer)
+        backlog = spool.backlog()
+        records = spool.append([db_writer.db_row(telegram) for telegram in telegrams])
+        if backlog:
+            return self.__replay(db_path, db_writer, spool)
+        if db_writer.write_rows(records, spool=spool.name):
+            spool.release(records[-1][0])
+            return True
+        spool.sync()
+        if self.logger is not None:
+            self.logger.error(msg=f'{db_path} unavailable, telegrams are kept in the spool')
+        return False
+
+    def __replay_spools(self, db_writers: Dict):
+        """
+        Replays the spools with a backlog, e.g. after the database was unavailable or after a restart.
+        :param db_writers: dictionary of the DBWriter objects of the writer thread per database path
+        """
+        self._last_replay = time.monotonic()
+        if not self.spool:
+            return
+        for db_path, spool in list(self._spools.items()):
+            if not spool.backlog():
+                continue
+            try:
+                if db_path not in db_writers:
+                    db_writers[db_path] = self.create_writer(db_path)
+                self.__replay(db_path, db_writers[db_path], spool)
+            except Exception as e:  # pylint: disable=broad-except
+                if self.logger is not None:
+                    self.logger.error(msg=f'replaying the spool of {db_path} failed: {e}')
+
+    def __replay(self, db_path, db_writer: DBWriter, spool: Spool) -> bool:
+        """
+        Inserts the records of the spool that are not in the database yet, replay_batch_size rows per transaction.
+        :param db_path: the path of the database
+        :param db_writer: the DBWriter of the database
+        :param spool: the Spool of the database
+        :return: True if the spool was replayed completely, False if writing to the database failed
+        """
+        self._last_replay = time.monotonic()
+        start = spool.replayed
+        replayed = 0
+        records = spool.records(after=spool.replayed)
+        while True:
+            batch = list(itertools.islice(records, self.replay_batch_size))
+            if not batch:
+                spool.release(spool.position)
+                break
+            if not db_writer.write_rows(batch, spool=spool.name):
+                spool.sync()
+                if self.logger is not None:
+                    self.logger.error(msg=f'{db_path} unavailable, telegrams are kept in the spool')
+                return False
+            spool.release(batch[-1][0])
+            replayed += len(batch)
+        self.replayed += replayed
+        if self.logger is not None and start != spool.position:
+            self.logger.info(msg=f'replayed {replayed} spooled telegram(s) into {db_path} '
+                                 f'in {time.monotonic() - self._last_replay:.1f}s')
+        return True
@@ -0,0 +1,67 @@
+"""
+This module contains the quality flag of a telegram: a bitmask per minute, stored in the database next to
+the telegram and written to the NetCDF as the quality_flag variable, so the quality control of a day or a year
+of data is a NumPy operation, e.g. (quality_flag & QUALITY_TRUNCATED) != 0, instead of searching the logs.
+
+The bits of the flag:
+- QUALITY_MISSING: the sensor returned no data, or a numeric field of the telegram is empty or not a number
+- QUALITY_TRUNCATED: the telegram does not have all its values, e.g. a Thies telegram without 526 values,
+  or a field with dimensions (the spectrum) with the wrong number of values
+- QUALITY_OUT_OF_RANGE: a value is outside the valid_min/valid_max of its field in the config
+- QUALITY_SENSOR_ERROR: a status or error code field of the sensor (sensor_error: true in the config) is not 0
+
+Functions:
+- scalar_flags: Returns the quality flags of a typed column of a scalar field of many telegrams at once.
+- flag_meanings: Returns the names of the bits set in a quality flag.
+"""
+
+from typing import List
+
+import numpy
+
+from modules.schema import FieldSchema
+
+QUALITY_MISSING = 1
+QUALITY_TRUNCATED = 2
+QUALITY_OUT_OF_RANGE = 4
+QUALITY_SENSOR_ERROR = 8
+# the bits of the quality flag by their name, in the order of the flag_masks and flag_meanings NetCDF attributes
+QUALITY_FLAGS = {'missing': QUALITY_MISSING, 'truncated': QUALITY_TRUNCATED, 'out_of_range': QUALITY_OUT_OF_RANGE,
+                 'sensor_error': QUALITY_SENSOR_ERROR}
+# the NumPy dtype of the quality flags, its NetCDF dtype is QUALITY_NC_DTYPE
+QUALITY_DTYPE = numpy.uint8
+QUALITY_NC_DTYPE = 'i2'
+
+
+def scalar_flags(field_schema: FieldSchema, column: numpy.ndarray, present: numpy.ndarray) -> numpy.ndarray:
+    """
+    This function returns the quality flags of the column of a scalar field of many telegrams at once,
+    as telegram.scalar_column returns it: missing where a telegram has the field but it is not a number,
+    out of range where the value is outside the valid_min/valid_max of the field, and sensor error where
+    a sensor_error field is not 0. Telegrams without the field are not flagged.
+    :param field_schema: the compiled config of the field
+    :param column: the typed values of the field, the fill value of the field where there is no number
+    :param present: boolean array, True for the telegrams that have the field
+    :return: array of QUALITY_DTYPE with the flags of every telegram
+    """
+    flags = numpy.zeros(len(column), dtype=QUALITY_DTYPE)
+    filled = column == numpy.asarray(field_schema.fill_value).astype(column.dtype)
+    flags[present & filled] |= QUALITY_MISSING
+    valid = present & ~filled
+    # the limits are compared in the dtype of the column, e.g. 99.999 as float32
+    if field_schema.valid_min is not None:
+        flags[valid & (column < numpy.asarray(field_schema.valid_min).astype(column.dtype))] |= QUALITY_OUT_OF_RANGE
+    if field_schema.valid_max is not None:
+        flags[valid & (column > numpy.asarray(field_schema.valid_max).astype(column.dtype))] |= QUALITY_OUT_OF_RANGE
+    if field_schema.sensor_error:
+        flags[valid & (column != 0)] |= QUALITY_SENSOR_ERROR
+    return flags
+
+
+def flag_meanings(flag: int) -> List[str]:
+    """
+    This function returns the names of the bits set in a quality flag, e.g. for a log message.
+    :param flag: the quality flag
+    :return: the names, e.g. ['missing', 'truncated'], empty for a telegram without problems
+    """
+    return [name for name, mask in QUALITY_FLAGS.items() if flag & mask]
@@ -0,0 +1,175 @@
+"""
+This module contains the registry of the supported sensor types: per sensor type (the sensor_type in the global_attrs
+of the site config) its Sensor class, Telegram class, general config and bulk decoder. The classes and the decoder
+are given as 'module:attribute' references, which are only imported when they are first used, so e.g. the export
+does not import the serial drivers, and a logger of a Parsivel does not import what only another sensor type uses.
+
+A new disdrometer model is added without editing the core modules, by registering its SensorEntry:
+- in code, with register_sensor, e.g. in the module that implements its Sensor and Telegram classes, or
+- from an installed package, with an entry point in the group disdrodl.sensors named by its sensor type,
+  which refers to its SensorEntry (or a function returning it), and is only loaded when that sensor type is looked up.
+
+Functions:
+- register_sensor: Registers the entry of a sensor type.
+- get_sensor_entry: Returns the entry of a sensor type, from the registered entries or the installed entry points.
+- sensor_types: Returns the registered sensor types.
+- load_reference: Returns the object of a 'module:attribute' reference, importing its module.
+
+Classes:
+- SensorEntry: Represents the classes, general config and decoder of one sensor type.
+"""
+
+from importlib import import_module
+from importlib.metadata import entry_points
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Union
+
+# the group of the entry points of installed packages that add a sensor type
+ENTRY_POINT_GROUP = 'disdrodl.sensors'
+
+# the registered entries, by their sensor type
+_entries: Dict[str, 'SensorEntry'] = {}
+
+
+def load_reference(reference: Union[str, Any]) -> Any:
+    """
+    This function returns the object of a 'module:attribute' reference, e.g. 'modules.sensors:Parsivel',
+    importing its module (once, later calls get the module from sys.modules).
+    :param reference: the reference, or the object itself, which is returned as it is
+    :return: the object
+    """
+    if not isinstance(reference, str):
+        return reference
+    module_name, _, attribute = reference.partition(':')
+    obj = import_module(module_name)
+    for name in attribute.split('.') if attribute else ():
+        obj = getattr(obj, name)
+    return obj
+
+
+class SensorEntry:
+    """
+    Class representing the classes, general config and decoder of one sensor type.
+    The classes and the decoder are imported when they are first used, see load_reference. They are looked up
+    in their module on every use (after the first import that is a dictionary lookup), so a patched class is used.
+
+    Attributes:
+    - sensor_type: the sensor type, as in the global_attrs of the site config, e.g. 'OTT Hydromet Parsivel2'
+    - general_config: the file name of the general config in configs_netcdf, or the absolute path of the general config
+    - sensor_id_argument: the keyword argument of the Sensor class that takes the sensor id, None if it takes none
+    - sensor_class: the Sensor class (imported when it is first used)
+    - telegram_class: the Telegram class (imported when it is first used)
+    - decoder: the function decoding a batch of database rows at once, see telegram.decode_telegrams
+      (imported when it is first used)
+
+    Functions:
+    - create_sensor: creates a Sensor object of the sensor type
+    - general_config_path: returns the path of the general config
+    """
+
+    def __init__(self, sensor_type: str, sensor_class: Union[str, type],  # pylint: disable=too-many-arguments,too-many-positional-arguments
+                 telegram_class: Union[str, type], general_config: Union[str, Path],
+                 decoder: Union[str, Callable] = 'modules.telegram:decode_telegrams',
+                 sensor_id_argument: Union[str, None] = None):
+        """
+        Constructor for SensorEntry.
+        :param sensor_type: the sensor type, as in the global_attrs of the site config
+        :param sensor_class: the 'module:attribute' reference of the Sensor class, or the class
+        :param telegram_class: the 'module:attribute' reference of the Telegram class, or the class
+        :param general_config: the file name of the general config in configs_netcdf, or its absolute path
+        :param decoder: the 'module:attribute' reference of the bulk decoder, or the function
+        :param sensor_id_argument: the keyword argument of the Sensor class that takes the sensor id, if any
+        """
+        self.sensor_type = sensor_type
+        self.general_config = general_config
+        self.sensor_id_argument = sensor_id_argument
+        self._references = {'sensor_class': sensor_class, 'telegram_class': telegram_class, 'decoder': decoder}
+
+    def _load(self, name: str) -> Any:
+        """
+        Method returning a class or function of the entry, its module is imported the first time.
+        :param name: sensor_class, telegram_class or decoder
+        :return: the class or function
+        """
+        return load_reference(self._references[name])
+
+    @property
+    def sensor_class(self) -> Callable:
+        """
+        The Sensor class of the sensor type
+        """
+        return self._load('sensor_class')
+
+    @property
+    def telegram_class(self) -> Callable:
+        """
+        The Telegram class of the sensor type
+        """
+        return self._load('telegram_class')
+
+    @property
+    def decoder(self) -> Callable:
+        """
+        The function decoding a batch of database rows of the sensor type at once, see telegram.decode_telegrams
+        """
+        return self._load('decoder')
+
+    def create_sensor(self, sensor_id: str = '00'):
+        """
+        Method creating a Sensor object of the sensor type.
+        :param sensor_id: the sensor id, for sensor types that address the sensor by its id (e.g. the Thies)
+        :return: the Sensor object
+        """
+        kwargs = {} if self.sensor_id_argument is None else {self.sensor_id_argument: sensor_id}
+        return self._load('sensor_class')(**kwargs)
+
+    def general_config_path(self, path: Path) -> Path:
+        """
+        Method returning the path of the general config of the sensor type.
+        :param path: the directory with the configs_netcdf directory, e.g. the directory of the scripts
+        :return: the path of the general config
+        """
+        return Path(path) / 'configs_netcdf' / self.general_config
+
+
+def register_sensor(entry: SensorEntry, replace: bool = True):
+    """
+    This function registers the entry of a sensor type.
+    :param entry: the SensorEntry
+    :param replace: whether to replace the entry of a sensor type that is already registered
+    """
+    if replace or entry.sensor_type not in _entries:
+        _entries[entry.sensor_type] = entry
+
+
+def get_sensor_entry(sensor_type: str) -> SensorEntry:
+    """
+    This function returns the entry of a sensor type. A sensor type that is not registered is looked up
+    in the entry points of the installed packages (group disdrodl.sensors), only the matching entry point is loaded.
+    :param sensor_type: the sensor type, as in the global_attrs of the site config
+    :return: the SensorEntry
+    :raises KeyError: if the sensor type is not registered and no entry point provides it
+    """
+    if sensor_type not in _entries:
+        for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+            if entry_point.name == sensor_type:
+                entry = entry_point.load()
+                register_sensor(entry if isinstance(entry, SensorEntry) else entry(), replace=False)
+                break
+    return _entries[sensor_type]
+
+
+def sensor_types() -> List[str]:
+    """
+    This function returns the registered sensor types, without loading the entry points.
+    :return: the sensor types, in the order they were registered
+    """
+    return list(_entries)
+
+
+register_sensor(SensorEntry(sensor_type='OTT Hydromet Parsivel2', sensor_class='modules.sensors:Parsivel',
+                            telegram_class='modules.telegram:ParsivelTelegram',
+                            general_config='config_general_parsivel.yml'))
+register_sensor(SensorEntry(sensor_type='Thies Clima', sensor_class='modules.sensors:Thies',
+                            telegram_class='modules.telegram:ThiesTelegram',
+                            general_config='config_general_thies.yml', sensor_id_argument='thies_id'))
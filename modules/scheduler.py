@@ -0,0 +1,174 @@
+"""
+This module contains a drift-free scheduler that triggers once every interval (one minute by default).
+
+The interval boundaries are computed from the wall clock (UTC), so ticks are always aligned to whole minutes,
+while the waiting itself is done against the monotonic clock, so it is not affected by clock adjustments
+in between two ticks. Boundaries that pass while the caller is still busy are reported as missed ticks
+instead of being silently skipped.
+
+Classes:
+- Tick: Represents one trigger of the scheduler.
+- MinuteScheduler: Computes the next interval boundary, sleeps until it and records jitter and missed ticks.
+"""
+
+import asyncio
+import math
+import time
+from datetime import datetime, timezone
+from logging import Logger
+from typing import Awaitable, Callable, List, Union
+
+from modules.now_time import NowTime
+
+
+class Tick(NowTime):
+    """
+    Class representing one trigger of the scheduler.
+    It extends NowTime, so the same time formats are available for the boundary the tick belongs to.
+
+    Attributes:
+    - utc: datetime of the interval boundary the tick belongs to
+    - jitter: seconds between the interval boundary and the moment the tick actually triggered
+    - missed: list of datetimes of the interval boundaries that were skipped right before this tick
+    """
+
+    def __init__(self, utc: datetime, jitter: float, missed: List[datetime]):
+        """
+        Constructor for Tick.
+        :param utc: datetime of the interval boundary the tick belongs to
+        :param jitter: seconds between the boundary and the actual trigger moment
+        :param missed: datetimes of the skipped interval boundaries
+        """
+        super().__init__(utc=utc)
+        self.jitter = jitter
+        self.missed = missed
+
+
+class MinuteScheduler:  # pylint: disable=too-many-instance-attributes
+    """
+    Class dedicated to triggering work at every interval boundary without drifting.
+
+    Attributes:
+    - interval: seconds between two ticks
+    - logger: optional logger for reporting missed ticks
+    - monotonic: function returning the monotonic clock in seconds
+    - wall_clock: function returning the POSIX timestamp in seconds
+    - sleep: function used to sleep a number of seconds
+    - async_sleep: coroutine function used to sleep a number of seconds in wait_async
+    - tick_count: number of ticks that have been triggered
+    - missed_count: number of interval boundaries that were missed
+    - last_jitter: jitter of the last tick in seconds
+    - max_jitter: largest jitter seen in seconds
+
+    Functions:
+    - seconds_until_next: returns the number of seconds until the next interval boundary
+    - wait: sleeps until the next interval boundary and returns the Tick
+    - wait_async: awaits the next interval boundary and returns the Tick
+    - mean_jitter: returns the mean jitter over all triggered ticks
+    """
+
+    def __init__(self, interval: float = 60, logger: Union[Logger, None] = None,  # pylint: disable=too-many-arguments
+                 monotonic: Callable[[], float] = time.monotonic,
+                 wall_clock: Callable[[], float] = time.time,
+                 sleep: Callable[[float], None] = time.sleep,
+                 async_sleep: Callable[[float], Awaitable[None]] = asyncio.sleep):
+        """
+        Constructor for MinuteScheduler.
+        :param interval: seconds between two ticks, boundaries are multiples of it since the epoch
+        :param logger: optional logger for reporting missed ticks
+        :param monotonic: function returning the monotonic clock in seconds
+        :param wall_clock: function returning the POSIX timestamp in seconds
+        :param sleep: function used to sleep a number of seconds
+        :param async_sleep: coroutine function used to sleep a number of seconds in wait_async
+        """
+        self.interval = interval
+        self.logger = logger
+        self.monotonic = monotonic
+        self.wall_clock = wall_clock
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+        self.tick_count = 0
+        self.missed_count = 0
+        self.last_jitter = 0.0
+        self.max_jitter = 0.0
+        self._jitter_sum = 0.0
+        self._next_boundary = None  # POSIX timestamp of the next boundary
+        self._next_deadline = None  # monotonic time of the next boundary
+
+    def seconds_until_next(self) -> float:
+        """
+        Returns the number of seconds until the next interval boundary.
+        The first call schedules the first boundary after the current wall clock time.
+        :return: seconds until the next boundary, 0 if it already passed
+        """
+        if self._next_boundary is None:
+            boundary = (math.floor(self.wall_clock() / self.interval) + 1) * self.interval
+            self.__schedule(boundary)
+        return max(0.0, self._next_deadline - self.monotonic())
+
+    def wait(self) -> Tick:
+        """
+        Sleeps until the next interval boundary.
+        :return: the Tick of the boundary that was reached
+        """
+        delay = self.seconds_until_next()
+        if delay > 0:
+            self.sleep(delay)
+        return self.__fire()
+
+    async def wait_async(self) -> Tick:
+        """
+        Awaits the next interval boundary without blocking the event loop.
+        :return: the Tick of the boundary that was reached
+        """
+        delay = self.seconds_until_next()
+        if delay > 0:
+            await self.async_sleep(delay)
+        return self.__fire()
+
+    def mean_jitter(self) -> float:
+        """
+        Returns the mean jitter over all triggered ticks.
+        :return: the mean jitter in seconds, 0 if no tick has been triggered yet
+        """
+        if self.tick_count == 0:
+            return 0.0
+        return self._jitter_sum / self.tick_count
+
+    def __schedule(self, boundary: float):
+        """
+        Sets the next boundary and translates it to the monotonic clock.
+        The offset between both clocks is measured again for every boundary,
+        so wall clock corrections are followed without accumulating drift.
+        :param boundary: POSIX timestamp of the next boundary
+        """
+        offset = self.wall_clock() - self.monotonic()
+        self._next_boundary = boundary
+        self._next_deadline = boundary - offset
+
+    def __fire(self) -> Tick:
+        """
+        Creates the Tick for the boundary that was reached and schedules the next one.
+        If more than one boundary passed, the tick belongs to the most recent one
+        and the earlier boundaries are reported as missed.
+        :return: the Tick of the boundary that was reached
+        """
+        late = self.monotonic() - self._next_deadline
+        skipped = max(0, math.floor(late / self.interval))
+        missed = [datetime.fromtimestamp(self._next_boundary + i * self.interval, tz=timezone.utc)
+                  for i in range(skipped)]
+        boundary = self._next_boundary + skipped * self.interval
+        jitter = late - skipped * self.interval
+
+        for missed_dt in missed:
+            if self.logger is not None:
+                self.logger.warning(msg=f'missed tick on: {missed_dt.isoformat()}')
+
+        self.tick_count += 1
+        self.missed_count += skipped
+        self.last_jitter = jitter
+        self.max_jitter = max(self.max_jitter, jitter)
+        self._jitter_sum += jitter
+
+        self.__schedule(boundary + self.interval)
+        return Tick(utc=datetime.fromtimestamp(boundary, tz=timezone.utc), jitter=jitter, missed=missed)
@@ -0,0 +1,157 @@
+"""
+This module contains the compiled telegram schema: the config of every telegram field, built once from the merged
+config and shared by the telegram parsers, the NetCDF writer and parse_disdro_csv_or_txt.py, so per row the config
+is one table lookup instead of nested dictionary access.
+
+Functions:
+- compile_schema: Returns the compiled schema of the telegram fields of a config, compiled once per config.
+- freeze: Returns a hashable copy of a config value, to key the compiled schemas on.
+
+Classes:
+- FieldSchema: Represents the compiled config of one telegram field.
+- TelegramSchema: Represents the compiled config of all telegram fields of a sensor.
+"""
+
+from typing import Any, Dict, Tuple, Union
+
+from modules.sqldb import PARSED_DTYPES
+
+# the Python type of the values of a field per dtype in the config
+PYTHON_TYPES = {'i4': int, 'i2': int, 'S4': str, 'f4': float}
+# the value of the NetCDF variables where there is no value, if the config does not give one
+DEFAULT_FILL_VALUE = -999
+
+# the compiled schemas, by the content (see freeze) of the telegram_fields and dimensions they were compiled from
+_schemas: Dict[Tuple, 'TelegramSchema'] = {}
+# the number of compiled schemas that are kept, the least recently compiled one is dropped first
+SCHEMA_CACHE_SIZE = 16
+
+
+class FieldSchema:  # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """
+    Class representing the compiled config of one telegram field.
+
+    Attributes:
+    - field: the number of the field, e.g. '93'
+    - index: the position of the field in the telegram_fields of the config
+    - dtype: the dtype in the config, e.g. 'f4' or 'S4', None if the config has none
+    - parsed_dtype: the NumPy dtype of the parsed values, e.g. '<f4', None for fields that stay strings
+    - python_type: the Python type of a value, e.g. float, None if the dtype is not known
+    - dimensions: the dimensions in the config, e.g. ('time', 'diameter_classes', 'velocity_classes')
+    - shape: the sizes of the dimensions after time, e.g. (32, 32), () for a scalar field,
+             None if a dimension is not in the config
+    - include_in_nc: when the field is written to the NetCDF: always, only_full or never
+    - variable: the name of the NetCDF variable (the standard_name), None if the config has none
+    - fill_value: the fill value of the NetCDF variable
+    - valid_min: the smallest valid value, None if the config has none
+    - valid_max: the largest valid value, None if the config has none
+    - sensor_error: whether the field is a status or error code of the sensor, which is 0 when the sensor is OK
+    """
+
+    def __init__(self, field: str, index: int, field_dict: Dict, dimensions: Union[Dict, None]):
+        """
+        Constructor for FieldSchema.
+        :param field: the number of the field
+        :param index: the position of the field in the telegram_fields of the config
+        :param field_dict: the config of the field
+        :param dimensions: the dimensions of the config, with their size, None if the config has none
+        """
+        self.field = field
+        self.index = index
+        self.dtype = field_dict.get('dtype')
+        self.parsed_dtype = PARSED_DTYPES.get(self.dtype)
+        self.python_type = PYTHON_TYPES.get(self.dtype)
+        self.dimensions = tuple(field_dict.get('dimensions') or ())
+        sizes = [(dimensions or {}).get(dimension, {}).get('size') for dimension in self.dimensions[1:]]
+        self.shape = tuple(sizes) if None not in sizes else None
+        self.include_in_nc = field_dict.get('include_in_nc')
+        self.variable = field_dict.get('var_attrs', {}).get('standard_name')
+        self.fill_value = field_dict.get('fill_value', DEFAULT_FILL_VALUE)
+        self.valid_min = field_dict.get('valid_min')
+        self.valid_max = field_dict.get('valid_max')
+        self.sensor_error = bool(field_dict.get('sensor_error', False))
+
+    def in_nc(self, full_version: bool) -> bool:
+        """
+        Returns whether the field is written to a full or a light NetCDF.
+        :param full_version: True for a full NetCDF, False for a light NetCDF
+        :return: True if the field is written
+        """
+        if full_version:
+            return self.include_in_nc != 'never'
+        return self.include_in_nc == 'always'
+
+
+class TelegramSchema:
+    """
+    Class representing the compiled config of all telegram fields of a sensor.
+
+    Attributes:
+    - fields: dictionary of the FieldSchema per field, in the order of the config
+    - parsed_dtypes: dictionary of the NumPy dtype of the parsed values per field, as sqldb.field_dtypes returns it
+    - nc_fields: dictionary with a dictionary of the FieldSchema per field written to the NetCDF,
+                 for a full (True) and a light (False) NetCDF
+
+    Functions:
+    - get: returns the FieldSchema of a field, None if the field is not in the config
+    """
+
+    def __init__(self, telegram_fields: Dict, dimensions: Union[Dict, None] = None):
+        """
+        Constructor for TelegramSchema.
+        :param telegram_fields: the telegram_fields of the config
+        :param dimensions: the dimensions of the config, with their size
+        """
+        self.fields = {field: FieldSchema(field, index, field_dict, dimensions)
+                       for index, (field, field_dict) in enumerate(telegram_fields.items())}
+        self.parsed_dtypes = {field: field_schema.parsed_dtype for field, field_schema in self.fields.items()}
+        self.nc_fields = {full_version: {field: field_schema for field, field_schema in self.fields.items()
+                                         if field_schema.in_nc(full_version)}
+                          for full_version in (True, False)}
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.fields
+
+    def __getitem__(self, field: str) -> FieldSchema:
+        return self.fields[field]
+
+    def get(self, field: str) -> Union[FieldSchema, None]:
+        """
+        Returns the FieldSchema of a field.
+        :param field: the number of the field
+        :return: the FieldSchema, None if the field is not in the config
+        """
+        return self.fields.get(field)
+
+
+def freeze(value: Any) -> Any:
+    """
+    This function returns a hashable copy of a config value: dictionaries become tuples of their items,
+    lists become tuples.
+    :param value: the config value, e.g. the telegram_fields of a config
+    :return: the hashable copy
+    """
+    if isinstance(value, dict):
+        return tuple((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def compile_schema(telegram_fields: Dict, dimensions: Union[Dict, None] = None) -> TelegramSchema:
+    """
+    This function returns the compiled schema of the telegram fields of a config.
+    The schema is compiled once per config content, and returned again for every telegram of that config,
+    or of another config with the same telegram fields and dimensions. A config that is changed after it was
+    compiled gets a new schema. At most SCHEMA_CACHE_SIZE schemas are kept.
+    :param telegram_fields: the telegram_fields of the config, e.g. config_dict['telegram_fields']
+    :param dimensions: the dimensions of the config, e.g. config_dict.get('dimensions')
+    :return: the TelegramSchema
+    """
+    key = (freeze(telegram_fields), freeze(dimensions))
+    schema = _schemas.get(key)
+    if schema is None:
+        if len(_schemas) >= SCHEMA_CACHE_SIZE:
+            del _schemas[next(iter(_schemas))]
+        schema = _schemas[key] = TelegramSchema(telegram_fields, dimensions)
+    return schema
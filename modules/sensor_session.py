@@ -0,0 +1,108 @@
+"""
+This module contains the session manager that keeps the configuration of a sensor applied.
+
+Instead of running the full start sequence after every telegram, the session runs it once,
+remembers which settings were applied, and re-applies only the settings that failed to apply
+or whose value reported in a telegram drifted from the config (e.g. the clock of the Thies).
+
+Classes:
+- SensorSession: Keeps track of the settings applied to a sensor and re-applies only what drifted or failed.
+"""
+
+from logging import Logger
+from typing import Dict, List, Union
+
+from modules.sensors import Sensor
+from modules.telegram import Telegram
+
+
+class SensorSession:
+    """
+    Class keeping track of the settings applied to one sensor.
+
+    Attributes:
+    - sensor: the Sensor object
+    - config_dict: the combined general and site specific config dictionary of the sensor
+    - logger: the logger of the sensor
+    - applied: dictionary telling for every setting of the sensor whether it is currently applied
+    - reapply_count: number of times a single setting was applied again
+
+    Functions:
+    - start: runs the full start sequence of the sensor
+    - update: marks the settings that drifted according to a telegram
+    - pending: returns the settings that should be applied again
+    - reconcile: applies the pending settings again
+    """
+
+    def __init__(self, sensor: Sensor, config_dict: Dict, logger: Logger):
+        """
+        Constructor for SensorSession, no setting counts as applied until start is called.
+        :param sensor: the Sensor object with an initialized serial connection
+        :param config_dict: the combined general and site specific config dictionary of the sensor
+        :param logger: the logger of the sensor
+        """
+        self.sensor = sensor
+        self.config_dict = config_dict
+        self.logger = logger
+        self.applied = {setting: False for setting in sensor.SETTINGS}
+        self.reapply_count = 0
+
+    def start(self, include_in_log: bool = True) -> bool:
+        """
+        Runs the full start sequence of the sensor, including the restart of the Parsivel.
+        :param include_in_log: whether the start sequence should be included in the log
+        :return: True if the start sequence finished, False if it failed
+        """
+        try:
+            self.sensor.sensor_start_sequence(config_dict=self.config_dict, logger=self.logger,
+                                              include_in_log=include_in_log)
+        except Exception as e:  # pylint: disable=broad-except
+            self.logger.error(msg=f'start sequence failed: {e}')
+            self.applied = {setting: False for setting in self.applied}
+            return False
+        self.applied = {setting: True for setting in self.applied}
+        return True
+
+    def update(self, telegram: Union[Telegram, None]) -> List[str]:
+        """
+        Marks the settings that drifted according to a telegram.
+        A missing or empty telegram marks all settings, since the sensor may have restarted.
+        Only the reported settings are looked up in the telegram (see Sensor.drifted_settings),
+        it is captured by the writer thread.
+        :param telegram: the Telegram object of the last read, or None
+        :return: names of the settings that were marked
+        """
+        if telegram is None:
+            drifted = list(self.applied)
+        else:
+            drifted = self.sensor.drifted_settings(telegram, self.config_dict)
+
+        for setting in drifted:
+            if self.applied[setting]:
+                self.logger.info(msg=f'setting {setting} drifted, it will be applied again')
+            self.applied[setting] = False
+        return drifted
+
+    def pending(self) -> List[str]:
+        """
+        Returns the settings that should be applied again.
+        :return: names of the settings that failed or drifted
+        """
+        return [setting for setting, applied in self.applied.items() if not applied]
+
+    def reconcile(self) -> List[str]:
+        """
+        Applies the pending settings again, settings that fail stay pending for the next call.
+        :return: names of the settings that were applied successfully
+        """
+        reapplied = []
+        for setting in self.pending():
+            try:
+                self.sensor.apply_setting(setting, config_dict=self.config_dict, logger=self.logger)
+            except Exception as e:  # pylint: disable=broad-except
+                self.logger.error(msg=f'applying setting {setting} failed: {e}')
+                continue
+            self.applied[setting] = True
+            self.reapply_count += 1
+            reapplied.append(setting)
+        return reapplied
@@ -5,12 +5,15 @@ and the implementations of different sensor classes inheriting this class.
 
 import sys
 from abc import abstractmethod, ABC
+from datetime import datetime, timezone
 from enum import Enum
 from time import sleep
+from typing import Dict, List, Union
 
 import serial
 
 from modules.now_time import NowTime  # pylint: disable=import-error
+from modules.framed_reader import STX, ETX, Frame, FramedReader, split_lines  # pylint: disable=import-error
 
 
 class SensorType(Enum):
@@ -36,8 +39,13 @@ class Sensor(ABC):
     - write: sends a message to the sensor
     - read: reads lines from the sensor
     - get_type: returns the type of the sensor as a string
+    - apply_setting: sends the commands of one setting of the start sequence to the sensor
+    - drifted_settings: returns the settings whose value in a telegram differs from the config
     """
 
+    # names of the settings of the start sequence that can be applied on their own with apply_setting
+    SETTINGS = ()
+
     def __init__(self, sensor_type: SensorType):
         """
         Constructor for sensors.
@@ -103,6 +111,27 @@ class Sensor(ABC):
         :return: Type of the sensor as a string
         """
 
+    @abstractmethod
+    def apply_setting(self, setting: str, config_dict, logger):
+        """
+        Abstract function for sending the commands of one setting of the start sequence to the sensor.
+        :param setting: name of the setting, one of SETTINGS
+        :param config_dict: Dictionary containing configuration parameters for the sensor
+        :param logger: Logger for logging information and errors
+        """
+
+    @abstractmethod
+    def drifted_settings(self, telegram, config_dict) -> List[str]:
+        """
+        Abstract function for comparing the values reported in a telegram with the config.
+        The values are looked up with telegram.lookup_fields, so the acquisition loop does not capture
+        the whole telegram (that is done once, by the writer thread).
+        :param telegram: the Telegram object read from the sensor
+        :param config_dict: Dictionary containing configuration parameters for the sensor
+        :return: names of the settings that should be applied again, all SETTINGS if the telegram has no data
+                 (the sensor may have restarted)
+        """
+
 
 class Parsivel(Sensor):
     """
@@ -110,8 +139,12 @@ class Parsivel(Sensor):
 
     Attributes:
     - serial_connection : the serial connection to the sensor
+    - read_deadline : seconds a telegram read may take before it is returned as partial
+    - last_frame : the Frame of the last read, with the timing of every stage
     """
 
+    SETTINGS = ('station_code', 'station_id', 'user_telegram')
+
     def __init__(self, sensor_type=SensorType.PARSIVEL):
         """
         Constructor for the parsivel type sensor
@@ -119,6 +152,8 @@ class Parsivel(Sensor):
         """
         super().__init__(sensor_type)
         self.serial_connection: serial.Serial = None
+        self.read_deadline = 10.0
+        self.last_frame: Frame = None
 
     def init_serial_connection(self, port: str, baud: int, logger):
         """
@@ -219,12 +254,30 @@ class Parsivel(Sensor):
         :param logger: logger for errors
         :return: List of lines or None
         """
-        if self.serial_connection is not None:
-            self.write('CS/PA\r\n'.encode('ascii'), logger)
-            parsivel_lines = self.serial_connection.readlines()
-            return parsivel_lines
-        logger.error(msg="serial_connection not initialized")
-        return None
+        frame = self.read_frame(logger)
+        if frame is None:
+            return None
+        return split_lines(frame.data)
+
+    def read_frame(self, logger) -> Union[Frame, None]:
+        """
+        Requests a telegram and reads it until the ETX byte, or until read_deadline passes.
+        :param logger: logger for errors and the read timings
+        :return: the Frame holding the telegram as one buffer, or None if the serial connection is not initialized
+        """
+        if self.serial_connection is None:
+            logger.error(msg="serial_connection not initialized")
+            return None
+
+        reader = FramedReader(self.serial_connection, end=ETX, deadline=self.read_deadline)
+        frame = reader.read_frame(request='CS/PA\r\n'.encode('ascii'))
+        self.last_frame = frame
+
+        if not frame.complete:
+            logger.error(msg=f'partial telegram: no ETX within {self.read_deadline} s, '
+                             f'{len(frame.data)} bytes received')
+        logger.debug(msg=f'telegram read in {frame.timings["total"]:.3f} s: {frame.timings}')
+        return frame
 
     def get_type(self) -> str:
         """
@@ -233,6 +286,50 @@ class Parsivel(Sensor):
         """
         return self.sensor_type.value
 
+    def apply_setting(self, setting: str, config_dict, logger):
+        """
+        Sends the command of one setting of the start sequence to the Parsivel.
+        The restart (CS/Z/1) is not a setting, since it resets the rain amount.
+        :param setting: name of the setting, one of SETTINGS
+        :param config_dict: Dictionary containing configuration parameters for the sensor
+        :param logger: Logger for logging information and errors
+        """
+        if setting == 'station_code':
+            self.write(('CS/K/' + config_dict['station_code'] + '\r').encode('utf-8'), logger)
+            sleep(1)
+        elif setting == 'station_id':
+            self.write(('CS/J/' + config_dict['global_attrs']['sensor_name'] + '\r').encode('utf-8'), logger)
+            sleep(2)
+        elif setting == 'user_telegram':
+            self.write('CS/M/M/1\r'.encode('utf-8'), logger)
+        else:
+            raise ValueError(f'Unknown Parsivel setting: {setting}')
+
+    def drifted_settings(self, telegram, config_dict) -> List[str]:
+        """
+        Compares the sensor name (field 22) and number (field 23) in the telegram with the config.
+        Fields that are missing or empty in the telegram are not compared. The Parsivel only stores a number
+        of at most 4 digits (CS/J), so the number is only compared, as a number, if the sensor_name is one,
+        e.g. not for PAR008.
+        :param telegram: the ParsivelTelegram object read from the sensor
+        :param config_dict: Dictionary containing configuration parameters for the sensor
+        :return: names of the settings that should be applied again, all SETTINGS if the telegram has no data
+        """
+        station_id = config_dict['global_attrs']['sensor_name']
+        station_id = int(station_id) if station_id.isdigit() and len(station_id) <= 4 else None
+        reported_values = telegram.lookup_fields(('22', '23'))
+        if reported_values is None:
+            return list(self.SETTINGS)
+        drifted = []
+        reported = reported_values.get('22')
+        if isinstance(reported, str) and len(reported) > 0 and reported != config_dict['station_code']:
+            drifted.append('station_code')
+        reported = reported_values.get('23')
+        if station_id is not None and isinstance(reported, str) and len(reported) > 0 and \
+                (not reported.isdigit() or int(reported) != station_id):
+            drifted.append('station_id')
+        return drifted
+
 
 class Thies(Sensor):
     """
@@ -241,8 +338,18 @@ class Thies(Sensor):
     Attributes:
     - serial_connection : the serial connection to the sensor
     - thies_id : id for the specific Thies sensor
+    - read_deadline : seconds a telegram read may take before it is dropped as partial
+    - last_frame : the Frame of the last read, with the timing of every stage
     """
 
+    SETTINGS = ('automatic_mode', 'clock')
+
+    # number of fields of telegram 5 as counted by ThiesTelegram, which counts the STX and device id separately
+    TELEGRAM_FIELDS = 526
+
+    # seconds the clock of the Thies may drift before it is set again, unless set in the config
+    CLOCK_DRIFT_THRESHOLD = 10
+
     def __init__(self, sensor_type=SensorType.THIES, thies_id='00'):
         """
         Constructor for the thies type serial_connection.
@@ -251,6 +358,8 @@ class Thies(Sensor):
         super().__init__(sensor_type)
         self.serial_connection: serial.Serial = None
         self.thies_id = thies_id
+        self.read_deadline = 10.0
+        self.last_frame: Frame = None
 
     def init_serial_connection(self, port, baud, logger):
         """
@@ -359,17 +468,45 @@ class Thies(Sensor):
         """
         Reads the data sent by the thies sensor.
         :param logger: the logger object
-        :return: the read line from the thies sensor
+        :return: the telegram from the STX up to the CR LF before the ETX,
+                 an empty string if the telegram is partial or does not have TELEGRAM_FIELDS fields,
+                 or None if the serial connection is not initialized
+        """
+        frame = self.read_frame(logger)
+        if frame is None:
+            return None
+        if not frame.complete:
+            logger.error(msg=f'partial telegram: no STX...ETX within {self.read_deadline} s, '
+                             f'{len(frame.data)} bytes received')
+            return ''
+
+        try:
+            decoded = frame.data[:-len(ETX)].rstrip(b'\r\n').decode('utf-8')
+        except UnicodeDecodeError as e:
+            logger.error(msg=f'telegram could not be decoded: {e}')
+            return ''
+
+        fields = decoded.count(';') + 2
+        if fields != self.TELEGRAM_FIELDS:
+            logger.error(msg=f'telegram has {fields} fields instead of {self.TELEGRAM_FIELDS}')
+            return ''
+        return decoded
+
+    def read_frame(self, logger) -> Union[Frame, None]:
+        """
+        Requests telegram 5 and waits for its STX...ETX frame, until read_deadline passes.
+        :param logger: the logger object for errors and the read latency
+        :return: the Frame holding the telegram, or None if the serial connection is not initialized
         """
         if self.serial_connection is None:
             logger.error(msg="serial_connection not initialized")
             return None
 
-        sleep(2)  # Give sensor some time to create the telegram
-        self.serial_connection.write(f'\r{self.thies_id}TR00005\r'.encode('utf-8'))
-        output = self.serial_connection.readline()
-        decoded = str(output[0:len(output) - 2].decode("utf-8"))
-        return decoded
+        reader = FramedReader(self.serial_connection, start=STX, end=ETX, deadline=self.read_deadline)
+        frame = reader.read_frame(request=f'\r{self.thies_id}TR00005\r'.encode('utf-8'))
+        self.last_frame = frame
+        logger.debug(msg=f'telegram read in {frame.timings["total"]:.3f} s: {frame.timings}')
+        return frame
 
     def get_type(self) -> str:
         """
@@ -377,3 +514,63 @@ class Thies(Sensor):
         :return: Type of the sensor as a string
         """
         return self.sensor_type.value
+
+    def apply_setting(self, setting: str, config_dict, logger):
+        """
+        Sends the commands of one setting of the start sequence to the Thies, in config mode.
+        :param setting: name of the setting, one of SETTINGS
+        :param config_dict: Dictionary containing configuration parameters for the sensor
+        :param logger: Logger for logging information and errors
+        """
+        if setting not in self.SETTINGS:
+            raise ValueError(f'Unknown Thies setting: {setting}')
+
+        self.write(('\r' + self.thies_id + 'KY00001\r').encode('utf-8'), logger)  # place in config mode
+        sleep(1)
+
+        if setting == 'automatic_mode':
+            self.write(('\r' + self.thies_id + 'TM00000\r').encode('utf-8'), logger)  # turn of automatic mode
+            sleep(1)
+        else:
+            for command, index in (('ZH', 0), ('ZM', 1), ('ZS', 2)):
+                # take the time right before every command, so the seconds are not off by the sleeps
+                value = NowTime().time_list[index]
+                self.write(('\r' + self.thies_id + command + '000' + value + '\r').encode('utf-8'), logger)
+                sleep(1)
+
+        self.write(('\r' + self.thies_id + 'KY00000\r').encode('utf-8'), logger)  # place out of config mode
+        sleep(1)
+
+    @staticmethod
+    def clock_drift(reported_values: Dict, timestamp: datetime) -> Union[float, None]:
+        """
+        Computes the drift of the Thies clock from the sensor date (field 5) and time (field 6) in a telegram.
+        :param reported_values: the values of fields 5 and 6 in the telegram, see Telegram.lookup_fields
+        :param timestamp: the timestamp of the telegram
+        :return: seconds the sensor clock is ahead of the timestamp of the telegram,
+                 None if the fields are missing or cannot be parsed
+        """
+        try:
+            sensor_dt = datetime.strptime(f"{reported_values['5']} {reported_values['6']}",
+                                          '%d.%m.%y %H:%M:%S').replace(tzinfo=timezone.utc)
+        except (KeyError, TypeError, ValueError):
+            return None
+        return (sensor_dt - timestamp).total_seconds()
+
+    def drifted_settings(self, telegram, config_dict) -> List[str]:
+        """
+        Checks whether the clock of the Thies drifted more than the threshold from the timestamp of the telegram.
+        :param telegram: the ThiesTelegram object read from the sensor
+        :param config_dict: Dictionary containing configuration parameters for the sensor,
+                            the optional key clock_drift_threshold overrides CLOCK_DRIFT_THRESHOLD
+        :return: ['clock'] if the clock should be set again, otherwise an empty list,
+                 all SETTINGS if the telegram has no data
+        """
+        reported_values = telegram.lookup_fields(('5', '6'))
+        if reported_values is None:
+            return list(self.SETTINGS)
+        drift = self.clock_drift(reported_values, telegram.timestamp)
+        threshold = config_dict.get('clock_drift_threshold', self.CLOCK_DRIFT_THRESHOLD)
+        if drift is not None and abs(drift) > threshold:
+            return ['clock']
+        return []
@@ -0,0 +1,278 @@
+"""
+This module contains the append-only spool the telegrams are written to before the database.
+
+Every telegram is appended to the spool as one record: its row of the disdrodl table (see DBWriter.db_row),
+preceded by the length of the row as a little-endian uint32. The writer thread then inserts the rows into SQLite.
+While the database cannot be written (locked, disk full, corrupt file), the telegrams stay in the spool,
+and they are replayed in bulk, thousands of rows per transaction, once the database is healthy again.
+Replaying is idempotent: the position of the last committed record is stored in the database in the same
+transaction as the rows (see DBWriter.write_rows), so records that were committed before are skipped.
+
+The spool consists of numbered segment files (e.g. disdrodl_000001.spool), a new segment is started when
+the current one is full, and a segment is deleted once all its records are in the database.
+The file is not fsynced after every record, but every sync_interval seconds or sync_records records,
+and whenever writing to the database fails. Records after the last fsync can be lost on a power cut,
+a record that was cut off halfway is dropped when the spool is opened again.
+
+The spool is tied to the database file it is replayed into, by the random id of the file (see sqldb.create_database_id),
+which is kept in the file disdrodl.database next to the segments. The position of the replay is stored in the database,
+so a new database (e.g. disdrodl.db was deleted or replaced) would get all the records of the previous one replayed.
+When the spool is opened for a database with another id, its segments are moved to the directory
+disdrodl_<previous id> instead, where they can be inspected or deleted.
+
+Classes:
+- Spool: Append-only spool of rows in segment files, with fsync batching.
+
+Functions:
+- encode_record: Encodes a row as a length-prefixed record.
+"""
+
+import os
+import pickle
+import struct
+import time
+from pathlib import Path
+from typing import Callable, Iterator, List, Tuple, Union
+
+
+RECORD_HEADER = struct.Struct('<I')
+SEGMENT_SUFFIX = '.spool'
+DATABASE_SUFFIX = '.database'
+
+
+def encode_record(row: Tuple) -> bytes:
+    """
+    Encodes a row as a record: the length of the pickled row as little-endian uint32, followed by the pickled row.
+    The spool is only read by the logger that wrote it, so the rows are pickled, which is the fastest to decode.
+    :param row: the row tuple
+    :return: the record bytes
+    """
+    data = pickle.dumps(row, protocol=pickle.DEFAULT_PROTOCOL)
+    return RECORD_HEADER.pack(len(data)) + data
+
+
+class Spool:  # pylint: disable=too-many-instance-attributes
+    """
+    Class representing the append-only spool of the rows of one database.
+    The position of a record is the (segment, offset) of its end, positions increase with every record.
+
+    Attributes:
+    - directory: the directory of the segment files
+    - name: the name of the spool, the prefix of the segment files
+    - max_segment_size: the size in bytes after which a new segment is started
+    - sync_interval: the maximum number of seconds between two fsyncs
+    - sync_records: the maximum number of records appended between two fsyncs
+    - monotonic: function returning the monotonic clock in seconds
+    - database_id: the id of the database the records are replayed into, None if the spool is not tied to one
+    - set_aside: the directory the segments of another database were moved to when opening, None if there were none
+    - segment: the number of the segment records are appended to
+    - position: the position of the last appended record
+    - replayed: the position up to which all records are in the database
+    - unsynced: the number of records appended since the last fsync
+    - syncs: the number of fsyncs
+
+    Functions:
+    - segments: returns the numbers of the segment files
+    - segment_path: returns the path of a segment file
+    - append: appends rows and fsyncs when the sync interval or number of records is reached
+    - sync: fsyncs the current segment
+    - records: reads the records after a position
+    - backlog: whether there are records that are not in the database yet
+    - release: marks the records up to a position as in the database and deletes the segments that are done
+    - close: fsyncs and closes the current segment
+    """
+
+    def __init__(self, directory, name: str,  # pylint: disable=too-many-arguments
+                 max_segment_size: int = 16 * 1024 * 1024, sync_interval: float = 60.0, sync_records: int = 60,
+                 monotonic: Callable[[], float] = time.monotonic, database_id: Union[str, None] = None):
+        """
+        Constructor for Spool, opens the last segment for appending, dropping a record that was cut off.
+        All records in the existing segments count as not replayed, the database skips the committed ones.
+        Segments that were written for a database with another id are moved aside first, see set_aside.
+        :param directory: the directory of the segment files, created if it does not exist
+        :param name: the name of the spool, e.g. the stem of the database file
+        :param max_segment_size: the size in bytes after which a new segment is started
+        :param sync_interval: the maximum number of seconds between two fsyncs
+        :param sync_records: the maximum number of records appended between two fsyncs
+        :param monotonic: function returning the monotonic clock in seconds
+        :param database_id: the id of the database the records are replayed into (see sqldb.create_database_id),
+                            None to not tie the spool to a database. The segments of a spool without stored id
+                            (written before the id was introduced) are kept for the database.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.name = name
+        self.max_segment_size = max_segment_size
+        self.sync_interval = sync_interval
+        self.sync_records = sync_records
+        self.monotonic = monotonic
+        self.unsynced = 0
+        self.syncs = 0
+        self.last_sync = monotonic()
+        self.replayed = (0, 0)
+        self.database_id = database_id
+        self.set_aside = None
+        if database_id is not None:
+            self.__tie_to_database(database_id)
+
+        segments = self.segments()
+        self.segment = segments[-1] if segments else 1
+        path = self.segment_path(self.segment)
+        size = self.__complete_size(path) if path.exists() else 0
+        self._file = open(path, 'ab')  # pylint: disable=consider-using-with
+        if self._file.tell() != size:
+            self._file.truncate(size)
+            self._file.seek(size)
+        self.position = (self.segment, size)
+
+    def segments(self) -> List[int]:
+        """
+        Returns the numbers of the segment files, oldest first.
+        :return: list of segment numbers
+        """
+        prefix = f'{self.name}_'
+        return sorted(int(path.stem[len(prefix):]) for path in self.directory.glob(f'{prefix}*{SEGMENT_SUFFIX}')
+                      if path.stem[len(prefix):].isdigit())
+
+    def segment_path(self, segment: int) -> Path:
+        """
+        Returns the path of a segment file.
+        :param segment: the number of the segment
+        :return: the path, e.g. spool/disdrodl_000001.spool
+        """
+        return self.directory / f'{self.name}_{segment:06d}{SEGMENT_SUFFIX}'
+
+    def append(self, rows: List[Tuple]) -> List[Tuple[Tuple[int, int], Tuple]]:
+        """
+        Appends rows to the spool, and fsyncs when the sync interval or number of records is reached.
+        :param rows: list of row tuples
+        :return: list of (position, row) records
+        """
+        if rows and self.position[1] >= self.max_segment_size:
+            self.__rotate()
+        records = []
+        offset = self.position[1]
+        data = bytearray()
+        for row in rows:
+            record = encode_record(row)
+            data += record
+            offset += len(record)
+            records.append(((self.segment, offset), row))
+        self._file.write(data)
+        self._file.flush()
+        self.position = (self.segment, offset)
+        self.unsynced += len(rows)
+        if self.unsynced >= self.sync_records or self.monotonic() - self.last_sync >= self.sync_interval:
+            self.sync()
+        return records
+
+    def sync(self):
+        """
+        Fsyncs the current segment, so the appended records survive a power cut.
+        """
+        if self.unsynced:
+            os.fsync(self._file.fileno())
+            self.syncs += 1
+        self.unsynced = 0
+        self.last_sync = self.monotonic()
+
+    def records(self, after: Tuple[int, int] = (0, 0)) -> Iterator[Tuple[Tuple[int, int], Tuple]]:
+        """
+        Reads the records after a position, in order. Every segment is read with one read call,
+        and a record that was cut off at the end of a segment is skipped.
+        :param after: the position to read after, (0, 0) reads all records
+        :return: generator of (position, row) records
+        """
+        for segment in self.segments():
+            if segment < after[0]:
+                continue
+            start = after[1] if segment == after[0] else 0
+            with open(self.segment_path(segment), 'rb') as f:
+                f.seek(start)
+                data = f.read()
+            view = memoryview(data)
+            offset = 0
+            while offset + RECORD_HEADER.size <= len(view):
+                size, = RECORD_HEADER.unpack_from(view, offset)
+                end = offset + RECORD_HEADER.size + size
+                if end > len(view):
+                    break
+                yield (segment, start + end), pickle.loads(view[offset + RECORD_HEADER.size:end])
+                offset = end
+
+    def backlog(self) -> bool:
+        """
+        Tells whether there are records that are not in the database yet.
+        :return: True if records should be replayed
+        """
+        return self.replayed < self.position
+
+    def release(self, position: Tuple[int, int]):
+        """
+        Marks the records up to a position as in the database, and deletes the older segments whose
+        records are all in the database (the current segment is kept for appending).
+        :param position: the position of the last record in the database
+        """
+        self.replayed = max(self.replayed, position)
+        for segment in self.segments():
+            if segment >= self.segment:
+                break
+            if segment == self.replayed[0] and self.replayed[1] < self.segment_path(segment).stat().st_size or \
+                    segment > self.replayed[0]:
+                break
+            self.segment_path(segment).unlink()
+
+    def close(self):
+        """
+        Fsyncs and closes the current segment.
+        """
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def __tie_to_database(self, database_id: str):
+        """
+        Stores the id of the database the records are replayed into, moving the segments of a database
+        with another id to the directory {name}_{previous id}.
+        :param database_id: the id of the database
+        """
+        id_path = self.directory / f'{self.name}{DATABASE_SUFFIX}'
+        previous = id_path.read_text(encoding='ascii').strip() if id_path.exists() else None
+        if previous == database_id:
+            return
+        segments = self.segments()
+        if previous is not None and segments:
+            self.set_aside = self.directory / f'{self.name}_{previous}'
+            self.set_aside.mkdir(exist_ok=True)
+            for segment in segments:
+                path = self.segment_path(segment)
+                path.rename(self.set_aside / path.name)
+        id_path.write_text(database_id, encoding='ascii')
+
+    def __rotate(self):
+        """
+        Fsyncs the current segment and starts the next one.
+        """
+        self.sync()
+        self._file.close()
+        self.segment += 1
+        self._file = open(self.segment_path(self.segment), 'ab')  # pylint: disable=consider-using-with
+        self.position = (self.segment, 0)
+
+    @staticmethod
+    def __complete_size(path: Path) -> int:
+        """
+        Returns the size of a segment file up to the end of its last complete record.
+        :param path: the path of the segment file
+        :return: the size in bytes
+        """
+        if not path.exists():
+            return 0
+        data = path.read_bytes()
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            end = offset + RECORD_HEADER.size + RECORD_HEADER.unpack_from(data, offset)[0]
+            if end > len(data):
+                break
+            offset = end
+        return offset
@@ -3,37 +3,136 @@ This module contains functionalities to use with the sql database.
 
 Functions:
 - connect_db: Connects to the database at the given path.
+- connect_db_readonly: Connects read-only to the database at the given path, with memory-mapped I/O.
 - create_db: Creates disdrodl.db if it does not exist yet.
+- create_index: Creates the unique (sensor_id, timestamp) index of a new database.
+- create_database_id: Stores a random id of the database file, if it has none yet.
+- database_id: Returns the random id of the database file.
+- has_unique_index: Returns whether the unique (sensor_id, timestamp) index exists.
+- create_range_index: Creates the non-unique (sensor_id, timestamp) index of an existing database.
+- create_unique_index: Creates the unique (sensor_id, timestamp) index, if the table has no duplicates.
+- add_spectrum_column: Adds the spectrum BLOB column to the disdrodl table if it does not exist yet.
+- add_parsed_column: Adds the parsed BLOB column to the disdrodl table if it does not exist yet.
+- add_quality_column: Adds the quality_flag column to the disdrodl table if it does not exist yet.
+- pack_spectrum: Packs the values of a spectrum field into a BLOB of little-endian uint16.
+- unpack_spectrum: Unpacks a spectrum BLOB into a NumPy array.
+- field_dtypes: Returns the NumPy dtype of the parsed value of every telegram field, from the config.
+- pack_fields: Packs parsed telegram data into a BLOB of typed values keyed by field.
+- unpack_fields: Unpacks a BLOB of pack_fields into parsed telegram data.
+- field_columns: Generates the typed columns of the scalar telegram fields from the telegram_fields of a config.
+- add_field_columns: Adds the typed columns of the scalar telegram fields to the disdrodl table if they do not exist.
+- field_value: Converts a telegram value to the type of its column.
+- field_aggregate: Runs an aggregate function over a field column between two timestamps.
 - dict_factory: Creates a dictionary from a database row.
 - sql_query_gen: Generates rows from an SQL query.
+- query_plan: Returns how SQLite executes a query.
+- range_query: Returns the query for the rows between two timestamps.
+- query_range_gen: Queries the rows between two timestamps, optionally of one sensor.
 - query_db_rows_gen: Queries the row for the given date.
+- day_range: Returns the first and last timestamp of the day queried by query_db_rows_gen.
+- minute_report: Reports the missing, duplicate and empty minutes of a sensor between two timestamps.
+- insert_statement: Returns the insert statement for the given optional columns.
+- insert_rows: Inserts (timestamp, datetime, sensor_id, telegram) rows with one prepared statement.
+- insert_telegrams: Inserts Telegram objects with one prepared statement and logs a summary.
+
+The partition files are handled in modules/partitions.py, the connections of the ingest loop and the export
+(DBWriter and DBReader) in modules/db_writer.py and modules/db_reader.py.
 """
 
 import sqlite3
-from typing import Tuple
+import struct
+import zlib
+from logging import Logger
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
 from datetime import timezone
+from pathlib import Path
+import numpy
 # telegram_fields = config_dict['telegram_fields'].keys()
 
+# a telegram of a minute that is already in the database is ignored, see create_index
+INSERT_TELEGRAM = 'INSERT OR IGNORE INTO disdrodl(timestamp, datetime, sensor_id, telegram) VALUES (?, ?, ?, ?)'
+
+# how the spectrum field (Parsivel 93, Thies 81) is stored: in the telegram TEXT column,
+# or in the spectrum BLOB column as little-endian uint16, optionally zlib compressed
+SPECTRUM_STORAGE = ('text', 'blob', 'zlib')
+SPECTRUM_DTYPE = numpy.dtype('<u2')
+# SQLite column type of a scalar telegram field, by the first letter of its NetCDF dtype in the config
+SQL_TYPES = {'f': 'REAL', 'i': 'INTEGER', 'S': 'TEXT'}
+AGGREGATES = ('MIN', 'MAX', 'AVG', 'SUM', 'COUNT', 'TOTAL')
+
+# bytes of the database file a read-only connection maps into memory, so reads need no copy into the page cache
+MMAP_SIZE = 256 * 1024 * 1024
+
+RANGE_INDEX = 'idx_disdrodl_sensor_id_timestamp'
+UNIQUE_INDEX = 'idx_disdrodl_sensor_id_timestamp_unique'
 
-def connect_db(dbpath: str) -> Tuple[sqlite3.Connection, sqlite3.Cursor]:
+# first byte of a spectrum BLOB, telling how the uint16 values that follow are encoded
+SPECTRUM_RAW = b'\x00'
+SPECTRUM_ZLIB = b'\x01'
+
+# first byte of a parsed BLOB, the version of its format
+PARSED_FORMAT = b'\x01'
+# NumPy dtype of a parsed telegram field, by its NetCDF dtype in the config, the other fields (S4) stay strings
+PARSED_DTYPES = {'f4': '<f4', 'i2': '<i2', 'i4': '<i4'}
+# header of a field in a parsed BLOB: the length of the field name, the kind of the values (the NumPy type
+# character, or s for strings), whether the value is a list, and the length in bytes of the values
+PARSED_FIELD = struct.Struct('<BcBI')
+PARSED_STRING = b's'
+# separator of the strings of a field whose value is a list of strings
+PARSED_SEPARATOR = '\x1f'
+
+
+def connect_db(dbpath: str, timeout: float = 5.0) -> Tuple[sqlite3.Connection, sqlite3.Cursor]:
     """
     This function sets up a connection with the database at the path provided as argument.
     :param dbpath: the path to the database to connect to as a string
+    :param timeout: seconds to wait for a lock held by another connection before raising 'database is locked'
     :return: the connection and cursor objects as a tuple
     """
-    con = sqlite3.connect(dbpath)
+    con = sqlite3.connect(dbpath, timeout=timeout)
     cur = con.cursor()
     return con, cur
 
 
-def create_db(dbpath):
+def connect_db_readonly(dbpath, timeout: float = 5.0, mmap_size: int = MMAP_SIZE) -> sqlite3.Connection:
+    """
+    This function opens a read-only connection to the database at the path provided as argument,
+    e.g. for the export: the file is opened with mode=ro, so it is never created or written (PRAGMA query_only),
+    and up to mmap_size bytes of it are read through memory-mapped I/O.
+    :param dbpath: the path to the database to connect to
+    :param timeout: seconds to wait for a lock held by another connection before raising 'database is locked'
+    :param mmap_size: bytes of the file to memory-map, 0 to read with normal I/O
+    :return: the connection object
+    :raises sqlite3.OperationalError: if the database does not exist
+    """
+    con = sqlite3.connect(f'{Path(dbpath).resolve().as_uri()}?mode=ro', uri=True, timeout=timeout)
+    con.execute("PRAGMA query_only=ON")
+    con.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+    return con
+
+
+def create_db(dbpath, spectrum_storage='text', columns=None, parsed=False, quality=False):
     """
     This function creates disdrodl.db at the specified path.
     with Table: disdrodl
     with columns id, timestamp, sensor_id, telegram
+    and the column spectrum if the spectra are not stored as text,
+    and the typed columns of the scalar telegram fields if columns are given (see field_columns),
+    and the column parsed if parsed is True (see pack_fields),
+    and the column quality_flag if quality is True (see quality.py),
+    and a unique index on (sensor_id, timestamp) for the range queries of the export if the table is new
+    (see create_index, the index of an existing database is built by upgrade_db.py),
+    and the table database_id with a random id of the file (see create_database_id).
+    The database is switched to WAL journaling, which is stored in the file,
+    so readers (e.g. the export script) do not block the logger and vice versa.
     :param dbpath: the path to create disdrodl.db at as a string
+    :param spectrum_storage: how the spectrum field is stored: text, blob or zlib
+    :param columns: optional dictionary of the (column name, column type) per field, see field_columns
+    :param parsed: whether to add the column with the parsed telegram fields
+    :param quality: whether to add the column with the quality flag of the telegrams
     """
     con, cur = connect_db(dbpath=str(dbpath))
+    cur.execute("PRAGMA journal_mode=WAL")
     cur.execute("""
                 CREATE TABLE IF NOT EXISTS disdrodl
                 (
@@ -44,7 +143,311 @@ def create_db(dbpath):
                     telegram TEXT
                 )
                 """)
+    create_index(cur)
+    create_database_id(cur)
+    if spectrum_storage != 'text':
+        add_spectrum_column(cur)
+    if parsed:
+        add_parsed_column(cur)
+    if quality:
+        add_quality_column(cur)
+    if columns:
+        add_field_columns(cur, columns)
     con.commit()
+    cur.close()
+    con.close()
+
+
+def create_index(cur) -> bool:
+    """
+    This function creates the unique (sensor_id, timestamp) index of a new database, so a range query of one sensor
+    reads only the rows in the range instead of scanning the whole table, and a sensor has at most one row per
+    timestamp: inserting a telegram again (e.g. replayed after a restart) is ignored by INSERT OR IGNORE.
+    The index is only created on an empty table, which is instant. The index of an existing database is not built
+    here, as building it over millions of rows (and failing on a database with duplicate rows) on every start of the
+    logger would hold the write lock; it is built by upgrade_db.py (see the RangeIndex and UniqueMinutes migrations).
+    :param cur: the database cursor object
+    :return: True if the unique index exists, False if the database still has to be upgraded
+    """
+    if has_unique_index(cur):
+        return True
+    if cur.execute("SELECT 1 FROM disdrodl LIMIT 1").fetchone() is not None:
+        return False
+    return create_unique_index(cur)
+
+
+def create_database_id(cur) -> str:
+    """
+    This function stores a random id of the database file in the table database_id, if it has none yet.
+    The spool of the logger is tied to this id (see Spool), so when disdrodl.db is deleted or replaced,
+    the records spooled for the previous file are not replayed into the new one.
+    :param cur: the database cursor object
+    :return: the id, 16 hexadecimal characters
+    """
+    cur.execute("CREATE TABLE IF NOT EXISTS database_id (id TEXT)")
+    cur.execute("INSERT INTO database_id(id) SELECT lower(hex(randomblob(8))) "
+                "WHERE NOT EXISTS (SELECT 1 FROM database_id)")
+    return database_id(cur)
+
+
+def database_id(cur) -> Union[str, None]:
+    """
+    This function returns the random id of the database file, see create_database_id.
+    :param cur: the database cursor object
+    :return: the id, None if the database has no id (it was not opened by create_db since the id was introduced)
+    """
+    if cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'database_id'").fetchone() is None:
+        return None
+    row = cur.execute("SELECT id FROM database_id LIMIT 1").fetchone()
+    return row[0] if row is not None else None
+
+
+def has_unique_index(cur) -> bool:
+    """
+    This function returns whether the unique (sensor_id, timestamp) index exists, from sqlite_master.
+    :param cur: the database cursor object
+    :return: True if the unique index exists
+    """
+    return cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+                       (UNIQUE_INDEX,)).fetchone() is not None
+
+
+def create_range_index(cur):
+    """
+    This function creates the non-unique (sensor_id, timestamp) index for the range queries of an existing database,
+    if it has neither index yet. It is built from the existing rows (in WAL mode readers are not blocked).
+    :param cur: the database cursor object
+    """
+    if not has_unique_index(cur):
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {RANGE_INDEX} ON disdrodl(sensor_id, timestamp)")
+
+
+def create_unique_index(cur) -> bool:
+    """
+    This function creates the unique (sensor_id, timestamp) index, which replaces the non-unique index.
+    It is built from the existing rows, and fails if a sensor has more than one row of a timestamp,
+    which are removed by the UniqueMinutes migration (see migrations.py).
+    :param cur: the database cursor object
+    :return: True if the unique index exists, False if the table has duplicate rows
+    """
+    try:
+        cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {UNIQUE_INDEX} ON disdrodl(sensor_id, timestamp)")
+    except sqlite3.IntegrityError:
+        return False
+    # the unique index serves the range queries as well
+    cur.execute(f"DROP INDEX IF EXISTS {RANGE_INDEX}")
+    return True
+
+
+def add_spectrum_column(cur):
+    """
+    This function adds the spectrum BLOB column to the disdrodl table if it does not exist yet.
+    Existing rows keep their spectrum in the telegram column (and NULL in the spectrum column).
+    :param cur: the database cursor object
+    """
+    columns = [column[1] for column in cur.execute("PRAGMA table_info(disdrodl)").fetchall()]
+    if 'spectrum' not in columns:
+        cur.execute("ALTER TABLE disdrodl ADD COLUMN spectrum BLOB")
+
+
+def add_parsed_column(cur):
+    """
+    This function adds the parsed BLOB column to the disdrodl table if it does not exist yet.
+    Existing rows get NULL in the parsed column, they are parsed from the telegram column as before.
+    :param cur: the database cursor object
+    """
+    columns = [column[1] for column in cur.execute("PRAGMA table_info(disdrodl)").fetchall()]
+    if 'parsed' not in columns:
+        cur.execute("ALTER TABLE disdrodl ADD COLUMN parsed BLOB")
+
+
+def add_quality_column(cur):
+    """
+    This function adds the quality_flag column to the disdrodl table if it does not exist yet.
+    Existing rows get NULL in the quality_flag column, until a migration checks them (see migrations.QualityFlag).
+    :param cur: the database cursor object
+    """
+    columns = [column[1] for column in cur.execute("PRAGMA table_info(disdrodl)").fetchall()]
+    if 'quality_flag' not in columns:
+        cur.execute("ALTER TABLE disdrodl ADD COLUMN quality_flag INTEGER")
+
+
+def field_columns(config_dict: Dict) -> Dict[str, Tuple[str, str]]:
+    """
+    This function generates the typed columns of the scalar telegram fields (fields without dimensions,
+    or only the time dimension) from the telegram_fields of a config, the type is taken from the dtype.
+    :param config_dict: the config dictionary with telegram_fields, e.g. of config_general_parsivel.yml
+    :return: dictionary of the (column name, column type) per field, e.g. {'01': ('f01', 'REAL'), ...}
+    """
+    columns = {}
+    for field, field_dict in config_dict['telegram_fields'].items():
+        dimensions = field_dict.get('dimensions') or []
+        if len(dimensions) > 1 or (len(dimensions) == 1 and dimensions[0] != 'time'):
+            continue
+        columns[field] = (f'f{field}', SQL_TYPES[field_dict['dtype'][0]])
+    return columns
+
+
+def add_field_columns(cur, columns: Dict[str, Tuple[str, str]]):
+    """
+    This function adds the typed columns of the scalar telegram fields to the disdrodl table if they do not exist yet.
+    Existing rows get NULL in the new columns, their values stay in the telegram column.
+    :param cur: the database cursor object
+    :param columns: dictionary of the (column name, column type) per field, see field_columns
+    """
+    existing = [column[1] for column in cur.execute("PRAGMA table_info(disdrodl)").fetchall()]
+    for column, column_type in columns.values():
+        if column not in existing:
+            cur.execute(f"ALTER TABLE disdrodl ADD COLUMN {column} {column_type}")
+
+
+def field_value(value, column_type: str):
+    """
+    This function converts a telegram value to the type of its column.
+    :param value: the value from the telegram data, a string (or a list if the field had no single value)
+    :param column_type: REAL, INTEGER or TEXT
+    :return: the converted value, None if the value is missing or cannot be converted
+    """
+    if not isinstance(value, str) or len(value) == 0:
+        return None
+    try:
+        if column_type == 'REAL':
+            return float(value)
+        if column_type == 'INTEGER':
+            return int(float(value))
+    except ValueError:
+        return None
+    return value
+
+
+def field_aggregate(con, column: str, aggregate: str, start_ts, end_ts, sensor_id=None):
+    """
+    This function runs an aggregate function over a field column between two timestamps inside SQLite,
+    e.g. the maximum rain intensity of a month: field_aggregate(con, 'f01', 'MAX', start_ts, end_ts, 'PAR008').
+    :param con: the database connection object
+    :param column: the field column, e.g. f01
+    :param aggregate: MIN, MAX, AVG, SUM, COUNT or TOTAL
+    :param start_ts: the first timestamp (seconds since epoch) to include
+    :param end_ts: the timestamp (seconds since epoch) to stop at, excluded
+    :param sensor_id: optional sensor_id (sensor name), to only aggregate the rows of that sensor using the index
+    :return: the result of the aggregate
+    """
+    if aggregate.upper() not in AGGREGATES:
+        raise ValueError(f'aggregate should be one of {AGGREGATES}, not {aggregate}')
+    if not column.isidentifier():
+        raise ValueError(f'{column} is not a column name')
+    query_str = f"SELECT {aggregate.upper()}({column}) FROM disdrodl WHERE timestamp >= ? AND timestamp < ?"
+    params = (start_ts, end_ts)
+    if sensor_id is not None:
+        query_str += " AND sensor_id = ?"
+        params += (sensor_id,)
+    return con.execute(query_str, params).fetchone()[0]
+
+
+def pack_spectrum(values: Union[str, Sequence], compress: bool = False) -> bytes:
+    """
+    This function packs the values of a spectrum field into a BLOB of little-endian uint16,
+    preceded by one byte telling whether the values are zlib compressed.
+    :param values: the values as a list of strings (or numbers), or as one string separated by ','
+    :param compress: whether to zlib compress the values
+    :return: the BLOB
+    :raises ValueError: if a value is not an integer between 0 and 65535
+    """
+    if isinstance(values, str):
+        values = values.split(',')
+    try:
+        data = numpy.asarray(values).astype(SPECTRUM_DTYPE).tobytes()
+    except OverflowError as e:
+        raise ValueError(str(e)) from e
+    if compress:
+        return SPECTRUM_ZLIB + zlib.compress(data)
+    return SPECTRUM_RAW + data
+
+
+def unpack_spectrum(blob: bytes, shape: Union[Tuple[int, ...], None] = None) -> numpy.ndarray:
+    """
+    This function unpacks a spectrum BLOB into a NumPy array of uint16, without parsing any strings.
+    :param blob: the BLOB created by pack_spectrum
+    :param shape: optional shape of the array, e.g. (32, 32), a flat array by default
+    :return: the array of values
+    """
+    data = blob[1:]
+    if blob[:1] == SPECTRUM_ZLIB:
+        data = zlib.decompress(data)
+    array = numpy.frombuffer(data, dtype=SPECTRUM_DTYPE)
+    if shape is not None:
+        array = array.reshape(shape)
+    return array
+
+
+def field_dtypes(config_dict: Dict) -> Dict[str, Union[str, None]]:
+    """
+    This function returns the NumPy dtype of the parsed value of every telegram field, from its dtype in the config.
+    :param config_dict: the config dictionary with telegram_fields, e.g. of config_general_parsivel.yml
+    :return: dictionary of the dtype per field, e.g. {'01': '<f4', ...}, None for the fields that stay strings
+    """
+    return {field: PARSED_DTYPES.get(field_dict['dtype'])
+            for field, field_dict in config_dict['telegram_fields'].items()}
+
+
+def pack_fields(telegram_data: Dict, dtypes: Dict[str, Union[str, numpy.dtype, None]]) -> bytes:
+    """
+    This function packs parsed telegram data (see Telegram.parse_telegram_row) into a BLOB, keyed by field:
+    the values of a field with a dtype are stored as little-endian binary values of that dtype, and as UTF-8 strings
+    if they cannot be converted without loss (e.g. 'None'), the values of the other fields as UTF-8 strings.
+    :param telegram_data: dictionary of the value per field, a string or a list (or array) of values
+    :param dtypes: the NumPy dtype per field, see field_dtypes
+    :return: the BLOB
+    """
+    data = bytearray(PARSED_FORMAT)
+    for field, value in telegram_data.items():
+        is_list = not isinstance(value, str)
+        values = value if is_list else [value]
+        kind, payload = PARSED_STRING, PARSED_SEPARATOR.join(str(v) for v in values).encode('utf-8')
+        if dtypes.get(field) is not None:
+            try:
+                floats = numpy.asarray(values, dtype=numpy.float64)
+                with numpy.errstate(invalid='ignore', over='ignore'):
+                    typed = floats.astype(dtypes[field])
+                # integers are only stored as binary if they are whole numbers within the range of their dtype
+                if typed.dtype.kind == 'f' or numpy.array_equal(typed, floats):
+                    kind, payload = typed.dtype.char.encode('ascii'), typed.tobytes()
+            except (TypeError, ValueError):
+                pass
+        key = field.encode('ascii')
+        data += PARSED_FIELD.pack(len(key), kind, is_list, len(payload)) + key + payload
+    return bytes(data)
+
+
+def unpack_fields(blob: bytes) -> Dict:
+    """
+    This function unpacks a BLOB of pack_fields into parsed telegram data, without parsing any strings
+    but those of the fields that are stored as strings.
+    :param blob: the BLOB created by pack_fields
+    :return: dictionary of the value per field: a NumPy scalar, a NumPy array, a string or a list of strings
+    :raises ValueError: if the BLOB has an unknown format
+    """
+    if blob[:1] != PARSED_FORMAT:
+        raise ValueError(f'unknown format {blob[:1]} of the parsed telegram')
+    view = memoryview(blob)
+    telegram_data = {}
+    offset = len(PARSED_FORMAT)
+    while offset < len(blob):
+        key_size, kind, is_list, size = PARSED_FIELD.unpack_from(blob, offset)
+        offset += PARSED_FIELD.size
+        field = bytes(view[offset:offset + key_size]).decode('ascii')
+        payload = view[offset + key_size:offset + key_size + size]
+        offset += key_size + size
+        if kind == PARSED_STRING:
+            text = bytes(payload).decode('utf-8')
+            if is_list:
+                telegram_data[field] = text.split(PARSED_SEPARATOR) if size else []
+            else:
+                telegram_data[field] = text
+        else:
+            array = numpy.frombuffer(payload, dtype=numpy.dtype(kind.decode('ascii')).newbyteorder('<'))
+            telegram_data[field] = array if is_list else array[0]
+    return telegram_data
 
 
 def dict_factory(cursor, row):
@@ -58,31 +461,198 @@ def dict_factory(cursor, row):
     return {key: value for key, value in zip(fields, row)} # pylint: disable=unnecessary-comprehension
 
 
-def sql_query_gen(con, query):
+def sql_query_gen(con, query, params=()):
     """
     This function generates rows from an SQL query.
     :param con: the database connection object
     :param query: the query to be executed
+    :param params: the values bound to the ? placeholders of the query
     :return: the result of the query
     """
     con.row_factory = dict_factory
-    yield from con.execute(query)
+    yield from con.execute(query, params)
+
+
+def query_plan(con, query, params=()) -> List[str]:
+    """
+    This function returns how SQLite executes a query, e.g. to check that it uses an index.
+    :param con: the database connection object
+    :param query: the query
+    :param params: the values bound to the ? placeholders of the query
+    :return: the details of the steps of the query plan, e.g. 'SEARCH disdrodl USING INDEX ...'
+    """
+    return [step[-1] for step in con.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()]
+
+
+def range_query(sensor_id=None) -> str:
+    """
+    This function returns the query for the rows between two timestamps, with ? placeholders for the bounds.
+    :param sensor_id: if not None, the query also has a placeholder for the sensor_id, so it uses the index
+    :return: the query string
+    """
+    if sensor_id is None:
+        return "SELECT * FROM disdrodl WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp"
+    return "SELECT * FROM disdrodl WHERE sensor_id = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp"
 
 
-def query_db_rows_gen(con, date_dt, logger):
+def query_range_gen(con, start_ts, end_ts, sensor_id=None, logger=None):
+    """
+    This function queries the database entries with start_ts <= timestamp < end_ts, ordered by timestamp.
+    If a sensor_id is given, only that sensor's rows are read using the (sensor_id, timestamp) index,
+    so the query time depends on the number of rows in the range and not on the size of the database.
+    :param con: the database connection object
+    :param start_ts: the first timestamp (seconds since epoch) to include
+    :param end_ts: the timestamp (seconds since epoch) to stop at, excluded
+    :param sensor_id: optional sensor_id (sensor name) to get the rows of
+    :param logger: optional logger object to log the query
+    :return: the result of the query
+    """
+    query_str = range_query(sensor_id)
+    params = (start_ts, end_ts) if sensor_id is None else (sensor_id, start_ts, end_ts)
+    if logger is not None:
+        logger.debug(msg=f'{query_str} {params}')
+    yield from sql_query_gen(con, query_str, params)
+
+
+def query_db_rows_gen(con, date_dt, logger, sensor_id=None):
     """
     This function queries the database entries for the specified date between 00:00:00 and 23:59:59.
     :param con: the database connection object
     :param date_dt: the date to get entries from in the format year,month,day
     :param logger: the logger object to log the query string
+    :param sensor_id: optional sensor_id (sensor name), to only get the rows of that sensor using the index
     :return: the result of the query
     """
+    start_ts, end_ts = day_range(date_dt)
+    # Append each SQL response row as Telegram instance to telegram_objs var
+    yield from query_range_gen(con, start_ts=start_ts, end_ts=end_ts, sensor_id=sensor_id, logger=logger)
+
+
+def day_range(date_dt) -> Tuple[float, float]:
+    """
+    This function returns the timestamps of the day queried by query_db_rows_gen, 00:00:00 and 23:59:59.
+    :param date_dt: the date in the format year,month,day
+    :return: the first timestamp of the day, and the timestamp to stop at
+    """
     start_dt = date_dt.replace(hour=0, minute=0, second=0, tzinfo=timezone.utc)  # redundant replace
-    start_ts = start_dt.timestamp()
     end_dt = date_dt.replace(hour=23, minute=59, second=59, tzinfo=timezone.utc)
-    end_ts = end_dt.timestamp()
-    query_str = f"SELECT * FROM disdrodl WHERE timestamp >= {start_ts} AND timestamp < {end_ts}"
-    logger.debug(msg=query_str)
-    # Append each SQL response row as Telegram instance to telegram_objs var
-    con.row_factory = dict_factory
-    yield from con.execute(query_str)
+    return start_dt.timestamp(), end_dt.timestamp()
+
+
+def minute_report(con, start_ts, end_ts, sensor_id, interval: int = 60) -> Dict:
+    """
+    This function reports the minutes of a sensor between two timestamps that are missing, stored more than once
+    or stored without data, e.g. for a day (see day_range) or a year. The gaps and duplicates are found by one query
+    that reads the timestamps in the order of the (sensor_id, timestamp) index and compares every timestamp with
+    the previous one (LAG), so only the gaps and duplicates are returned to Python instead of every minute.
+    The timestamps are not rounded: a step from the previous timestamp of 1.5 intervals or more is a gap
+    (of round(step / interval) - 1 minutes), and a step of less than half an interval is a duplicate, so a telegram
+    logged a few seconds late (a step between 0.5 and 1.5 intervals) is neither.
+    :param con: the database connection object
+    :param start_ts: the first timestamp (seconds since epoch) to include, the first expected minute
+    :param end_ts: the timestamp (seconds since epoch) to stop at, excluded
+    :param sensor_id: the sensor_id (sensor name) to report on
+    :param interval: the seconds between two telegrams
+    :return: dictionary with the number of expected, present, missing and empty minutes,
+             the gaps as (first missing timestamp, last missing timestamp, number of missing minutes) tuples,
+             and the duplicates as (timestamp, number of rows) tuples of the minutes stored more than once
+    """
+    expected = max(0, -int((start_ts - end_ts) // interval))
+    # the first expected minute after the range, which closes a gap at the end of the range
+    stop_ts = start_ts + expected * interval
+    where = "sensor_id = ? AND timestamp >= ? AND timestamp < ?"
+    params = (sensor_id, start_ts, end_ts)
+    # the steps from the previous timestamp that are a gap (1.5 intervals or more) or a duplicate (less than half)
+    steps = con.execute(f"""
+        SELECT previous, next FROM (
+            SELECT LAG(timestamp, 1, ?) OVER (ORDER BY timestamp) AS previous, timestamp AS next
+            FROM disdrodl WHERE {where}
+        ) WHERE next - previous >= ? OR next - previous < ?
+        """, (start_ts - interval,) + params + (1.5 * interval, 0.5 * interval)).fetchall()
+    rows, empty, last = con.execute(f"SELECT COUNT(*), TOTAL(telegram = ''), MAX(timestamp) FROM disdrodl "
+                                    f"WHERE {where}", params).fetchone()
+    gaps, duplicates = [], []
+    for previous, timestamp in steps:
+        if timestamp - previous >= 1.5 * interval:
+            gaps.append((previous + interval, timestamp - interval, round((timestamp - previous) / interval) - 1))
+        elif duplicates and duplicates[-1][2] == previous:
+            duplicates[-1] = (duplicates[-1][0], duplicates[-1][1] + 1, timestamp)
+        else:
+            duplicates.append((previous, 2, timestamp))
+    if last is None:
+        last = start_ts - interval
+    if stop_ts - last >= 1.5 * interval:
+        gaps.append((last + interval, stop_ts - interval, round((stop_ts - last) / interval) - 1))
+    return {'expected': expected,
+            'present': rows - sum(count - 1 for _, count, _ in duplicates),
+            'missing': sum(gap[2] for gap in gaps),
+            'empty': int(empty),
+            'gaps': gaps,
+            'duplicates': [(timestamp, count) for timestamp, count, _ in duplicates]}
+
+
+def insert_statement(spectrum: bool = False, columns: Sequence[str] = (), parsed: bool = False,
+                     quality: bool = False) -> str:
+    """
+    This function returns the insert statement with bound parameters for the given optional columns.
+    :param spectrum: whether the statement includes the spectrum BLOB
+    :param columns: names of the field columns the statement includes
+    :param parsed: whether the statement includes the parsed BLOB
+    :param quality: whether the statement includes the quality flag
+    :return: the insert statement
+    """
+    if not spectrum and not columns and not parsed and not quality:
+        return INSERT_TELEGRAM
+    names = ['timestamp', 'datetime', 'sensor_id', 'telegram'] + (['spectrum'] if spectrum else []) + \
+        (['parsed'] if parsed else []) + (['quality_flag'] if quality else []) + list(columns)
+    return f"INSERT OR IGNORE INTO disdrodl({', '.join(names)}) VALUES ({', '.join('?' * len(names))})"
+
+
+def insert_rows(cur: sqlite3.Cursor, rows: Iterable[Tuple], spectrum: bool = False,
+                columns: Sequence[str] = (), parsed: bool = False, quality: bool = False) -> int:
+    """
+    This function inserts rows into the disdrodl table with bound parameters, so the statement is prepared once
+    for all rows and quotes in the telegram need no escaping.
+    Rows of a (sensor_id, timestamp) that is already in the table are ignored, see create_index.
+    :param cur: the database cursor object
+    :param rows: (timestamp, datetime, sensor_id, telegram) tuples, followed by the spectrum if spectrum is True,
+                 the parsed BLOB if parsed is True, the quality flag if quality is True and the values of the columns
+    :param spectrum: whether the rows include the spectrum BLOB
+    :param columns: names of the field columns the rows include
+    :param parsed: whether the rows include the parsed BLOB
+    :param quality: whether the rows include the quality flag
+    :return: the number of inserted rows
+    """
+    cur.executemany(insert_statement(spectrum=spectrum, columns=columns, parsed=parsed, quality=quality), rows)
+    return cur.rowcount
+
+
+def insert_telegrams(cur: sqlite3.Cursor, telegrams: List, logger: Union[Logger, None] = None,
+                     spectrum_storage: str = 'text', columns: Union[Dict[str, Tuple[str, str]], None] = None,
+                     parsed: bool = False, quality: bool = False) -> int:
+    """
+    This function inserts Telegram objects into the disdrodl table with one prepared statement,
+    e.g. one batch of the ingest loop or a backfill, and logs a summary instead of the statements.
+    :param cur: the database cursor object
+    :param telegrams: list of Telegram objects to insert
+    :param logger: optional logger to log the summary
+    :param spectrum_storage: how the spectrum field is stored: text, blob or zlib
+    :param columns: optional dictionary of the (column name, column type) per field to fill, see field_columns
+    :param parsed: whether to store the parsed telegram fields in the parsed column, see pack_fields
+    :param quality: whether to store the quality flag of the telegrams in the quality_flag column
+    :return: the number of inserted telegrams, without the telegrams of minutes that were already in the table
+    """
+    rows = [telegram.db_row(spectrum_storage=spectrum_storage, columns=columns, parsed=parsed, quality=quality)
+            for telegram in telegrams]
+    inserted = insert_rows(cur=cur, rows=rows, spectrum=spectrum_storage != 'text',
+                           columns=[column for column, _ in (columns or {}).values()], parsed=parsed,
+                           quality=quality)
+    if logger is not None and rows:
+        period = rows[0][1] if len(rows) == 1 else f'{rows[0][1]} - {rows[-1][1]}'
+        logger.info(msg=f'inserting to DB: {period}')
+        logger.debug(msg=f'inserted {inserted} telegram(s) from {rows[0][2]}, '
+                         f'{sum(len(row[3]) for row in rows)} characters')
+        if inserted < len(rows):
+            logger.warning(msg=f'ignored {len(rows) - inserted} telegram(s) from {rows[0][2]} '
+                               f'of minutes that are already in the database: {period}')
+    return inserted
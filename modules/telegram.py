@@ -4,15 +4,36 @@ and the implementation of different telegram classes inheriting this class.
 
 Functions:
 - create_telegram: Creates a specific Telegram object based on the sensor type in the configuration dictionary.
+- decode_telegrams: Decodes the telegrams of a batch of database rows at once into a structured array.
+- telegrams2records: Converts the telegram data of many telegrams at once into a structured array with quality flags.
+- parse_numbers: Parses comma separated numbers with one NumPy call.
+- decode_spectrum: Decodes fixed width spectrum values straight from their bytes with a fixed stride.
+- scalar_column: Converts the values of a scalar field of all telegrams into one typed column.
+- array_column: Converts the values of a field with dimensions of all telegrams into one typed (T, ...) column.
 """
 
+import warnings
 from abc import abstractmethod, ABC
 from datetime import datetime
 from venv import logger as telegram_logger
 from sqlite3 import Cursor
 from logging import Logger
-from typing import Dict, Union
-import chardet
+from typing import Dict, Iterable, List, Tuple, Union
+
+import numpy
+
+from modules.sqldb import insert_telegrams, pack_spectrum, unpack_spectrum, field_value, pack_fields, \
+    unpack_fields, SPECTRUM_DTYPE
+from modules.schema import compile_schema, TelegramSchema, DEFAULT_FILL_VALUE
+from modules.registry import get_sensor_entry
+from modules.quality import scalar_flags, QUALITY_DTYPE, QUALITY_MISSING, QUALITY_TRUNCATED
+
+# the value of a field with dimensions that does not have the right number of values
+ERROR_VALUE = -99
+# the value of a scalar field that is missing or not a number, the fill value of the NetCDF variables
+FILL_VALUE = DEFAULT_FILL_VALUE
+# the fields of a record of telegrams2records before the fields of the telegram
+RECORD_FIELDS = ('id', 'timestamp', 'quality_flag')
 
 
 class Telegram(ABC):
@@ -31,20 +52,39 @@ class Telegram(ABC):
     - telegram_data: data from the telegram sent by a sensor
     - db_row_id: row id from the database
     - telegram_data_str: telegram data string
+    - spectrum_blob: the spectrum BLOB from the database, None if the spectrum is stored in the telegram string
+    - parsed_blob: the parsed BLOB from the database, None if the telegram is parsed from the telegram string
+    - SPECTRUM_FIELD: the field holding the raw spectrum (stored as a BLOB when enabled)
+    - SPECTRUM_SIZE: the number of values in the raw spectrum
+    - DATA_FIELD: the field a telegram from the database has only if it has data
+    - schema: the compiled schema of the telegram fields of self.config_dict, shared by all telegrams of that config
 
     Functions:
     - capture_prefixes_and_data: captures the telegram prefixes and data stored in self.telegram_lines
         and adds the data to self.telegram_data dict
+    - lookup_fields: returns the values of a few fields, without capturing the whole telegram if it was not captured
     - parse_telegram_row: parses telegram string from SQL telegram field
     - prep_telegram_data4db: transforms self.telegram_data so that it can be easily inserted to SQL DB
+    - db_row: captures and prepares the telegram data as a row of the database
+    - quality_flag: returns the quality flag of the telegram data, see quality.py
+    - spectrum2blob: packs the spectrum field into a BLOB
+    - blob2spectrum: sets the spectrum field from the spectrum BLOB
+    - parsed2blob: packs the telegram data, as parse_telegram_row returns it, into a BLOB
+    - blob2parsed: sets the telegram data from the parsed BLOB
     - insert2db: inserts telegram strings into the database
     - Functions:
     - str2list: Converts telegram_data values from string to list by splitting at the specified separator.
+    - str2spectrum: Converts the spectrum field from string to an array of uint16, see decode_spectrum.
     """
 
-    def __init__(self, config_dict: Dict, telegram_lines: Union[str, bytes],
+    SPECTRUM_FIELD = None
+    SPECTRUM_SIZE = 0
+    DATA_FIELD = None
+
+    def __init__(self, config_dict: Dict, telegram_lines: Union[str, bytes],  # pylint: disable=too-many-arguments
                  timestamp: datetime, db_cursor: Union[Cursor, None],
-                 logger: Logger, telegram_data: Dict, db_row_id=None, telegram_data_str=None):
+                 logger: Logger, telegram_data: Dict, db_row_id=None, telegram_data_str=None, spectrum_blob=None,
+                 parsed_blob=None):
         """
         Constructor for telegram class
         :param config_dict: dictionary for later exporting into netcdf
@@ -55,6 +95,8 @@ class Telegram(ABC):
         :param telegram_data: data from the telegram sent by a sensor
         :param db_row_id: row id from the database
         :param telegram_data_str: telegram data string
+        :param spectrum_blob: the spectrum BLOB from the database, if the spectrum is not in the telegram string
+        :param parsed_blob: the parsed BLOB from the database, if the telegram was stored with its parsed fields
         """
         self.config_dict = config_dict
         self.telegram_lines = telegram_lines
@@ -65,6 +107,15 @@ class Telegram(ABC):
         self.db_cursor = db_cursor
         self.db_row_id = db_row_id
         self.telegram_data_str = telegram_data_str
+        self.spectrum_blob = spectrum_blob
+        self.parsed_blob = parsed_blob
+
+    @property
+    def schema(self) -> TelegramSchema:
+        """
+        The compiled schema of the telegram fields of self.config_dict, see schema.compile_schema
+        """
+        return compile_schema(self.config_dict['telegram_fields'], self.config_dict.get('dimensions'))
 
     @abstractmethod
     def capture_prefixes_and_data(self):
@@ -73,13 +124,30 @@ class Telegram(ABC):
         and adds the data to self.telegram_data dict.
         """
 
+    def lookup_fields(self, fields: Iterable[str]) -> Union[Dict, None]:
+        """
+        Method returning the values of a few fields, e.g. the settings reported by the sensor, which the acquisition
+        loop compares with the config (see SensorSession.update). The values are taken from self.telegram_data
+        if the telegram was captured, the sensor types look them up in self.telegram_lines otherwise,
+        so the whole telegram is only captured once, by the writer thread (see db_row).
+        This implementation captures the telegram if it was not captured yet.
+        :param fields: the fields, e.g. ['22', '23']
+        :return: dictionary of the value per field, without the fields the telegram does not have,
+                 None if the telegram has no data
+        """
+        if not self.telegram_data:
+            self.capture_prefixes_and_data()
+        if not self.telegram_data:
+            return None
+        return {field: self.telegram_data[field] for field in fields if field in self.telegram_data}
+
     @abstractmethod
     def parse_telegram_row(self):
         """
         Abstract method that parses telegram string from SQL telegram field.
         """
 
-    def prep_telegram_data4db(self):
+    def prep_telegram_data4db(self, exclude=()):
         """
         Transforms self.telegram_data items into self.telegram_data_str
         so that it can be easily inserted to SQL DB.
@@ -89,10 +157,13 @@ class Telegram(ABC):
         * empty lists, empty strings: converted to 'None'
         Example: 19:None; 20:10; 21:25.05.2023;
         51:000140; 90:-9.999|-9.999|-9.999|-9.999|-9.999 ...
+        :param exclude: fields to leave out, e.g. the spectrum when it is stored as a BLOB
         """
         self.telegram_data_str = ''
 
         for key, val in self.telegram_data.items():
+            if key in exclude:
+                continue
             dt_str = f'{key}:'
 
             if isinstance(val, list):
@@ -105,6 +176,12 @@ class Telegram(ABC):
                     dt_str += 'None'
                 else:
                     dt_str += val
+            elif isinstance(val, numpy.ndarray):
+                # a spectrum decoded from the telegram, written with the width of its values in the telegram
+                if val.size == 0:
+                    dt_str += 'None'
+                else:
+                    dt_str += ','.join(map('{:03d}'.format, val.ravel().tolist()))
 
             self.telegram_data_str += dt_str
             self.telegram_data_str += '; '
@@ -112,25 +189,127 @@ class Telegram(ABC):
         self.telegram_data_str = self.telegram_data_str[:-2]  # remove last '; '
 
 
-    def insert2db(self):
-        """"
-        Method for passing telegrams strings into the database
+    def db_row(self, spectrum_storage: str = 'text',
+               columns: Union[Dict[str, Tuple[str, str]], None] = None, parsed: bool = False,
+               quality: bool = False) -> Tuple:
         """
-        self.capture_prefixes_and_data()
-        self.prep_telegram_data4db()
-
-        self.logger.info(msg=f'inserting to DB: {self.timestamp.isoformat()}')
-        insert = 'INSERT INTO disdrodl(timestamp, datetime, sensor_id, telegram) VALUES'
+        Method for capturing and preparing the telegram data as a row of the disdrodl table,
+        a telegram that was captured before is not captured again
+        :param spectrum_storage: how the spectrum field is stored: text, blob or zlib
+        :param columns: optional dictionary of the (column name, column type) per field, see sqldb.field_columns
+        :param parsed: whether to add the parsed BLOB, see parsed2blob
+        :param quality: whether to add the quality flag, see quality_flag
+        :return: the (timestamp, datetime, sensor_id, telegram) tuple, followed by the spectrum BLOB
+                 if it is not stored as text, the parsed BLOB if parsed is True, the quality flag if quality is True,
+                 and the typed values of the columns
+        """
+        if not self.telegram_data:
+            self.capture_prefixes_and_data()
+
+        blob = None if spectrum_storage == 'text' else self.spectrum2blob(compress=spectrum_storage == 'zlib')
+        # a spectrum that cannot be packed stays in the telegram string (and in the parsed BLOB)
+        exclude = (self.SPECTRUM_FIELD,) if blob is not None else ()
+        parsed_blob = self.parsed2blob(exclude=exclude) if parsed else None
+        self.prep_telegram_data4db(exclude=exclude)
+
+        row = (self.timestamp.timestamp(), self.timestamp.isoformat(), self.config_dict['global_attrs']['sensor_name'],
+               self.telegram_data_str)
+        if spectrum_storage != 'text':
+            row += (blob,)
+        if parsed:
+            row += (parsed_blob,)
+        if quality:
+            row += (self.quality_flag(),)
+
+        if columns:
+            row += tuple(field_value(self.telegram_data.get(field), column_type)
+                         for field, (_, column_type) in columns.items())
+        return row
+
+    def quality_flag(self) -> int:
+        """
+        Method for checking the captured or parsed telegram data, with the same checks as the export
+        (see telegrams2records): a telegram without data is missing, and also truncated if the sensor did
+        return something, e.g. a Thies telegram without 526 values
+        :return: the quality flag, a bitmask of the QUALITY_ bits in quality.py
+        """
+        if self.DATA_FIELD not in self.telegram_data:
+            return QUALITY_MISSING | (QUALITY_TRUNCATED if any(self.telegram_lines) else 0)
+        records = telegrams2records(self.config_dict, [self.db_row_id or 0], [self.timestamp.timestamp()],
+                                    [self.telegram_data])
+        return int(records['quality_flag'][0])
 
-        timestamp_str = self.timestamp.isoformat()
-        ts = self.timestamp.timestamp()
-        sensor = self.config_dict['global_attrs']['sensor_name']
-        t_str = self.telegram_data_str
+    def spectrum2blob(self, compress: bool = False) -> Union[bytes, None]:
+        """
+        Method for packing the spectrum field into a BLOB of little-endian uint16
+        :param compress: whether to zlib compress the BLOB
+        :return: the BLOB, or None if the telegram has no spectrum or it has the wrong number of values
+        """
+        values = self.telegram_data.get(self.SPECTRUM_FIELD)
+        if values is None:
+            return None
+        try:
+            blob = pack_spectrum(values, compress=compress)
+        except ValueError as e:
+            self.logger.error(msg=f'field {self.SPECTRUM_FIELD} stored as text, it has values that are not uint16: {e}')
+            return None
+        if len(unpack_spectrum(blob)) != self.SPECTRUM_SIZE:
+            self.logger.error(msg=f'field {self.SPECTRUM_FIELD} stored as text, '
+                                  f'it does not have {self.SPECTRUM_SIZE} values')
+            return None
+        return blob
+
+    def blob2spectrum(self) -> bool:
+        """
+        Method for setting the spectrum field from self.spectrum_blob, as a flat NumPy array of uint16
+        :return: True if the spectrum was set, False if there is no spectrum BLOB
+        """
+        if self.spectrum_blob is None:
+            return False
+        self.telegram_data[self.SPECTRUM_FIELD] = unpack_spectrum(self.spectrum_blob)
+        return True
 
-        insert_str = f"{insert} ({ts}, '{timestamp_str}', '{sensor}', '{t_str}');"
+    def parsed2blob(self, exclude=()) -> Union[bytes, None]:
+        """
+        Method for packing the telegram data into a BLOB of typed values (see sqldb.pack_fields), as parse_telegram_row
+        returns it from the telegram string, so the export reads the same values without parsing the string again
+        :param exclude: fields to leave out, e.g. the spectrum when it is stored in the spectrum BLOB
+        :return: the BLOB, or None if the telegram has no data or cannot be parsed
+        """
+        if not self.telegram_data:
+            return None
+        self.prep_telegram_data4db()
+        telegram = type(self)(config_dict=self.config_dict, telegram_lines=self.telegram_data_str,
+                              timestamp=self.timestamp, db_cursor=None, logger=self.logger, telegram_data={},
+                              spectrum_blob=self.spectrum_blob)
+        try:
+            telegram.parse_telegram_row()
+        except KeyError as e:
+            self.logger.error(msg=f'telegram stored without parsed BLOB, field {e} is missing')
+            return None
+        dtypes = dict(self.schema.parsed_dtypes)
+        dtypes[self.SPECTRUM_FIELD] = SPECTRUM_DTYPE
+        return pack_fields({field: value for field, value in telegram.telegram_data.items() if field not in exclude},
+                           dtypes)
+
+    def blob2parsed(self) -> bool:
+        """
+        Method for setting the telegram data from self.parsed_blob, and the spectrum field from self.spectrum_blob
+        if the spectrum is not in the parsed BLOB
+        :return: True if the telegram data was set, False if there is no parsed BLOB
+        """
+        if self.parsed_blob is None:
+            return False
+        self.telegram_data.update(unpack_fields(self.parsed_blob))
+        if self.SPECTRUM_FIELD not in self.telegram_data:
+            self.blob2spectrum()
+        return True
 
-        self.logger.debug(msg=insert_str)
-        self.db_cursor.execute(insert_str)
+    def insert2db(self):
+        """"
+        Method for passing telegrams strings into the database, with bound parameters
+        """
+        insert_telegrams(cur=self.db_cursor, telegrams=[self], logger=self.logger)
 
 
     def str2list(self, field, separator):
@@ -144,22 +323,74 @@ class Telegram(ABC):
         list_val = str_val.split(separator)
         self.telegram_data[field] = list_val
 
+    def str2spectrum(self):
+        """
+        Converts the spectrum field from string to a flat array of uint16, decoded with a fixed stride
+        (see decode_spectrum), or to a list of strings (see str2list) if it does not have SPECTRUM_SIZE values
+        of three digits, so the NetCDF gets the error value for it.
+        """
+        str_val = self.telegram_data[self.SPECTRUM_FIELD]
+        try:
+            spectrum = decode_spectrum(str_val.encode('ascii'), self.SPECTRUM_SIZE)
+        except (AttributeError, UnicodeEncodeError):
+            spectrum = None
+        if spectrum is None:
+            self.str2list(field=self.SPECTRUM_FIELD, separator=',')
+        else:
+            self.telegram_data[self.SPECTRUM_FIELD] = spectrum
+
 
 class ParsivelTelegram(Telegram):
     """
     Class dedicated to handling the returned the Parsivel telegram lines:
     * storing, processing and writing telegram to netCDF.
     Note: f61 is handled a little differently as its values are multi-line, hence self.f61_rows.
+
+    Attributes:
+    - decode_fallbacks: number of telegrams (of all ParsivelTelegram objects) that were not plain ASCII,
+        and needed the encoding to be detected
     """
 
+    SPECTRUM_FIELD = '93'
+    SPECTRUM_SIZE = 1024
+    DATA_FIELD = '90'
+    decode_fallbacks = 0
+
+    def decode_telegram_lines(self, lines: Union[List[bytes], None] = None) -> str:
+        """
+        Decodes all lines stored in self.telegram_lines at once, joined by newlines.
+        The Parsivel sends plain ASCII, a telegram with other bytes (e.g. a corrupted byte on the serial line)
+        is decoded as latin-1, which decodes every byte to the same character, whatever packages are installed.
+        :param lines: the lines to decode instead of self.telegram_lines
+        :return: the decoded telegram
+        """
+        data = b'\n'.join(self.telegram_lines if lines is None else lines)
+        try:
+            return data.decode('ascii')
+        except UnicodeDecodeError as e:
+            ParsivelTelegram.decode_fallbacks += 1
+            self.logger.warning(msg=f'telegram is not ASCII (byte {data[e.start:e.start + 1]!r} at position '
+                                    f'{e.start}), decoded as latin-1')
+        return data.decode('latin-1')
+
     def capture_prefixes_and_data(self):
         """
         Captures the telegram prefixes and data stored in self.telegram_lines
         and adds the data to self.telegram_data dict.
+        The spectrum (field 93) is decoded from its bytes into an array of uint16 (see decode_spectrum),
+        it is only decoded as text, into a list of strings, if it does not have 1024 values of three digits.
         """
-        for line in self.telegram_lines:
-            encoding = chardet.detect(line)['encoding']
-            line_str = line.decode(encoding)
+        prefix = f'{self.SPECTRUM_FIELD}:'.encode('ascii')
+        lines, spectrum = self.telegram_lines, None
+        for i, line in enumerate(lines):
+            if line.startswith(prefix):
+                spectrum = decode_spectrum(memoryview(line)[len(prefix):], self.SPECTRUM_SIZE)
+                if spectrum is not None:
+                    # the field keeps its place in telegram_data, without decoding its values as text
+                    lines = [*lines[:i], prefix, *lines[i + 1:]]
+                break
+
+        for line_str in self.decode_telegram_lines(lines).split('\n'):
             line_list = line_str.split(":")
 
             if len(line_list) > 1 and line_list[1].strip() != self.delimiter:
@@ -176,11 +407,40 @@ class ParsivelTelegram(Telegram):
                 super().__setattr__(f'field_{field}_values', value)
                 self.telegram_data[field] = value
 
+        if spectrum is not None:
+            self.telegram_data[self.SPECTRUM_FIELD] = spectrum
+
+
+    def lookup_fields(self, fields: Iterable[str]) -> Union[Dict, None]:
+        """
+        Returns the values of a few fields, see Telegram.lookup_fields. If the telegram was not captured,
+        only the lines of the fields are decoded, with the same rules as capture_prefixes_and_data.
+        :param fields: the fields, e.g. ['22', '23']
+        :return: dictionary of the value per field, None if the telegram has no data
+        """
+        if self.telegram_data:
+            return super().lookup_fields(fields)
+        prefixes = {f'{field}:'.encode('ascii'): field for field in fields}
+        values, has_data = {}, False
+        for line in self.telegram_lines:
+            line_list = line.split(b':', 2)
+            if len(line_list) < 2 or line_list[1].strip() == self.delimiter.encode('ascii'):
+                continue
+            has_data = True
+            field = prefixes.get(line_list[0] + b':')
+            if field is not None:
+                value_list = [v for v in self.decode_telegram_lines([line_list[1].strip()]).split(self.delimiter)
+                              if len(v) > 0]
+                values[field] = value_list[0] if len(value_list) == 1 else value_list
+        return values if has_data else None
 
     def parse_telegram_row(self):
         """
-        Parses telegram string from SQL telegram fields.
+        Parses telegram string from SQL telegram fields, or reads the parsed BLOB if the row has one.
         """
+        if self.blob2parsed():
+            return
+
         telegram_lines_list = self.telegram_lines.split('; ')
 
         try:
@@ -189,10 +449,11 @@ class ParsivelTelegram(Telegram):
             telegram_logger.error(msg=f"self.telegram_lines is EMPTY. self.telegram_lines: {self.telegram_lines}")
             return
 
+        schema = self.schema
         for keyval in telegram_lines_list:
             keyval_list = keyval.split(':')
 
-            if keyval_list[0] in self.config_dict['telegram_fields'].keys() and \
+            if keyval_list[0] in schema and \
                     len(keyval_list) > 1 and keyval_list[1].strip() != self.delimiter:
                 field = keyval_list[0]
                 value = keyval_list[1].strip()  # strip white space
@@ -208,7 +469,8 @@ class ParsivelTelegram(Telegram):
 
         self.str2list(field='90', separator=',')
         self.str2list(field='91', separator=',')
-        self.str2list(field='93', separator=',')
+        if not self.blob2spectrum():
+            self.str2spectrum()
 
 
 class ThiesTelegram(Telegram):
@@ -217,6 +479,10 @@ class ThiesTelegram(Telegram):
     * storing, processing and writing telegram to netCDF.
     """
 
+    SPECTRUM_FIELD = '81'
+    SPECTRUM_SIZE = 440
+    DATA_FIELD = '11'
+
     def capture_prefixes_and_data(self):
         """
         Captures the telegram prefixes and data stored in self.telegram_lines
@@ -241,23 +507,36 @@ class ThiesTelegram(Telegram):
            telegram_logger.error(msg=f"telegram is missing values")
            return
 
-        # put telegram values into telegram dictionary
-        for index,value in enumerate(telegram_list[:-1]):
-            if index == 80:
-                self.telegram_data['81'] = value
-                super().__setattr__(f'field_{index+1}_values', value)
-            if 81 <= index <= 519:
-                self.telegram_data['81'] = self.telegram_data['81'] + ',' + value
-                super().__setattr__(f'field_{81}_values', value)
-            else:
-                self.telegram_data[str(index+1)] = value
-                super().__setattr__(f'field_{index+1}_values', value)
+        # put telegram values into telegram dictionary, with the 440 values of the 22x20 matrix (indexes 80 to 519)
+        # sliced at once and joined into field 81
+        self.telegram_data.update(zip(map(str, range(1, 81)), telegram_list[:80]))
+        self.telegram_data['81'] = ','.join(telegram_list[80:80 + self.SPECTRUM_SIZE])
+        self.telegram_data.update(zip(map(str, range(521, 526)), telegram_list[520:525]))
+
+    def lookup_fields(self, fields: Iterable[str]) -> Union[Dict, None]:
+        """
+        Returns the values of a few of the fields 3 to 80, see Telegram.lookup_fields. If the telegram was not
+        captured, only the values up to the last of the fields are split off, a telegram without 526 values
+        has no data, as in capture_prefixes_and_data.
+        :param fields: the fields, e.g. ['5', '6']
+        :return: dictionary of the value per field, None if the telegram has no data
+        """
+        if self.telegram_data:
+            return super().lookup_fields(fields)
+        # the telegram has the STX and device id, followed by the values of fields 3 to 525 separated by ';'
+        if len(self.telegram_lines) == 0 or self.telegram_lines.count(';') != 524:
+            return None
+        indexes = {field: int(field) - 2 for field in fields if 3 <= int(field) <= 80}
+        values = self.telegram_lines.split(';', max(indexes.values(), default=0) + 1)
+        return {field: values[index] for field, index in indexes.items()}
 
 
     def parse_telegram_row(self):
         """
-        Parses telegram string from SQL database telegram fields.
+        Parses telegram string from SQL database telegram fields, or reads the parsed BLOB if the row has one.
         """
+        if self.blob2parsed():
+            return
 
         telegram_lines_list = self.telegram_lines.split('; ')
         try:
@@ -266,6 +545,7 @@ class ThiesTelegram(Telegram):
             telegram_logger.error(msg=f"self.telegram_lines is EMPTY. self.telegram_lines: {self.telegram_lines}")
             return
 
+        schema = self.schema
         for keyval in telegram_lines_list:
             # check if telegram value is sensor time (has format 6:XX:XX:XX)
             if len(keyval) > 0 and keyval[0] == '6':
@@ -273,7 +553,7 @@ class ThiesTelegram(Telegram):
             else:
                 keyval_list = keyval.split(':')
 
-            if keyval_list[0] not in self.config_dict['telegram_fields'].keys() or\
+            if keyval_list[0] not in schema or\
                     len(keyval_list) <= 1 or keyval_list[1].strip() == self.delimiter:
                 continue
 
@@ -290,12 +570,15 @@ class ThiesTelegram(Telegram):
             self.telegram_data[field] = value
 
         # add 440 value array representing 22x20 matrix
-        self.str2list(field='81', separator=',')
+        if not self.blob2spectrum():
+            self.str2list(field='81', separator=',')
 
 
 def create_telegram(config_dict: Dict, telegram_lines: Union[str, bytes],
                  timestamp: datetime, db_cursor: Union[Cursor, None],
-                 logger: Logger, db_row_id: Union[Cursor, None], telegram_data: Dict) -> Union[Telegram, None]: # pylint: disable=unused-argument
+                 logger: Logger, db_row_id: Union[Cursor, None], telegram_data: Dict, # pylint: disable=unused-argument
+                 spectrum_blob: Union[bytes, None] = None,
+                 parsed_blob: Union[bytes, None] = None) -> Union[Telegram, None]:
     """
     Creates a specific Telegram object based on the sensor type in the configuration dictionary.
     :param config_dict: dictionary for later exporting into netcdf
@@ -305,25 +588,243 @@ def create_telegram(config_dict: Dict, telegram_lines: Union[str, bytes],
     :param logger: logger logging data from a sensor
     :param telegram_data: data from the telegram sent by a sensor
     :param db_row_id: row id from the database
+    :param spectrum_blob: the spectrum BLOB from the database, if the spectrum is not in the telegram string
+    :param parsed_blob: the parsed BLOB from the database, if the telegram was stored with its parsed fields
     :return: the respective Telegram object for a recognized sensor type, or None otherwise
     """
     sensor_type = config_dict['global_attrs']['sensor_type']
 
-    # Create dictionary with the sensor types as keys and the respective Telegram classes as values
-    sensors = {"OTT Hydromet Parsivel2": ParsivelTelegram, "Thies Clima": ThiesTelegram}
-
     try:
-        telegram_obj = sensors[sensor_type](config_dict=config_dict,
+        telegram_obj = get_sensor_entry(sensor_type).telegram_class(config_dict=config_dict,
                                             telegram_lines=telegram_lines,
                                             db_row_id=db_row_id,
                                             timestamp=timestamp,
                                             db_cursor=db_cursor,
                                             telegram_data=telegram_data,
-                                            logger=logger)
+                                            logger=logger,
+                                            spectrum_blob=spectrum_blob,
+                                            parsed_blob=parsed_blob)
         return telegram_obj
     except KeyError:
         # If the sensor type is not recognized, log an error and return None
         logger.error(msg=f"Sensor type {sensor_type} not recognized")
         return None
 
-    
\ No newline at end of file
+
+def decode_telegrams(config_dict: Dict, rows: Iterable[Tuple], logger: Logger) -> numpy.ndarray:
+    """
+    Decodes the telegrams of a batch of database rows (e.g. one day of a sensor) at once into one structured array,
+    instead of creating a Telegram object with a dictionary of strings per row.
+    The telegram strings are split into their fields in one pass, after which every field is converted for all
+    telegrams at once, see telegrams2records.
+    Rows with a parsed BLOB are not parsed. Rows without data (no Telegram.DATA_FIELD, e.g. an empty read or a Thies
+    telegram without all its values) are kept as a record with the fill values, flagged with the quality flag stored
+    with the row, or as missing if the row has none.
+    :param config_dict: the combined config dictionary
+    :param rows: the (id, timestamp, telegram, spectrum, parsed) rows ordered by timestamp, with None for a BLOB column
+                 that the database does not have, optionally followed by the stored quality flag (None if the
+                 database has no quality_flag column)
+    :param logger: the logger object
+    :return: structured array with a record per row, see telegrams2records
+    """
+    telegram_class = get_sensor_entry(config_dict['global_attrs']['sensor_type']).telegram_class
+    ids, timestamps, telegrams, stored_flags = [], [], [], []
+    for row_id, timestamp, telegram_str, spectrum, parsed, *stored_flag in rows:
+        if parsed is not None:
+            telegram_data = unpack_fields(parsed)
+        else:
+            telegram_data = dict(keyval.partition(':')[::2] for keyval in (telegram_str or '').split('; '))
+        if telegram_class.DATA_FIELD not in telegram_data:
+            telegram_data = {}
+        elif spectrum is not None and telegram_class.SPECTRUM_FIELD not in telegram_data:
+            telegram_data[telegram_class.SPECTRUM_FIELD] = unpack_spectrum(spectrum)
+        ids.append(row_id)
+        timestamps.append(timestamp)
+        telegrams.append(telegram_data)
+        stored_flags.append(stored_flag[0] if stored_flag else None)
+    return telegrams2records(config_dict, ids, timestamps, telegrams, logger, empty_flags=stored_flags)
+
+
+def telegrams2records(config_dict: Dict, ids: List[int], timestamps: List[float],
+                      telegrams: List[Dict], logger: Union[Logger, None] = None, *,
+                      empty_flags: Union[List[Union[int, None]], None] = None) -> numpy.ndarray:
+    """
+    Converts the telegram data of many telegrams at once into one structured array: a scalar field into a column
+    of its dtype, a field with dimensions (e.g. the spectrum) into a (T, ...) column with the sizes of its dimensions
+    in the config, e.g. (T, 32, 32) or (T, 22, 20). The quality flag of every telegram (see quality.py) is computed
+    from the same columns: a field with the wrong number of values is truncated, a numeric field that is not a number
+    is missing, and the values are checked against the valid_min/valid_max and sensor_error of their field.
+    A telegram without data (an empty dictionary) gets the fill value of every field, and is flagged as missing,
+    or with its flag in empty_flags, e.g. missing and truncated for a Thies telegram without all its values.
+    :param config_dict: the combined config dictionary
+    :param ids: the database row id of every telegram
+    :param timestamps: the timestamp (seconds since epoch) of every telegram
+    :param telegrams: the telegram data of every telegram: strings, lists of strings or NumPy values per field
+    :param logger: optional logger to log the fields with the wrong number of values
+    :param empty_flags: optional quality flag per telegram, used for the telegrams without data (None is missing),
+                        e.g. the flag stored in the quality_flag column of the database
+    :return: structured array with a record per telegram: the id, timestamp and quality_flag of the telegram
+             (see RECORD_FIELDS), and a column per telegram field that occurs in the telegrams, named by its number,
+             e.g. records['93']
+    """
+    present = set().union(*telegrams)
+    schema = compile_schema(config_dict['telegram_fields'], config_dict.get('dimensions'))
+    # a field with a dimension that is not in the config is kept as string
+    columns = [(field_schema, field_schema.parsed_dtype if field_schema.shape is not None else None,
+                field_schema.shape or ())
+               for field, field_schema in schema.fields.items() if field in present]
+
+    records = numpy.zeros(len(telegrams), dtype=list(zip(RECORD_FIELDS, ('<i8', '<f8', QUALITY_DTYPE))) +
+                          [(field_schema.field, dtype or object, shape) for field_schema, dtype, shape in columns])
+    records['id'] = ids
+    records['timestamp'] = timestamps
+    flags = records['quality_flag']
+    empty = numpy.fromiter((len(telegram_data) == 0 for telegram_data in telegrams), bool, len(telegrams))
+    for field_schema, dtype, shape in columns:
+        field = field_schema.field
+        values = [telegram_data.get(field) for telegram_data in telegrams]
+        if dtype is None:
+            records[field] = [value.strip() if isinstance(value, str) else
+                              '' if value is None else ','.join(str(v) for v in value) for value in values]
+        elif not shape:
+            records[field] = scalar_column(values, dtype, field_schema.fill_value)
+            flags |= scalar_flags(field_schema, records[field],
+                                  numpy.fromiter((value is not None for value in values), bool, len(values)))
+        else:
+            records[field], invalid = array_column(values, dtype, shape)
+            records[field][empty] = field_schema.fill_value
+            invalid = [i for i in invalid if not empty[i]]
+            if invalid:
+                flags[invalid] |= QUALITY_TRUNCATED
+                if logger is not None:
+                    logger.error(msg=f'field {field} of {len(invalid)} telegram(s) does not have '
+                                     f'{numpy.prod(shape)} values, (error value) {ERROR_VALUE} is added instead, '
+                                     f'e.g. DB item {ids[invalid[0]]}')
+    if empty.any():
+        flags[empty] = [QUALITY_MISSING if empty_flags is None or empty_flags[i] is None else empty_flags[i]
+                        for i in numpy.flatnonzero(empty)]
+    return records
+
+
+def parse_numbers(text: str, dtype: Union[str, numpy.dtype], count: int) -> Union[numpy.ndarray, None]:
+    """
+    Parses comma separated numbers, e.g. the joined spectra of many telegrams, with one NumPy call.
+    :param text: the comma separated numbers
+    :param dtype: the dtype to parse the numbers as, an integer dtype only parses integers
+    :param count: the expected number of values
+    :return: the array of the values, or None if the text has another number of values or values that are no number
+    """
+    with warnings.catch_warnings():
+        # older NumPy versions warn and return the values up to the first value that is no number
+        warnings.simplefilter('ignore', DeprecationWarning)
+        try:
+            values = numpy.fromstring(text, dtype=dtype, sep=',')
+        except ValueError:
+            return None
+    return values if values.size == count else None
+
+
+def decode_spectrum(data: Union[bytes, bytearray, memoryview], count: int, width: int = 3,
+                    shape: Union[Tuple[int, ...], None] = None) -> Union[numpy.ndarray, None]:
+    """
+    Decodes spectrum values of a fixed number of digits, e.g. the 1024 values of Parsivel field 93 (000;001;...),
+    straight from their bytes into uint16: the digits are read through a strided view of the buffer
+    (numpy.ndarray over a memoryview, the values are width + 1 bytes apart), so the values never become strings.
+    :param data: the bytes of the values, separated by one byte (';' or ','), optionally followed by a separator
+                 and white space
+    :param count: the expected number of values
+    :param width: the number of digits of every value
+    :param shape: optional shape of the array, e.g. (32, 32), a flat array by default
+    :return: the array of uint16, or None if the data are not count values of width digits
+    """
+    view = memoryview(data)
+    stride = width + 1
+    end = count * stride - 1
+    if count == 0 or view.nbytes < end or bytes(view[end:]).strip(b';, \r\n'):
+        return None
+    digits = numpy.ndarray(shape=(count, width), dtype=numpy.uint8, buffer=view, strides=(stride, 1))
+    separators = numpy.ndarray(shape=(count - 1,), dtype=numpy.uint8, buffer=view, offset=width, strides=(stride,))
+    if separators.size and (separators[0] not in b';,' or (separators != separators[0]).any()):
+        return None
+    digits = digits - ord('0')
+    # bytes below '0' wrap around to above 9
+    if (digits > 9).any():
+        return None
+    values = digits.astype(SPECTRUM_DTYPE) @ (10 ** numpy.arange(width - 1, -1, -1)).astype(SPECTRUM_DTYPE)
+    return values if shape is None else values.reshape(shape)
+
+
+def scalar_column(values: List, dtype: Union[str, numpy.dtype], fill_value) -> numpy.ndarray:
+    """
+    Converts the values of a scalar field of all telegrams into one column of the dtype of the field.
+    :param values: the values of the telegrams, strings or NumPy scalars, None for a telegram without the field
+    :param dtype: the dtype of the field, see schema.FieldSchema.parsed_dtype
+    :param fill_value: the value of a telegram without the field, or with a value that is not a number
+    :return: the column
+    """
+    try:
+        floats = numpy.array(values, dtype=numpy.float64)
+    except (TypeError, ValueError):
+        floats = numpy.full(len(values), numpy.nan)
+        for i, value in enumerate(values):
+            try:
+                floats[i] = float(value)
+            except (TypeError, ValueError):
+                pass
+    floats[numpy.isnan(floats)] = fill_value
+    return floats.astype(dtype)
+
+
+def array_column(values: List, dtype: Union[str, numpy.dtype],
+                 shape: Tuple[int, ...]) -> Tuple[numpy.ndarray, List[int]]:
+    """
+    Converts the values of a field with dimensions (e.g. the spectrum) of all telegrams into one (T, ...) column.
+    The comma separated strings of the telegrams are joined and parsed with one NumPy call (see parse_numbers),
+    arrays (from a spectrum or parsed BLOB) are copied as they are.
+    :param values: the values of the telegrams, comma separated strings, arrays or lists of strings,
+                   None for a telegram without the field
+    :param dtype: the dtype of the field, see schema.FieldSchema.parsed_dtype
+    :param shape: the sizes of the dimensions of the field after time, e.g. (32, 32)
+    :return: the column of shape (T, ...) and the indexes of the telegrams whose value does not have the right number
+             of values (or values that are no number), which are set to ERROR_VALUE
+    """
+    size = int(numpy.prod(shape))
+    parse_dtype = dtype if numpy.dtype(dtype).kind == 'i' else numpy.float64
+    column = numpy.full((len(values), size), ERROR_VALUE, dtype=dtype)
+    invalid, text_rows, texts = [], [], []
+    for i, value in enumerate(values):
+        if isinstance(value, str):
+            if value.count(',') == size - 1:
+                text_rows.append(i)
+                texts.append(value)
+            else:
+                invalid.append(i)
+        elif value is not None and len(value) == size:
+            try:
+                column[i] = numpy.asarray(value, dtype=numpy.float64)
+            except ValueError:
+                invalid.append(i)
+        else:
+            invalid.append(i)
+
+    if texts:
+        joined = ','.join(texts)
+        parsed = None
+        if numpy.dtype(dtype).kind in 'iu':
+            # spectra of three digit values are decoded with a fixed stride, see decode_spectrum
+            try:
+                parsed = decode_spectrum(joined.encode('ascii'), len(texts) * size)
+            except UnicodeEncodeError:
+                pass
+        if parsed is None:
+            parsed = parse_numbers(joined, parse_dtype, len(texts) * size)
+        if parsed is not None:
+            column[text_rows] = parsed.reshape(len(texts), size)
+        else:
+            for i, text in zip(text_rows, texts):
+                parsed = parse_numbers(text, parse_dtype, size)
+                if parsed is None:
+                    invalid.append(i)
+                else:
+                    column[i] = parsed
+    return column.reshape((len(values),) + tuple(shape)), sorted(invalid)
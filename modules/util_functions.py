@@ -16,11 +16,15 @@ import sys
 from logging import Logger
 from time import sleep
 from pathlib import Path
-from typing import Dict, Union
+from typing import Dict, Union, TYPE_CHECKING
 from logging import Logger
 import yaml
 
-from modules.sensors import Parsivel, Thies, Sensor
+from modules.registry import get_sensor_entry
+
+if TYPE_CHECKING:
+    # the sensor drivers are only imported by create_sensor, see registry.py
+    from modules.sensors import Sensor
 
 if __name__ == '__main__':
     from log import log  # pylint: disable=import-error
@@ -48,14 +52,9 @@ def get_general_config_dict(path: Path, sensor_type: str, logger: Logger) -> Uni
     :param logger: logger for logging a potential KeyError
     :return: dict of the respective general config file
     """
-    # Create dictionary with the sensor types as keys and the respective config files as values
-    config_files = {
-        "OTT Hydromet Parsivel2": 'config_general_parsivel.yml',
-        "Thies Clima": 'config_general_thies.yml'
-    }
-
+    # The general config of every sensor type is in the registry, see registry.py
     try:
-        return yaml2dict(path=path / 'configs_netcdf' / config_files[sensor_type])
+        return yaml2dict(path=get_sensor_entry(sensor_type).general_config_path(path))
     except KeyError:
         # If the sensor type is not recognized, log an error and return None
         logger.error(msg=f"Sensor type {sensor_type} not recognized")
@@ -113,19 +112,16 @@ def create_logger(log_dir, script_name, sensor_name):
     logger.info(msg=f"Starting {script_name} for {sensor_name}")
     return logger
 
-def create_sensor(sensor_type: str, logger: Logger, sensor_id: str = '00',) -> Sensor:
+def create_sensor(sensor_type: str, logger: Logger, sensor_id: str = '00',) -> 'Sensor':
     """
     This function creates a sensor object based on the provided sensor type.
+    Only the Sensor class of that sensor type is imported and instantiated, see registry.py.
     :param sensor_type: a string indicating the sensor type
     :param sensor_id: a string indicating the sensor id
     :return: sensor object
     """
-    sensors = {
-        'OTT Hydromet Parsivel2': Parsivel(),
-        'Thies Clima': Thies(thies_id=sensor_id)
-    }
     try:
-        return sensors[sensor_type]
+        return get_sensor_entry(sensor_type).create_sensor(sensor_id=sensor_id)
     except KeyError:
         logger.error(msg=f"Sensor type {sensor_type} not recognized")
         sys.exit(1)
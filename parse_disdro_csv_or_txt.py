@@ -15,11 +15,11 @@ from modules.telegram import ParsivelTelegram, ThiesTelegram, create_telegram
 #from pprint import pprint
 from modules.util_functions import yaml2dict, create_logger
 from modules.netCDF import NetCDF
+from modules.schema import compile_schema
 
 #Different dictionaries to select the necessary method/file needed, corresponding to the respective sensor
 telegrams = {'THIES': ThiesTelegram, 'PAR': ParsivelTelegram}
 config_files = {'THIES': 'config_general_thies.yml', 'PAR': 'config_general_parsivel.yml'}
-field_type = {'i4': int, 'i2': int, 'S4': str, 'f4': float}
 
 default_parsivel_telegram_indices = ['01', '02', '03', '04', '05', '06', '07', '08', '09', '10', '11', '12',
     '13', '14', '15', '16', '17', '18', '19', '20', '21', '22', '23', '24', '25', '26', '27', '28', '30',
@@ -51,6 +51,7 @@ def parsival_telegram_to_dict(telegram: list[str], dt: datetime, ts: datetime, c
     :param config_telegram_fields: dict of the config file, only the telegram_fields are passed
     '''
 
+    schema = compile_schema(config_telegram_fields)
     telegram_dict = {} 
     for i, key in enumerate(default_parsivel_telegram_indices):
         if(key == '90' or key == '91'):
@@ -58,7 +59,7 @@ def parsival_telegram_to_dict(telegram: list[str], dt: datetime, ts: datetime, c
             Field 90 and 91 have a list of 32 values
             Grab the corresponding 32 values for field 90 or 91
             '''
-            value_type = field_type[config_telegram_fields[key]['dtype']] #Get value type, e.g float or integer
+            value_type = schema[key].python_type #Get value type, e.g float or integer
             telegram_value = telegram[-65:-33] if key == '90' else telegram[-33:-1] #Copy all values and cast to respective type
             telegram_dict[key] = [value_type(value) for value in telegram_value]
         elif(key == '93'):
@@ -74,7 +75,7 @@ def parsival_telegram_to_dict(telegram: list[str], dt: datetime, ts: datetime, c
             '''
             Value is cast to type based on the config dict
             '''
-            telegram_value = field_type[config_telegram_fields[key]['dtype']](telegram[i])
+            telegram_value = schema[key].python_type(telegram[i])
             telegram_dict[key] = telegram_value
     
     telegram_dict['datetime'] = dt
@@ -89,15 +90,17 @@ def thies_telegram_to_dict(telegram: list[str], dt: datetime, ts: datetime, conf
     :param ts: datetime object, timestamp of the telegram
     :param config_telegram_fields: telegram fields from the config file
     '''
-    telegram_indices = list(config_telegram_fields.keys())[1:]
+    schema = compile_schema(config_telegram_fields)
+    telegram_indices = list(schema.fields.values())[1:]
     telegram_dict = {}
-    for index, field_n in enumerate(telegram_indices):
-        if(config_telegram_fields[field_n]['include_in_nc'] == 'never'):
+    for index, field_schema in enumerate(telegram_indices):
+        field_n = field_schema.field
+        if(field_schema.include_in_nc == 'never'):
             continue
         if(field_n == '81'):
             telegram_dict[field_n] = [int(x) for x in telegram[index:index+440]]
         else:
-            telegram_dict[field_n] = field_type[config_telegram_fields[field_n]['dtype']](telegram[index])
+            telegram_dict[field_n] = field_schema.python_type(telegram[index])
 
     telegram_dict['datetime'] = dt
     telegram_dict['timestamp'] = str(ts)
@@ -113,7 +116,7 @@ def process_txt_file(txt_list: list, config_telegram_fields: dict):
     date = ''
     time = ''
     #All fields in the config dict
-    fields = config_telegram_fields.keys()
+    schema = compile_schema(config_telegram_fields)
     for field in txt_list:
         key_value = field.split(':')
         
@@ -134,17 +137,18 @@ def process_txt_file(txt_list: list, config_telegram_fields: dict):
         key, value = key_value
 
         #Skip fields that are not in the config dict
-        if key not in fields:
+        field_schema = schema.get(key)
+        if field_schema is None:
             continue
 
         #Skip fields that should never be included in the netCDF
-        if(config_telegram_fields[key]['include_in_nc'] == 'never'):
+        if(field_schema.include_in_nc == 'never'):
             continue
 
-        data_type = field_type[config_telegram_fields[key]['dtype']]
+        data_type = field_schema.python_type
 
         #Multivalue fields
-        if len(config_telegram_fields[key]['dimensions']) > 1:  
+        if len(field_schema.dimensions) > 1:  
             list_values = value.split(';')
             #List fields end with an empty string after split, remove it
             list_values.remove('')
@@ -1,12 +1,10 @@
 """
 Script to reset the serial connection for a given sensor.
 """
-import sys
 from argparse import ArgumentParser
 from pathlib import Path
 
-from modules.sensors import Parsivel, Thies
-from modules.util_functions import yaml2dict, create_logger
+from modules.util_functions import yaml2dict, create_logger, create_sensor
 
 
 def get_config_file():
@@ -32,18 +30,10 @@ def main(config_file):
                            script_name=config_dict['script_name'],
                            sensor_name=config_dict['global_attrs']['sensor_name'])
 
-    sensor_type = config_dict['global_attrs']['sensor_type']
-    sensor = None
-
-    # Create the sensor object based on the type specified in the config file
-    if sensor_type == 'OTT Hydromet Parsivel2':
-        sensor = Parsivel()
-    elif sensor_type == 'Thies Clima':
-        thies_id = config_dict['global_attrs']['sensor_name'][-2:]
-        sensor = Thies(thies_id=thies_id)
-    else:
-        logger.error(msg=f"Sensor type {sensor_type} not recognized")
-        sys.exit(1)
+    # Create the sensor object based on the type specified in the config file, see registry.py
+    # (the sensor id, e.g. of a Thies, is the end of the sensor name)
+    sensor = create_sensor(sensor_type=config_dict['global_attrs']['sensor_type'], logger=logger,
+                           sensor_id=config_dict['global_attrs']['sensor_name'][-2:])
 
     # Initialize the serial connection and reset the sensor
     sensor.init_serial_connection(port=config_dict['port'], baud=config_dict['baud'], logger=logger)
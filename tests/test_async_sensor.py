@@ -0,0 +1,162 @@
+"""
+Module for testing the AsyncSensor class from async_sensor.py.
+
+Functions:
+- create_async_sensor: Creates an AsyncSensor around a mocked Sensor.
+- test_read: Tests that a telegram is read through the worker thread of the sensor.
+- test_read_timeout: Tests that a read that does not finish in time returns None and is logged.
+- test_read_error: Tests that an exception in the worker thread returns None and is logged.
+- test_slow_sensor_does_not_delay_others: Tests that sensors are read concurrently.
+- test_start_sequence_in_background: Tests running the start sequence as a background task.
+- test_reconcile: Tests that only the settings that drifted are applied again.
+- test_close: Tests that closing stops the worker thread and closes the serial connection.
+"""
+
+import asyncio
+import threading
+import time
+from unittest.mock import Mock
+
+from conftest import config_dict_parsivel, parsivel_lines
+from modules.async_sensor import AsyncSensor
+
+
+def create_async_sensor(read_delay=0.0, read_side_effect=None):
+    """
+    Creates an AsyncSensor around a mocked Sensor.
+    :param read_delay: seconds the mocked read blocks before returning
+    :param read_side_effect: optional exception raised by the mocked read
+    :return: the AsyncSensor object
+    """
+    def read(logger):  # pylint: disable=unused-argument
+        time.sleep(read_delay)
+        if read_side_effect is not None:
+            raise read_side_effect
+        return parsivel_lines
+
+    sensor = Mock()
+    sensor.SETTINGS = ('station_code', 'station_id')
+    sensor.read.side_effect = read
+    sensor.read.__name__ = 'read'
+    return AsyncSensor(sensor=sensor, config_dict=config_dict_parsivel, logger=Mock())
+
+
+def test_read():
+    """
+    Tests that a telegram is read through the worker thread of the sensor.
+    """
+    async_sensor = create_async_sensor()
+
+    result = asyncio.run(async_sensor.read(timeout=1))
+
+    assert result == parsivel_lines
+    assert async_sensor.name == config_dict_parsivel['global_attrs']['sensor_name']
+    async_sensor.logger.error.assert_not_called()
+    async_sensor.close()
+
+
+def test_read_timeout():
+    """
+    Tests that a read that does not finish in time returns None and is logged.
+    """
+    async_sensor = create_async_sensor(read_delay=0.5)
+
+    result = asyncio.run(async_sensor.read(timeout=0.05))
+
+    assert result is None
+    async_sensor.logger.error.assert_called_once_with(msg='PAR008: read timed out after 0.05 s')
+    async_sensor.close()
+
+
+def test_read_error():
+    """
+    Tests that an exception in the worker thread returns None and is logged.
+    """
+    async_sensor = create_async_sensor(read_side_effect=OSError('port closed'))
+
+    result = asyncio.run(async_sensor.read(timeout=1))
+
+    assert result is None
+    async_sensor.logger.error.assert_called_once_with(msg='PAR008: read failed: port closed')
+    async_sensor.close()
+
+
+def test_slow_sensor_does_not_delay_others():
+    """
+    Tests that sensors are read concurrently: the reads of three sensors only return once all three are reading,
+    which they would never be if one read waited for another, and a sensor that times out does not keep the
+    others from returning their telegram.
+    """
+    all_reading = threading.Barrier(3, timeout=5)
+    release = threading.Event()
+
+    def concurrent_read(logger):  # pylint: disable=unused-argument
+        all_reading.wait()
+        return parsivel_lines
+
+    def stuck_read(logger):  # pylint: disable=unused-argument
+        release.wait(timeout=5)
+        return parsivel_lines
+
+    async_sensors = [create_async_sensor() for _ in range(4)]
+    for async_sensor, read in zip(async_sensors, [concurrent_read] * 3 + [stuck_read]):
+        async_sensor.sensor.read.side_effect = read
+
+    async def read_all():
+        return await asyncio.gather(*(async_sensor.read(timeout=1) for async_sensor in async_sensors))
+
+    results = asyncio.run(read_all())
+    release.set()
+
+    assert results[:3] == [parsivel_lines] * 3
+    assert results[3] is None
+    assert not all_reading.broken
+    for async_sensor in async_sensors:
+        async_sensor.close()
+
+
+def test_start_sequence_in_background():
+    """
+    Tests running the start sequence as a background task.
+    """
+    async_sensor = create_async_sensor()
+
+    async def start():
+        task = async_sensor.run_in_background(async_sensor.start_sequence(timeout=1, include_in_log=False))
+        assert async_sensor.background is task
+        await task
+
+    asyncio.run(start())
+
+    async_sensor.sensor.sensor_start_sequence.assert_called_once_with(config_dict=config_dict_parsivel,
+                                                                      logger=async_sensor.logger,
+                                                                      include_in_log=False)
+    assert async_sensor.session.pending() == []
+    async_sensor.close()
+
+
+def test_reconcile():
+    """
+    Tests that only the settings that drifted are applied again, in the worker thread of the sensor.
+    """
+    async_sensor = create_async_sensor()
+    async_sensor.session.applied = {'station_code': True, 'station_id': False}
+
+    asyncio.run(async_sensor.reconcile(timeout=1))
+
+    async_sensor.sensor.apply_setting.assert_called_once_with('station_id', config_dict=config_dict_parsivel,
+                                                              logger=async_sensor.logger)
+    assert async_sensor.session.pending() == []
+    async_sensor.close()
+
+
+def test_close():
+    """
+    Tests that closing stops the worker thread and closes the serial connection.
+    """
+    async_sensor = create_async_sensor()
+
+    async_sensor.close()
+
+    async_sensor.sensor.close_serial_connection.assert_called_once()
+    assert async_sensor.executor._shutdown is True  # pylint: disable=protected-access
@@ -5,6 +5,28 @@ Functions:
 - test_connect_db: Tests that connect_db returns a Connection and Cursor object.
 - test_db_schema: Tests that the test database has the correct schema.
 - test_db_insert_parsivel: Tests that inserting a ParsivelTelegram object into the database works correctly.
+- test_insert_telegrams_batch: Tests that many telegrams are inserted with one statement and a compact log summary.
+- test_insert_telegrams_quote: Tests that a quote in a telegram value is stored as is.
+- test_pack_spectrum: Tests that a spectrum is packed into a uint16 BLOB and unpacked into the same values.
+- test_spectrum_blob_storage: Tests that spectra are stored as BLOB, and read back as arrays next to legacy text rows.
+- test_pack_fields: Tests that parsed telegram fields are packed into typed binary values and unpacked again.
+- test_parsed_storage: Tests that the parsed fields are stored at ingest and read back as the text is parsed.
+- test_range_index_existing_db: Tests that the (sensor_id, timestamp) index is added to an existing database.
+- test_query_range_gen: Tests that the range query only returns the rows of the sensor within the range.
+- test_unique_minutes: Tests that a minute of a sensor is stored once, and that duplicates keep the index non-unique.
+- test_minute_report: Tests that the missing, duplicate and empty minutes of a day and a year are reported.
+- test_db_reader: Tests that the DBReader cannot write, and reads the rows in batches of tuples or record arrays.
+- test_range_query_plan: Tests that the range query of one sensor searches the index of a database with two sensors.
+- test_range_query_benchmark: Benchmarks the range query time as the database grows.
+- test_field_columns: Tests that the typed columns of the scalar fields are generated from the config.
+- test_field_columns_storage: Tests that the scalar fields are stored in typed columns and aggregated in SQL.
+- test_partition_paths: Tests the names of the partition files and which of them overlap a range.
+- test_db_writer_partitions: Tests that telegrams are written into monthly partitions and old partitions are sealed.
+- test_query_partitions_batches: Tests that more partitions than can be attached at once are queried in batches.
+- test_db_writer_pragmas: Tests that the DBWriter connection uses WAL journaling and the given pragmas.
+- test_db_writer_concurrent_reader: Tests that a reader with an open transaction does not block the DBWriter.
+- test_db_writer_reconnect: Tests that the DBWriter reconnects and retries after an I/O error.
+- test_db_writer_locked: Tests that the DBWriter gives up after its retries when another writer holds the lock.
 - test_unpack_telegram_from_db: Tests the unpack_telegram_from_db function.
 - test_query_db_parsivel: Tests querying from the database and creates a test netCDF file.
 - test_NetCDF: This function tests whether netCDF files are correctly created.
@@ -15,25 +37,42 @@ Functions:
 - test_NetCDF_w_gaps_thies: Tests whether the db rows with empty telegram data are not included in NetCDF.
 - test_netcdf_wrong_f81_len_thies: Tests thies netcdf creation when matrix array is of wrong length.
 - test_netcdf_wrong_f93_len_parsivel: Tests parsivel netcdf creation when matrix array is of wrong length.
+- varied_rows: Creates the database rows of a day of telegrams with varying values.
+- test_decode_telegrams: Tests that a batch of rows is decoded into a structured array with typed columns.
+- test_decode_telegrams_netcdf: Tests that the NetCDF of the structured array is the same as that of the objects.
+- test_decode_telegrams_benchmark: Benchmarks decoding and writing a day at once against per object.
 - test_compress_non_existent_file: Tests compressing a non-existent NetCDF file.
 """
 
 import os
+import hashlib
 import sqlite3
+import time
 import logging
 from pathlib import Path
 from logging import StreamHandler
 from datetime import datetime, timedelta, timezone
 import unittest
+from unittest.mock import Mock, patch
+import numpy
 import pytest
 from netCDF4 import Dataset # pylint: disable=no-name-in-module
 from cftime import num2date
 from pydantic.v1.utils import deep_update
 
-from modules.sqldb import connect_db, query_db_rows_gen
+from modules.sqldb import connect_db, create_db, query_db_rows_gen, insert_telegrams, pack_spectrum, unpack_spectrum, \
+    insert_rows, query_plan, query_range_gen, range_query, field_columns, field_value, field_aggregate, day_range, \
+    create_index, create_range_index, create_unique_index, minute_report, RANGE_INDEX, UNIQUE_INDEX, pack_fields, \
+    unpack_fields, field_dtypes
+from modules.partitions import partition_path, partition_paths, query_partitions_gen
+from modules.db_writer import DBWriter
+from modules.db_reader import DBReader
 from modules.util_functions import yaml2dict
+from modules.migrations import migrate, RangeIndex
 from modules.now_time import NowTime
-from modules.telegram import ParsivelTelegram, ThiesTelegram
+from modules.telegram import ParsivelTelegram, ThiesTelegram, create_telegram, decode_telegrams, ERROR_VALUE, \
+    FILL_VALUE
+from modules.quality import QUALITY_MISSING
 from modules.netCDF import NetCDF, unpack_telegram_from_db
 
 # General variables
@@ -190,6 +229,724 @@ def test_db_insert_thies(create_db_thies): # pylint: disable=unused-argument
     con.close()
 
 
+def create_parsivel_telegram(timestamp):
+    """
+    This function creates a ParsivelTelegram object for the given timestamp, without a cursor.
+    :param timestamp: the timestamp of the telegram
+    :return: the ParsivelTelegram object
+    """
+    return ParsivelTelegram(config_dict=config_dict_parsivel,
+                            telegram_lines=parsivel_lines,
+                            timestamp=timestamp,
+                            db_cursor=None,
+                            telegram_data={},
+                            logger=logger)
+
+
+def test_insert_telegrams_batch(create_db_parsivel): # pylint: disable=unused-argument
+    """
+    This function tests that many telegrams are inserted with one executemany call,
+    and that only a summary is logged instead of the statements.
+    :param create_db_parsivel: the function to create the test database
+    """
+    con, cur = connect_db(dbpath=str(db_path_parsivel))
+    telegrams = [create_parsivel_telegram(start_dt + timedelta(minutes=i)) for i in range(60)]
+    mock_logger = Mock()
+
+    assert insert_telegrams(cur=cur, telegrams=telegrams, logger=mock_logger) == 60
+    con.commit()
+
+    assert cur.execute("SELECT COUNT(*) FROM disdrodl").fetchone()[0] == 60
+    first, last = cur.execute("SELECT MIN(timestamp), MAX(timestamp) FROM disdrodl").fetchone()
+    assert first == start_dt.timestamp()
+    assert last == (start_dt + timedelta(minutes=59)).timestamp()
+    mock_logger.info.assert_called_once_with(
+        msg=f'inserting to DB: {start_dt.isoformat()} - {(start_dt + timedelta(minutes=59)).isoformat()}')
+    summary = mock_logger.debug.call_args.kwargs['msg']
+    assert summary.startswith('inserted 60 telegram(s)')
+    assert 'INSERT' not in summary
+    assert len(summary) < 200
+    cur.close()
+    con.close()
+
+
+def test_insert_telegrams_quote(create_db_parsivel): # pylint: disable=unused-argument
+    """
+    This function tests that a quote in a telegram value, which broke the formatted insert statement, is stored as is.
+    :param create_db_parsivel: the function to create the test database
+    """
+    con, cur = connect_db(dbpath=str(db_path_parsivel))
+    lines = [b"22:Cabauw's\r\n" if line.startswith(b'22:') else line for line in parsivel_lines]
+    telegram = ParsivelTelegram(config_dict=config_dict_parsivel, telegram_lines=lines, timestamp=start_dt,
+                                db_cursor=cur, telegram_data={}, logger=logger)
+
+    telegram.insert2db()
+    con.commit()
+
+    telegram_str = cur.execute("SELECT telegram FROM disdrodl").fetchone()[0]
+    assert "22:Cabauw's; " in telegram_str
+    cur.close()
+    con.close()
+
+
+def test_pack_spectrum():
+    """
+    This function tests that a spectrum is packed into a little-endian uint16 BLOB, optionally compressed,
+    and unpacked into the same values, and that values that do not fit in a uint16 raise a ValueError.
+    """
+    values = [f'{i % 1000:03d}' for i in range(1024)]
+    blob = pack_spectrum(values)
+    assert len(blob) == 1 + 2 * 1024
+    assert pack_spectrum(','.join(values)) == blob
+    numpy.testing.assert_array_equal(unpack_spectrum(blob), numpy.arange(1024) % 1000)
+
+    zeros = pack_spectrum(['000'] * 1024, compress=True)
+    assert len(zeros) < 100
+    spectrum = unpack_spectrum(zeros, shape=(32, 32))
+    assert spectrum.shape == (32, 32)
+    assert spectrum.dtype == numpy.dtype('<u2')
+    assert spectrum.sum() == 0
+
+    with pytest.raises(ValueError):
+        pack_spectrum(['000', '-01'])
+    with pytest.raises(ValueError):
+        pack_spectrum(['000', ''])
+
+
+@pytest.mark.parametrize('spectrum_storage', ['blob', 'zlib'])
+@pytest.mark.parametrize('config_dict, telegram_lines, db_path', [
+    (config_dict_parsivel, parsivel_lines, db_path_parsivel),
+    (config_dict_thies, thies_lines, db_path_thies)])
+def test_spectrum_blob_storage(config_dict, telegram_lines, db_path, spectrum_storage):
+    """
+    This function tests that the spectrum is stored in the spectrum BLOB column instead of the telegram string,
+    and that it is read back as an array, while rows stored before (as text) are still read from the string.
+    :param config_dict: the config dictionary of the sensor
+    :param telegram_lines: the telegram lines of the sensor
+    :param db_path: the path of the test database
+    :param spectrum_storage: blob or zlib
+    """
+    if os.path.isfile(db_path):
+        os.remove(db_path)
+    create_db(dbpath=str(db_path))
+    db_writer = DBWriter(dbpath=str(db_path))
+    telegram = create_telegram(config_dict=config_dict, telegram_lines=telegram_lines, timestamp=start_dt,
+                               db_cursor=None, db_row_id=None, telegram_data={}, logger=logger)
+    assert db_writer.write([telegram]) is True
+    db_writer.close()
+
+    # enabling the storage adds the column to the existing database
+    create_db(dbpath=str(db_path), spectrum_storage=spectrum_storage)
+    db_writer = DBWriter(dbpath=str(db_path), spectrum_storage=spectrum_storage)
+    telegram = create_telegram(config_dict=config_dict, telegram_lines=telegram_lines,
+                               timestamp=start_dt + timedelta(minutes=1),
+                               db_cursor=None, db_row_id=None, telegram_data={}, logger=logger)
+    assert db_writer.write([telegram]) is True
+    db_writer.close()
+
+    field = telegram.SPECTRUM_FIELD
+    con, cur = connect_db(dbpath=str(db_path))
+    rows = list(query_db_rows_gen(con, date_dt=start_dt, logger=logger))
+    con.close()
+    assert len(rows) == 2
+    assert rows[0]['spectrum'] is None
+    assert f'; {field}:' in rows[0]['telegram']
+    assert isinstance(rows[1]['spectrum'], bytes)
+    assert f'; {field}:' not in rows[1]['telegram']
+    assert len(rows[1]['telegram']) + len(rows[1]['spectrum']) < len(rows[0]['telegram'])
+
+    spectra = []
+    for row in rows:
+        telegram = create_telegram(config_dict=config_dict, telegram_lines=row['telegram'],
+                                   timestamp=start_dt, db_cursor=None, db_row_id=row['id'], telegram_data={},
+                                   logger=logger, spectrum_blob=row['spectrum'])
+        telegram.parse_telegram_row()
+        spectra.append(telegram.telegram_data[field])
+    # the Parsivel spectrum stored as text is decoded into an array as well, see Telegram.str2spectrum
+    assert isinstance(spectra[0], numpy.ndarray if field == '93' else list)
+    assert isinstance(spectra[1], numpy.ndarray)
+    assert len(spectra[1]) == telegram.SPECTRUM_SIZE
+    numpy.testing.assert_array_equal(spectra[1], numpy.array(spectra[0]).astype(int))
+
+
+def test_pack_fields():
+    """
+    This function tests that parsed telegram fields with a numeric dtype are packed into binary values of that dtype,
+    that values that cannot be converted without loss are kept as strings, and that unpacking gives the same values.
+    """
+    telegram_data = {'01': '0012.345', '03': '07', '05': 'NP', '08': '99999', '09': ['1', '2', '3'], '11': 'None',
+                     '90': ['-9.999', '0.5'], '97': [], '98': ['a', 'b']}
+    dtypes = {'01': '<f4', '03': '<i2', '05': None, '08': '<i2', '09': '<i4', '11': '<i4', '90': '<f4', '97': None}
+    unpacked = unpack_fields(pack_fields(telegram_data, dtypes))
+
+    assert list(unpacked) == list(telegram_data)
+    assert unpacked['01'].dtype == numpy.float32 and unpacked['01'] == numpy.float32(12.345)
+    assert unpacked['03'].dtype == numpy.int16 and unpacked['03'] == 7
+    assert unpacked['05'] == 'NP'
+    assert unpacked['08'] == '99999'  # does not fit in an int16
+    assert unpacked['09'].dtype == numpy.int32 and list(unpacked['09']) == [1, 2, 3]
+    assert unpacked['11'] == 'None'
+    numpy.testing.assert_array_equal(unpacked['90'], numpy.array([-9.999, 0.5], dtype=numpy.float32))
+    assert unpacked['97'] == []
+    assert unpacked['98'] == ['a', 'b']
+    with pytest.raises(ValueError):
+        unpack_fields(b'\x00')
+
+
+@pytest.mark.parametrize('spectrum_storage', ['text', 'zlib'])
+@pytest.mark.parametrize('config_dict, telegram_lines', [
+    (config_dict_parsivel, parsivel_lines),
+    (config_dict_thies, thies_lines)])
+def test_parsed_storage(tmp_path, config_dict, telegram_lines, spectrum_storage):
+    """
+    This function tests that the parsed fields are stored next to the telegram string, and that the telegram data
+    read from them has the same values (in the dtype of the NetCDF variable) as the telegram data parsed from the string.
+    :param tmp_path: temporary directory
+    :param config_dict: the config dictionary of the sensor
+    :param telegram_lines: the telegram lines of the sensor
+    :param spectrum_storage: text or zlib
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    create_db(dbpath=str(db_path), spectrum_storage=spectrum_storage, parsed=True)
+    db_writer = DBWriter(dbpath=str(db_path), spectrum_storage=spectrum_storage, parsed=True)
+    telegram = create_telegram(config_dict=config_dict, telegram_lines=telegram_lines, timestamp=start_dt,
+                               db_cursor=None, db_row_id=None, telegram_data={}, logger=logger)
+    assert db_writer.write([telegram]) is True
+    db_writer.close()
+
+    con, _ = connect_db(dbpath=str(db_path))
+    row = list(query_db_rows_gen(con, date_dt=start_dt, logger=logger))[0]
+    con.close()
+    assert isinstance(row['parsed'], bytes)
+
+    telegrams = []
+    for parsed_blob in (None, row['parsed']):
+        telegram = create_telegram(config_dict=config_dict, telegram_lines=row['telegram'], timestamp=start_dt,
+                                   db_cursor=None, db_row_id=row['id'], telegram_data={}, logger=logger,
+                                   spectrum_blob=row.get('spectrum'), parsed_blob=parsed_blob)
+        telegram.parse_telegram_row()
+        telegrams.append(telegram.telegram_data)
+    text_data, parsed_data = telegrams
+    assert list(parsed_data) == list(text_data)
+    dtypes = field_dtypes(config_dict)
+    for field, value in text_data.items():
+        if dtypes.get(field) is None:
+            assert parsed_data[field] == value
+        else:
+            numpy.testing.assert_array_equal(numpy.asarray(parsed_data[field]),
+                                             numpy.asarray(value, dtype=numpy.float64).astype(dtypes[field]))
+
+
+def fill_db(db_path, minutes, sensors=('PAR008',)):
+    """
+    This function creates a database with one short row per minute per sensor, starting at start_dt.
+    :param db_path: the path of the database
+    :param minutes: the number of minutes to fill
+    :param sensors: the sensor_ids to insert rows for
+    """
+    if os.path.isfile(db_path):
+        os.remove(db_path)
+    create_db(dbpath=str(db_path))
+    con, cur = connect_db(dbpath=str(db_path))
+    start_ts = start_dt.timestamp()
+    insert_rows(cur=cur, rows=((start_ts + 60 * i, '', sensor, '01:0000.000')
+                               for i in range(minutes) for sensor in sensors))
+    con.commit()
+    cur.close()
+    con.close()
+
+
+def test_range_index_existing_db():
+    """
+    This function tests that starting the logger (create_db) on a database created without the
+    (sensor_id, timestamp) index does not build it, that upgrade_db.py (the RangeIndex migration) adds it,
+    keeping the rows, and that the range query of one sensor then searches the index instead of scanning the table.
+    """
+    db_path = data_dir / 'test_range_index.db'
+    if os.path.isfile(db_path):
+        os.remove(db_path)
+    con, cur = connect_db(dbpath=str(db_path))
+    cur.execute("CREATE TABLE disdrodl (id INTEGER PRIMARY KEY, timestamp REAL, datetime TEXT, sensor_id TEXT, "
+                "telegram TEXT)")
+    insert_rows(cur=cur, rows=[(start_dt.timestamp() + 60 * i, '', 'PAR008', '') for i in range(10)])
+    con.commit()
+    params = ('PAR008', start_dt.timestamp(), start_dt.timestamp() + 3600)
+    assert any(step.startswith('SCAN') for step in query_plan(con, range_query('PAR008'), params))
+    cur.close()
+    con.close()
+
+    create_db(dbpath=str(db_path))
+    con = connect_db(dbpath=str(db_path))[0]
+    assert any(step.startswith('SCAN') for step in query_plan(con, range_query('PAR008'), params))
+    con.close()
+
+    migrate(db_path, config_dict=config_dict_parsivel, logger=Mock(), migrations=[RangeIndex()])
+
+    con, cur = connect_db(dbpath=str(db_path))
+    plan = query_plan(con, range_query('PAR008'), params)
+    assert any('USING INDEX idx_disdrodl_sensor_id_timestamp' in step for step in plan)
+    assert not any(step.startswith('SCAN') for step in plan)  # no full scan, and no sort
+    assert cur.execute("SELECT COUNT(*) FROM disdrodl").fetchone()[0] == 10
+    cur.close()
+    con.close()
+    os.remove(db_path)
+
+
+def test_query_range_gen():
+    """
+    This function tests that the range query only returns the rows of the sensor with start <= timestamp < end,
+    ordered by timestamp, and all sensors' rows when no sensor is given.
+    """
+    db_path = data_dir / 'test_range_query.db'
+    fill_db(db_path, minutes=120, sensors=('PAR008', 'THIES006'))
+    con, _ = connect_db(dbpath=str(db_path))
+    start_ts = start_dt.timestamp() + 600
+    mock_logger = Mock()
+
+    rows = list(query_range_gen(con, start_ts=start_ts, end_ts=start_ts + 1800, sensor_id='PAR008',
+                                logger=mock_logger))
+    assert [row['timestamp'] for row in rows] == [start_ts + 60 * i for i in range(30)]
+    assert {row['sensor_id'] for row in rows} == {'PAR008'}
+    assert '?' in mock_logger.debug.call_args.kwargs['msg']
+
+    assert len(list(query_range_gen(con, start_ts=start_ts, end_ts=start_ts + 1800))) == 60
+    assert len(list(query_db_rows_gen(con, date_dt=start_dt, logger=logger, sensor_id='THIES006'))) == 120
+    con.close()
+    os.remove(db_path)
+
+
+def test_unique_minutes(tmp_path):
+    """
+    This function tests that a telegram of a minute that is already stored for the sensor is ignored,
+    also by the DBWriter, and that the unique index is only created on a new table: an existing database
+    (with or without duplicate rows) gets its index from upgrade_db.py, see test_migrations.py.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    create_db(dbpath=str(db_path))
+    con, cur = connect_db(dbpath=str(db_path))
+    rows = [(start_dt.timestamp() + 60 * i, '', sensor, '01:0000.000') for i in range(3) for sensor in ('A', 'B')]
+    assert insert_rows(cur=cur, rows=rows) == 6
+    assert insert_rows(cur=cur, rows=rows[:2] + [(start_dt.timestamp() + 180, '', 'A', '')]) == 1
+    con.commit()
+    assert cur.execute("SELECT COUNT(*) FROM disdrodl").fetchone()[0] == 7
+    indexes = [row[0] for row in cur.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()]
+    assert indexes == [UNIQUE_INDEX]
+    cur.close()
+    con.close()
+
+    mock_logger = Mock()
+    db_writer = DBWriter(dbpath=str(db_path), logger=mock_logger)
+    assert db_writer.write([create_parsivel_telegram(start_dt + timedelta(minutes=i)) for i in range(2)]) is True
+    assert db_writer.write([create_parsivel_telegram(start_dt)]) is True
+    assert db_writer.cur.execute("SELECT COUNT(*) FROM disdrodl WHERE sensor_id = 'PAR008'").fetchone()[0] == 2
+    db_writer.close()
+    assert 'ignored 1 telegram(s) from PAR008' in mock_logger.warning.call_args.kwargs['msg']
+
+    legacy_path = tmp_path / 'legacy.db'
+    con, cur = connect_db(dbpath=str(legacy_path))
+    cur.execute("CREATE TABLE disdrodl (id INTEGER PRIMARY KEY, timestamp REAL, datetime TEXT, sensor_id TEXT, "
+                "telegram TEXT)")
+    cur.executemany("INSERT INTO disdrodl(timestamp, datetime, sensor_id, telegram) VALUES (?, ?, ?, ?)",
+                    rows + rows[:1])
+    con.commit()
+    cur.close()
+    con.close()
+    # starting the logger on the legacy database does not try to build an index over its rows
+    create_db(dbpath=str(legacy_path))
+    con, cur = connect_db(dbpath=str(legacy_path))
+    assert create_index(cur) is False
+    assert cur.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall() == []
+    create_range_index(cur)
+    assert create_unique_index(cur) is False
+    indexes = [row[0] for row in cur.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()]
+    assert indexes == [RANGE_INDEX]
+    cur.execute("DELETE FROM disdrodl WHERE id = (SELECT MAX(id) FROM disdrodl)")
+    assert create_unique_index(cur) is True
+    assert create_index(cur) is True
+    indexes = [row[0] for row in cur.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()]
+    assert indexes == [UNIQUE_INDEX]
+    cur.close()
+    con.close()
+
+
+def test_minute_report(tmp_path):
+    """
+    This function tests that the minutes of a day that are missing (at the start, in the middle and at the end),
+    stored twice (by a legacy database) or stored without data are reported, and that a year is reported
+    with one query per kind instead of one per minute.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    con, cur = connect_db(dbpath=str(db_path))
+    cur.execute("CREATE TABLE disdrodl (id INTEGER PRIMARY KEY, timestamp REAL, datetime TEXT, sensor_id TEXT, "
+                "telegram TEXT)")
+    start_ts, end_ts = day_range(start_dt)
+    minutes = [i for i in range(1440) if not 0 <= i < 2 and not 600 <= i < 610 and i != 1439]
+    rows = [(start_ts + 60 * i, '', 'PAR008', '' if i == 700 else '01:0000.000') for i in minutes]
+    rows += [(start_ts + 60 * 800 + 2, '', 'PAR008', '01:0000.000'), (start_ts + 60 * 5, '', 'THIES006', '')]
+    insert_rows(cur=cur, rows=rows)
+    create_range_index(cur)
+    con.commit()
+
+    report = minute_report(con, start_ts, end_ts, sensor_id='PAR008')
+    assert report['expected'] == 1440
+    assert report['missing'] == 13
+    assert report['present'] == 1427
+    assert report['empty'] == 1
+    assert report['gaps'] == [(start_ts, start_ts + 60, 2), (start_ts + 60 * 600, start_ts + 60 * 609, 10),
+                              (start_ts + 60 * 1439, start_ts + 60 * 1439, 1)]
+    assert report['duplicates'] == [(start_ts + 60 * 800, 2)]
+
+    year_start = datetime(start_dt.year, 1, 1, tzinfo=timezone.utc).timestamp()
+    year_end = datetime(start_dt.year + 1, 1, 1, tzinfo=timezone.utc).timestamp()
+    report = minute_report(con, year_start, year_end, sensor_id='PAR008')
+    assert report['expected'] == (year_end - year_start) / 60
+    assert report['missing'] == report['expected'] - 1427
+    assert len(report['gaps']) == 3
+    assert minute_report(con, start_ts, end_ts, sensor_id='PAR007')['gaps'] == [(start_ts, start_ts + 60 * 1439, 1440)]
+    con.close()
+
+
+def test_db_reader(tmp_path):
+    """
+    This function tests that the DBReader opens the database read-only with memory-mapped I/O,
+    that it does not create a missing database, and that it returns the rows of a range in batches
+    of tuples or of NumPy record arrays, the same rows as query_range_gen.
+    :param tmp_path: temporary directory
+    """
+    with pytest.raises(sqlite3.OperationalError):
+        DBReader(dbpath=tmp_path / 'missing.db')
+    assert not (tmp_path / 'missing.db').exists()
+
+    db_path = tmp_path / 'disdrodl.db'
+    create_db(dbpath=str(db_path), spectrum_storage='blob', columns={'01': ('f01', 'REAL'), '18': ('f18', 'INTEGER')})
+    con, cur = connect_db(dbpath=str(db_path))
+    rows = [(start_dt.timestamp() + 60 * i, '', 'PAR008', '01:0000.000', b'\x00\x00\x00', float(i), None)
+            for i in range(25)]
+    insert_rows(cur=cur, rows=rows, spectrum=True, columns=['f01', 'f18'])
+    con.commit()
+    expected = list(query_range_gen(con, start_dt.timestamp(), start_dt.timestamp() + 3600, sensor_id='PAR008'))
+    cur.close()
+    con.close()
+
+    reader = DBReader(dbpath=db_path, fetch_size=10, mmap_size=1024 * 1024)
+    assert reader.con.execute("PRAGMA query_only").fetchone()[0] == 1
+    assert reader.con.execute("PRAGMA mmap_size").fetchone()[0] == 1024 * 1024
+    with pytest.raises(sqlite3.OperationalError):
+        reader.con.execute("DELETE FROM disdrodl")
+
+    batches = list(reader.range_batches(start_dt.timestamp(), start_dt.timestamp() + 3600, sensor_id='PAR008'))
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert reader.columns == list(expected[0].keys())
+    assert [dict(zip(reader.columns, row)) for batch in batches for row in batch] == expected
+    assert len(list(reader.rows(start_dt.timestamp(), start_dt.timestamp() + 600))) == 10
+
+    records = list(reader.range_batches(start_dt.timestamp(), start_dt.timestamp() + 3600, records=True))
+    assert [len(batch) for batch in records] == [10, 10, 5]
+    assert records[0].dtype['id'] == numpy.int64
+    assert numpy.array_equal(records[1].f01, numpy.arange(10, 20, dtype=float))
+    assert numpy.isnan(records[2].f18).all()
+    assert records[0].spectrum[0] == b'\x00\x00\x00'
+    assert records[0].telegram[0] == '01:0000.000'
+    reader.close()
+
+
+def test_range_query_plan():
+    """
+    This function tests that the query of one day of one sensor in a database with two sensors searches the
+    (sensor_id, timestamp) index for the range, without a full scan or a sort, so its time does not grow with the size
+    of the database.
+    """
+    db_path = data_dir / 'test_range_plan.db'
+    fill_db(db_path, minutes=3 * 1440, sensors=('PAR008', 'THIES006'))
+    con, _ = connect_db(dbpath=str(db_path))
+    start_ts, end_ts = day_range(start_dt + timedelta(days=1))
+
+    plan = query_plan(con, range_query('PAR008'), ('PAR008', start_ts, end_ts))
+    assert any(step.startswith(f'SEARCH disdrodl USING INDEX {UNIQUE_INDEX}') for step in plan)
+    assert not any(step.startswith('SCAN') or 'TEMP B-TREE' in step for step in plan)
+    rows = list(query_db_rows_gen(con, date_dt=start_dt + timedelta(days=1), logger=logger, sensor_id='PAR008'))
+    assert len(rows) == 1440
+    con.close()
+    os.remove(db_path)
+
+
+@pytest.mark.benchmark
+def test_range_query_benchmark():
+    """
+    This function benchmarks the query of one day of one sensor in a database of 10 days and in one of 100 days
+    (with two sensors): the query time should stay flat as the database grows, instead of growing with its size.
+    """
+    timings = []
+    for days in (10, 100):
+        db_path = data_dir / f'test_range_benchmark_{days}.db'
+        fill_db(db_path, minutes=days * 1440, sensors=('PAR008', 'THIES006'))
+        con, _ = connect_db(dbpath=str(db_path))
+        best = None
+        for _ in range(5):
+            start = time.perf_counter()
+            rows = list(query_db_rows_gen(con, date_dt=start_dt + timedelta(days=5), logger=logger,
+                                          sensor_id='PAR008'))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        assert len(rows) == 1440
+        timings.append(best)
+        con.close()
+        os.remove(db_path)
+
+    print(f'one day query: {timings[0] * 1000:.1f} ms (10 days in db), {timings[1] * 1000:.1f} ms (100 days in db)')
+    # a full scan would take about 10 times longer
+    assert timings[1] < 3 * timings[0]
+
+
+def test_field_columns():
+    """
+    This function tests that the typed columns of the scalar fields are generated from the telegram_fields
+    of the config, and that the spectra and vectors get no column.
+    """
+    columns = field_columns(config_dict_parsivel)
+    assert columns['01'] == ('f01', 'REAL')
+    assert columns['03'] == ('f03', 'INTEGER')
+    assert columns['05'] == ('f05', 'TEXT')
+    assert columns['13'] == ('f13', 'INTEGER')  # no dimensions
+    assert not {'61', '90', '91', '93'} & set(columns)
+
+    columns = field_columns(config_dict_thies)
+    assert columns['46'] == ('f46', 'REAL')
+    assert '81' not in columns
+
+    assert field_value('0012.500', 'REAL') == 12.5
+    assert field_value('00', 'INTEGER') == 0
+    assert field_value('NP', 'REAL') is None
+    assert field_value('', 'TEXT') is None
+    assert field_value([], 'TEXT') is None
+
+
+def test_field_columns_storage():
+    """
+    This function tests that the scalar fields are stored in typed columns next to the telegram text,
+    that the columns are added to an existing database, and that aggregates run in SQL.
+    """
+    db_path = data_dir / 'test_field_columns.db'
+    if os.path.isfile(db_path):
+        os.remove(db_path)
+    create_db(dbpath=str(db_path))
+    columns = field_columns(config_dict_parsivel)
+    create_db(dbpath=str(db_path), columns=columns)
+
+    db_writer = DBWriter(dbpath=str(db_path), columns=columns)
+    telegrams = []
+    for i, intensity in enumerate(['0000.000', '0012.345', '0001.500']):
+        lines = [f'01:{intensity}\r\n'.encode() if line.startswith(b'01:') else line for line in parsivel_lines]
+        telegrams.append(ParsivelTelegram(config_dict=config_dict_parsivel, telegram_lines=lines,
+                                          timestamp=start_dt + timedelta(minutes=i), db_cursor=None,
+                                          telegram_data={}, logger=logger))
+    assert db_writer.write(telegrams) is True
+
+    con, cur = connect_db(dbpath=str(db_path))
+    types = {column[1]: column[2] for column in cur.execute("PRAGMA table_info(disdrodl)").fetchall()}
+    assert types['f01'] == 'REAL' and types['f08'] == 'INTEGER' and types['f05'] == 'TEXT'
+    f01, f08, f05, telegram = cur.execute("SELECT f01, f08, f05, telegram FROM disdrodl WHERE id = 2").fetchone()
+    assert (f01, f08, f05) == (12.345, 20000, 'NP')
+    assert '01:0012.345' in telegram
+    assert cur.execute("SELECT typeof(f01), typeof(f12) FROM disdrodl").fetchone() == ('real', 'real')
+
+    end_ts = (start_dt + timedelta(days=1)).timestamp()
+    assert field_aggregate(con, 'f01', 'max', start_dt.timestamp(), end_ts, sensor_id='PAR008') == 12.345
+    assert field_aggregate(con, 'f01', 'SUM', start_dt.timestamp(), end_ts) == pytest.approx(13.845)
+    assert field_aggregate(con, 'f01', 'COUNT', start_dt.timestamp(), end_ts, sensor_id='THIES006') == 0
+    with pytest.raises(ValueError):
+        field_aggregate(con, 'f01', 'DROP', start_dt.timestamp(), end_ts)
+    with pytest.raises(ValueError):
+        field_aggregate(con, 'f01) FROM disdrodl; --', 'MAX', start_dt.timestamp(), end_ts)
+    cur.close()
+    con.close()
+    db_writer.close()
+    os.remove(db_path)
+
+
+def test_partition_paths(tmp_path):
+    """
+    This function tests the names of the partition files, and that only the existing partitions
+    overlapping a range are returned, oldest first.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    assert partition_path(db_path, start_dt, 'none') == db_path
+    assert partition_path(db_path, start_dt, 'monthly') == tmp_path / 'disdrodl_202401.db'
+    assert partition_path(db_path, start_dt, 'daily') == tmp_path / 'disdrodl_20240101.db'
+    assert partition_path(db_path, start_dt, 'yearly') == tmp_path / 'disdrodl_2024.db'
+
+    for name in ('disdrodl_202311.db', 'disdrodl_202312.db', 'disdrodl_202401.db', 'disdrodl_202403.db',
+                 'disdrodl_202401.db.sha256', 'disdrodl_20240101.db', 'other_202401.db'):
+        (tmp_path / name).touch()
+    dec = datetime(2023, 12, 15, tzinfo=timezone.utc).timestamp()
+    feb = datetime(2024, 2, 1, tzinfo=timezone.utc).timestamp()
+    assert partition_paths(db_path, dec, feb, 'monthly') == [tmp_path / 'disdrodl_202312.db',
+                                                              tmp_path / 'disdrodl_202401.db']
+    assert partition_paths(db_path, feb, feb + 86400, 'monthly') == []
+    assert partition_paths(db_path, dec, feb, 'none') == []
+
+
+def test_db_writer_partitions(tmp_path):
+    """
+    This function tests that telegrams are written into the monthly partition of their timestamp,
+    that the partitions before the current one are sealed with a checksum, that a range query only returns
+    the rows of the overlapping partitions, and that a late telegram unseals its partition.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    mock_logger = Mock()
+    db_writer = DBWriter(dbpath=str(db_path), logger=mock_logger, partitioning='monthly')
+    assert db_writer.con is None
+    first = datetime(2023, 12, 31, 23, 58, tzinfo=timezone.utc)
+    for i in range(4):
+        assert db_writer.write([create_parsivel_telegram(first + timedelta(minutes=i))]) is True
+    assert db_writer.write([create_parsivel_telegram(datetime(2024, 2, 1, tzinfo=timezone.utc))]) is True
+    db_writer.close()
+
+    assert sorted(path.name for path in tmp_path.iterdir() if path.suffix in ('.db', '.sha256')) == [
+        'disdrodl_202312.db', 'disdrodl_202312.db.sha256', 'disdrodl_202401.db', 'disdrodl_202401.db.sha256',
+        'disdrodl_202402.db']
+    assert not db_path.exists()
+    sealed = tmp_path / 'disdrodl_202312.db'
+    assert not (tmp_path / 'disdrodl_202312.db-wal').exists()
+    checksum = (tmp_path / 'disdrodl_202312.db.sha256').read_text(encoding='utf-8').split()
+    assert checksum == [hashlib.sha256(sealed.read_bytes()).hexdigest(), 'disdrodl_202312.db']
+
+    rows = list(query_partitions_gen(db_path, start_ts=first.timestamp(), end_ts=first.timestamp() + 3600,
+                                     partitioning='monthly', sensor_id='PAR008'))
+    assert [row['timestamp'] for row in rows] == [(first + timedelta(minutes=i)).timestamp() for i in range(4)]
+    rows = list(query_partitions_gen(db_path, *day_range(datetime(2024, 2, 1)), partitioning='monthly'))
+    assert len(rows) == 1
+
+    db_writer = DBWriter(dbpath=str(db_path), logger=mock_logger, partitioning='monthly')
+    assert db_writer.write([create_parsivel_telegram(first - timedelta(minutes=1))]) is True
+    db_writer.close()
+    assert not (tmp_path / 'disdrodl_202312.db.sha256').exists()
+    mock_logger.warning.assert_called_once()
+
+
+def test_query_partitions_batches(tmp_path):
+    """
+    This function tests that more daily partitions than can be attached at once are queried in batches,
+    and that a column missing in older partitions is returned as None.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    db_writer = DBWriter(dbpath=str(db_path), partitioning='daily')
+    for day in range(12):
+        assert db_writer.write([create_parsivel_telegram(start_dt + timedelta(days=day, hours=hour))
+                                for hour in (0, 12)]) is True
+    db_writer.close()
+    db_writer = DBWriter(dbpath=str(db_path), partitioning='daily', spectrum_storage='blob')
+    for day in range(12, 25):
+        assert db_writer.write([create_parsivel_telegram(start_dt + timedelta(days=day, hours=hour))
+                                for hour in (0, 12)]) is True
+    db_writer.close()
+
+    mock_logger = Mock()
+    rows = list(query_partitions_gen(db_path, start_ts=start_dt.timestamp(),
+                                     end_ts=(start_dt + timedelta(days=30)).timestamp(), partitioning='daily',
+                                     sensor_id='PAR008', logger=mock_logger))
+    assert len(rows) == 50
+    assert [row['timestamp'] for row in rows] == sorted(row['timestamp'] for row in rows)
+    assert mock_logger.debug.call_count == 3  # 10 + 10 + 5 partitions
+    assert rows[0]['spectrum'] is None
+    assert isinstance(rows[-1]['spectrum'], bytes)
+
+
+def test_db_writer_pragmas(create_db_parsivel): # pylint: disable=unused-argument
+    """
+    This function tests that the DBWriter connection uses WAL journaling and the given pragmas.
+    :param create_db_parsivel: the function to create the test database
+    """
+    db_writer = DBWriter(dbpath=str(db_path_parsivel), synchronous='full', busy_timeout=2.5)
+    assert db_writer.cur.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    assert db_writer.cur.execute("PRAGMA synchronous").fetchone()[0] == 2  # FULL
+    assert db_writer.cur.execute("PRAGMA busy_timeout").fetchone()[0] == 2500
+    db_writer.close()
+    assert db_writer.con is None
+
+    with pytest.raises(ValueError):
+        DBWriter(dbpath=str(db_path_parsivel), synchronous='SOMETIMES')
+
+
+def test_db_writer_concurrent_reader(create_db_parsivel): # pylint: disable=unused-argument
+    """
+    This function tests that a reader with an open transaction (e.g. the export script) does not block the DBWriter,
+    and that the reader only sees the new rows once its transaction ends.
+    :param create_db_parsivel: the function to create the test database
+    """
+    db_writer = DBWriter(dbpath=str(db_path_parsivel), busy_timeout=0.1, max_retries=0)
+    assert db_writer.write([create_parsivel_telegram(start_dt)]) is True
+
+    con, cur = connect_db(dbpath=str(db_path_parsivel))
+    cur.execute("BEGIN")
+    assert cur.execute("SELECT COUNT(*) FROM disdrodl").fetchone()[0] == 1
+
+    for i in range(1, 10):
+        assert db_writer.write([create_parsivel_telegram(start_dt + timedelta(minutes=i))]) is True
+
+    assert cur.execute("SELECT COUNT(*) FROM disdrodl").fetchone()[0] == 1
+    con.commit()
+    assert cur.execute("SELECT COUNT(*) FROM disdrodl").fetchone()[0] == 10
+    cur.close()
+    con.close()
+    db_writer.close()
+
+
+def test_db_writer_reconnect(create_db_parsivel): # pylint: disable=unused-argument
+    """
+    This function tests that the DBWriter reconnects and retries after an I/O error.
+    :param create_db_parsivel: the function to create the test database
+    """
+    mock_logger = Mock()
+    db_writer = DBWriter(dbpath=str(db_path_parsivel), logger=mock_logger)
+    telegram = create_parsivel_telegram(start_dt)
+    errors = [sqlite3.OperationalError('disk I/O error')]
+
+    def failing_insert_telegrams(**kwargs):
+        if errors:
+            raise errors.pop()
+        return insert_telegrams(**kwargs)
+
+    first_con = db_writer.con
+
+    with patch('modules.db_writer.insert_telegrams', side_effect=failing_insert_telegrams):
+        assert db_writer.write([telegram]) is True
+
+    assert db_writer.reconnect_count == 1
+    assert db_writer.con is not first_con
+    mock_logger.error.assert_called_once()
+    assert db_writer.cur.execute("SELECT COUNT(*) FROM disdrodl").fetchone()[0] == 1
+    db_writer.close()
+
+
+def test_db_writer_locked(create_db_parsivel): # pylint: disable=unused-argument
+    """
+    This function tests that the DBWriter gives up after its retries when another writer holds the lock,
+    without reconnecting, and that writing works again once the lock is released.
+    :param create_db_parsivel: the function to create the test database
+    """
+    mock_logger = Mock()
+    db_writer = DBWriter(dbpath=str(db_path_parsivel), logger=mock_logger, busy_timeout=0.05, max_retries=1)
+
+    con, cur = connect_db(dbpath=str(db_path_parsivel))
+    cur.execute("BEGIN IMMEDIATE")
+    assert db_writer.write([create_parsivel_telegram(start_dt)]) is False
+    assert mock_logger.error.call_count == 2
+    assert db_writer.reconnect_count == 0
+    con.rollback()
+
+    assert db_writer.write([create_parsivel_telegram(start_dt)]) is True
+    assert cur.execute("SELECT COUNT(*) FROM disdrodl").fetchone()[0] == 1
+    cur.close()
+    con.close()
+    db_writer.close()
+
+
 def test_unpack_telegram_from_db():
     """
     This function tests the unpack_telegram_from_db function.
@@ -742,6 +1499,171 @@ def test_netcdf_wrong_f93_len_parsivel(db_insert_two_telegrams_parsivel): # pyli
     os.remove(data_dir / 'test_wrong_f93_len_parsivel.nc')
     os.remove(db_path_parsivel)
 
+def varied_rows(config_dict, minutes, spectrum_storage='text', parsed=False):
+    """
+    This function creates the (id, timestamp, telegram, spectrum, parsed) rows of telegrams with varying values
+    (rain intensity, temperature and spectrum), one per minute from start_dt, as export_disdrodlDB2NC.read_rows reads them.
+    :param config_dict: the config dictionary of the sensor
+    :param minutes: the number of telegrams
+    :param spectrum_storage: text, blob or zlib
+    :param parsed: whether to add the parsed BLOB
+    :return: list of row tuples
+    """
+    rng = numpy.random.default_rng(8)
+    rows = []
+    for i in range(minutes):
+        spectrum = ';'.join(f'{value:03d}' for value in rng.integers(0, 999, 1024 if config_dict is
+                                                                     config_dict_parsivel else 440))
+        if config_dict is config_dict_parsivel:
+            lines = [b'01:%08.3f\r\n' % rng.uniform(0, 100) if line.startswith(b'01:') else
+                     b'12:%03d\r\n' % rng.integers(0, 40) if line.startswith(b'12:') else
+                     b'93:' + spectrum.encode() + b';\r\n' if line.startswith(b'93:') else line
+                     for line in parsivel_lines]
+        else:
+            values = thies_lines.split(';')
+            values[45] = f'{rng.uniform(-10, 30):+05.1f}'
+            values[16] = f'{rng.uniform(0, 100):07.2f}'
+            lines = ';'.join(values[:79] + [spectrum] + values[519:])
+        telegram = create_telegram(config_dict=config_dict, telegram_lines=lines,
+                                   timestamp=start_dt + timedelta(minutes=i), db_cursor=None, db_row_id=None,
+                                   telegram_data={}, logger=logger)
+        row = telegram.db_row(spectrum_storage=spectrum_storage, parsed=parsed)
+        rows.append((i + 1, row[0], row[3], row[4] if spectrum_storage != 'text' else None,
+                     row[-1] if parsed else None))
+    return rows
+
+
+def test_decode_telegrams():
+    """
+    This function tests that rows stored as text, with a spectrum BLOB or with a parsed BLOB are decoded into the same
+    typed columns, with the spectrum as a (T, 32, 32) column, that a row without data is kept with the fill values
+    and flagged as missing, and that a spectrum with the wrong number of values is replaced by the error value.
+    """
+    rows = varied_rows(config_dict_parsivel, 3) + varied_rows(config_dict_parsivel, 3, 'zlib', parsed=True)
+    rows = [(i, timestamp + 180 * (i >= 3), *row) for i, (_, timestamp, *row) in enumerate(rows)]
+    rows.insert(2, (10, rows[1][1] + 30, '', None, None))
+    # the first value of the spectrum is missing
+    spectrum_start = rows[0][2].index('; 93:') + 5
+    rows.append((11, rows[-1][1] + 60, rows[0][2][:spectrum_start] +
+                 rows[0][2][rows[0][2].index(',', spectrum_start) + 1:], None, None))
+    mock_logger = Mock()
+
+    records = decode_telegrams(config_dict_parsivel, rows, mock_logger)
+
+    assert len(records) == 8
+    assert list(records['id']) == [0, 1, 10, 2, 3, 4, 5, 11]
+    assert records['quality_flag'][2] == QUALITY_MISSING
+    assert records['01'][2] == FILL_VALUE
+    assert (records['93'][2] == FILL_VALUE).all()
+    records = numpy.delete(records, 2)
+    assert records['01'].dtype == numpy.float32
+    assert records['03'].dtype == numpy.int16
+    assert records['05'].dtype == object and records['05'][0] == 'NP'
+    assert records['90'].shape == (7, 32)
+    assert records['93'].shape == (7, 32, 32)
+    assert records['93'].dtype == numpy.int32
+    for field in records.dtype.names[2:]:
+        if records[field].dtype != object:
+            numpy.testing.assert_array_equal(records[field][:3], records[field][3:6])
+    telegram = create_telegram(config_dict=config_dict_parsivel, telegram_lines=rows[0][2], timestamp=start_dt,
+                               db_cursor=None, db_row_id=0, telegram_data={}, logger=logger)
+    telegram.parse_telegram_row()
+    numpy.testing.assert_array_equal(records['93'][0], numpy.array(telegram.telegram_data['93'], dtype=int)
+                                     .reshape(32, 32))
+    assert records['01'][0] == numpy.float32(telegram.telegram_data['01'])
+    assert (records['93'][-1] == ERROR_VALUE).all()
+    assert 'field 93 of 1 telegram(s) does not have 1024 values' in mock_logger.error.call_args.kwargs['msg']
+
+    rows[0] = (0, rows[0][1], rows[0][2].replace('01:', '01:x').replace('; 03:00', ''), None, None)
+    records = decode_telegrams(config_dict_parsivel, rows, Mock())
+    assert records['01'][0] == FILL_VALUE
+    assert records['03'][0] == FILL_VALUE
+
+
+@pytest.mark.parametrize('full_version', [True, False])
+@pytest.mark.parametrize('config_dict', [config_dict_parsivel, config_dict_thies])
+def test_decode_telegrams_netcdf(config_dict, full_version):
+    """
+    This function tests that the NetCDF written from the structured array of decode_telegrams is the same as the NetCDF
+    written from the Telegram objects, for rows stored as text and rows stored with a spectrum and parsed BLOB.
+    :param config_dict: the config dictionary of the sensor
+    :param full_version: whether to write the full or the light NetCDF
+    """
+    rows = varied_rows(config_dict, 20) + \
+        [(21 + i, timestamp + 1200, *row) for i, (_, timestamp, *row) in
+         enumerate(varied_rows(config_dict, 20, 'zlib', parsed=True))]
+    telegram_objs = []
+    for row_id, timestamp, telegram_str, spectrum, parsed in rows:
+        telegram = create_telegram(config_dict=config_dict, telegram_lines=telegram_str,
+                                   timestamp=datetime.fromtimestamp(timestamp, tz=timezone.utc), db_cursor=None,
+                                   db_row_id=row_id, telegram_data={}, logger=logger, spectrum_blob=spectrum,
+                                   parsed_blob=parsed)
+        telegram.parse_telegram_row()
+        telegram_objs.append(telegram)
+
+    datasets = []
+    for fn_start, objs, records in (('test_objects', telegram_objs, None),
+                                    ('test_records', None, decode_telegrams(config_dict, rows, logger))):
+        nc = NetCDF(logger=logger, config_dict=config_dict, data_dir=data_dir, fn_start=fn_start,
+                    full_version=full_version, telegram_objs=objs, date=start_dt, records=records)
+        nc.create_netCDF()
+        nc.write_data_to_netCDF()
+        datasets.append(Dataset(data_dir / f'{fn_start}.nc', 'r', format="NETCDF4"))
+
+    objects, records = datasets
+    assert list(objects.variables) == list(records.variables)
+    # the telegram values vary
+    names = [field_dict['var_attrs']['standard_name'] for field_dict in config_dict['telegram_fields'].values()]
+    assert sum(numpy.ma.filled(variable[:], 0).std() > 0 for name, variable in objects.variables.items()
+               if variable.dtype != str and name in names) >= 2
+    for name, variable in objects.variables.items():
+        expected, value = variable[:], records.variables[name][:]
+        if variable.dtype == str:
+            assert list(numpy.ravel(value)) == list(numpy.ravel(expected)), name
+        else:
+            numpy.testing.assert_array_equal(numpy.ma.getmaskarray(value), numpy.ma.getmaskarray(expected), name)
+            numpy.testing.assert_array_equal(numpy.ma.filled(value), numpy.ma.filled(expected), name)
+    for dataset, fn_start in zip(datasets, ('test_objects', 'test_records')):
+        dataset.close()
+        os.remove(data_dir / f'{fn_start}.nc')
+
+
+@pytest.mark.benchmark
+def test_decode_telegrams_benchmark():
+    """
+    This function tests that decoding a day of telegrams at once and writing the NetCDF from the structured array
+    is faster than creating a Telegram object per telegram and writing the NetCDF from the objects.
+    """
+    rows = varied_rows(config_dict_parsivel, data_points_24h)
+    durations = []
+    for fn_start in ('test_objects', 'test_records'):
+        # the best of three runs, so a busy machine does not decide the comparison
+        runs = []
+        for _ in range(3):
+            start = time.perf_counter()
+            telegram_objs, records = None, None
+            if fn_start == 'test_objects':
+                telegram_objs = []
+                for row_id, timestamp, telegram_str, _, _ in rows:
+                    telegram = create_telegram(config_dict=config_dict_parsivel, telegram_lines=telegram_str,
+                                               timestamp=datetime.fromtimestamp(timestamp, tz=timezone.utc),
+                                               db_cursor=None, db_row_id=row_id, telegram_data={}, logger=logger)
+                    telegram.parse_telegram_row()
+                    telegram_objs.append(telegram)
+            else:
+                records = decode_telegrams(config_dict_parsivel, rows, logger)
+            nc = NetCDF(logger=Mock(), config_dict=config_dict_parsivel, data_dir=data_dir, fn_start=fn_start,
+                        full_version=True, telegram_objs=telegram_objs, date=start_dt, records=records)
+            nc.create_netCDF()
+            nc.write_data_to_netCDF()
+            runs.append(time.perf_counter() - start)
+            os.remove(data_dir / f'{fn_start}.nc')
+        durations.append(min(runs))
+
+    print(f'a day per object in {durations[0]:.2f}s, at once in {durations[1]:.2f}s')
+    assert durations[1] < durations[0]
+
+
 def test_compress_non_existent_file(caplog):
     '''
     This function tests compressing a non-existent NetCDF file.
@@ -7,17 +7,28 @@ That is mainly done in test_db.py.
 
 Functions:
 - side_effect: Side effect to replace 'data_dir' in mocked netCDF objects.
+- range_config: Writes a copy of a site config and its test database to a temporary directory.
+- test_export_range: Verifies that a range of days of several sensors is exported by a pool of worker processes.
 """
 
 import os
+import shutil
 import unittest
+from argparse import Namespace
+from datetime import datetime
 from pathlib import Path
 from unittest.mock import patch, Mock
+import numpy
 import pytest
+import yaml
+from netCDF4 import Dataset  # pylint: disable=no-name-in-module
 import export_disdrodlDB2NC
-from modules.util_functions import create_dir
-from modules.sqldb import connect_db
+from conftest import db_path_parsivel, db_path_thies
+from modules.util_functions import create_dir, yaml2dict
+from modules.sqldb import connect_db, UNIQUE_INDEX
+from modules.db_reader import DBReader
 from modules.netCDF import NetCDF
+from modules.quality import QUALITY_MISSING
 
 output_file_dir = Path('sample_data/')
 
@@ -39,16 +50,20 @@ class ExportParsivelTests(unittest.TestCase):
     Functions:
     - test_parsivel_full: Verifies that exporting a full version of the PAR008 sensor results in no errors.
     - test_parsivel_light: Verifies that exporting a light version of the PAR008 sensor results in no errors.
+    - test_parsivel_duplicates: Verifies that a minute stored twice in a legacy database is exported once,
+      both when decoded at once and when parsed per object.
+    - test_parsivel_missing_minute: Verifies that a minute without data is exported with fill values,
+      flagged as missing.
     """
 
     @patch('export_disdrodlDB2NC.create_dir')
-    @patch('export_disdrodlDB2NC.connect_db')
+    @patch('export_disdrodlDB2NC.DBReader')
     @patch('export_disdrodlDB2NC.NetCDF')
-    def test_parsivel_full(self, mock_NetCDF, mock_connect_db, mock_create_dir): # pylint: disable=unused-argument
+    def test_parsivel_full(self, mock_NetCDF, mock_db_reader, mock_create_dir): # pylint: disable=unused-argument
         """
         This function verifies that exporting a full version of the PAR008 sensor results in no errors.
         :param mock_NetCDF: Mock object for NetCDF objects
-        :param mock_connect_db: Mock object for connecting to the test database with connect_db
+        :param mock_db_reader: Mock object for reading the test database with DBReader
         :param mock_create_dir: Mock object for creating the output directory
         """
         output_file_path = output_file_dir / '20240101_Green_Village-GV_PAR008.nc'
@@ -56,19 +71,17 @@ class ExportParsivelTests(unittest.TestCase):
         if os.path.exists(output_file_path):
             os.remove(output_file_path)
 
-        mock_args = Mock()
-        mock_args.config = 'configs_netcdf/config_PAR_008_GV.yml'
-        mock_args.date = '2024-01-01'
-        mock_args.version = 'full'
+        args = Namespace(config=['configs_netcdf/config_PAR_008_GV.yml'], date='2024-01-01', version='full',
+                         per_object=False, start=None, end=None, workers=1)
 
         db_path = Path("sample_data/test_parsivel.db")
-        mock_connect_db.return_value = connect_db(dbpath=str(db_path))
+        mock_db_reader.return_value = DBReader(dbpath=db_path)
 
         mock_create_dir.return_value = create_dir(path=output_file_dir)
 
         mock_NetCDF.side_effect = side_effect
 
-        export_disdrodlDB2NC.main(mock_args)
+        export_disdrodlDB2NC.main(args)
 
         assert output_file_path.exists()
 
@@ -76,13 +89,13 @@ class ExportParsivelTests(unittest.TestCase):
             os.remove(output_file_path)
 
     @patch('export_disdrodlDB2NC.create_dir')
-    @patch('export_disdrodlDB2NC.connect_db')
+    @patch('export_disdrodlDB2NC.DBReader')
     @patch('export_disdrodlDB2NC.NetCDF')
-    def test_parsivel_light(self, mock_NetCDF, mock_connect_db, mock_create_dir): # pylint: disable=unused-argument
+    def test_parsivel_light(self, mock_NetCDF, mock_db_reader, mock_create_dir): # pylint: disable=unused-argument
         """
         This function verifies that exporting a light version of the PAR008 sensor results in no errors.
         :param mock_NetCDF: Mock object for NetCDF objects
-        :param mock_connect_db: Mock object for connecting to the test database with connect_db
+        :param mock_db_reader: Mock object for reading the test database with DBReader
         :param mock_create_dir: Mock object for creating the output directory
         """
         output_file_path = output_file_dir / '20240101_Green_Village-GV_PAR008_light.nc'
@@ -90,25 +103,97 @@ class ExportParsivelTests(unittest.TestCase):
         if os.path.exists(output_file_path):
             os.remove(output_file_path)
 
-        mock_args = Mock()
-        mock_args.config = 'configs_netcdf/config_PAR_008_GV.yml'
-        mock_args.date = '2024-01-01'
-        mock_args.version = 'light'
+        args = Namespace(config=['configs_netcdf/config_PAR_008_GV.yml'], date='2024-01-01', version='light',
+                         per_object=False, start=None, end=None, workers=1)
 
         db_path = Path("sample_data/test_parsivel.db")
-        mock_connect_db.return_value = connect_db(dbpath=str(db_path))
+        mock_db_reader.return_value = DBReader(dbpath=db_path)
 
         mock_create_dir.return_value = create_dir(path=output_file_dir)
 
         mock_NetCDF.side_effect = side_effect
 
-        export_disdrodlDB2NC.main(mock_args)
+        export_disdrodlDB2NC.main(args)
 
         assert output_file_path.exists()
 
         if os.path.exists(output_file_path):
             os.remove(output_file_path)
 
+    @patch('export_disdrodlDB2NC.create_dir')
+    @patch('export_disdrodlDB2NC.DBReader')
+    @patch('export_disdrodlDB2NC.NetCDF')
+    def test_parsivel_duplicates(self, mock_NetCDF, mock_db_reader, mock_create_dir): # pylint: disable=unused-argument
+        """
+        This function verifies that a minute stored twice, in a database from before the unique index,
+        is exported once, so the time dimension of the NetCDF has no duplicates, with and without --per-object.
+        :param mock_NetCDF: Mock object for NetCDF objects
+        :param mock_db_reader: Mock object for reading the test database with DBReader
+        :param mock_create_dir: Mock object for creating the output directory
+        """
+        args = Namespace(config=['configs_netcdf/config_PAR_008_GV.yml'], date='2024-01-01', version='full',
+                         per_object=False, start=None, end=None, workers=1)
+
+        con, cur = connect_db(dbpath="sample_data/test_parsivel.db")
+        cur.execute(f"DROP INDEX {UNIQUE_INDEX}")
+        cur.execute("INSERT INTO disdrodl(timestamp, datetime, sensor_id, telegram) "
+                    "SELECT timestamp + 1, datetime, sensor_id, telegram FROM disdrodl ORDER BY id LIMIT 2")
+        con.commit()
+        cur.close()
+        con.close()
+        mock_db_reader.return_value = DBReader(dbpath="sample_data/test_parsivel.db")
+
+        export_disdrodlDB2NC.main(args)
+
+        timestamps = list(mock_NetCDF.call_args.kwargs['records']['timestamp'])
+        assert len(timestamps) == 1440
+        assert timestamps == sorted(set(timestamps))
+
+        args.per_object = True
+        mock_db_reader.return_value = DBReader(dbpath="sample_data/test_parsivel.db")
+
+        export_disdrodlDB2NC.main(args)
+
+        assert mock_NetCDF.call_args.kwargs['records'] is None
+        telegram_timestamps = [telegram.timestamp.timestamp()
+                               for telegram in mock_NetCDF.call_args.kwargs['telegram_objs']]
+        assert telegram_timestamps == timestamps
+
+    @patch('export_disdrodlDB2NC.create_dir')
+    @patch('export_disdrodlDB2NC.DBReader')
+    @patch('export_disdrodlDB2NC.NetCDF')
+    def test_parsivel_missing_minute(self, mock_NetCDF, mock_db_reader, mock_create_dir):
+        """
+        This function verifies that a minute with an empty read is exported as a time step with the fill values,
+        with the missing bit set in its quality_flag, with and without --per-object.
+        :param mock_NetCDF: Mock object for NetCDF objects
+        :param mock_db_reader: Mock object for reading the test database with DBReader
+        :param mock_create_dir: Mock object for creating the output directory
+        """
+        output_file_path = output_file_dir / '20240101_Green_Village-GV_PAR008.nc'
+        con, cur = connect_db(dbpath="sample_data/test_parsivel.db")
+        cur.execute("UPDATE disdrodl SET telegram = '' WHERE id = (SELECT id FROM disdrodl ORDER BY timestamp "
+                    "LIMIT 1 OFFSET 10)")
+        con.commit()
+        cur.close()
+        con.close()
+        mock_create_dir.return_value = create_dir(path=output_file_dir)
+        mock_NetCDF.side_effect = side_effect
+
+        for per_object in (False, True):
+            args = Namespace(config=['configs_netcdf/config_PAR_008_GV.yml'], date='2024-01-01', version='full',
+                             per_object=per_object, start=None, end=None, workers=1)
+            mock_db_reader.return_value = DBReader(dbpath="sample_data/test_parsivel.db")
+
+            export_disdrodlDB2NC.main(args)
+
+            with Dataset(output_file_path, 'r', format="NETCDF4") as rootgrp:
+                quality_flag = rootgrp.variables['quality_flag'][:]
+                assert len(quality_flag) == 1440
+                assert (quality_flag & QUALITY_MISSING).nonzero()[0].tolist() == [10]
+                assert rootgrp.variables['rain_intensity'][10] is numpy.ma.masked
+            os.remove(output_file_path)
+
 @pytest.mark.usefixtures("db_insert_24h_thies")
 class ExportThiesTests(unittest.TestCase):
     """
@@ -120,13 +205,13 @@ class ExportThiesTests(unittest.TestCase):
     """
 
     @patch('export_disdrodlDB2NC.create_dir')
-    @patch('export_disdrodlDB2NC.connect_db')
+    @patch('export_disdrodlDB2NC.DBReader')
     @patch('export_disdrodlDB2NC.NetCDF')
-    def test_thies_full(self, mock_NetCDF, mock_connect_db, mock_create_dir): # pylint: disable=unused-argument
+    def test_thies_full(self, mock_NetCDF, mock_db_reader, mock_create_dir): # pylint: disable=unused-argument
         """
         This function verifies that exporting a full version of the THIES006 sensor results in no errors.
         :param mock_NetCDF: Mock object for NetCDF objects
-        :param mock_connect_db: Mock object for connecting to the test database with connect_db
+        :param mock_db_reader: Mock object for reading the test database with DBReader
         :param mock_create_dir: Mock object for creating the output directory
         """
         output_file_path = output_file_dir / '20240101_Green_Village-GV_THIES006.nc'
@@ -134,19 +219,17 @@ class ExportThiesTests(unittest.TestCase):
         if os.path.exists(output_file_path):
             os.remove(output_file_path)
 
-        mock_args = Mock()
-        mock_args.config = 'configs_netcdf/config_THIES_006_GV.yml'
-        mock_args.date = '2024-01-01'
-        mock_args.version = 'full'
+        args = Namespace(config=['configs_netcdf/config_THIES_006_GV.yml'], date='2024-01-01', version='full',
+                         per_object=False, start=None, end=None, workers=1)
 
         db_path = Path("sample_data/test_thies.db")
-        mock_connect_db.return_value = connect_db(dbpath=str(db_path))
+        mock_db_reader.return_value = DBReader(dbpath=db_path)
 
         mock_create_dir.return_value = create_dir(path=output_file_dir)
 
         mock_NetCDF.side_effect = side_effect
 
-        export_disdrodlDB2NC.main(mock_args)
+        export_disdrodlDB2NC.main(args)
 
         assert output_file_path.exists()
 
@@ -154,13 +237,13 @@ class ExportThiesTests(unittest.TestCase):
             os.remove(output_file_path)
 
     @patch('export_disdrodlDB2NC.create_dir')
-    @patch('export_disdrodlDB2NC.connect_db')
+    @patch('export_disdrodlDB2NC.DBReader')
     @patch('export_disdrodlDB2NC.NetCDF')
-    def test_thies_light(self, mock_NetCDF, mock_connect_db, mock_create_dir): # pylint: disable=unused-argument
+    def test_thies_light(self, mock_NetCDF, mock_db_reader, mock_create_dir): # pylint: disable=unused-argument
         """
         This function verifies that exporting a light version of the THIES006 sensor results in no errors.
         :param mock_NetCDF: Mock object for NetCDF objects
-        :param mock_connect_db: Mock object for connecting to the test database with connect_db
+        :param mock_db_reader: Mock object for reading the test database with DBReader
         :param mock_create_dir: Mock object for creating the output directory
         """
         output_file_path = output_file_dir / '20240101_Green_Village-GV_THIES006_light.nc'
@@ -168,19 +251,17 @@ class ExportThiesTests(unittest.TestCase):
         if os.path.exists(output_file_path):
             os.remove(output_file_path)
 
-        mock_args = Mock()
-        mock_args.config = 'configs_netcdf/config_THIES_006_GV.yml'
-        mock_args.date = '2024-01-01'
-        mock_args.version = 'light'
+        args = Namespace(config=['configs_netcdf/config_THIES_006_GV.yml'], date='2024-01-01', version='light',
+                         per_object=False, start=None, end=None, workers=1)
 
         db_path = Path("sample_data/test_thies.db")
-        mock_connect_db.return_value = connect_db(dbpath=str(db_path))
+        mock_db_reader.return_value = DBReader(dbpath=db_path)
 
         mock_create_dir.return_value = create_dir(path=output_file_dir)
 
         mock_NetCDF.side_effect = side_effect
 
-        export_disdrodlDB2NC.main(mock_args)
+        export_disdrodlDB2NC.main(args)
 
         assert output_file_path.exists()
 
@@ -201,63 +282,59 @@ class ExportArgumentExceptionTests(unittest.TestCase):
     """
 
     @patch('export_disdrodlDB2NC.create_dir')
-    @patch('export_disdrodlDB2NC.connect_db')
+    @patch('export_disdrodlDB2NC.DBReader')
     @patch('export_disdrodlDB2NC.NetCDF')
-    def test_bad_config(self, mock_NetCDF, mock_connect_db, mock_create_dir):
+    def test_bad_config(self, mock_NetCDF, mock_db_reader, mock_create_dir):
         """
         This function verifies that passing an unrecognized config file as argument results in an error.
         :param mock_NetCDF: Mock object for NetCDF objects
-        :param mock_connect_db: Mock object for connecting to the test database with connect_db
+        :param mock_db_reader: Mock object for reading the test database with DBReader
         :param mock_create_dir: Mock object for creating the output directory
         """
-        mock_args = Mock()
-        mock_args.config = 'configs_netcdf/config_000.yml'
-        mock_args.date = '2024-01-01'
-        mock_args.version = 'full'
+        args = Namespace(config=['configs_netcdf/config_000.yml'], date='2024-01-01', version='full',
+                         per_object=False, start=None, end=None, workers=1)
 
         db_path = Path("sample_data/test_parsivel.db")
-        mock_connect_db.return_value = connect_db(dbpath=str(db_path))
+        mock_db_reader.return_value = DBReader(dbpath=db_path)
 
         mock_create_dir.return_value = create_dir(path=output_file_dir)
 
         mock_NetCDF.side_effect = side_effect
 
         with self.assertRaises(FileNotFoundError):
-            export_disdrodlDB2NC.main(mock_args)
+            export_disdrodlDB2NC.main(args)
 
     @patch('export_disdrodlDB2NC.create_dir')
-    @patch('export_disdrodlDB2NC.connect_db')
+    @patch('export_disdrodlDB2NC.DBReader')
     @patch('export_disdrodlDB2NC.NetCDF')
-    def test_bad_date(self, mock_NetCDF, mock_connect_db, mock_create_dir):
+    def test_bad_date(self, mock_NetCDF, mock_db_reader, mock_create_dir):
         """
         This function verifies that passing an incorrectly formatted date as argument results in an error.
         :param mock_NetCDF: Mock object for NetCDF objects
-        :param mock_connect_db: Mock object for connecting to the test database with connect_db
+        :param mock_db_reader: Mock object for reading the test database with DBReader
         :param mock_create_dir: Mock object for creating the output directory
         """
-        mock_args = Mock()
-        mock_args.config = 'configs_netcdf/config_PAR_008_GV.yml'
-        mock_args.date = '2024'
-        mock_args.version = 'full'
+        args = Namespace(config=['configs_netcdf/config_PAR_008_GV.yml'], date='2024', version='full',
+                         per_object=False, start=None, end=None, workers=1)
 
         db_path = Path("sample_data/test_parsivel.db")
-        mock_connect_db.return_value = connect_db(dbpath=str(db_path))
+        mock_db_reader.return_value = DBReader(dbpath=db_path)
 
         mock_create_dir.return_value = create_dir(path=output_file_dir)
 
         mock_NetCDF.side_effect = side_effect
 
         with self.assertRaises(Exception):
-            export_disdrodlDB2NC.main(mock_args)
+            export_disdrodlDB2NC.main(args)
 
     @patch('export_disdrodlDB2NC.create_dir')
-    @patch('export_disdrodlDB2NC.connect_db')
+    @patch('export_disdrodlDB2NC.DBReader')
     @patch('export_disdrodlDB2NC.NetCDF')
-    def test_bad_version(self, mock_NetCDF, mock_connect_db, mock_create_dir):
+    def test_bad_version(self, mock_NetCDF, mock_db_reader, mock_create_dir):
         """
         This function verifies that passing an unrecognized version type as argument results in a SystemExit.
         :param mock_NetCDF: Mock object for NetCDF objects
-        :param mock_connect_db: Mock object for connecting to the test database with connect_db
+        :param mock_db_reader: Mock object for reading the test database with DBReader
         :param mock_create_dir: Mock object for creating the output directory
         """
         output_file_path = output_file_dir / '20240101_Green_Village-GV_PAR008.nc'
@@ -265,13 +342,11 @@ class ExportArgumentExceptionTests(unittest.TestCase):
         if os.path.exists(output_file_path):
             os.remove(output_file_path)
 
-        mock_args = Mock()
-        mock_args.config = 'configs_netcdf/config_PAR_008_GV.yml'
-        mock_args.date = '2024-01-01'
-        mock_args.version = 'bad'
+        args = Namespace(config=['configs_netcdf/config_PAR_008_GV.yml'], date='2024-01-01', version='bad',
+                         per_object=False, start=None, end=None, workers=1)
 
         db_path = Path("sample_data/test_parsivel.db")
-        mock_connect_db.return_value = connect_db(dbpath=str(db_path))
+        mock_db_reader.return_value = DBReader(dbpath=db_path)
 
         mock_create_dir.return_value = create_dir(path=output_file_dir)
 
@@ -280,7 +355,7 @@ class ExportArgumentExceptionTests(unittest.TestCase):
         result = 0
 
         try:
-            export_disdrodlDB2NC.main(mock_args)
+            export_disdrodlDB2NC.main(args)
         except SystemExit:
             result = 1
 
@@ -298,14 +373,14 @@ class EmptyExportTests(unittest.TestCase):
     """
 
     @patch('export_disdrodlDB2NC.create_dir')
-    @patch('export_disdrodlDB2NC.connect_db')
+    @patch('export_disdrodlDB2NC.DBReader')
     @patch('export_disdrodlDB2NC.NetCDF')
-    def test_no_telegrams(self, mock_NetCDF, mock_connect_db, mock_create_dir):
+    def test_no_telegrams(self, mock_NetCDF, mock_db_reader, mock_create_dir):
         """
         This function verifies that running the export script for a date
         without database entries resuls in a SystemExit.
         :param mock_NetCDF: Mock object for NetCDF objects
-        :param mock_connect_db: Mock object for connecting to the test database with connect_db
+        :param mock_db_reader: Mock object for reading the test database with DBReader
         :param mock_create_dir: Mock object for creating the output directory
         """
         output_file_path = output_file_dir / '20240101_Green_Village-GV_PAR008.nc'
@@ -313,13 +388,11 @@ class EmptyExportTests(unittest.TestCase):
         if os.path.exists(output_file_path):
             os.remove(output_file_path)
 
-        mock_args = Mock()
-        mock_args.config = 'configs_netcdf/config_PAR_008_GV.yml'
-        mock_args.date = '2024-01-01'
-        mock_args.version = 'full'
+        args = Namespace(config=['configs_netcdf/config_PAR_008_GV.yml'], date='2024-01-01', version='full',
+                         per_object=False, start=None, end=None, workers=1)
 
         db_path = Path("sample_data/test_parsivel.db")
-        mock_connect_db.return_value = connect_db(dbpath=str(db_path))
+        mock_db_reader.return_value = DBReader(dbpath=db_path)
 
         mock_create_dir.return_value = create_dir(path=output_file_dir)
 
@@ -328,7 +401,7 @@ class EmptyExportTests(unittest.TestCase):
         result = 0
 
         try:
-            export_disdrodlDB2NC.main(mock_args)
+            export_disdrodlDB2NC.main(args)
         except SystemExit:
             result = 1
 
@@ -336,3 +409,58 @@ class EmptyExportTests(unittest.TestCase):
         assert output_file_path.exists() is False
 
         os.remove("sample_data/test_parsivel.db")
+
+
+def range_config(tmp_path, config, db_path):
+    """
+    Writes a copy of a site config to a temporary directory, with its data_dir and log_dir in that directory,
+    and copies its test database to the data_dir.
+    :param tmp_path: temporary directory
+    :param config: the path of the site config file
+    :param db_path: the path of the test database of the sensor
+    :return: the path of the copy of the site config file, and its data_dir
+    """
+    config_dict = yaml2dict(path=Path(config))
+    data_dir = tmp_path / config_dict['global_attrs']['sensor_name']
+    data_dir.mkdir()
+    shutil.copy(db_path, data_dir / 'disdrodl.db')
+    config_dict['data_dir'] = str(data_dir)
+    config_dict['log_dir'] = str(tmp_path)
+    config_path = tmp_path / Path(config).name
+    with open(config_path, 'w', encoding='utf8') as config_f:
+        yaml.safe_dump(config_dict, config_f)
+    return str(config_path), data_dir
+
+
+@pytest.mark.usefixtures("db_insert_24h_parsivel", "db_insert_24h_thies")
+def test_export_range(tmp_path, capsys):
+    """
+    Verifies that a range of days of a Parsivel and a Thies is exported by a pool of worker processes,
+    that the days without data are reported and make the script exit with an error,
+    and that the throughput is reported in days per minute.
+    :param tmp_path: temporary directory
+    :param capsys: the pytest fixture capturing the output
+    """
+    config_parsivel, data_dir_parsivel = range_config(tmp_path, 'configs_netcdf/config_PAR_008_GV.yml',
+                                                      db_path_parsivel)
+    config_thies, data_dir_thies = range_config(tmp_path, 'configs_netcdf/config_THIES_006_GV.yml', db_path_thies)
+
+    exported, missing = export_disdrodlDB2NC.export_range([config_parsivel, config_thies], datetime(2023, 12, 31),
+                                                          datetime(2024, 1, 2), full_version=True, per_object=False,
+                                                          workers=2)
+
+    assert (exported, missing) == (2, 4)
+    assert (data_dir_parsivel / '202401' / '20240101_Green_Village-GV_PAR008.nc').exists()
+    assert (data_dir_thies / '202401' / '20240101_Green_Village-GV_THIES006.nc').exists()
+    assert not (data_dir_parsivel / '202312').exists()
+    assert 'Exported 2 of 6 day(s) of 2 sensor(s) with 2 worker(s)' in capsys.readouterr().out
+
+    # one worker exports the days in this process, with one database connection
+    args = Namespace(config=[config_parsivel], date=None, start='2024-01-01', end='2024-01-02', version='light',
+                     per_object=False, workers=1)
+    with patch('export_disdrodlDB2NC.DBReader', wraps=export_disdrodlDB2NC.DBReader) as mock_db_reader:
+        with pytest.raises(SystemExit):
+            export_disdrodlDB2NC.main(args)
+    mock_db_reader.assert_called_once()
+    assert (data_dir_parsivel / '202401' / '20240101_Green_Village-GV_PAR008_light.nc').exists()
+    assert 'days per minute' in capsys.readouterr().out
@@ -0,0 +1,149 @@
+"""
+Module for testing the FramedReader class from framed_reader.py, against a fake sensor on a pseudo terminal.
+
+Functions:
+- fake_sensor: Context manager opening a serial connection to a fake sensor answering the request with chunks.
+- test_fragmented_telegram: Tests that a telegram arriving in fragments is returned as one complete frame.
+- test_no_port_timeout_wait: Tests that the read returns at the ETX byte instead of waiting for the port timeout.
+- test_partial_telegram: Tests that a telegram without ETX is returned as incomplete when the deadline passes.
+- test_bytes_after_etx: Tests that bytes after the ETX byte are not part of the frame.
+- test_thies_frame: Tests that bytes before the STX byte are skipped and a fragmented Thies telegram is reassembled.
+- test_frame_too_long: Tests that a frame longer than the buffer is returned as incomplete.
+- test_split_lines: Tests that split_lines splits a frame in the same lines as readlines().
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import serial
+
+from conftest import parsivel_lines, thies_lines
+from modules.framed_reader import FramedReader, split_lines, STX, ETX
+
+
+@contextmanager
+def fake_sensor(chunks, delay=0.0, port_timeout=1):
+    """
+    Context manager opening a serial connection to a fake sensor on a pseudo terminal.
+    Once the request arrives, the fake sensor waits delay seconds and writes the chunks one by one.
+    :param chunks: list of bytes to write, or (bytes, seconds to wait afterwards) tuples
+    :param delay: seconds between the request and the first chunk
+    :param port_timeout: timeout of the serial connection
+    :return: the serial connection
+    """
+    master, slave = os.openpty()
+    connection = serial.Serial(os.ttyname(slave), 19200, timeout=port_timeout)
+
+    def answer():
+        os.read(master, 1024)  # the request
+        time.sleep(delay)
+        for chunk in chunks:
+            chunk, pause = chunk if isinstance(chunk, tuple) else (chunk, 0.0)
+            os.write(master, chunk)
+            time.sleep(pause)
+
+    thread = threading.Thread(target=answer, daemon=True)
+    thread.start()
+    try:
+        yield connection
+    finally:
+        thread.join(timeout=2)
+        connection.close()
+        os.close(master)
+        os.close(slave)
+
+
+def test_fragmented_telegram():
+    """
+    Tests that a telegram arriving in fragments is returned as one complete frame,
+    with the same lines as readlines() would return.
+    """
+    telegram = b''.join(parsivel_lines)
+    chunks = [(telegram[i:i + 500], 0.01) for i in range(0, len(telegram), 500)]
+
+    with fake_sensor(chunks, delay=0.1) as connection:
+        frame = FramedReader(connection, deadline=5).read_frame(request=b'CS/PA\r\n')
+
+    assert frame.complete is True
+    assert frame.data == telegram
+    assert split_lines(frame.data) == parsivel_lines
+    assert frame.timings['first_byte'] >= 0.09
+    assert frame.timings['transfer'] > 0
+    assert frame.timings['total'] >= frame.timings['first_byte'] + frame.timings['transfer']
+
+
+def test_no_port_timeout_wait():
+    """
+    Tests that the read returns at the ETX byte instead of waiting for the port timeout of 1 s,
+    and that the port timeout is restored afterwards.
+    """
+    with fake_sensor([b'TYP OP4A\r\n01:0000.000\r\n\x03'], port_timeout=1) as connection:
+        frame = FramedReader(connection, deadline=5).read_frame(request=b'CS/PA\r\n')
+        assert connection.timeout == 1
+
+    assert frame.complete is True
+    assert frame.timings['total'] < 0.5
+
+
+def test_partial_telegram():
+    """
+    Tests that a telegram without ETX is returned as incomplete when the deadline passes,
+    even though the port timeout is longer than the deadline.
+    """
+    with fake_sensor([b'TYP OP4A\r\n', b'01:0000.0'], port_timeout=5) as connection:
+        frame = FramedReader(connection, deadline=0.3).read_frame(request=b'CS/PA\r\n')
+        assert connection.timeout == 5
+
+    assert frame.complete is False
+    assert frame.data == b'TYP OP4A\r\n01:0000.0'
+    assert 0.3 <= frame.timings['total'] < 1
+
+
+def test_bytes_after_etx():
+    """
+    Tests that bytes after the ETX byte are not part of the frame.
+    """
+    with fake_sensor([b'99:;\r\n\x03\r\nnoise']) as connection:
+        frame = FramedReader(connection, deadline=1).read_frame(request=b'CS/PA\r\n')
+
+    assert frame.complete is True
+    assert frame.data == b'99:;\r\n\x03'
+
+
+def test_thies_frame():
+    """
+    Tests that bytes before the STX byte are skipped, and that a Thies telegram arriving in fragments,
+    with the STX and ETX in separate reads, is reassembled.
+    """
+    telegram = STX + thies_lines.encode('utf-8') + b'\r\n' + ETX
+    chunks = [(b'\r\n06', 0.02), (telegram[:1], 0.02), (telegram[1:1000], 0.02), (telegram[1000:-1], 0.02),
+              telegram[-1:]]
+
+    with fake_sensor(chunks) as connection:
+        frame = FramedReader(connection, start=STX, end=ETX, deadline=2).read_frame(request=b'\r06TR00005\r')
+
+    assert frame.complete is True
+    assert frame.data == telegram
+
+
+def test_frame_too_long():
+    """
+    Tests that a frame longer than the buffer is returned as incomplete, without waiting for the deadline.
+    """
+    with fake_sensor([b'x' * 100 + ETX]) as connection:
+        frame = FramedReader(connection, deadline=2, max_size=64).read_frame(request=b'CS/PA\r\n')
+
+    assert frame.complete is False
+    assert frame.data == b'x' * 64
+    assert frame.timings['total'] < 1
+
+
+def test_split_lines():
+    """
+    Tests that split_lines splits a frame in the same lines as readlines().
+    """
+    assert split_lines(b'a\r\nb\r\n\x03') == [b'a\r\n', b'b\r\n', b'\x03']
+    assert split_lines(b'a\r\nb\r\n') == [b'a\r\n', b'b\r\n']
+    assert split_lines(b'') == []
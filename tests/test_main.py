@@ -4,18 +4,26 @@ This file contains the tests for the main.py file.
 The main goal of this file is to test the main loop of the program,
 which logs data once every minute.
 """
+import asyncio
 import os
+import shutil
 import sys
+import threading
 import unittest
-from datetime import datetime, timezone
+from copy import deepcopy
+from datetime import timedelta
 from pathlib import Path
 from unittest.mock import Mock, patch
 
 import pytest
 
-from main import main
+from conftest import FakeClock, start_dt, config_dict_parsivel, config_dict_thies
+from main import main, log_sensors
+from modules.async_sensor import AsyncSensor
+from modules.scheduler import MinuteScheduler
 from modules.sensors import Thies, Parsivel
 from modules.sqldb import connect_db, create_db
+from modules.db_writer import DBWriter
 
 wd = Path(__file__).parent.parent
 
@@ -23,12 +31,26 @@ db_name = 'integration-test.db'
 db_path = Path(f'sample_data/{db_name}')
 
 
-def create_db_wrapper(dbpath):
-    create_db(dbpath=str(db_path))
+def create_db_wrapper(dbpath, **kwargs):  # pylint: disable=unused-argument
+    create_db(dbpath=str(db_path), **kwargs)
 
 
-def connect_db_wrapper(dbpath):
-    return connect_db(dbpath=str(db_path))
+def db_writer_wrapper(dbpath, **kwargs):  # pylint: disable=unused-argument
+    return DBWriter(dbpath=str(db_path), **kwargs)
+
+
+def fake_scheduler(n_ticks):
+    """
+    Creates a MinuteScheduler running on a FakeClock, which interrupts the main loop after n_ticks.
+    :param n_ticks: the number of ticks before a KeyboardInterrupt is raised
+    :return: the MinuteScheduler object
+    """
+    def stop_after(clock):
+        if len(clock.sleeps) > n_ticks:
+            raise KeyboardInterrupt
+
+    clock = FakeClock(sleep_hook=stop_after)
+    return MinuteScheduler(monotonic=clock.monotonic, wall_clock=clock.time, sleep=clock.sleep)
 
 
 class TestIntegration(unittest.TestCase):
@@ -98,20 +120,20 @@ class TestIntegration(unittest.TestCase):
 
     @patch('modules.sensors.sleep', return_value=None)
     @patch.object(Thies, 'read')
-    @patch('main.NowTime')
+    @patch('main.MinuteScheduler')
     @patch('main.yaml2dict')
     @patch('main.sleep', return_value=None)
     @patch('modules.sensors.serial')
     @patch('main.create_db', new=create_db_wrapper)
-    @patch('main.connect_db', new=connect_db_wrapper)
+    @patch('main.DBWriter', new=db_writer_wrapper)
     def test_main_loop_thies(self, mock_serial, mock_sleep, mock_yaml2dict,  # pylint: disable=unused-argument
-                             mock_now_time, mock_read, mock_sensor_sleep):  # pylint: disable=unused-argument
+                             mock_scheduler, mock_read, mock_sensor_sleep):  # pylint: disable=unused-argument
         """
         Test for the main loop of the Thies sensor, it checks whether there are 1440 rows in the database.
         :param mock_serial: mock serial object
         :param mock_sleep: mock sleep object to skip the sleep time
         :param mock_yaml2dict: mock yaml2dict object
-        :param mock_now_time: mock NowTime object to always be on a whole minute
+        :param mock_scheduler: mock MinuteScheduler object running on a fake clock
         :param mock_read: mock read object to return a Thies line
         :param mock_sensor_sleep: mock sensor sleep object to skip sleep in sensor class
         """
@@ -122,6 +144,7 @@ class TestIntegration(unittest.TestCase):
             'log_dir': 'sample_data',
             'data_dir': 'sample_data',
             'script_name': 'test_log',
+            'queue_overflow': 'block',  # the fake clock ticks faster than the writer thread can write
             'port': '/dev/ttyACM0',
             'baud': 9600,
             'global_attrs': {
@@ -133,14 +156,7 @@ class TestIntegration(unittest.TestCase):
 
         mock_yaml2dict.return_value = test_conf_dict_site
 
-        mock_now_time.return_value.time_list = ['10', '10', '00']
-        mock_now_time.return_value.utc = datetime.now(timezone.utc)
-
-        def side_effect(seconds):  # pylint: disable=unused-argument
-            if mock_sleep.call_count > 1440:
-                raise KeyboardInterrupt
-
-        mock_sleep.side_effect = side_effect
+        mock_scheduler.return_value = fake_scheduler(n_ticks=1440)
 
         # If the db already exists, remove it, otherwise test will fail
         if os.path.exists(f'sample_data/{db_name}'):
@@ -159,20 +175,20 @@ class TestIntegration(unittest.TestCase):
 
     @patch('modules.sensors.sleep', return_value=None)
     @patch.object(Parsivel, 'read')
-    @patch('main.NowTime')
+    @patch('main.MinuteScheduler')
     @patch('main.yaml2dict')
     @patch('main.sleep', return_value=None)
     @patch('modules.sensors.serial')
     @patch('main.create_db', new=create_db_wrapper)
-    @patch('main.connect_db', new=connect_db_wrapper)
+    @patch('main.DBWriter', new=db_writer_wrapper)
     def test_main_loop_parsivel(self, mock_serial, mock_sleep, mock_yaml2dict,  # pylint: disable=unused-argument
-                                mock_now_time, mock_read, mock_sensor_sleep):  # pylint: disable=unused-argument
+                                mock_scheduler, mock_read, mock_sensor_sleep):  # pylint: disable=unused-argument
         """
         Test for the main loop of the Parsivel sensor, it checks whether there are 1440 rows in the database.
         :param mock_serial: mock serial object
         :param mock_sleep: mock sleep object to skip the sleep time
         :param mock_yaml2dict: mock yaml2dict object
-        :param mock_now_time: mock NowTime object to always be on a whole minute
+        :param mock_scheduler: mock MinuteScheduler object running on a fake clock
         :param mock_read: mock read object to return a Thies line
         :param mock_sensor_sleep: mock sensor sleep object to skip sleep in sensor class
         """
@@ -183,6 +199,7 @@ class TestIntegration(unittest.TestCase):
             'log_dir': 'sample_data',
             'data_dir': 'sample_data',
             'script_name': 'test_log',
+            'queue_overflow': 'block',  # the fake clock ticks faster than the writer thread can write
             'port': '/dev/ttyUSB0',
             'baud': 19200,
             'station_code': 'GV',
@@ -195,14 +212,7 @@ class TestIntegration(unittest.TestCase):
 
         mock_yaml2dict.return_value = test_conf_dict_site
 
-        mock_now_time.return_value.time_list = ['10', '10', '00']
-        mock_now_time.return_value.utc = datetime.now(timezone.utc)
-
-        def side_effect(seconds):  # pylint: disable=unused-argument
-            if mock_sleep.call_count > 1440:
-                raise KeyboardInterrupt
-
-        mock_sleep.side_effect = side_effect
+        mock_scheduler.return_value = fake_scheduler(n_ticks=1440)
 
         # If the db already exists, remove it, otherwise test will fail
         if os.path.exists(f'sample_data/{db_name}'):
@@ -221,22 +231,22 @@ class TestIntegration(unittest.TestCase):
 
     @patch('modules.sensors.sleep', return_value=None)
     @patch.object(Thies, 'read')
-    @patch('main.NowTime')
+    @patch('main.MinuteScheduler')
     @patch('main.yaml2dict')
     @patch('main.sleep', return_value=None)
     @patch('modules.sensors.serial')
     @patch('main.create_db')
-    @patch('main.connect_db')
+    @patch('main.DBWriter')
     @patch('main.create_telegram', return_value=None)
     @patch('main.create_logger')
-    def test_telegram_is_none(self, mock_create_logger, mock_create_telegram, mock_connect_db, mock_create_db, mock_serial, mock_sleep, mock_yaml2dict,  # pylint: disable=unused-argument
-                             mock_now_time, mock_read, mock_sensor_sleep):  # pylint: disable=unused-argument
+    def test_telegram_is_none(self, mock_create_logger, mock_create_telegram, mock_db_writer, mock_create_db, mock_serial, mock_sleep, mock_yaml2dict,  # pylint: disable=unused-argument
+                             mock_scheduler, mock_read, mock_sensor_sleep):  # pylint: disable=unused-argument
         """
         Test for the main loop of the Thies sensor, it checks whether there are 1440 rows in the database.
         :param mock_serial: mock serial object
         :param mock_sleep: mock sleep object to skip the sleep time
         :param mock_yaml2dict: mock yaml2dict object
-        :param mock_now_time: mock NowTime object to always be on a whole minute
+        :param mock_scheduler: mock MinuteScheduler object running on a fake clock
         :param mock_read: mock read object to return a Thies line
         :param mock_sensor_sleep: mock sensor sleep object to skip sleep in sensor class
         """
@@ -256,9 +266,8 @@ class TestIntegration(unittest.TestCase):
 
         }
 
-        mock_connection = Mock()
-        mock_cursor = Mock()
-        mock_connect_db.return_value = mock_connection, mock_cursor
+        mock_writer = Mock()
+        mock_db_writer.return_value = mock_writer
 
         mock_logger = Mock()
 
@@ -266,14 +275,7 @@ class TestIntegration(unittest.TestCase):
 
         mock_yaml2dict.return_value = test_conf_dict_site
 
-        mock_now_time.return_value.time_list = ['10', '10', '00']
-        mock_now_time.return_value.utc = 420
-
-        def side_effect(seconds):  # pylint: disable=unused-argument
-            if mock_sleep.call_count > 1:
-                raise KeyboardInterrupt
-
-        mock_sleep.side_effect = side_effect
+        mock_scheduler.return_value = fake_scheduler(n_ticks=1)
 
         # If the db already exists, remove it, otherwise test will fail
         if os.path.exists(f'sample_data/{db_name}'):
@@ -282,8 +284,78 @@ class TestIntegration(unittest.TestCase):
         with self.assertRaises(KeyboardInterrupt):
             main('configs_netcdf/config_THIES_006_GV.yml')
 
-        assert mock_connection.commit.call_count == 0
-        assert mock_connection.close.call_count == 1
-        assert mock_cursor.close.call_count == 1
+        assert mock_writer.write.call_count == 0
         assert mock_logger.error.call_count == 1
-        mock_logger.error.assert_called_with(msg=f"telegram is None on: {['10', '10', '00']}, 420")
+        first_tick = start_dt + timedelta(minutes=1)
+        mock_logger.error.assert_called_with(msg=f"telegram is None on: {['00', '01', '00']}, {first_tick}")
+
+
+class StopLogging(Exception):
+    """
+    Raised by the fake clock to stop the multi-sensor loop.
+    """
+
+
+def test_log_sensors_slow_sensor():
+    """
+    Test for logging two sensors in a single process, where one of the sensors does not answer in time.
+    The fast sensor is still logged every minute, the slow one gets an empty row, and the loop does not wait
+    for the read of the slow sensor: it is still reading when the loop stops.
+    """
+    multi_db_path = Path('sample_data/disdrodl.db')
+    if multi_db_path.exists():
+        os.remove(multi_db_path)
+    create_db(dbpath=str(multi_db_path))
+
+    release = threading.Event()
+    slow_reads = []
+
+    def slow_read(logger):  # pylint: disable=unused-argument
+        release.wait(timeout=5)
+        slow_reads.append(release.is_set())
+        return TestIntegration.thies_line
+
+    async_sensors = []
+    for config_dict, read in [(config_dict_parsivel, Mock(return_value=TestIntegration.parsivel_lines)),
+                              (config_dict_thies, slow_read)]:
+        config_dict = deepcopy(config_dict)
+        config_dict['data_dir'] = 'sample_data'
+        sensor = Mock()
+        sensor.SETTINGS = ('clock',)
+        sensor.drifted_settings.return_value = []
+        sensor.read = read
+        sensor.read.__name__ = 'read'
+        async_sensors.append(AsyncSensor(sensor=sensor, config_dict=config_dict, logger=Mock()))
+
+    n_ticks = 3
+
+    def stop_after(clock):
+        if len(clock.sleeps) > n_ticks:
+            # no read of the slow sensor has returned yet
+            assert not slow_reads
+            raise StopLogging
+
+    clock = FakeClock(sleep_hook=stop_after)
+    scheduler = MinuteScheduler(monotonic=clock.monotonic, wall_clock=clock.time, sleep=clock.sleep,
+                                async_sleep=clock.async_sleep)
+
+    with pytest.raises(StopLogging):
+        asyncio.run(log_sensors(async_sensors, scheduler, Mock(), read_timeout=0.1, start_sequence_timeout=1))
+    release.set()
+
+    for async_sensor in async_sensors:
+        async_sensor.close()
+
+    con, cur = connect_db(dbpath=str(multi_db_path))
+    rows = con.execute('SELECT timestamp, sensor_id, telegram FROM disdrodl ORDER BY timestamp, sensor_id').fetchall()
+    cur.close()
+    con.close()
+    os.remove(multi_db_path)
+    shutil.rmtree('sample_data/spool', ignore_errors=True)
+
+    assert len(rows) == 2 * n_ticks
+    assert sorted({row[1] for row in rows}) == ['PAR008', 'THIES006']
+    assert all(row[2] != '' for row in rows if row[1] == 'PAR008')
+    assert all(row[2] == '' for row in rows if row[1] == 'THIES006')
+    assert {row[0] for row in rows} == {(start_dt + timedelta(minutes=i + 1)).timestamp() for i in range(n_ticks)}
+    async_sensors[1].logger.error.assert_any_call(msg='THIES006: read timed out after 0.1 s')
@@ -0,0 +1,399 @@
+"""
+Module for testing the schema migrations from migrations.py.
+
+Functions:
+- fill_text_db: Creates a database with the schema of an older version and fills it with telegrams stored as text.
+- test_column_exists: Tests that column_exists finds a column of the disdrodl table.
+- test_telegram_fields: Tests that a telegram string is split into fields and joined again without changes.
+- test_rename_sensor_id: Tests that an old database with parsivel_id is upgraded and the versions are recorded.
+- test_pending_migrations: Tests that migrations that are not enabled by the config stay pending.
+- test_migrate_resume: Tests that an interrupted data migration resumes after the last committed batch.
+- test_migrate_spectrum_and_columns: Tests that migrated rows are read back the same as rows written with the schema.
+- test_migrate_live_writer: Tests that the logger can write between the batches of a running migration.
+- test_unique_minutes: Tests that duplicate rows are removed, keeping the row with data, and the index made unique.
+- test_migrate_parsed_column: Tests that the parsed fields of migrated rows are the same as those of written rows.
+- test_migrate_quality_flag: Tests that the quality flags of migrated rows are the same as those of written rows.
+- test_skip_blocking: Tests that the migrations building an index are announced with the number of rows, or skipped.
+"""
+
+import sqlite3
+import threading
+from copy import deepcopy
+from datetime import timedelta
+from unittest.mock import Mock
+
+import numpy
+
+from conftest import start_dt, config_dict_parsivel, config_dict_thies, parsivel_lines, thies_lines
+from modules.migrations import column_exists, telegram_fields, pending_migrations, create_version_tables, \
+    applied_versions, migrate, MIGRATIONS
+from modules.quality import QUALITY_MISSING
+from modules.sqldb import connect_db, create_db, insert_telegrams, field_columns, RANGE_INDEX, UNIQUE_INDEX
+from modules.db_writer import DBWriter
+from modules.telegram import ParsivelTelegram, ThiesTelegram, create_telegram
+
+
+def fill_text_db(db_path, config_dict, telegram_lines, minutes):
+    """
+    Creates a database with the schema of an older version (spectrum in the telegram string, no typed columns)
+    and fills it with one telegram per minute.
+    :param db_path: the path of the database
+    :param config_dict: the combined config dictionary
+    :param telegram_lines: the telegram lines of the sensor
+    :param minutes: the number of telegrams
+    """
+    create_db(dbpath=str(db_path))
+    telegram_class = ParsivelTelegram if config_dict is config_dict_parsivel else ThiesTelegram
+    telegrams = [telegram_class(config_dict=config_dict, telegram_lines=telegram_lines,
+                                timestamp=start_dt + timedelta(minutes=i), db_cursor=None,
+                                telegram_data={}, logger=Mock()) for i in range(minutes)]
+    con, cur = connect_db(dbpath=str(db_path))
+    insert_telegrams(cur, telegrams)
+    con.commit()
+    cur.close()
+    con.close()
+
+
+def test_column_exists(tmp_path):
+    """
+    Tests that column_exists finds a column of the disdrodl table, and does not find a missing one.
+    :param tmp_path: temporary directory
+    """
+    create_db(dbpath=str(tmp_path / 'disdrodl.db'))
+    con, cur = connect_db(dbpath=str(tmp_path / 'disdrodl.db'))
+    assert column_exists(cur, 'sensor_id') is True
+    assert column_exists(cur, 'parsivel_id') is False
+    cur.close()
+    con.close()
+
+
+def test_telegram_fields():
+    """
+    Tests that a telegram string is split into fields, keeping the ':' of the sensor time and the 'None' values,
+    and that the fields are joined again into the same string.
+    """
+    telegram_str = '19:None; 20:10:13:21; 21:25.05.2023; 93:000,001,002'
+    fields = telegram_fields(telegram_str)
+    assert fields == {'19': 'None', '20': '10:13:21', '21': '25.05.2023', '93': '000,001,002'}
+    assert '; '.join(f'{field}:{value}' for field, value in fields.items()) == telegram_str
+    assert telegram_fields('') == {}
+
+
+def test_rename_sensor_id(tmp_path):
+    """
+    Tests that a database of the first version, with a parsivel_id column and no index, is upgraded,
+    and that the applied versions are recorded so a second run does nothing.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    con = sqlite3.connect(db_path)
+    con.execute("CREATE TABLE disdrodl (id INTEGER PRIMARY KEY, timestamp REAL, datetime TEXT, "
+                "parsivel_id TEXT, telegram TEXT)")
+    con.execute("INSERT INTO disdrodl(timestamp, datetime, parsivel_id, telegram) VALUES (0, '', 'PAR008', '')")
+    con.commit()
+    con.close()
+
+    mock_logger = Mock()
+    assert migrate(db_path, config_dict=config_dict_parsivel, logger=mock_logger) is True
+
+    con, cur = connect_db(dbpath=str(db_path))
+    assert column_exists(cur, 'sensor_id') is True
+    assert column_exists(cur, 'parsivel_id') is False
+    assert cur.execute("SELECT sensor_id FROM disdrodl").fetchone()[0] == 'PAR008'
+    assert applied_versions(cur) == [1, 2, 5]
+    assert cur.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'").fetchone()[0]
+    cur.close()
+    con.close()
+    assert mock_logger.info.call_count == 4
+
+    mock_logger.reset_mock()
+    assert migrate(db_path, config_dict=config_dict_parsivel, logger=mock_logger) is True
+    mock_logger.info.assert_not_called()
+
+
+def test_pending_migrations(tmp_path):
+    """
+    Tests that migrations that are not enabled by the config stay pending, and are applied once the config enables them.
+    :param tmp_path: temporary directory
+    """
+    create_db(dbpath=str(tmp_path / 'disdrodl.db'))
+    migrate(tmp_path / 'disdrodl.db', config_dict=config_dict_parsivel, logger=Mock())
+
+    con, cur = connect_db(dbpath=str(tmp_path / 'disdrodl.db'))
+    create_version_tables(cur)
+    assert pending_migrations(cur, config_dict_parsivel) == []
+    config_dict = deepcopy(config_dict_parsivel)
+    config_dict['db_field_columns'] = True
+    assert [migration.VERSION for migration in pending_migrations(cur, config_dict)] == [4]
+    assert [migration.VERSION for migration in MIGRATIONS] == [1, 2, 3, 4, 5, 6, 7]
+    cur.close()
+    con.close()
+
+
+def test_migrate_resume(tmp_path):
+    """
+    Tests that an interrupted data migration commits every batch with its progress,
+    and resumes after the last committed batch instead of starting again.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    fill_text_db(db_path, config_dict_parsivel, parsivel_lines, minutes=25)
+    config_dict = deepcopy(config_dict_parsivel)
+    config_dict['db_field_columns'] = True
+
+    assert migrate(db_path, config_dict=config_dict, logger=Mock(), batch_size=10, pause=0, max_batches=2) is False
+
+    con, cur = connect_db(dbpath=str(db_path))
+    assert cur.execute("SELECT last_id, rows FROM schema_migration WHERE version = 4").fetchone() == (20, 20)
+    assert cur.execute("SELECT COUNT(*) FROM disdrodl WHERE f01 IS NOT NULL").fetchone()[0] == 20
+    assert 4 not in applied_versions(cur)
+    cur.close()
+    con.close()
+
+    mock_logger = Mock()
+    assert migrate(db_path, config_dict=config_dict, logger=mock_logger, batch_size=10, pause=0) is True
+    messages = [c.kwargs['msg'] for c in mock_logger.info.call_args_list]
+    assert 'resuming migration 4 (typed field columns) after row 20' in messages[0]
+    assert 'migration 4 (typed field columns): 25/25 rows (5 changed in this batch)' in messages[1]
+
+    con, cur = connect_db(dbpath=str(db_path))
+    assert cur.execute("SELECT COUNT(*) FROM disdrodl WHERE f01 IS NOT NULL").fetchone()[0] == 25
+    assert cur.execute("SELECT COUNT(*) FROM schema_migration").fetchone()[0] == 0
+    assert 4 in applied_versions(cur)
+    cur.close()
+    con.close()
+
+
+def test_migrate_spectrum_and_columns(tmp_path):
+    """
+    Tests that the rows migrated to the spectrum BLOB and typed columns are the same as the rows
+    written by a DBWriter with that schema, and that they are parsed into the same telegram data as before.
+    :param tmp_path: temporary directory
+    """
+    for config_dict, telegram_lines, telegram_class in ((config_dict_parsivel, parsivel_lines, ParsivelTelegram),
+                                                        (config_dict_thies, thies_lines, ThiesTelegram)):
+        config_dict = deepcopy(config_dict)
+        config_dict['db_spectrum_storage'] = 'zlib'
+        config_dict['db_field_columns'] = True
+        columns = field_columns(config_dict)
+
+        migrated_path = tmp_path / f'migrated_{telegram_class.__name__}.db'
+        fill_text_db(migrated_path, config_dict_parsivel if telegram_class is ParsivelTelegram else config_dict_thies,
+                     telegram_lines, minutes=3)
+        con, cur = connect_db(dbpath=str(migrated_path))
+        text_rows = cur.execute("SELECT telegram FROM disdrodl ORDER BY id").fetchall()
+        cur.close()
+        con.close()
+        assert migrate(migrated_path, config_dict=config_dict, logger=Mock(), batch_size=2, pause=0) is True
+
+        written_path = tmp_path / f'written_{telegram_class.__name__}.db'
+        create_db(dbpath=str(written_path), spectrum_storage='zlib', columns=columns)
+        db_writer = DBWriter(dbpath=str(written_path), spectrum_storage='zlib', columns=columns)
+        db_writer.write([telegram_class(config_dict=config_dict, telegram_lines=telegram_lines,
+                                        timestamp=start_dt + timedelta(minutes=i), db_cursor=None,
+                                        telegram_data={}, logger=Mock()) for i in range(3)])
+        db_writer.close()
+
+        select = f"SELECT telegram, spectrum, {', '.join(column for column, _ in columns.values())} " \
+                 f"FROM disdrodl ORDER BY id"
+        results = []
+        for path in (migrated_path, written_path):
+            con, cur = connect_db(dbpath=str(path))
+            results.append(cur.execute(select).fetchall())
+            cur.close()
+            con.close()
+        # the Thies device id is a list in a telegram read from the sensor, which has no typed value
+        for migrated, written in zip(*results):
+            assert [value for value, expected in zip(migrated, written) if expected is not None] == \
+                   [value for value in written if value is not None]
+
+        for (text,), (telegram_str, blob, *_) in zip(text_rows, results[0]):
+            before = create_telegram(config_dict=config_dict, telegram_lines=text, timestamp=start_dt,
+                                     db_cursor=None, logger=Mock(), db_row_id=None, telegram_data={})
+            after = create_telegram(config_dict=config_dict, telegram_lines=telegram_str, timestamp=start_dt,
+                                    db_cursor=None, logger=Mock(), db_row_id=None, telegram_data={},
+                                    spectrum_blob=blob)
+            before.parse_telegram_row()
+            after.parse_telegram_row()
+            field = telegram_class.SPECTRUM_FIELD
+            assert numpy.array_equal(numpy.asarray(before.telegram_data.pop(field), dtype=int),
+                                     after.telegram_data.pop(field))
+            assert before.telegram_data == after.telegram_data
+
+
+def test_migrate_live_writer(tmp_path):
+    """
+    Tests that the logger can write between the batches of a running migration,
+    and that the rows it writes during the migration are migrated as well.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    fill_text_db(db_path, config_dict_parsivel, parsivel_lines, minutes=50)
+    config_dict = deepcopy(config_dict_parsivel)
+    config_dict['db_field_columns'] = True
+
+    results = []
+
+    def write():
+        db_writer = DBWriter(dbpath=str(db_path), busy_timeout=2)
+        for i in range(5):
+            telegram = ParsivelTelegram(config_dict=config_dict_parsivel, telegram_lines=parsivel_lines,
+                                        timestamp=start_dt + timedelta(minutes=50 + i), db_cursor=None,
+                                        telegram_data={}, logger=Mock())
+            results.append(db_writer.write([telegram]))
+        results.append(db_writer.reconnect_count)
+        db_writer.close()
+
+    thread = threading.Timer(0.01, write)
+    thread.start()
+    assert migrate(db_path, config_dict=config_dict, logger=Mock(), batch_size=5, pause=0.01) is True
+    thread.join()
+
+    assert results == [True] * 5 + [0]
+    con, cur = connect_db(dbpath=str(db_path))
+    assert cur.execute("SELECT COUNT(*) FROM disdrodl").fetchone()[0] == 55
+    cur.close()
+    con.close()
+
+
+def test_unique_minutes(tmp_path):
+    """
+    Tests that the rows of a sensor and timestamp stored more than once are removed across batches,
+    keeping the first row with a telegram, and that the index is unique afterwards.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    con = sqlite3.connect(db_path)
+    con.execute("CREATE TABLE disdrodl (id INTEGER PRIMARY KEY, timestamp REAL, datetime TEXT, "
+                "sensor_id TEXT, telegram TEXT)")
+    con.execute(f"CREATE INDEX {RANGE_INDEX} ON disdrodl(sensor_id, timestamp)")
+    rows = [(60.0 * i, 'PAR008', 'data') for i in range(10)]
+    # a restart stored minute 3 without data first, minute 5 twice and minute 7 three times, and
+    # another sensor has the same timestamps
+    rows += [(180.0, 'PAR008', 'late'), (300.0, 'PAR008', 'twice'), (420.0, 'PAR008', ''),
+             (420.0, 'PAR008', 'again'), (300.0, 'THIES006', 'data')]
+    rows.insert(0, (180.0, 'PAR008', ''))
+    con.executemany("INSERT INTO disdrodl(timestamp, datetime, sensor_id, telegram) VALUES (?, '', ?, ?)", rows)
+    con.commit()
+    con.close()
+
+    mock_logger = Mock()
+    assert migrate(db_path, config_dict=config_dict_parsivel, logger=mock_logger, batch_size=4, pause=0) is True
+
+    con, cur = connect_db(dbpath=str(db_path))
+    assert cur.execute("SELECT timestamp, sensor_id, telegram FROM disdrodl ORDER BY sensor_id, timestamp").fetchall() \
+        == [(60.0 * i, 'PAR008', 'data') for i in range(10)] + [(300.0, 'THIES006', 'data')]
+    indexes = [row[0] for row in cur.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()]
+    assert indexes == [UNIQUE_INDEX]
+    assert 5 in applied_versions(cur)
+    cur.close()
+    con.close()
+    deleted = [c.kwargs['msg'] for c in mock_logger.warning.call_args_list if c.kwargs['msg'].startswith('deleted')]
+    assert sum(int(msg.split()[1]) for msg in deleted) == 5
+
+
+def test_migrate_parsed_column(tmp_path):
+    """
+    Tests that the parsed BLOB of the migrated rows, also of rows whose spectrum was moved to the spectrum column,
+    is the same as the parsed BLOB stored by a DBWriter, and that rows without telegram data keep no parsed BLOB.
+    :param tmp_path: temporary directory
+    """
+    for config_dict, telegram_lines, telegram_class in ((config_dict_parsivel, parsivel_lines, ParsivelTelegram),
+                                                        (config_dict_thies, thies_lines, ThiesTelegram)):
+        for spectrum_storage in ('text', 'zlib'):
+            config_dict = deepcopy(config_dict)
+            config_dict['db_spectrum_storage'] = spectrum_storage
+            config_dict['db_parsed_column'] = True
+
+            migrated_path = tmp_path / f'migrated_{telegram_class.__name__}_{spectrum_storage}.db'
+            fill_text_db(migrated_path, config_dict_parsivel if telegram_class is ParsivelTelegram
+                         else config_dict_thies, telegram_lines, minutes=3)
+            con, cur = connect_db(dbpath=str(migrated_path))
+            cur.execute("INSERT INTO disdrodl(timestamp, datetime, sensor_id, telegram) VALUES (0, '', 'PAR008', '')")
+            con.commit()
+            cur.close()
+            con.close()
+            assert migrate(migrated_path, config_dict=config_dict, logger=Mock(), batch_size=2, pause=0) is True
+
+            written_path = tmp_path / f'written_{telegram_class.__name__}_{spectrum_storage}.db'
+            create_db(dbpath=str(written_path), spectrum_storage=spectrum_storage, parsed=True)
+            db_writer = DBWriter(dbpath=str(written_path), spectrum_storage=spectrum_storage, parsed=True)
+            db_writer.write([telegram_class(config_dict=config_dict, telegram_lines=telegram_lines,
+                                            timestamp=start_dt + timedelta(minutes=i), db_cursor=None,
+                                            telegram_data={}, logger=Mock()) for i in range(3)])
+            db_writer.close()
+
+            results = []
+            for path in (migrated_path, written_path):
+                con, cur = connect_db(dbpath=str(path))
+                results.append(cur.execute("SELECT parsed FROM disdrodl ORDER BY id").fetchall())
+                cur.close()
+                con.close()
+            assert results[0] == results[1] + [(None,)]
+
+
+def test_migrate_quality_flag(tmp_path):
+    """
+    Tests that the quality flag of the migrated rows, also of rows with a spectrum BLOB, is the same as the quality flag
+    stored by a DBWriter, and that a row without telegram data is missing.
+    :param tmp_path: temporary directory
+    """
+    for config_dict, telegram_lines, telegram_class in ((config_dict_parsivel, parsivel_lines, ParsivelTelegram),
+                                                        (config_dict_thies, thies_lines, ThiesTelegram)):
+        config_dict = deepcopy(config_dict)
+        config_dict['db_spectrum_storage'] = 'zlib'
+        config_dict['db_quality_column'] = True
+
+        migrated_path = tmp_path / f'migrated_{telegram_class.__name__}.db'
+        fill_text_db(migrated_path, config_dict_parsivel if telegram_class is ParsivelTelegram
+                     else config_dict_thies, telegram_lines, minutes=3)
+        con, cur = connect_db(dbpath=str(migrated_path))
+        cur.execute("INSERT INTO disdrodl(timestamp, datetime, sensor_id, telegram) VALUES (0, '', 'PAR008', '')")
+        con.commit()
+        cur.close()
+        con.close()
+        assert migrate(migrated_path, config_dict=config_dict, logger=Mock(), batch_size=2, pause=0) is True
+
+        written_path = tmp_path / f'written_{telegram_class.__name__}.db'
+        create_db(dbpath=str(written_path), spectrum_storage='zlib', quality=True)
+        db_writer = DBWriter(dbpath=str(written_path), spectrum_storage='zlib', quality=True)
+        db_writer.write([telegram_class(config_dict=config_dict, telegram_lines=telegram_lines,
+                                        timestamp=start_dt + timedelta(minutes=i), db_cursor=None,
+                                        telegram_data={}, logger=Mock()) for i in range(3)])
+        db_writer.close()
+
+        results = []
+        for path in (migrated_path, written_path):
+            con, cur = connect_db(dbpath=str(path))
+            results.append(cur.execute("SELECT quality_flag FROM disdrodl ORDER BY id").fetchall())
+            cur.close()
+            con.close()
+        assert results[0] == results[1] + [(QUALITY_MISSING,)]
+        assert results[1] == [(0,)] * 3
+
+
+def test_skip_blocking(tmp_path):
+    """
+    Tests that the migrations that build an index over all rows can be skipped and are applied by a later run,
+    which logs a warning with the number of rows before building the index.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    fill_text_db(db_path, config_dict_parsivel, parsivel_lines, 3)
+    assert [migration.VERSION for migration in MIGRATIONS if migration.BLOCKING] == [2, 5]
+
+    mock_logger = Mock()
+    assert migrate(db_path, config_dict=config_dict_parsivel, logger=mock_logger, skip=[2, 5]) is False
+    con, cur = connect_db(dbpath=str(db_path))
+    assert applied_versions(cur) == [1]
+    mock_logger.warning.assert_not_called()
+    assert f'{db_path}: skipped migration 2 (index on (sensor_id, timestamp))' in \
+        [c.kwargs['msg'] for c in mock_logger.info.call_args_list]
+
+    assert migrate(db_path, config_dict=config_dict_parsivel, logger=mock_logger) is True
+    assert applied_versions(cur) == [1, 2, 5]
+    cur.close()
+    con.close()
+    warnings = [c.kwargs['msg'] for c in mock_logger.warning.call_args_list]
+    assert len(warnings) == 2
+    assert all('builds an index over 3 rows' in msg for msg in warnings)
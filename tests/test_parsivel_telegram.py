@@ -16,16 +16,30 @@ Functions:
   multiple values (key:val;val;) and parsing a telegram with a key that is not in the configuration
   dictionary of the sensor.
 - test_str2list_parsivel: Tests str2list method for ParsivelTelegram class.
+- test_capture_ascii_fast_path_parsivel: Tests that an ASCII telegram is captured without importing chardet.
+- test_capture_decode_fallback_parsivel: Tests that a telegram that is not ASCII is decoded as latin-1,
+  and that the fallback is counted.
+- test_decode_spectrum: Tests that fixed width spectrum values are decoded from their bytes, and that other data
+  are not.
+- test_capture_spectrum_fallback_parsivel: Tests that a spectrum that is not 1024 three digit values is captured
+  as strings.
+- test_decode_spectrum_benchmark: Benchmarks decoding a day of spectra with a fixed stride against splitting
+  them into strings.
 """
 
 import logging
+import sys
+import time
+from unittest.mock import patch, Mock
 from logging import StreamHandler
 from datetime import datetime, timezone
 from pathlib import Path
+import numpy
+import pytest
 from pydantic.v1.utils import deep_update
 
 from conftest import now
-from modules.telegram import ParsivelTelegram
+from modules.telegram import ParsivelTelegram, decode_spectrum
 from modules.util_functions import yaml2dict
 
 
@@ -70,7 +84,8 @@ def test_capture_prefixes_and_data_parsivel():
     #check that keys with data arrays/matrices work
     assert data_dictionary['90'] == key_90_values
     assert data_dictionary['91'] == key_91_values
-    assert data_dictionary['93'] == ['000' for _ in range(1024)]
+    assert data_dictionary['93'].dtype == numpy.uint16
+    numpy.testing.assert_array_equal(data_dictionary['93'], numpy.zeros(1024))
 
 def test_capture_prefixes_and_data_empty_parsivel():
     """
@@ -158,11 +173,8 @@ def test_telegram_row_parsivel():
         # print('f91:', i)
         assert len(i) == 6 and ',' not in i
     assert len(row_telegram.telegram_data['93']) == 1024
-    for i in row_telegram.telegram_data['93']:
-        # print('f93:', i)
-        assert len(i) == 3
-        for letter in i:
-            assert int(letter) in list(range(10))
+    assert row_telegram.telegram_data['93'].dtype == numpy.uint16
+    assert (row_telegram.telegram_data['93'] <= 999).all()
     for key in row_telegram.telegram_data.keys():
         assert key in config_dict['telegram_fields']
 
@@ -234,3 +246,117 @@ def test_str2list_parsivel():
         logger=None)
     telegram.str2list('1',',')
     assert telegram_data['1'] == ['1','2','3','4','5']
+
+
+def test_capture_ascii_fast_path_parsivel():
+    """
+    Tests that an ASCII telegram is captured without importing chardet, and without counting a fallback.
+    """
+    fallbacks = ParsivelTelegram.decode_fallbacks
+    telegram = ParsivelTelegram(config_dict=None,
+                                telegram_lines=parsivel_lines,
+                                timestamp=None,
+                                db_cursor=None,
+                                telegram_data={},
+                                logger=None)
+    # importing chardet raises an ImportError
+    with patch.dict(sys.modules, {'chardet': None}):
+        telegram.capture_prefixes_and_data()
+
+    assert list(telegram.telegram_data.keys()) == keys
+    assert ParsivelTelegram.decode_fallbacks == fallbacks
+
+
+def test_capture_decode_fallback_parsivel():
+    """
+    Tests that a telegram that is not ASCII is decoded as latin-1, without detecting its encoding,
+    with the same result for the ASCII lines, and that the fallback is counted and logged.
+    """
+    fallbacks = ParsivelTelegram.decode_fallbacks
+    lines = [b'05:   \xe9\r\n' if line.startswith(b'05:') else line for line in parsivel_lines]
+    mock_logger = Mock()
+    telegram = ParsivelTelegram(config_dict=None,
+                                telegram_lines=lines,
+                                timestamp=None,
+                                db_cursor=None,
+                                telegram_data={},
+                                logger=mock_logger)
+    # the result does not depend on chardet, which is not imported
+    with patch.dict(sys.modules, {'chardet': None}):
+        telegram.capture_prefixes_and_data()
+
+    assert list(telegram.telegram_data.keys()) == keys
+    assert telegram.telegram_data['05'] == '\u00e9'
+    assert telegram.telegram_data['08'] == '20000'
+    numpy.testing.assert_array_equal(telegram.telegram_data['93'], numpy.zeros(1024))
+    assert ParsivelTelegram.decode_fallbacks == fallbacks + 1
+    assert 'decoded as latin-1' in mock_logger.warning.call_args.kwargs['msg']
+    # every byte is decoded, to the character with its value
+    assert telegram.decode_telegram_lines([b'\x80\xff']) == '\u0080\u00ff'
+
+
+def test_decode_spectrum():
+    """
+    Tests that spectrum values of three digits are decoded from their bytes into uint16, separated by ';' as sent
+    by the sensor or by ',' as stored in the database, and that data with values of another width, another number
+    of values or other characters are not decoded.
+    """
+    values = numpy.arange(1024) % 1000
+    sensor = ';'.join(f'{value:03d}' for value in values).encode('ascii') + b';\r\n'
+    stored = ','.join(f'{value:03d}' for value in values).encode('ascii')
+
+    spectrum = decode_spectrum(memoryview(b'93:' + sensor)[3:], 1024)
+    assert spectrum.dtype == numpy.uint16
+    numpy.testing.assert_array_equal(spectrum, values)
+    numpy.testing.assert_array_equal(decode_spectrum(stored, 1024, shape=(32, 32)), values.reshape(32, 32))
+
+    assert decode_spectrum(stored, 1025) is None
+    assert decode_spectrum(stored + b',000', 1024) is None
+    assert decode_spectrum(stored.replace(b'999', b'99a'), 1024) is None
+    assert decode_spectrum(stored.replace(b',', b';', 1), 1024) is None
+    assert decode_spectrum(b'1;22;333', 3) is None
+    assert decode_spectrum(b'-01;000;000', 3) is None
+
+
+def test_capture_spectrum_fallback_parsivel():
+    """
+    Tests that a spectrum that is not 1024 values of three digits is captured as a list of strings, as before,
+    so it still gets the error value in the NetCDF, while the other fields are captured as usual.
+    """
+    lines = [b'93:' + b'0000;' * 1024 + b'\r\n' if line.startswith(b'93:') else line for line in parsivel_lines]
+    telegram = ParsivelTelegram(config_dict=None,
+                                telegram_lines=lines,
+                                timestamp=None,
+                                db_cursor=None,
+                                telegram_data={},
+                                logger=None)
+    telegram.capture_prefixes_and_data()
+
+    assert list(telegram.telegram_data.keys()) == keys
+    assert telegram.telegram_data['93'] == ['0000' for _ in range(1024)]
+    assert telegram.telegram_data['08'] == '20000'
+
+
+@pytest.mark.benchmark
+def test_decode_spectrum_benchmark():
+    """
+    Benchmarks decoding the spectra of a day of telegrams (1440) with a fixed stride into uint16 (32, 32) arrays
+    against the string path: splitting them into strings and converting those into an array.
+    Only runs with --benchmark, see conftest.py.
+    """
+    rng = numpy.random.default_rng(22)
+    lines = [b'93:' + ';'.join(f'{value:03d}' for value in rng.integers(0, 999, 1024)).encode('ascii') + b';\r\n'
+             for _ in range(1440)]
+
+    start = time.perf_counter()
+    strings = [numpy.array([v for v in line[3:].decode('ascii').strip().split(';') if len(v) > 0])
+               .reshape(32, 32).astype(numpy.uint16) for line in lines]
+    string_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    spectra = [decode_spectrum(memoryview(line)[3:], 1024, shape=(32, 32)) for line in lines]
+    stride_duration = time.perf_counter() - start
+
+    numpy.testing.assert_array_equal(numpy.array(spectra), numpy.array(strings))
+    print(f'a day of spectra as strings in {string_duration:.3f}s, with a fixed stride in {stride_duration:.3f}s')
+    assert stride_duration < string_duration
@@ -0,0 +1,201 @@
+"""
+Module for testing the TelegramQueue and TelegramPipeline classes from pipeline.py.
+
+Functions:
+- create_telegram_mock: Creates a mocked Telegram with the given timestamp.
+- test_queue_drop_oldest: Tests that a full queue with the drop_oldest policy drops the oldest telegram.
+- test_queue_drop_newest: Tests that a full queue with the drop_newest policy drops the telegram being put.
+- test_queue_block: Tests that a full queue with the block policy waits for room and drops after the timeout.
+- test_queue_invalid_arguments: Tests that an unknown overflow policy or a size below 1 raises a ValueError.
+- test_pipeline_storage_stall: Tests that a stalled database does not block putting telegrams.
+- test_pipeline_batches_per_db: Tests that one batch is written with one transaction per database.
+- test_pipeline_failed_write: Tests that failed writes are counted and the writer thread keeps running.
+- test_pipeline_writes_to_db: Tests that the telegrams end up in the database once the pipeline is stopped.
+"""
+
+import os
+import threading
+import time
+from datetime import timedelta
+from unittest.mock import Mock
+
+import pytest
+
+from conftest import start_dt, config_dict_parsivel, parsivel_lines, logger
+from modules.pipeline import TelegramQueue, TelegramPipeline
+from modules.sqldb import create_db, connect_db
+from modules.db_writer import DBWriter
+from modules.telegram import ParsivelTelegram
+
+
+def create_telegram_mock(minute):
+    """
+    Creates a mocked Telegram with the given timestamp.
+    :param minute: the number of minutes after start_dt
+    :return: the mocked Telegram
+    """
+    telegram = Mock()
+    telegram.timestamp = start_dt + timedelta(minutes=minute)
+    return telegram
+
+
+def test_queue_drop_oldest():
+    """
+    Tests that a full queue with the drop_oldest policy drops the oldest telegram.
+    """
+    telegram_queue = TelegramQueue(maxsize=3, overflow='drop_oldest')
+    telegrams = [create_telegram_mock(i) for i in range(5)]
+
+    results = [telegram_queue.put('disdrodl.db', telegram) for telegram in telegrams]
+
+    assert results == [True] * 5
+    assert telegram_queue.depth() == 3
+    assert telegram_queue.max_depth == 3
+    assert telegram_queue.enqueued == 5
+    assert telegram_queue.dropped == 2
+    batch = telegram_queue.get_batch(batch_size=10, timeout=0)
+    assert [telegram for _, telegram in batch] == telegrams[2:]
+
+
+def test_queue_drop_newest():
+    """
+    Tests that a full queue with the drop_newest policy drops the telegram being put.
+    """
+    telegram_queue = TelegramQueue(maxsize=3, overflow='drop_newest')
+    telegrams = [create_telegram_mock(i) for i in range(5)]
+
+    results = [telegram_queue.put('disdrodl.db', telegram) for telegram in telegrams]
+
+    assert results == [True, True, True, False, False]
+    assert telegram_queue.enqueued == 3
+    assert telegram_queue.dropped == 2
+    batch = telegram_queue.get_batch(batch_size=2, timeout=0)
+    assert [telegram for _, telegram in batch] == telegrams[:2]
+    assert telegram_queue.depth() == 1
+
+
+def test_queue_block():
+    """
+    Tests that a full queue with the block policy waits for room and drops after the timeout.
+    """
+    telegram_queue = TelegramQueue(maxsize=1, overflow='block', block_timeout=0.05)
+    assert telegram_queue.put('disdrodl.db', create_telegram_mock(0)) is True
+    assert telegram_queue.put('disdrodl.db', create_telegram_mock(1)) is False
+    assert telegram_queue.dropped == 1
+
+    threading.Timer(0.01, telegram_queue.get_batch, kwargs={'batch_size': 1, 'timeout': 0}).start()
+    telegram_queue.block_timeout = 1
+    assert telegram_queue.put('disdrodl.db', create_telegram_mock(2)) is True
+    assert telegram_queue.enqueued == 2
+
+
+def test_queue_invalid_arguments():
+    """
+    Tests that an unknown overflow policy or a size below 1 raises a ValueError.
+    """
+    with pytest.raises(ValueError):
+        TelegramQueue(overflow='drop_all')
+    with pytest.raises(ValueError):
+        TelegramQueue(maxsize=0)
+
+
+def test_pipeline_storage_stall():
+    """
+    Tests that a stalled database does not block putting telegrams, and that the queued telegrams
+    are committed in batches once the database is available again.
+    """
+    stalled = threading.Event()
+
+    def write(telegrams):  # pylint: disable=unused-argument
+        stalled.wait(timeout=5)
+        return True
+
+    db_writer = Mock()
+    db_writer.write.side_effect = write
+    pipeline = TelegramPipeline(create_writer=Mock(return_value=db_writer), maxsize=100, batch_timeout=0.01)
+    pipeline.start()
+
+    start = time.monotonic()
+    for i in range(50):
+        assert pipeline.put('disdrodl.db', create_telegram_mock(i)) is True
+    assert time.monotonic() - start < 0.5
+
+    stalled.set()
+    pipeline.stop()
+
+    metrics = pipeline.metrics()
+    assert metrics['enqueued'] == 50
+    assert metrics['written'] == 50
+    assert metrics['dropped'] == 0
+    assert metrics['depth'] == 0
+    assert metrics['batches'] < 50
+    assert sum(len(c.args[0]) for c in db_writer.write.call_args_list) == 50
+
+
+def test_pipeline_batches_per_db():
+    """
+    Tests that one batch is written with one transaction per database, using one writer per database.
+    """
+    db_writers = {'a.db': Mock(), 'b.db': Mock()}
+    create_writer = Mock(side_effect=lambda db_path: db_writers[db_path])
+    pipeline = TelegramPipeline(create_writer=create_writer, batch_timeout=0.01)
+    telegrams = [create_telegram_mock(i) for i in range(3)]
+    pipeline.put('a.db', telegrams[0])
+    pipeline.put('b.db', telegrams[1])
+    pipeline.put('a.db', telegrams[2])
+
+    pipeline.start()
+    pipeline.stop()
+
+    db_writers['a.db'].write.assert_called_once_with([telegrams[0], telegrams[2]])
+    db_writers['b.db'].write.assert_called_once_with([telegrams[1]])
+    assert create_writer.call_count == 2
+    db_writers['a.db'].close.assert_called_once()
+    assert pipeline.batches == 1
+
+
+def test_pipeline_failed_write():
+    """
+    Tests that failed writes are counted and logged, and the writer thread keeps running.
+    """
+    db_writer = Mock()
+    db_writer.write.side_effect = [False, OSError('disk full'), True]
+    mock_logger = Mock()
+    pipeline = TelegramPipeline(create_writer=Mock(return_value=db_writer), logger=mock_logger,
+                                batch_size=1, batch_timeout=0.01)
+    for i in range(3):
+        pipeline.put('disdrodl.db', create_telegram_mock(i))
+
+    pipeline.start()
+    pipeline.stop()
+
+    assert pipeline.failed == 2
+    assert pipeline.written == 1
+    assert mock_logger.error.call_count == 3
+
+
+def test_pipeline_writes_to_db():
+    """
+    Tests that the telegrams end up in the database once the pipeline is stopped.
+    """
+    db_path = 'sample_data/test_pipeline.db'
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    create_db(dbpath=db_path)
+
+    pipeline = TelegramPipeline(create_writer=lambda path: DBWriter(dbpath=path), batch_timeout=0.01)
+    pipeline.start()
+    for i in range(10):
+        pipeline.put(db_path, ParsivelTelegram(config_dict=config_dict_parsivel,
+                                               telegram_lines=parsivel_lines,
+                                               timestamp=start_dt + timedelta(minutes=i),
+                                               db_cursor=None,
+                                               telegram_data={},
+                                               logger=logger))
+    pipeline.stop()
+
+    con, cur = connect_db(dbpath=db_path)
+    assert cur.execute('SELECT COUNT(*) FROM disdrodl').fetchone()[0] == 10
+    cur.close()
+    con.close()
+    os.remove(db_path)
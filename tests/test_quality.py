@@ -0,0 +1,201 @@
+"""
+Module for testing the quality flag of the telegrams from quality.py.
+
+Functions:
+- quality_telegram: Creates a telegram of a sensor and captures its data.
+- parsivel_with: Returns the sample Parsivel telegram lines with the values of some fields replaced.
+- thies_with: Returns the sample Thies telegram with the values at some positions replaced.
+- test_scalar_flags: Tests the flags of the typed column of a scalar field.
+- test_quality_flag_parsivel: Tests the quality flag of Parsivel telegrams with missing, truncated and bad values.
+- test_quality_flag_thies: Tests the quality flag of Thies telegrams with missing, truncated and bad values.
+- test_quality_flag_db: Tests that the DBWriter stores the quality flag of every telegram in the quality_flag column.
+- test_quality_flag_netcdf: Tests that the quality flags are written to the quality_flag NetCDF variable,
+  and that an out-of-range value is read back unmasked.
+"""
+
+import os
+from datetime import timedelta
+from unittest.mock import Mock
+
+import numpy
+import pytest
+from netCDF4 import Dataset  # pylint: disable=no-name-in-module
+
+from conftest import start_dt, config_dict_parsivel, config_dict_thies, parsivel_lines, thies_lines, data_dir
+from modules.netCDF import NetCDF
+from modules.quality import scalar_flags, flag_meanings, QUALITY_MISSING, QUALITY_TRUNCATED, \
+    QUALITY_OUT_OF_RANGE, QUALITY_SENSOR_ERROR, QUALITY_FLAGS
+from modules.schema import compile_schema
+from modules.sqldb import connect_db, create_db
+from modules.db_writer import DBWriter
+from modules.telegram import create_telegram, decode_telegrams
+
+
+def quality_telegram(config_dict, telegram_lines, minute=0):
+    """
+    Creates a telegram of the sensor of the config and captures its data.
+    :param config_dict: the config dictionary of the sensor
+    :param telegram_lines: the telegram lines, as the sensor returns them
+    :param minute: the minute after start_dt of the telegram
+    :return: the Telegram object
+    """
+    telegram = create_telegram(config_dict=config_dict, telegram_lines=telegram_lines,
+                               timestamp=start_dt + timedelta(minutes=minute), db_cursor=None, db_row_id=None,
+                               telegram_data={}, logger=Mock())
+    telegram.capture_prefixes_and_data()
+    return telegram
+
+
+def parsivel_with(**values):
+    """
+    Returns the sample Parsivel telegram lines with the values of some fields replaced.
+    :param values: the new value per field, e.g. f18=b'1'
+    :return: the telegram lines
+    """
+    replace = {field[1:].encode('ascii') + b':': value for field, value in values.items()}
+    return [line[:3] + replace[line[:3]] + b'\r\n' if line[:3] in replace else line for line in parsivel_lines]
+
+
+def thies_with(**values):
+    """
+    Returns the sample Thies telegram with the values at some positions replaced.
+    :param values: the new value per position in the telegram, e.g. v21='1' (the position is the field number - 2)
+    :return: the telegram string
+    """
+    telegram_list = thies_lines.split(';')
+    for position, value in values.items():
+        telegram_list[int(position[1:])] = value
+    return ';'.join(telegram_list)
+
+
+def test_scalar_flags():
+    """
+    Tests that a value that is not a number is missing, that a value outside the valid range (compared as float32,
+    so the limit itself is valid) is out of range, that a status that is not 0 is a sensor error,
+    and that telegrams without the field are not flagged.
+    """
+    schema = compile_schema(config_dict_parsivel['telegram_fields'], config_dict_parsivel['dimensions'])
+    column = numpy.array([99.999, -9.999, 100.5, -10, -10, 5], dtype=numpy.float32)
+    present = numpy.array([True, True, True, True, False, True])
+
+    flags = scalar_flags(schema['07'], column, present)
+
+    assert flags.tolist() == [0, 0, QUALITY_OUT_OF_RANGE, QUALITY_MISSING, 0, 0]
+    flags = scalar_flags(schema['18'], numpy.array([0, 1, 2, -999], dtype=numpy.int16), numpy.ones(4, dtype=bool))
+    assert flags.tolist() == [0, QUALITY_SENSOR_ERROR, QUALITY_SENSOR_ERROR, QUALITY_MISSING]
+    assert flag_meanings(QUALITY_MISSING | QUALITY_TRUNCATED) == ['missing', 'truncated']
+    assert flag_meanings(0) == []
+
+
+def test_quality_flag_parsivel():
+    """
+    Tests the quality flag of the sample Parsivel telegram, an empty read, a spectrum without its last value,
+    a sensor status and error code, a rain intensity above its valid range and a temperature that is not a number,
+    and that decode_telegrams gives the same flags for the stored telegrams.
+    """
+    spectrum = next(line for line in parsivel_lines if line.startswith(b'93:'))
+    cases = [([], QUALITY_MISSING),
+             (parsivel_lines, 0),
+             ([spectrum[:-6] + b'\r\n' if line.startswith(b'93:') else line for line in parsivel_lines],
+              QUALITY_TRUNCATED),
+             (parsivel_with(f18=b'1'), QUALITY_SENSOR_ERROR),
+             (parsivel_with(f25=b'003', f01=b'9999.000'), QUALITY_SENSOR_ERROR | QUALITY_OUT_OF_RANGE),
+             (parsivel_with(f12=b'x'), QUALITY_MISSING)]
+
+    telegrams = [quality_telegram(config_dict_parsivel, lines, minute) for minute, (lines, _) in enumerate(cases)]
+
+    assert [telegram.quality_flag() for telegram in telegrams] == [flag for _, flag in cases]
+    rows = []
+    for row_id, telegram in enumerate(telegrams):
+        row = telegram.db_row()
+        rows.append((row_id, row[0], row[3], None, None))
+    records = decode_telegrams(config_dict_parsivel, rows, Mock())
+    # the empty read has no data, and is kept as a record with the fill values
+    assert records['quality_flag'].tolist() == [flag for _, flag in cases]
+
+
+def test_quality_flag_thies():
+    """
+    Tests the quality flag of the sample Thies telegram, an empty read, a telegram without its last values,
+    a static signal error, a visibility above its valid range and a measuring quality that is not a number,
+    and that decode_telegrams gives the same flags for the stored telegrams with their stored quality flag.
+    """
+    cases = [('', QUALITY_MISSING),
+             (thies_lines, 0),
+             (thies_lines[:-20], QUALITY_MISSING | QUALITY_TRUNCATED),
+             (thies_with(v21='1'), QUALITY_SENSOR_ERROR),
+             (thies_with(v16='100000'), QUALITY_OUT_OF_RANGE),
+             (thies_with(v18='x'), QUALITY_MISSING)]
+
+    telegrams = [quality_telegram(config_dict_thies, lines, minute) for minute, (lines, _) in enumerate(cases)]
+
+    assert [telegram.quality_flag() for telegram in telegrams] == [flag for _, flag in cases]
+    rows = []
+    for row_id, telegram in enumerate(telegrams):
+        row = telegram.db_row(quality=True)
+        rows.append((row_id, row[0], row[3], None, None, row[4]))
+    records = decode_telegrams(config_dict_thies, rows, Mock())
+    # the telegram without its last values is stored as an empty telegram, the stored flag keeps it truncated
+    assert records['quality_flag'].tolist() == [flag for _, flag in cases]
+
+
+def test_quality_flag_db(tmp_path):
+    """
+    Tests that the DBWriter stores the quality flag of every telegram in the quality_flag column,
+    so the flags of a period are one query.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    create_db(dbpath=str(db_path), quality=True)
+    db_writer = DBWriter(dbpath=str(db_path), quality=True)
+    db_writer.write([create_telegram(config_dict=config_dict_parsivel, telegram_lines=lines,
+                                     timestamp=start_dt + timedelta(minutes=minute), db_cursor=None,
+                                     db_row_id=None, telegram_data={}, logger=Mock())
+                     for minute, lines in enumerate([parsivel_lines, [], parsivel_with(f18=b'2')])])
+    db_writer.close()
+
+    con, cur = connect_db(dbpath=str(db_path))
+    flags = [row[0] for row in cur.execute("SELECT quality_flag FROM disdrodl ORDER BY timestamp").fetchall()]
+    cur.close()
+    con.close()
+    assert flags == [0, QUALITY_MISSING, QUALITY_SENSOR_ERROR]
+
+
+@pytest.mark.parametrize('full_version', [True, False])
+def test_quality_flag_netcdf(full_version):
+    """
+    Tests that the quality flags are written to the quality_flag NetCDF variable, with its flag_masks and
+    flag_meanings, the same from the structured array of decode_telegrams and from the Telegram objects,
+    and that the rain intensity above its valid range is read back as it is, not masked.
+    :param full_version: whether to write the full or the light NetCDF
+    """
+    telegrams = [quality_telegram(config_dict_parsivel, lines, minute) for minute, lines in
+                 enumerate([parsivel_lines, parsivel_with(f18=b'1'), parsivel_with(f01=b'9999.000')])]
+    rows = []
+    for row_id, telegram in enumerate(telegrams):
+        row = telegram.db_row()
+        rows.append((row_id, row[0], row[3], None, None))
+    telegram_objs = []
+    for telegram in telegrams:
+        telegram_obj = create_telegram(config_dict=config_dict_parsivel, telegram_lines=telegram.telegram_data_str,
+                                       timestamp=telegram.timestamp, db_cursor=None, db_row_id=None,
+                                       telegram_data={}, logger=Mock())
+        telegram_obj.parse_telegram_row()
+        telegram_objs.append(telegram_obj)
+
+    for fn_start, objs, records in (('test_quality_objects', telegram_objs, None),
+                                    ('test_quality_records', None, decode_telegrams(config_dict_parsivel, rows,
+                                                                                    Mock()))):
+        nc = NetCDF(logger=Mock(), config_dict=config_dict_parsivel, data_dir=data_dir, fn_start=fn_start,
+                    full_version=full_version, telegram_objs=objs, date=start_dt, records=records)
+        nc.create_netCDF()
+        nc.write_data_to_netCDF()
+        with Dataset(data_dir / f'{fn_start}.nc', 'r', format="NETCDF4") as rootgrp:
+            variable = rootgrp.variables['quality_flag']
+            assert variable[:].tolist() == [0, QUALITY_SENSOR_ERROR, QUALITY_OUT_OF_RANGE]
+            assert variable.flag_masks.tolist() == list(QUALITY_FLAGS.values())
+            assert variable.flag_meanings.split() == list(QUALITY_FLAGS)
+            rain_intensity = rootgrp.variables['rain_intensity']
+            assert 'valid_max' not in rain_intensity.ncattrs()
+            assert rain_intensity[2] == 9999.0 and rain_intensity[2] is not numpy.ma.masked
+        os.remove(data_dir / f'{fn_start}.nc')
@@ -0,0 +1,130 @@
+"""
+Module for testing the registry of the sensor types from registry.py.
+
+Functions:
+- other_sensor: Fixture registering another sensor type, which the core modules do not know.
+- test_builtin_entries: Tests the entries of the Parsivel and Thies.
+- test_lazy_import: Tests that the export does not import the sensor drivers.
+- test_other_sensor: Tests that a registered sensor type is used without edits of the core modules.
+- test_entry_point: Tests that the sensor type of an installed package is loaded from its entry point when looked up.
+"""
+
+import os
+import subprocess
+import sys
+from unittest.mock import Mock, patch
+
+import pytest
+from netCDF4 import Dataset  # pylint: disable=no-name-in-module
+
+from conftest import wd, data_dir, start_dt, config_dict_parsivel, parsivel_lines
+from modules import registry
+from modules.netCDF import NetCDF
+from modules.registry import SensorEntry, register_sensor, get_sensor_entry, sensor_types, load_reference
+from modules.sensors import Parsivel
+from modules.telegram import ParsivelTelegram, ThiesTelegram, create_telegram, decode_telegrams
+from modules.util_functions import get_general_config_dict, create_sensor
+
+OTHER_SENSOR_TYPE = 'Other Disdrometer'
+
+
+class OtherTelegram(ParsivelTelegram):
+    """
+    Telegram of another sensor type, with the telegram format of the Parsivel.
+    """
+
+
+@pytest.fixture(name='other_sensor')
+def fixture_other_sensor(monkeypatch):
+    """
+    Registers another sensor type, with its classes given as objects and its general config as an absolute path,
+    and removes it again after the test.
+    :param monkeypatch: the pytest monkeypatch fixture
+    :return: the config dictionary of the other sensor type
+    """
+    monkeypatch.setattr(registry, '_entries', dict(registry._entries))  # pylint: disable=protected-access
+    register_sensor(SensorEntry(sensor_type=OTHER_SENSOR_TYPE, sensor_class=Parsivel, telegram_class=OtherTelegram,
+                                general_config=wd / 'configs_netcdf' / 'config_general_parsivel.yml'))
+    return {**config_dict_parsivel,
+            'global_attrs': {**config_dict_parsivel['global_attrs'], 'sensor_type': OTHER_SENSOR_TYPE}}
+
+
+def test_builtin_entries():
+    """
+    Tests the classes, general config and decoder of the Parsivel and Thies, and that an unknown sensor type
+    raises a KeyError.
+    """
+    assert sensor_types()[:2] == ['OTT Hydromet Parsivel2', 'Thies Clima']
+    parsivel = get_sensor_entry('OTT Hydromet Parsivel2')
+    assert parsivel.telegram_class is ParsivelTelegram
+    assert parsivel.decoder is decode_telegrams
+    assert isinstance(parsivel.create_sensor(sensor_id='06'), Parsivel)
+    assert parsivel.general_config_path(wd) == wd / 'configs_netcdf' / 'config_general_parsivel.yml'
+    thies = get_sensor_entry('Thies Clima')
+    assert thies.telegram_class is ThiesTelegram
+    assert thies.create_sensor(sensor_id='06').thies_id == '06'
+    assert load_reference('modules.telegram:ThiesTelegram.DATA_FIELD') == '11'
+    with pytest.raises(KeyError):
+        get_sensor_entry('unsupported_sensor')
+
+
+def test_lazy_import():
+    """
+    Tests that importing the export does not import the sensor drivers (and the serial package),
+    they are only imported when a sensor is created.
+    """
+    code = ("import sys, export_disdrodlDB2NC; from modules.util_functions import create_sensor; "
+            "print('modules.sensors' in sys.modules, 'serial' in sys.modules); "
+            "create_sensor('Thies Clima', None); print('modules.sensors' in sys.modules)")
+    result = subprocess.run([sys.executable, '-c', code], cwd=wd, capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ['False', 'False', 'True']
+
+
+def test_other_sensor(other_sensor):
+    """
+    Tests that the sensor, telegram and general config of a registered sensor type are used by the core modules,
+    and that its telegram objects are written to the NetCDF.
+    :param other_sensor: the config dictionary of the other sensor type
+    """
+    assert isinstance(create_sensor(sensor_type=OTHER_SENSOR_TYPE, logger=Mock()), Parsivel)
+    assert get_general_config_dict(wd, OTHER_SENSOR_TYPE, Mock())['dimensions'] == config_dict_parsivel['dimensions']
+    telegram = create_telegram(config_dict=other_sensor, telegram_lines=parsivel_lines, timestamp=start_dt,
+                               db_cursor=None, db_row_id=None, telegram_data={}, logger=Mock())
+    assert isinstance(telegram, OtherTelegram)
+    telegram.capture_prefixes_and_data()
+    assert telegram.quality_flag() == 0
+
+    nc = NetCDF(logger=Mock(), config_dict=other_sensor, data_dir=data_dir, fn_start='test_registry',
+                full_version=True, telegram_objs=[telegram], date=start_dt)
+    nc.create_netCDF()
+    nc.write_data_to_netCDF()
+    with Dataset(data_dir / 'test_registry.nc', 'r', format="NETCDF4") as rootgrp:
+        assert rootgrp.variables['rain_intensity'][:].tolist() == [0]
+        assert rootgrp.variables['quality_flag'][:].tolist() == [0]
+    os.remove(data_dir / 'test_registry.nc')
+
+
+def test_entry_point(monkeypatch):
+    """
+    Tests that a sensor type that is not registered is loaded from the entry point with its name,
+    and that the other entry points are not loaded.
+    :param monkeypatch: the pytest monkeypatch fixture
+    """
+    monkeypatch.setattr(registry, '_entries', dict(registry._entries))  # pylint: disable=protected-access
+    entry = SensorEntry(sensor_type=OTHER_SENSOR_TYPE, sensor_class='modules.sensors:Parsivel',
+                        telegram_class='modules.telegram:ParsivelTelegram',
+                        general_config='config_general_parsivel.yml')
+    other_entry_point = Mock()
+    other_entry_point.name = 'Another Disdrometer'
+    entry_point = Mock()
+    entry_point.name = OTHER_SENSOR_TYPE
+    # the entry point may refer to a function returning the entry
+    entry_point.load.return_value = lambda: entry
+
+    with patch('modules.registry.entry_points', return_value=[other_entry_point, entry_point]) as mock_entry_points:
+        assert get_sensor_entry(OTHER_SENSOR_TYPE) is entry
+        assert get_sensor_entry(OTHER_SENSOR_TYPE) is entry
+
+    mock_entry_points.assert_called_once_with(group='disdrodl.sensors')
+    other_entry_point.load.assert_not_called()
+    assert OTHER_SENSOR_TYPE in sensor_types()
@@ -42,7 +42,7 @@ class TestResetParsivel(unittest.TestCase):
 
     @patch('reset_sensor.create_logger')
     @patch('reset_sensor.yaml2dict')
-    @patch('reset_sensor.Parsivel')
+    @patch('modules.sensors.Parsivel')
     def test_main_parsivel(self, mock_parsivel, mock_yaml2dict, mock_create_logger):
         """
         Tests for the main function
@@ -86,7 +86,7 @@ class TestResetParsivel(unittest.TestCase):
 
     @patch('reset_sensor.create_logger')
     @patch('reset_sensor.yaml2dict')
-    @patch('reset_sensor.Thies')
+    @patch('modules.sensors.Thies')
     def test_main_thies(self, mock_thies, mock_yaml2dict, mock_create_logger):
         """
         Tests for the main function
@@ -119,7 +119,7 @@ class TestResetParsivel(unittest.TestCase):
         ]
 
         mock_yaml2dict.assert_has_calls(expected_calls_yaml2dict)
-        mock_thies.assert_called_once()
+        mock_thies.assert_called_once_with(thies_id='es')
         mock_create_logger.assert_called_with(log_dir=Path('value1'),
                                               script_name='value2',
                                               sensor_name='thies')
@@ -0,0 +1,159 @@
+"""
+Module for testing the MinuteScheduler class from scheduler.py.
+All tests run on a FakeClock, so a full day of ticks is checked in milliseconds.
+
+Functions:
+- create_scheduler: Creates a MinuteScheduler running on the given FakeClock.
+- test_24h_of_ticks: Tests that 24 hours of ticks are on every whole minute without jitter or missed ticks.
+- test_first_tick_mid_minute: Tests that the first tick is on the next whole minute when started mid-minute.
+- test_slow_work_no_drift: Tests that time spent working does not shift the following ticks.
+- test_missed_ticks: Tests that boundaries passing while busy are reported as missed ticks.
+- test_wall_clock_step: Tests that the scheduler follows a step of the wall clock.
+- test_jitter: Tests that a late wake up is recorded as jitter.
+- test_wait_async: Tests the asyncio version of wait.
+"""
+
+import asyncio
+from datetime import timedelta
+from unittest.mock import Mock
+
+from conftest import FakeClock, start_dt
+from modules.scheduler import MinuteScheduler, Tick
+
+
+def create_scheduler(clock, logger=None):
+    """
+    Creates a MinuteScheduler running on the given FakeClock.
+    :param clock: the FakeClock object
+    :param logger: optional logger object
+    :return: the MinuteScheduler object
+    """
+    return MinuteScheduler(logger=logger, monotonic=clock.monotonic, wall_clock=clock.time, sleep=clock.sleep,
+                           async_sleep=clock.async_sleep)
+
+
+def test_24h_of_ticks():
+    """
+    Tests that 24 hours of ticks are on every whole minute without jitter or missed ticks.
+    """
+    clock = FakeClock()
+    scheduler = create_scheduler(clock)
+
+    for i in range(1440):
+        tick = scheduler.wait()
+        assert isinstance(tick, Tick)
+        assert tick.utc == start_dt + timedelta(minutes=i + 1)
+        assert tick.time_list[2] == '00'
+        assert tick.missed == []
+        clock.work(0.5)  # time needed to read and store the telegram
+
+    assert scheduler.tick_count == 1440
+    assert scheduler.missed_count == 0
+    assert scheduler.max_jitter == 0
+    assert scheduler.mean_jitter() == 0
+
+
+def test_first_tick_mid_minute():
+    """
+    Tests that the first tick is on the next whole minute when started mid-minute.
+    """
+    clock = FakeClock(start=start_dt + timedelta(seconds=42.5))
+    scheduler = create_scheduler(clock)
+
+    assert scheduler.seconds_until_next() == 17.5
+    tick = scheduler.wait()
+
+    assert tick.utc == start_dt + timedelta(minutes=1)
+    assert clock.sleeps == [17.5]
+
+
+def test_slow_work_no_drift():
+    """
+    Tests that time spent working does not shift the following ticks.
+    """
+    clock = FakeClock()
+    scheduler = create_scheduler(clock)
+
+    for i in range(100):
+        tick = scheduler.wait()
+        assert tick.utc == start_dt + timedelta(minutes=i + 1)
+        clock.work(15.3)  # slow start sequence after every telegram
+
+    assert all(abs(seconds - 44.7) < 1e-6 for seconds in clock.sleeps[1:])
+    assert scheduler.missed_count == 0
+
+
+def test_missed_ticks():
+    """
+    Tests that boundaries passing while busy are reported as missed ticks.
+    """
+    mock_logger = Mock()
+    clock = FakeClock()
+    scheduler = create_scheduler(clock, logger=mock_logger)
+
+    scheduler.wait()
+    clock.work(150)  # busy for 2.5 minutes
+    tick = scheduler.wait()
+
+    assert tick.utc == start_dt + timedelta(minutes=3)
+    assert tick.missed == [start_dt + timedelta(minutes=2)]
+    assert scheduler.missed_count == 1
+    assert abs(tick.jitter - 30) < 1e-6
+    assert mock_logger.warning.call_count == 1
+
+    tick = scheduler.wait()
+    assert tick.utc == start_dt + timedelta(minutes=4)
+    assert tick.missed == []
+
+
+def test_wall_clock_step():
+    """
+    Tests that the scheduler follows a step of the wall clock (e.g. an NTP correction).
+    """
+    clock = FakeClock()
+    scheduler = create_scheduler(clock)
+
+    scheduler.wait()
+    scheduler.wait()
+    clock.wall += 5  # wall clock is corrected forward, monotonic clock is not
+    tick = scheduler.wait()
+
+    assert tick.utc == start_dt + timedelta(minutes=3)
+    tick = scheduler.wait()
+    assert tick.utc == start_dt + timedelta(minutes=4)
+    assert abs(clock.sleeps[-1] - 55) < 1e-6
+    assert clock.time() == (start_dt + timedelta(minutes=4)).timestamp()
+
+
+def test_jitter():
+    """
+    Tests that a late wake up is recorded as jitter.
+    """
+    clock = FakeClock()
+
+    def oversleep(fake_clock):
+        fake_clock.work(0.25)
+
+    clock.sleep_hook = oversleep
+    scheduler = create_scheduler(clock)
+
+    for _ in range(10):
+        tick = scheduler.wait()
+        assert abs(tick.jitter - 0.25) < 1e-6
+
+    assert abs(scheduler.last_jitter - 0.25) < 1e-6
+    assert abs(scheduler.max_jitter - 0.25) < 1e-6
+    assert abs(scheduler.mean_jitter() - 0.25) < 1e-6
+
+
+def test_wait_async():
+    """
+    Tests the asyncio version of wait.
+    """
+    clock = FakeClock(start=start_dt + timedelta(seconds=30))
+    scheduler = create_scheduler(clock)
+
+    tick = asyncio.run(scheduler.wait_async())
+
+    assert tick.utc == start_dt + timedelta(minutes=1)
+    assert clock.sleeps == [30]
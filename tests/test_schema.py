@@ -0,0 +1,95 @@
+"""
+Module for testing the compiled telegram schema from schema.py.
+
+Functions:
+- test_compile_schema_once: Tests that a config is compiled once and its schema is shared by all its telegrams.
+- test_compile_schema_content: Tests that the schemas are cached by the content of the config, in a bounded cache.
+- test_field_schema: Tests the compiled config of the fields of the Parsivel and Thies configs.
+- test_nc_fields: Tests that the fields written to a full and a light NetCDF follow include_in_nc.
+"""
+
+from copy import deepcopy
+from unittest.mock import Mock
+
+from conftest import start_dt, config_dict_parsivel, config_dict_thies, parsivel_lines
+from modules import schema as schema_module
+from modules.schema import compile_schema, TelegramSchema, SCHEMA_CACHE_SIZE
+from modules.sqldb import field_dtypes
+from modules.telegram import ParsivelTelegram
+
+
+def test_compile_schema_once():
+    """
+    Tests that the schema of a config is compiled once, and shared by all telegrams of that config,
+    while another config gets its own schema.
+    """
+    telegrams = [ParsivelTelegram(config_dict=config_dict_parsivel, telegram_lines=parsivel_lines, timestamp=start_dt,
+                                  db_cursor=None, telegram_data={}, logger=Mock()) for _ in range(2)]
+
+    schema = compile_schema(config_dict_parsivel['telegram_fields'], config_dict_parsivel['dimensions'])
+
+    assert isinstance(schema, TelegramSchema)
+    assert telegrams[0].schema is schema
+    assert telegrams[1].schema is schema
+    assert compile_schema(config_dict_thies['telegram_fields'], config_dict_thies['dimensions']) is not schema
+
+
+def test_compile_schema_content():
+    """
+    Tests that the schemas are cached by the content of the config: a copy of a config gets the same schema,
+    a config that is changed after it was compiled gets a new one, and the cache keeps at most SCHEMA_CACHE_SIZE
+    schemas, however many configs are compiled.
+    """
+    schema = compile_schema(config_dict_parsivel['telegram_fields'], config_dict_parsivel['dimensions'])
+    telegram_fields = deepcopy(config_dict_parsivel['telegram_fields'])
+
+    assert compile_schema(telegram_fields, config_dict_parsivel['dimensions']) is schema
+    telegram_fields['01']['fill_value'] = -1
+    changed = compile_schema(telegram_fields, config_dict_parsivel['dimensions'])
+    assert changed is not schema
+    assert changed['01'].fill_value == -1
+    assert schema['01'].fill_value != -1
+
+    for fill_value in range(2 * SCHEMA_CACHE_SIZE):
+        compile_schema({'01': {'dtype': 'f4', 'fill_value': fill_value}})
+    assert len(schema_module._schemas) == SCHEMA_CACHE_SIZE  # pylint: disable=protected-access
+
+
+def test_field_schema():
+    """
+    Tests the compiled config of the fields of the Parsivel and Thies configs: the position, dtypes, shape
+    and NetCDF variable of a field, and that the parsed dtypes are those of sqldb.field_dtypes.
+    """
+    schema = compile_schema(config_dict_parsivel['telegram_fields'], config_dict_parsivel['dimensions'])
+
+    assert list(schema.fields) == list(config_dict_parsivel['telegram_fields'])
+    assert schema['01'].index == 0
+    assert schema['01'].parsed_dtype == '<f4'
+    assert schema['01'].python_type is float
+    assert schema['01'].shape == ()
+    assert schema['93'].shape == (32, 32)
+    assert schema['93'].variable == config_dict_parsivel['telegram_fields']['93']['var_attrs']['standard_name']
+    assert schema['05'].parsed_dtype is None
+    assert '800' not in schema
+    assert schema.get('800') is None
+    assert schema.parsed_dtypes == field_dtypes(config_dict_parsivel)
+
+    schema = compile_schema(config_dict_thies['telegram_fields'], config_dict_thies['dimensions'])
+    assert schema['81'].shape == (22, 20)
+    # the schema of a config without dimensions does not know the shape of fields with dimensions
+    assert compile_schema(config_dict_thies['telegram_fields'])['81'].shape is None
+
+
+def test_nc_fields():
+    """
+    Tests that a full NetCDF gets every field that is not never included, and a light NetCDF only the fields
+    that are always included.
+    """
+    schema = compile_schema(config_dict_parsivel['telegram_fields'], config_dict_parsivel['dimensions'])
+    telegram_fields = config_dict_parsivel['telegram_fields']
+
+    assert list(schema.nc_fields[True]) == [field for field, field_dict in telegram_fields.items()
+                                            if field_dict['include_in_nc'] != 'never']
+    assert list(schema.nc_fields[False]) == [field for field, field_dict in telegram_fields.items()
+                                             if field_dict['include_in_nc'] == 'always']
+    assert len(schema.nc_fields[False]) < len(schema.nc_fields[True]) < len(telegram_fields)
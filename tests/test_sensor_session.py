@@ -0,0 +1,191 @@
+"""
+Module for testing the SensorSession class from sensor_session.py.
+
+Functions:
+- create_thies_telegram: Creates a ThiesTelegram whose sensor clock is the given number of seconds ahead.
+- test_start: Tests that the full start sequence marks all settings as applied.
+- test_start_failed: Tests that a failing start sequence leaves all settings pending.
+- test_no_drift_no_commands: Tests that a minute without drift sends no command to the sensor.
+- test_thies_clock_drift: Tests that only the clock of the Thies is set again after it drifted past the threshold.
+- test_parsivel_station_code_drift: Tests that only the station code of the Parsivel is set again after it drifted.
+- test_empty_telegram: Tests that an empty telegram marks all settings as pending.
+- test_update_lookup: Tests that the drift is checked without capturing the telegram, which db_row captures once.
+- test_reconcile_failed: Tests that a setting that fails to apply stays pending.
+"""
+
+from copy import deepcopy
+from datetime import timedelta
+from unittest.mock import Mock, patch
+
+from conftest import start_dt, config_dict_parsivel, config_dict_thies, parsivel_lines, thies_lines
+from modules.sensors import Parsivel, Thies
+from modules.sensor_session import SensorSession
+from modules.telegram import ParsivelTelegram, ThiesTelegram
+
+
+def create_thies_telegram(drift):
+    """
+    Creates a ThiesTelegram whose sensor clock is the given number of seconds ahead of its timestamp.
+    :param drift: seconds the sensor clock is ahead
+    :return: the ThiesTelegram object
+    """
+    sensor_dt = start_dt + timedelta(seconds=drift)
+    line = thies_lines.replace('01.01.14;18:59:00', sensor_dt.strftime('%d.%m.%y;%H:%M:%S'))
+    return ThiesTelegram(config_dict=config_dict_thies, telegram_lines=line, timestamp=start_dt,
+                         db_cursor=None, telegram_data={}, logger=Mock())
+
+
+def create_session(sensor, config_dict=None):
+    """
+    Creates a SensorSession for a sensor with a mocked serial connection.
+    :param sensor: the Sensor object
+    :param config_dict: the config dictionary, config_dict_thies by default
+    :return: the SensorSession object
+    """
+    sensor.serial_connection = Mock()
+    return SensorSession(sensor=sensor, config_dict=config_dict or config_dict_thies, logger=Mock())
+
+
+@patch('modules.sensors.sleep', return_value=None)
+def test_start(mock_sleep):  # pylint: disable=unused-argument
+    """
+    Tests that the full start sequence marks all settings as applied.
+    """
+    session = create_session(Thies(thies_id='06'))
+    assert session.pending() == ['automatic_mode', 'clock']
+
+    assert session.start() is True
+
+    assert session.pending() == []
+    assert session.sensor.serial_connection.write.call_count == 6
+
+
+def test_start_failed():
+    """
+    Tests that a failing start sequence leaves all settings pending.
+    """
+    sensor = Mock()
+    sensor.SETTINGS = ('automatic_mode', 'clock')
+    sensor.sensor_start_sequence.side_effect = OSError('device disconnected')
+    session = SensorSession(sensor=sensor, config_dict=config_dict_thies, logger=Mock())
+
+    assert session.start() is False
+    assert session.pending() == ['automatic_mode', 'clock']
+    session.logger.error.assert_called_once_with(msg='start sequence failed: device disconnected')
+
+
+@patch('modules.sensors.sleep', return_value=None)
+def test_no_drift_no_commands(mock_sleep):  # pylint: disable=unused-argument
+    """
+    Tests that a minute without drift sends no command to the sensor.
+    """
+    session = create_session(Thies(thies_id='06'))
+    session.start()
+    session.sensor.serial_connection.reset_mock()
+
+    for _ in range(10):
+        assert session.update(create_thies_telegram(drift=2)) == []
+        assert session.reconcile() == []
+
+    session.sensor.serial_connection.write.assert_not_called()
+
+
+@patch('modules.sensors.NowTime')
+@patch('modules.sensors.sleep', return_value=None)
+def test_thies_clock_drift(mock_sleep, mock_now_time):  # pylint: disable=unused-argument
+    """
+    Tests that only the clock of the Thies is set again after it drifted past the threshold.
+    """
+    mock_now_time.return_value.time_list = ['10', '20', '30']
+    session = create_session(Thies(thies_id='06'))
+    session.start()
+    session.sensor.serial_connection.reset_mock()
+
+    assert session.update(create_thies_telegram(drift=-25)) == ['clock']
+    assert session.pending() == ['clock']
+    assert session.reconcile() == ['clock']
+
+    written = [c.args[0] for c in session.sensor.serial_connection.write.call_args_list]
+    assert written == [b'\r06KY00001\r', b'\r06ZH00010\r', b'\r06ZM00020\r', b'\r06ZS00030\r', b'\r06KY00000\r']
+    assert session.pending() == []
+    assert session.reapply_count == 1
+
+    # a larger threshold in the config tolerates the same drift
+    config_dict = deepcopy(config_dict_thies)
+    config_dict['clock_drift_threshold'] = 30
+    session.config_dict = config_dict
+    assert session.update(create_thies_telegram(drift=-25)) == []
+
+
+@patch('modules.sensors.sleep', return_value=None)
+def test_parsivel_station_code_drift(mock_sleep):  # pylint: disable=unused-argument
+    """
+    Tests that only the station code of the Parsivel is set again after it drifted,
+    and that the restart which resets the rain amount is not sent.
+    """
+    session = create_session(Parsivel(), config_dict=config_dict_parsivel)
+    session.start()
+    session.sensor.serial_connection.reset_mock()
+
+    lines = [b'22:OTHER\r\n' if line.startswith(b'22:') else line for line in parsivel_lines]
+    telegram = ParsivelTelegram(config_dict=config_dict_parsivel, telegram_lines=lines, timestamp=start_dt,
+                                db_cursor=None, telegram_data={}, logger=Mock())
+
+    assert session.update(telegram) == ['station_code']
+    session.reconcile()
+
+    station_code = config_dict_parsivel['station_code']
+    session.sensor.serial_connection.write.assert_called_once_with(f'CS/K/{station_code}\r'.encode('utf-8'))
+
+
+def test_empty_telegram():
+    """
+    Tests that an empty telegram, or no telegram at all, marks all settings as pending.
+    """
+    session = create_session(Thies(thies_id='06'))
+    session.applied = {'automatic_mode': True, 'clock': True}
+    telegram = ThiesTelegram(config_dict=config_dict_thies, telegram_lines='', timestamp=start_dt,
+                             db_cursor=None, telegram_data={}, logger=Mock())
+
+    assert session.update(telegram) == ['automatic_mode', 'clock']
+
+    session.applied = {'automatic_mode': True, 'clock': True}
+    assert session.update(None) == ['automatic_mode', 'clock']
+
+
+def test_update_lookup():
+    """
+    Tests that the drift is checked from the looked up fields, without capturing the telegram in the acquisition
+    loop, and that the telegram is captured once when it is written (see Telegram.db_row).
+    """
+    telegrams = [ParsivelTelegram(config_dict=config_dict_parsivel, telegram_lines=parsivel_lines,
+                                  timestamp=start_dt, db_cursor=None, telegram_data={}, logger=Mock()),
+                 create_thies_telegram(drift=2)]
+    for telegram, sensor, config_dict in zip(telegrams, [Parsivel(), Thies(thies_id='06')],
+                                             [config_dict_parsivel, config_dict_thies]):
+        session = create_session(sensor, config_dict=config_dict)
+        with patch.object(telegram, 'capture_prefixes_and_data',
+                          wraps=telegram.capture_prefixes_and_data) as mock_capture:
+            assert session.update(telegram) == []
+            mock_capture.assert_not_called()
+            row = telegram.db_row()
+            telegram.db_row()
+            mock_capture.assert_called_once()
+        assert row == type(telegram)(config_dict=config_dict, telegram_lines=telegram.telegram_lines,
+                                     timestamp=start_dt, db_cursor=None, telegram_data={}, logger=Mock()).db_row()
+
+
+def test_reconcile_failed():
+    """
+    Tests that a setting that fails to apply stays pending, and is applied on the next call.
+    """
+    sensor = Mock()
+    sensor.SETTINGS = ('automatic_mode', 'clock')
+    sensor.apply_setting.side_effect = [OSError('write timeout'), None, None]
+    session = SensorSession(sensor=sensor, config_dict=config_dict_thies, logger=Mock())
+    session.applied = {'automatic_mode': True, 'clock': False}
+
+    assert session.reconcile() == []
+    assert session.pending() == ['clock']
+    assert session.reconcile() == ['clock']
+    assert session.pending() == []
@@ -24,6 +24,9 @@ class TestParsivel(unittest.TestCase):  # pylint: disable=too-many-public-method
     - test_read_success: Good weather test for the read function.
     - test_read_fail: Bad weather test for the read function.
     - test_get_type: Test if the get_type function returns the correct sensor type.
+    - test_apply_setting: Test if apply_setting sends the command of a single setting.
+    - test_drifted_settings_empty_fields: Test if empty name and number fields are not reported as drifted.
+    - test_drifted_settings_populated_fields: Test if name and number fields that match the config are not drifted.
     """
 
     def test___init__(self):
@@ -204,13 +207,24 @@ class TestParsivel(unittest.TestCase):  # pylint: disable=too-many-public-method
         """
         parsivel_obj = Parsivel()
         mock_serial_connection = Mock()
-        mock_serial_connection.readlines.return_value = "test"
+        mock_serial_connection.timeout = 1
+        chunks = [b'TYP OP4A\r\n01:00', b'00.000\r\n\x03']
+
+        def readinto(view):
+            chunk = chunks.pop(0)
+            view[:len(chunk)] = chunk
+            return len(chunk)
+
+        mock_serial_connection.in_waiting = 64
+        mock_serial_connection.readinto.side_effect = readinto
         mock_logger = Mock()
         parsivel_obj.serial_connection = mock_serial_connection
 
         res = parsivel_obj.read(mock_logger)
 
-        assert res == "test"
+        assert res == [b'TYP OP4A\r\n', b'01:0000.000\r\n', b'\x03']
+        mock_serial_connection.write.assert_called_once_with(b'CS/PA\r\n')
+        assert parsivel_obj.last_frame.complete is True
         mock_logger.error.assert_not_called()
 
     def test_read_fail(self):
@@ -244,3 +258,55 @@ class TestParsivel(unittest.TestCase):  # pylint: disable=too-many-public-method
         parsivel_obj.close_serial_connection()
 
         mock_serial_connection.close.assert_called_once()
+
+    @patch('modules.sensors.sleep', return_value=None)
+    def test_apply_setting(self, mock_sleep):
+        """
+        Test if apply_setting sends the command of a single setting.
+        :param mock_sleep: mock sleep to skip the waiting time
+        """
+        parsivel_obj = Parsivel()
+        parsivel_obj.write = Mock()
+        mock_logger = Mock()
+        config_dict = {'station_code': 'STATION1', 'global_attrs': {'sensor_name': '1234'}}
+
+        parsivel_obj.apply_setting('station_id', config_dict=config_dict, logger=mock_logger)
+
+        parsivel_obj.write.assert_called_once_with(b'CS/J/1234\r', mock_logger)
+        mock_sleep.assert_called_once_with(2)
+        with self.assertRaises(ValueError):
+            parsivel_obj.apply_setting('restart', config_dict=config_dict, logger=mock_logger)
+
+    def test_drifted_settings_empty_fields(self):
+        """
+        Test if empty name and number fields are not reported as drifted, but a different name is.
+        """
+        parsivel_obj = Parsivel()
+        config_dict = {'station_code': 'STATION1', 'global_attrs': {'sensor_name': '1234'}}
+        telegram = Mock()
+        telegram.lookup_fields.return_value = {}
+        assert parsivel_obj.drifted_settings(telegram, config_dict) == []
+        telegram.lookup_fields.assert_called_once_with(('22', '23'))
+        telegram.lookup_fields.return_value = {'22': 'STATION1', '23': '9999'}
+        assert parsivel_obj.drifted_settings(telegram, config_dict) == ['station_id']
+        telegram.lookup_fields.return_value = None
+        assert parsivel_obj.drifted_settings(telegram, config_dict) == list(Parsivel.SETTINGS)
+
+    def test_drifted_settings_populated_fields(self):
+        """
+        Test if populated name and number fields that match the config are not reported as drifted,
+        that the number is compared as a number, and that it is not compared with a sensor_name that the Parsivel
+        cannot store as its number, e.g. PAR008.
+        """
+        parsivel_obj = Parsivel()
+        telegram = Mock()
+        config_dict = {'station_code': 'GV', 'global_attrs': {'sensor_name': '8'}}
+        telegram.lookup_fields.return_value = {'22': 'GV', '23': '0008'}
+        assert parsivel_obj.drifted_settings(telegram, config_dict) == []
+        telegram.lookup_fields.return_value = {'22': 'GV', '23': '0009'}
+        assert parsivel_obj.drifted_settings(telegram, config_dict) == ['station_id']
+        config_dict = {'station_code': 'GV', 'global_attrs': {'sensor_name': 'PAR008'}}
+        telegram.lookup_fields.return_value = {'22': 'GV', '23': '0008'}
+        assert parsivel_obj.drifted_settings(telegram, config_dict) == []
+        telegram.lookup_fields.return_value = {'22': 'PAR', '23': '0008'}
+        assert parsivel_obj.drifted_settings(telegram, config_dict) == ['station_code']
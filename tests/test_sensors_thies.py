@@ -3,10 +3,34 @@ Module for testing the Thies class from sensors.py
 """
 
 import unittest
+from datetime import datetime, timezone
 from unittest.mock import MagicMock, patch, call, Mock
+from conftest import thies_lines
 from modules.sensors import Thies
 
 
+def mock_serial_chunks(chunks):
+    """
+    Creates a mocked serial connection whose readinto returns the given chunks one by one.
+    :param chunks: list of bytes returned by consecutive reads
+    :return: the mocked serial connection
+    """
+    chunks = list(chunks)
+
+    def readinto(view):
+        if not chunks:
+            return 0
+        chunk = chunks.pop(0)
+        view[:len(chunk)] = chunk
+        return len(chunk)
+
+    mock_serial = MagicMock()
+    mock_serial.timeout = 0.01
+    mock_serial.in_waiting = 4096
+    mock_serial.readinto.side_effect = readinto
+    return mock_serial
+
+
 class TestThies(unittest.TestCase):  # pylint: disable=too-many-public-methods
     """
     Class for testing the Thies Sensor subclass.
@@ -25,7 +49,12 @@ class TestThies(unittest.TestCase):  # pylint: disable=too-many-public-methods
     - test_write_fail: Test if the logger writes an error when there is an exception in the write function.
     - test_read_success: Test if the read function reads the data from the serial connection.
     - test_read_fail: Test if the read function writes an error to the logger when there is an exception.
+    - test_read_partial: Test if a telegram without ETX is dropped when the deadline passes.
+    - test_read_wrong_length: Test if a telegram with a wrong number of fields is dropped.
     - test_get_type: Test if the get_type function returns the correct sensor type.
+    - test_apply_setting_automatic_mode: Test if apply_setting sends only the automatic mode command in config mode.
+    - test_apply_setting_unknown: Test if apply_setting raises a ValueError for an unknown setting.
+    - test_clock_drift_missing_fields: Test if clock_drift returns None when the date or time is missing.
     """
 
     def test___init__(self):
@@ -188,15 +217,17 @@ class TestThies(unittest.TestCase):  # pylint: disable=too-many-public-methods
         """
         Test if the read function reads the data from the serial connection.
         """
-        thies = Thies()
+        thies = Thies(thies_id='06')
         logger = MagicMock()
-        mock_serial = MagicMock()
-        mock_serial.readline.return_value = "telegram".encode('utf-8')
-        thies.serial_connection = mock_serial
+        telegram = b'\x02' + thies_lines.encode('utf-8') + b'\r\n\x03'
+        # noise before the STX, and the telegram spread over several reads
+        thies.serial_connection = mock_serial_chunks([b'\r\n', telegram[:700], telegram[700:1500], telegram[1500:]])
         return_value = thies.read(logger)
-        thies.serial_connection.readline.assert_called_once()
+        thies.serial_connection.write.assert_called_once_with(b'\r06TR00005\r')
         logger.error.assert_not_called()
-        assert return_value is not None
+        assert return_value == '\x02' + thies_lines
+        assert thies.last_frame.complete is True
+        assert thies.last_frame.timings['total'] >= thies.last_frame.timings['first_byte']
 
     def test_read_fail(self):
         """
@@ -226,3 +257,67 @@ class TestThies(unittest.TestCase):  # pylint: disable=too-many-public-methods
         thies.close_serial_connection()
 
         mock_serial_connection.close.assert_called_once()
+
+    @patch('modules.sensors.sleep', return_value=None)
+    def test_apply_setting_automatic_mode(self, mock_sleep):  # pylint: disable=unused-argument
+        """
+        Test if apply_setting sends only the automatic mode command, in config mode.
+        :param mock_sleep: mock sleep to skip the waiting time
+        """
+        thies = Thies(thies_id='06')
+        thies.serial_connection = Mock()
+
+        thies.apply_setting('automatic_mode', config_dict={}, logger=Mock())
+
+        thies.serial_connection.write.assert_has_calls([call(b'\r06KY00001\r'),
+                                                        call(b'\r06TM00000\r'),
+                                                        call(b'\r06KY00000\r')])
+        assert thies.serial_connection.write.call_count == 3
+
+    def test_apply_setting_unknown(self):
+        """
+        Test if apply_setting raises a ValueError for an unknown setting, without writing to the sensor.
+        """
+        thies = Thies()
+        thies.serial_connection = Mock()
+
+        with self.assertRaises(ValueError):
+            thies.apply_setting('heating', config_dict={}, logger=Mock())
+        thies.serial_connection.write.assert_not_called()
+
+    def test_clock_drift_missing_fields(self):
+        """
+        Test if clock_drift returns None when the date or time is missing or malformed.
+        """
+        thies = Thies()
+        timestamp = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        assert thies.clock_drift({'5': '01.01.24'}, timestamp) is None
+        assert thies.clock_drift({'5': '01.01.24', '6': '99:00:00'}, timestamp) is None
+        assert thies.clock_drift({'5': '01.01.24', '6': '00:00:05'}, timestamp) == 5
+        telegram = Mock()
+        telegram.lookup_fields.return_value = {'5': '01.01.24', '6': '99:00:00'}
+        assert thies.drifted_settings(telegram, config_dict={}) == []
+
+    def test_read_partial(self):
+        """
+        Test if a telegram without ETX is dropped when the deadline passes.
+        """
+        thies = Thies()
+        thies.read_deadline = 0.05
+        logger = MagicMock()
+        thies.serial_connection = mock_serial_chunks([b'\x02' + thies_lines[:100].encode('utf-8')])
+
+        assert thies.read(logger) == ''
+        assert thies.last_frame.complete is False
+        logger.error.assert_called_once()
+
+    def test_read_wrong_length(self):
+        """
+        Test if a telegram with a wrong number of fields is dropped.
+        """
+        thies = Thies()
+        logger = MagicMock()
+        thies.serial_connection = mock_serial_chunks([b'\x02' + thies_lines[:-3].encode('utf-8') + b'\r\n\x03'])
+
+        assert thies.read(logger) == ''
+        logger.error.assert_called_once_with(msg='telegram has 525 fields instead of 526')
@@ -0,0 +1,309 @@
+"""
+Module for testing the Spool class from spool.py, and replaying it into the database.
+
+Functions:
+- create_telegrams: Creates Parsivel telegrams, one per minute.
+- create_rows: Creates the database rows of Parsivel telegrams, one per minute.
+- count_rows: Returns the number of rows in the disdrodl table.
+- test_append_and_read: Tests that appended rows are read back in order with increasing positions.
+- test_cut_off_record: Tests that a record that was cut off is dropped when the spool is opened again.
+- test_sync_batching: Tests that the spool is fsynced per number of records or interval, not per record.
+- test_segments_released: Tests that full segments are deleted once their records are in the database.
+- test_write_rows_idempotent: Tests that replaying the same records twice inserts them once.
+- test_pipeline_outage: Tests that telegrams written while the database is locked are replayed once it is free.
+- test_restart_replay: Tests that a spool left by a crashed logger is replayed without duplicates.
+- test_replaced_database: Tests that the spool of a database that was replaced is not replayed into the new one.
+- test_replay_long_outage: Tests that a long outage is replayed in batches, resuming after an interruption.
+"""
+
+import sqlite3
+import time
+from datetime import timedelta
+from unittest.mock import Mock, patch
+
+from conftest import start_dt, config_dict_parsivel, parsivel_lines
+from modules.pipeline import TelegramPipeline
+from modules.spool import Spool, RECORD_HEADER
+from modules.sqldb import create_db, connect_db, database_id
+from modules.db_writer import DBWriter
+from modules.telegram import ParsivelTelegram
+
+
+def create_telegrams(minutes, first=0):
+    """
+    Creates Parsivel telegrams, one per minute.
+    :param minutes: the number of telegrams
+    :param first: the minute after start_dt of the first telegram
+    :return: list of ParsivelTelegram objects
+    """
+    return [ParsivelTelegram(config_dict=config_dict_parsivel, telegram_lines=parsivel_lines,
+                             timestamp=start_dt + timedelta(minutes=first + i), db_cursor=None,
+                             telegram_data={}, logger=Mock()) for i in range(minutes)]
+
+
+def create_rows(minutes):
+    """
+    Creates the database rows of Parsivel telegrams, one per minute.
+    :param minutes: the number of rows
+    :return: list of row tuples
+    """
+    row = create_telegrams(1)[0].db_row()
+    return [(row[0] + 60 * i, row[1], row[2], row[3]) for i in range(minutes)]
+
+
+def count_rows(db_path):
+    """
+    Returns the number of rows in the disdrodl table.
+    :param db_path: the path of the database
+    :return: the number of rows
+    """
+    con, cur = connect_db(dbpath=str(db_path))
+    count = cur.execute("SELECT COUNT(*) FROM disdrodl").fetchone()[0]
+    distinct = cur.execute("SELECT COUNT(DISTINCT timestamp) FROM disdrodl").fetchone()[0]
+    cur.close()
+    con.close()
+    assert count == distinct, 'rows were inserted twice'
+    return count
+
+
+def test_append_and_read(tmp_path):
+    """
+    Tests that appended rows are read back in order with increasing positions, also after a given position.
+    :param tmp_path: temporary directory
+    """
+    spool = Spool(tmp_path, 'disdrodl')
+    rows = [(1.0, 'a', 'PAR008', 'x'), (2.0, 'b', 'PAR008', 'y', b'\x00\x01'), (3.0, 'c', 'PAR008', 'z')]
+    records = spool.append(rows)
+
+    assert [row for _, row in records] == rows
+    assert [position for position, _ in records] == sorted(position for position, _ in records)
+    assert list(spool.records()) == records
+    assert list(spool.records(after=records[0][0])) == records[1:]
+    assert spool.position == records[-1][0]
+    assert spool.backlog() is True
+    spool.release(spool.position)
+    assert spool.backlog() is False
+    spool.close()
+
+
+def test_cut_off_record(tmp_path):
+    """
+    Tests that a record that was cut off (e.g. by a power cut) is skipped when reading,
+    and dropped when the spool is opened again, so the next record is appended after the last complete one.
+    :param tmp_path: temporary directory
+    """
+    spool = Spool(tmp_path, 'disdrodl')
+    records = spool.append([(1.0, 'a', 'PAR008', 'x')])
+    spool.close()
+    with open(spool.segment_path(1), 'ab') as f:
+        f.write(RECORD_HEADER.pack(100) + b'cut off')
+    assert list(Spool(tmp_path, 'disdrodl').records()) == records
+
+    spool = Spool(tmp_path, 'disdrodl')
+    assert spool.position == records[-1][0]
+    spool.append([(2.0, 'b', 'PAR008', 'y')])
+    assert [row[0] for _, row in spool.records()] == [1.0, 2.0]
+    spool.close()
+
+
+@patch('modules.spool.os.fsync')
+def test_sync_batching(mock_fsync, tmp_path):
+    """
+    Tests that the spool is fsynced once per sync_records records or sync_interval seconds, not per record.
+    :param mock_fsync: Mock object for os.fsync
+    :param tmp_path: temporary directory
+    """
+    clock = Mock(return_value=0.0)
+    spool = Spool(tmp_path, 'disdrodl', sync_records=10, sync_interval=60, monotonic=clock)
+    for row in create_rows(25):
+        spool.append([row])
+    assert mock_fsync.call_count == 2
+    assert spool.unsynced == 5
+
+    clock.return_value = 61.0
+    spool.append(create_rows(1))
+    assert mock_fsync.call_count == 3
+    spool.close()
+    assert mock_fsync.call_count == 3  # nothing left to sync
+
+
+def test_segments_released(tmp_path):
+    """
+    Tests that a new segment is started when the current one is full,
+    and that the older segments are deleted once all their records are in the database.
+    :param tmp_path: temporary directory
+    """
+    spool = Spool(tmp_path, 'disdrodl', max_segment_size=20000)
+    records = []
+    for row in create_rows(12):
+        records += spool.append([row])
+    assert spool.segments() == [1, 2, 3]
+
+    spool.release(records[0][0])
+    assert spool.segments() == [1, 2, 3]
+    last_of_first = max(record for record in records if record[0][0] == 1)
+    spool.release(last_of_first[0])
+    assert spool.segments() == [2, 3]
+    spool.release(spool.position)
+    assert spool.segments() == [3]
+    assert [row for _, row in spool.records(after=spool.replayed)] == []
+    spool.close()
+
+
+def test_write_rows_idempotent(tmp_path):
+    """
+    Tests that replaying the same records twice, or records of which a part was committed, inserts every row once.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    create_db(dbpath=str(db_path))
+    spool = Spool(tmp_path / 'spool', 'disdrodl')
+    records = spool.append(create_rows(10))
+    db_writer = DBWriter(dbpath=str(db_path))
+
+    assert db_writer.write_rows(records[:6], spool='disdrodl') is True
+    assert db_writer.write_rows(list(spool.records()), spool='disdrodl') is True
+    assert db_writer.write_rows(list(spool.records()), spool='disdrodl') is True
+    assert db_writer.spool_position('disdrodl') == records[-1][0]
+    db_writer.close()
+    spool.close()
+    assert count_rows(db_path) == 10
+
+
+def test_pipeline_outage(tmp_path):
+    """
+    Tests that telegrams written while another process holds the write lock are kept in the spool
+    instead of being lost, and that they are replayed in order, once, when the database is free again.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    create_db(dbpath=str(db_path))
+    mock_logger = Mock()
+    pipeline = TelegramPipeline(create_writer=lambda path: DBWriter(dbpath=path, busy_timeout=0.01, max_retries=0),
+                                logger=mock_logger, batch_timeout=0.01, spool=True, replay_interval=0.05)
+    pipeline.start()
+
+    locker = sqlite3.connect(db_path)
+    locker.execute("BEGIN EXCLUSIVE")
+    for telegram in create_telegrams(5):
+        pipeline.put(str(db_path), telegram)
+    time.sleep(0.2)
+    assert pipeline.metrics()['spool_backlog'] == 1
+    assert pipeline.failed > 0
+    locker.rollback()
+    locker.close()
+
+    for telegram in create_telegrams(3, first=5):
+        pipeline.put(str(db_path), telegram)
+    time.sleep(0.2)
+    pipeline.stop()
+
+    assert pipeline.metrics()['spool_backlog'] == 0
+    assert count_rows(db_path) == 8
+    con, cur = connect_db(dbpath=str(db_path))
+    timestamps = [row[0] for row in cur.execute("SELECT timestamp FROM disdrodl ORDER BY id").fetchall()]
+    cur.close()
+    con.close()
+    assert timestamps == sorted(timestamps)
+    assert any('kept in the spool' in c.kwargs['msg'] for c in mock_logger.error.call_args_list)
+    assert (tmp_path / 'spool' / 'disdrodl_000001.spool').exists()
+
+
+def test_restart_replay(tmp_path):
+    """
+    Tests that a spool left by a logger that crashed before or after committing is replayed by the next one,
+    without inserting the committed rows twice.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    create_db(dbpath=str(db_path))
+    spool = Spool(tmp_path / 'spool', 'disdrodl')
+    records = spool.append(create_rows(20))
+    db_writer = DBWriter(dbpath=str(db_path))
+    db_writer.write_rows(records[:12], spool='disdrodl')
+    db_writer.close()
+    spool.close()  # the logger crashed
+
+    pipeline = TelegramPipeline(create_writer=lambda path: DBWriter(dbpath=path), batch_timeout=0.01, spool=True)
+    pipeline.put(str(db_path), create_telegrams(1, first=20)[0])
+    pipeline.start()
+    pipeline.stop()
+
+    assert count_rows(db_path) == 21
+    assert pipeline.replayed == 21
+
+
+def test_replaced_database(tmp_path):
+    """
+    Tests that the segments left for a database that was deleted and created again are moved aside
+    instead of being replayed into the new database, and that the spool is replayed into the same database.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    create_db(dbpath=str(db_path))
+    con, cur = connect_db(dbpath=str(db_path))
+    previous_id = database_id(cur)
+    cur.close()
+    con.close()
+    create_db(dbpath=str(db_path))
+    db_writer = DBWriter(dbpath=str(db_path))
+    assert db_writer.database_id() == previous_id
+    spool = Spool(tmp_path / 'spool', 'disdrodl', database_id=db_writer.database_id())
+    records = spool.append(create_rows(20))
+    db_writer.write_rows(records[:12], spool='disdrodl')
+    db_writer.close()
+    spool.close()
+
+    db_path.unlink()
+    create_db(dbpath=str(db_path))
+    mock_logger = Mock()
+    pipeline = TelegramPipeline(create_writer=lambda path: DBWriter(dbpath=path), logger=mock_logger,
+                                batch_timeout=0.01, spool=True)
+    pipeline.put(str(db_path), create_telegrams(1, first=20)[0])
+    pipeline.start()
+    pipeline.stop()
+
+    assert count_rows(db_path) == 1
+    set_aside = tmp_path / 'spool' / f'disdrodl_{previous_id}'
+    assert [path.name for path in set_aside.iterdir()] == ['disdrodl_000001.spool']
+    assert any(str(set_aside) in c.kwargs['msg'] for c in mock_logger.warning.call_args_list)
+
+    spool = Spool(tmp_path / 'spool', 'disdrodl', database_id=DBWriter(dbpath=str(db_path)).database_id())
+    assert spool.set_aside is None
+    assert len(list(spool.records())) == 1
+    spool.close()
+
+
+def test_replay_long_outage(tmp_path):
+    """
+    Tests that the telegrams of a long outage (two weeks of one telegram per minute) are replayed in batches,
+    that the position of the last batch is committed with it, and that a replay that is interrupted after
+    its first batch resumes after that position, so every telegram is inserted once.
+    :param tmp_path: temporary directory
+    """
+    db_path = tmp_path / 'disdrodl.db'
+    create_db(dbpath=str(db_path))
+    spool = Spool(tmp_path / 'spool', 'disdrodl')
+    spool.append(create_rows(20160))
+    positions = [position for position, _ in spool.records()]
+    db_writer = DBWriter(dbpath=str(db_path))
+
+    first_batch = [record for _, record in zip(range(5000), spool.records())]
+    assert db_writer.write_rows(first_batch, spool='disdrodl') is True
+    assert db_writer.spool_position('disdrodl') == positions[4999]
+    db_writer.close()
+
+    db_writer = DBWriter(dbpath=str(db_path))
+    records = spool.records(after=db_writer.spool_position('disdrodl'))
+    while True:
+        batch = [record for _, record in zip(range(5000), records)]
+        if not batch:
+            break
+        assert db_writer.write_rows(batch, spool='disdrodl') is True
+    assert db_writer.spool_position('disdrodl') == positions[-1]
+    # a replay of all records inserts nothing
+    assert db_writer.write_rows(list(spool.records()), spool='disdrodl') is True
+    db_writer.close()
+    spool.close()
+
+    assert count_rows(db_path) == 20160
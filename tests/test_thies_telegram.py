@@ -16,14 +16,18 @@ Functions:
   multiple values (key:val;val;) and parsing a telegram with a key that is not in the configuration
   dictionary of the sensor.
 - test_str2list_thies: Tests str2list method for ThiesTelegram class.
+- test_capture_prefixes_and_data_spectrum_thies: Tests that the 440 values of the matrix are captured in order.
+- test_capture_prefixes_and_data_benchmark_thies: Benchmarks capturing a day of Thies telegrams.
 """
 
 import logging
 import os
+import time
 from pathlib import Path
 from logging import StreamHandler
 from datetime import datetime, timezone
 
+import pytest
 from pydantic.v1.utils import deep_update
 
 from modules.sqldb import connect_db, query_db_rows_gen
@@ -244,3 +248,47 @@ def test_str2list_thies():
         logger=None)
     telegram.str2list('1',',')
     assert telegram_data['1'] == ['1','2','3','4','5']
+
+
+def test_capture_prefixes_and_data_spectrum_thies():
+    """
+    This function tests that the 440 values of the 22x20 matrix are captured in order into field 81,
+    and that the fields after the matrix are numbered from 521.
+    """
+    values = thies_lines.split(';')
+    values[79:519] = [f'{i:03d}' for i in range(440)]
+    telegram = ThiesTelegram(config_dict=None,
+                             telegram_lines=';'.join(values),
+                             timestamp=None,
+                             db_cursor=None,
+                             telegram_data={},
+                             logger=None)
+    telegram.capture_prefixes_and_data()
+
+    assert list(telegram.telegram_data.keys()) == keys
+    assert telegram.telegram_data['80'] == '00000.000'
+    assert telegram.telegram_data['81'] == ','.join(f'{i:03d}' for i in range(440))
+    assert telegram.telegram_data['521'] == '99999'
+    assert telegram.telegram_data['525'] == 'E9'
+
+@pytest.mark.benchmark
+def test_capture_prefixes_and_data_benchmark_thies():
+    """
+    This function benchmarks capturing the telegram data of a day of Thies telegrams (1440),
+    the 440 values of the matrix are sliced at once instead of being added one at a time.
+    Only runs with --benchmark, see conftest.py.
+    """
+    start = time.perf_counter()
+    for _ in range(1440):
+        telegram = ThiesTelegram(config_dict=None,
+                                 telegram_lines=thies_lines,
+                                 timestamp=None,
+                                 db_cursor=None,
+                                 telegram_data={},
+                                 logger=None)
+        telegram.capture_prefixes_and_data()
+    duration = time.perf_counter() - start
+
+    assert telegram.telegram_data['81'] == matrix_values
+    print(f'captured 1440 telegrams in {duration:.3f}s')
+    assert duration < 0.5
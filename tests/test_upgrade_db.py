@@ -1,16 +1,17 @@
 import unittest
-from unittest.mock import patch, Mock
+from pathlib import Path
+from unittest.mock import patch, Mock, call
 
 import upgrade_db
-from upgrade_db import get_config_file
+from upgrade_db import get_arguments, database_paths
 
 
 class TestUpgradeDb(unittest.TestCase):
 
     @patch('upgrade_db.ArgumentParser')
-    def test_get_config_file(self, mock_argument_parser):
+    def test_get_arguments(self, mock_argument_parser):
         """
-        Tests for the get_config_file function
+        Tests for the get_arguments function
         :param mock_argument_parser: Mock object for the ArgumentParser call
         """
         mock_parser = Mock()
@@ -19,69 +20,78 @@ class TestUpgradeDb(unittest.TestCase):
         mock_args.config = "config_PAR_008_GV.yml"
         mock_parser.parse_args.return_value = mock_args
 
-        res = get_config_file()
+        res = get_arguments()
 
-        self.assertEqual(res, "config_PAR_008_GV.yml")
-        mock_argument_parser.assert_called_once_with(
-            description="Upgrade the disdrodl.db database to change the column name from 'parsivel_id' to 'sensor_id"
-        )
-        mock_parser.add_argument.assert_called_once_with('-c',
-                                                         '--config',
-                                                         required=True,
-                                                         help='Path to site config file. ie. -c configs_netcdf/config_PAR_008_GV.yml')
+        self.assertEqual(res.config, "config_PAR_008_GV.yml")
+        mock_argument_parser.assert_called_once()
+        mock_parser.add_argument.assert_any_call('-c',
+                                                 '--config',
+                                                 required=True,
+                                                 help='Path to site config file. ie. -c configs_netcdf/config_PAR_008_GV.yml')
+        self.assertEqual(mock_parser.add_argument.call_count, 4)
         mock_parser.parse_args.assert_called_once()
 
-    @patch('upgrade_db.connect_db')
-    def test_column_exists_fail(self, mock_connect_db):
-        mock_cur = Mock()
-        mock_con = Mock()
-
-        mock_connect_db.return_value = mock_con, mock_cur
-        mock_cur.fetchall.return_value = [(0, 'test_column', 'TEXT', 0, None, 0)]
-        result = upgrade_db.column_exists(mock_cur, 'parsivel_id')
-        assert result is False
-
-    @patch('upgrade_db.connect_db')
-    def test_column_exists_success(self, mock_connect_db):
-        mock_cur = Mock()
-        mock_con = Mock()
-
-        mock_connect_db.return_value = mock_con, mock_cur
-        mock_cur.fetchall.return_value = [(0, 'parsivel_id', 'TEXT', 0, None, 0)]
-        result = upgrade_db.column_exists(mock_cur, 'parsivel_id')
-        assert result is True
-
-    @patch('upgrade_db.column_exists', return_value=True)
-    @patch('upgrade_db.connect_db')
+    def test_database_paths(self):
+        """
+        Tests that the partition files are only upgraded with partitioning
+        """
+        mock_path = Mock()
+        mock_path.exists.return_value = True
+        mock_path.stem = 'disdrodl'
+        mock_path.suffix = '.db'
+        mock_path.parent.glob.return_value = [Path('disdrodl_202402.db'), Path('disdrodl_202401.db')]
+
+        self.assertEqual(database_paths(mock_path, 'none'), [mock_path])
+        self.assertEqual(database_paths(mock_path, 'monthly'),
+                         [mock_path, Path('disdrodl_202401.db'), Path('disdrodl_202402.db')])
+        mock_path.parent.glob.assert_called_once_with('disdrodl_*.db')
+
+    @patch('upgrade_db.seal_partition')
+    @patch('upgrade_db.migrate')
+    @patch('upgrade_db.database_paths')
+    @patch('upgrade_db.get_general_config_dict')
+    @patch('upgrade_db.create_logger')
     @patch('upgrade_db.yaml2dict')
-    def test_main_success(self, mock_yaml2dict, mock_connect_db, mock_column_exists):  #pylint: disable=unused-argument
-        mock_cur = Mock()
-        mock_con = Mock()
-
-        mock_connect_db.return_value = mock_con, mock_cur
-
+    def test_main_success(self, mock_yaml2dict, mock_create_logger, mock_get_general_config_dict,  # pylint: disable=too-many-arguments
+                          mock_database_paths, mock_migrate, mock_seal_partition):
         site_dict = {
             'data_dir': 'value1',
+            'log_dir': 'value2',
+            'global_attrs': {'sensor_name': 'PAR008', 'sensor_type': 'OTT Hydromet Parsivel2'},
+            'db_partitioning': 'monthly',
         }
-
-        upgrade_db.main('config_PAR_008_GV.yml')
-        mock_cur.execute.assert_called_once()
-        mock_con.commit.assert_called_once()
-        mock_cur.close.assert_called_once()
-        mock_con.close.assert_called_once()
-
-    @patch('upgrade_db.column_exists', return_value=False)
-    @patch('upgrade_db.connect_db')
+        mock_yaml2dict.return_value = site_dict
+        mock_get_general_config_dict.return_value = {'telegram_fields': {}}
+        mock_database_paths.return_value = [Path('value1/disdrodl.db'), Path('README.md')]
+
+        upgrade_db.main('config_PAR_008_GV.yml', batch_size=10, pause=0)
+
+        mock_database_paths.assert_called_once_with(Path('value1/disdrodl.db'), 'monthly')
+        config_dict = {**site_dict, 'telegram_fields': {}}
+        mock_migrate.assert_has_calls([
+            call(Path('value1/disdrodl.db'), config_dict=config_dict, logger=mock_create_logger.return_value,
+                 batch_size=10, pause=0, busy_timeout=10.0, skip=[]),
+            call(Path('README.md'), config_dict=config_dict, logger=mock_create_logger.return_value,
+                 batch_size=10, pause=0, busy_timeout=10.0, skip=[])])
+        mock_seal_partition.assert_not_called()
+
+        # the migrations that build the index over all rows are skipped while the logger is running
+        mock_database_paths.return_value = [Path('value1/disdrodl.db')]
+        upgrade_db.main('config_PAR_008_GV.yml', batch_size=10, pause=0, skip_index=True)
+        mock_migrate.assert_called_with(Path('value1/disdrodl.db'), config_dict=config_dict,
+                                        logger=mock_create_logger.return_value, batch_size=10, pause=0,
+                                        busy_timeout=10.0, skip=[2, 5])
+
+    @patch('upgrade_db.migrate')
+    @patch('upgrade_db.get_general_config_dict', return_value=None)
+    @patch('upgrade_db.create_logger')
     @patch('upgrade_db.yaml2dict')
-    def test_main_fail(self, mock_yaml2dict, mock_connect_db,
-                       mock_column_exists):  #pylint: disable=unused-argument
-        mock_cur = Mock()
-        mock_con = Mock()
-
-        mock_connect_db.return_value = mock_con, mock_cur
-
+    def test_main_fail(self, mock_yaml2dict, mock_create_logger, mock_get_general_config_dict,  # pylint: disable=unused-argument
+                       mock_migrate):
         site_dict = {
             'data_dir': 'value1',
+            'log_dir': 'value2',
+            'global_attrs': {'sensor_name': 'XYZ001', 'sensor_type': 'unknown'},
         }
 
         mock_yaml2dict.return_value = site_dict
@@ -92,7 +102,4 @@ class TestUpgradeDb(unittest.TestCase):
         except SystemExit:
             exited = True
         assert exited is True
-        mock_cur.execute.assert_not_called()
-        mock_con.commit.assert_not_called()
-        mock_cur.close.assert_called_once()
-        mock_con.close.assert_called_once()
+        mock_migrate.assert_not_called()
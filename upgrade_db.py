@@ -1,79 +1,100 @@
 """
-This script is used to upgrade the disdrodl.db database to change the column name from 'parsivel_id' to 'sensor_id'
+This script upgrades the disdrodl.db database (or all its partition files) to the current schema,
+by applying the migrations of modules/migrations.py that the database misses.
+It can run while the logger is running, the data is migrated in short transactions,
+and an interrupted upgrade resumes where it stopped when the script is run again.
 
-- column_exists: Function to check if a column exists in the disdrodl table
+- database_paths: Function that returns the database files of a site
 - main: Main function to upgrade the disdrodl.db database
-- get_config_file: Function that gets the config file from the command line
+- get_arguments: Function that gets the config file and migration settings from the command line
 """
 import sys
 from argparse import ArgumentParser
 from pathlib import Path
 
-from modules.sqldb import connect_db
-from modules.util_functions import yaml2dict
+from pydantic.v1.utils import deep_update
 
+from modules.migrations import migrate, MIGRATIONS
+from modules.partitions import PARTITION_FORMATS, seal_partition
+from modules.util_functions import yaml2dict, create_logger, get_general_config_dict
 
-def column_exists(cur, column_name):
+
+def database_paths(db_path: Path, partitioning: str):
     """
-    Function to check if a column exists in the disdrodl table
-    :param cur: the database cursor
-    :param column_name: the name of the column to check
-    :return: True if the column exists, False otherwise
+    Function that returns the database files of a site: disdrodl.db and, with partitioning, all partition files
+    :param db_path: the path of the database without partitions, e.g. /data/disdroDL/disdrodl.db
+    :param partitioning: none, daily, monthly or yearly
+    :return: list of the existing paths
     """
-    # This query gets info about the table including the column names
-    cur.execute("PRAGMA table_info(disdrodl)")
-    columns = cur.fetchall()
-    for column in columns:
-        if column[1] == column_name:
-            return True
-    return False
+    paths = [db_path] if db_path.exists() else []
+    if PARTITION_FORMATS.get(partitioning) is not None:
+        paths += sorted(db_path.parent.glob(f'{db_path.stem}_*{db_path.suffix}'))
+    return paths
 
 
-def main(config_site):
+def main(config_site, batch_size=1000, pause=0.1, skip_index=False):
     """
     Main function to upgrade the disdrodl.db database
     :param config_site: The config file for the site
+    :param batch_size: the maximum number of rows migrated in one transaction
+    :param pause: seconds to wait between two batches
+    :param skip_index: whether to skip the migrations that build an index over all rows in one transaction,
+                       which blocks the logger (see Migration.BLOCKING), so the upgrade can run on a live database
     """
     wd = Path(__file__).parent
 
     config_dict_site = yaml2dict(path=wd / config_site)
-
-    db_path = Path(config_dict_site['data_dir']) / 'disdrodl.db'
-
-    con, cur = connect_db(dbpath=str(db_path))
-
-    query = """
-        ALTER TABLE disdrodl
-        RENAME COLUMN parsivel_id TO sensor_id
-    """
-
-    exists = column_exists(cur, 'parsivel_id')
-    if not exists:
-        cur.close()
-        con.close()
-        sys.exit(0)
-
-    cur.execute(query)
-    con.commit()
-    cur.close()
-    con.close()
-
-
-def get_config_file():
+    logger = create_logger(log_dir=Path(config_dict_site['log_dir']),
+                           script_name='upgrade_db',
+                           sensor_name=config_dict_site['global_attrs']['sensor_name'])
+
+    config_dict_general = get_general_config_dict(wd, config_dict_site['global_attrs']['sensor_type'], logger)
+    if config_dict_general is None:
+        sys.exit(1)
+    config_dict = deep_update(config_dict_general, config_dict_site)
+
+    skip = [migration.VERSION for migration in MIGRATIONS if migration.BLOCKING] if skip_index else []
+    db_path = Path(config_dict['data_dir']) / 'disdrodl.db'
+    for path in database_paths(db_path, config_dict.get('db_partitioning', 'none')):
+        sealed = Path(f'{path}.sha256').exists()
+        migrate(path, config_dict=config_dict, logger=logger, batch_size=batch_size, pause=pause,
+                busy_timeout=config_dict.get('db_busy_timeout', 10.0), skip=skip)
+        if sealed:
+            # the migration changed the file, so its checksum is written again
+            seal_partition(path)
+
+
+def get_arguments():
     """
-    Function that gets th config file from the command line
-    :return: the config file's name
+    Function that gets the config file and migration settings from the command line
+    :return: the parsed arguments
     """
     parser = ArgumentParser(
-        description="Upgrade the disdrodl.db database to change the column name from 'parsivel_id' to 'sensor_id")
+        description="Upgrade the disdrodl.db database to the current schema, "
+                    "can run while the logger is running and resumes when interrupted")
     parser.add_argument(
         '-c',
         '--config',
         required=True,
         help='Path to site config file. ie. -c configs_netcdf/config_PAR_008_GV.yml')
-    args = parser.parse_args()
-    return args.config
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=1000,
+        help='Maximum number of rows migrated in one transaction')
+    parser.add_argument(
+        '--pause',
+        type=float,
+        default=0.1,
+        help='Seconds to wait between two batches, so the logger can write')
+    parser.add_argument(
+        '--skip-index',
+        action='store_true',
+        help='Skip the migrations that build the (sensor_id, timestamp) index, which blocks the logger while it is '
+             'built, run again without it when the logger is stopped')
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
-    main(get_config_file())
+    arguments = get_arguments()
+    main(arguments.config, batch_size=arguments.batch_size, pause=arguments.pause, skip_index=arguments.skip_index)